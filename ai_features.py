@@ -109,10 +109,12 @@ def analyze_learning_style(quiz_results, lesson_completion_times):
         "insights": insights
     }
 
-def generate_personalized_path(user_profile, completed_courses, all_courses):
+def generate_personalized_path(user_profile, completed_courses, all_courses, enrollment_counts=None):
     """
     Generate a personalized learning path based on user profile and past performance.
     Uses collaborative filtering and content-based recommendations.
+    enrollment_counts maps course id to enrollments; without it each course's
+    enrollments are loaded.
     """
     if not all_courses:
         return []
@@ -124,9 +126,11 @@ def generate_personalized_path(user_profile, completed_courses, all_courses):
     # Content-based filtering
     recommended_courses = []
     
+    completed_ids = {c.id for c in completed_courses}
+    
     for course in all_courses:
         # Skip already completed courses
-        if course.id in [c.id for c in completed_courses]:
+        if course.id in completed_ids:
             continue
         
         score = 0
@@ -144,7 +148,11 @@ def generate_personalized_path(user_profile, completed_courses, all_courses):
             score += 1
         
         # Popularity bonus
-        score += min(len(course.enrollments) / 10, 1)
+        if enrollment_counts is None:
+            enrollment_count = len(course.enrollments)
+        else:
+            enrollment_count = enrollment_counts.get(course.id, 0)
+        score += min(enrollment_count / 10, 1)
         
         if score > 0:
             recommended_courses.append({
@@ -1,212 +1,227 @@
+"""
+Application factory for LearnSmart
+create_app() builds a configured app without touching the database, so
+importing this module and starting workers is cheap. Schema creation and
+sample data are an explicit one-time step:
+
+    flask --app app init-db
+    flask --app app run
+"""
+
 from flask import Flask, render_template
-from flask_jwt_extended import JWTManager
-from flask_cors import CORS
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///learnsmart.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False
-
-# Import models first to get db instance
-from models import db
-db.init_app(app)
-
-jwt = JWTManager(app)
-CORS(app)
-
-# Import routes after db initialization
-from routes import register_routes
-
-# Register all routes
-register_routes(app)
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-def initialize_db():
-    """Initialize database with sample data if empty"""
-    with app.app_context():
-        db.create_all()
-        
-        # Check if database is empty
-        from models import User, Course
-        user_count = User.query.count()
-        course_count = Course.query.count()
-        
-        # If no users or courses, initialize sample data
-        if user_count == 0 or course_count == 0:
-            print("Initializing database with sample data...")
-            
-            from werkzeug.security import generate_password_hash
-            from models import Lesson, Quiz, Question
-            
-            # Create users if they don't exist
-            if user_count == 0:
-                admin_user = User(
-                    username='admin',
-                    email='admin@learnsmart.com',
-                    role='admin',
-                    skill_level='advanced'
-                )
-                admin_user.password_hash = generate_password_hash('admin123')
-                
-                learner_user = User(
-                    username='learner',
-                    email='learner@learnsmart.com',
-                    role='learner',
-                    skill_level='beginner'
-                )
-                learner_user.password_hash = generate_password_hash('learner123')
-                learner_user.set_interests(['programming', 'web development', 'python'])
-                
-                db.session.add(admin_user)
-                db.session.add(learner_user)
-                db.session.commit()
-                print("✓ Users created")
-            
-            # Create courses if they don't exist
-            if course_count == 0:
-                # Create Python Course
-                python_course = Course(
-                    title='Python Programming Fundamentals',
-                    description='Learn the basics of Python programming language from scratch. Perfect for beginners.',
-                    category='programming',
-                    difficulty_level='beginner',
-                    duration_hours=20.0,
-                    instructor='Dr. Sarah Johnson'
-                )
-                db.session.add(python_course)
-                db.session.commit()
-                
-                # Create Flask Course
-                flask_course = Course(
-                    title='Web Development with Flask',
-                    description='Build web applications using Python Flask framework.',
-                    category='web development',
-                    difficulty_level='intermediate',
-                    duration_hours=25.0,
-                    instructor='Prof. Michael Chen'
-                )
-                db.session.add(flask_course)
-                db.session.commit()
-                
-                # Create Database Course
-                db_course = Course(
-                    title='Database Design and Management',
-                    description='Learn how to design and manage databases effectively.',
-                    category='database',
-                    difficulty_level='intermediate',
-                    duration_hours=18.0,
-                    instructor='Dr. Emily Rodriguez'
-                )
-                db.session.add(db_course)
-                db.session.commit()
-                
-                # Create Machine Learning Course
-                ml_course = Course(
-                    title='Machine Learning Basics',
-                    description='Introduction to machine learning concepts and algorithms.',
-                    category='machine learning',
-                    difficulty_level='advanced',
-                    duration_hours=30.0,
-                    instructor='Dr. James Wilson'
-                )
-                db.session.add(ml_course)
-                db.session.commit()
-                
-                # Create Bootstrap Course
-                bs_course = Course(
-                    title='Frontend Development with Bootstrap',
-                    description='Create responsive web designs using Bootstrap framework.',
-                    category='web development',
-                    difficulty_level='beginner',
-                    duration_hours=15.0,
-                    instructor='Ms. Lisa Thompson'
-                )
-                db.session.add(bs_course)
-                db.session.commit()
-                
-                print("✓ Courses created")
-                
-                # Create lessons for Python course
-                python_course = Course.query.filter_by(title='Python Programming Fundamentals').first()
-                lesson1 = Lesson(
-                    course_id=python_course.id,
-                    title='Introduction to Python',
-                    content='Python is a high-level programming language known for its simplicity and readability. In this lesson, you will learn about Python history, features, and why it is popular among developers.',
-                    order_index=1,
-                    duration_minutes=45
-                )
-                lesson2 = Lesson(
-                    course_id=python_course.id,
-                    title='Variables and Data Types',
-                    content='Learn about Python variables and different data types including integers, floats, strings, booleans, lists, tuples, and dictionaries.',
-                    order_index=2,
-                    duration_minutes=60
-                )
-                lesson3 = Lesson(
-                    course_id=python_course.id,
-                    title='Control Structures',
-                    content='Master if statements, loops (for and while), and how to control the flow of your Python programs.',
-                    order_index=3,
-                    duration_minutes=75
-                )
-                db.session.add(lesson1)
-                db.session.add(lesson2)
-                db.session.add(lesson3)
-                db.session.commit()
-                
-                # Create quiz for Python course
-                quiz = Quiz(
-                    course_id=python_course.id,
-                    title='Python Fundamentals Quiz',
-                    description='Test your knowledge of Python programming basics',
-                    passing_score=70,
-                    time_limit_minutes=30
-                )
-                db.session.add(quiz)
-                db.session.commit()
-                
-                # Create questions
-                q1 = Question(
-                    quiz_id=quiz.id,
-                    question_text='What is the correct way to create a variable in Python?',
-                    correct_answer=1,
-                    explanation='In Python, you simply assign a value to a variable name without declaring the type.',
-                    points=1
-                )
-                q1.set_options(['var x = 5', 'x = 5', 'int x = 5', 'variable x = 5'])
-                
-                q2 = Question(
-                    quiz_id=quiz.id,
-                    question_text='Which of the following is NOT a Python data type?',
-                    correct_answer=3,
-                    explanation='Python does not have a separate char type. Characters are strings of length 1.',
-                    points=1
-                )
-                q2.set_options(['int', 'float', 'string', 'char'])
-                
-                db.session.add(q1)
-                db.session.add(q2)
-                quiz.total_questions = 2
-                db.session.commit()
-                
-                print("✓ Lessons and quiz created")
-                
-                print("\n" + "="*60)
-                print("✓ Database initialized successfully!")
-                print("Default accounts created:")
-                print("  Admin: username='admin', password='admin123'")
-                print("  Learner: username='learner', password='learner123'")
-                print("="*60)
+import time
+
+import click
+
+
+def create_app(config=None):
+    """Build and configure a LearnSmart app; config overrides environment settings"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///learnsmart.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string')
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False
+    # Only routes that opt in read the token from the query string (event streams)
+    app.config['JWT_QUERY_STRING_NAME'] = 'token'
+
+    # Write-behind buffering for lesson-progress and quiz-attempt events (opt-in)
+    app.config['WRITE_BEHIND_ENABLED'] = os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+    app.config['WRITE_BEHIND_LOG_DIR'] = os.getenv('WRITE_BEHIND_LOG_DIR', os.path.join(app.instance_path, 'write_behind'))
+    app.config['WRITE_BEHIND_FLUSH_MS'] = int(os.getenv('WRITE_BEHIND_FLUSH_MS', '50'))
+    app.config['WRITE_BEHIND_BATCH_SIZE'] = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '500'))
+    app.config['WRITE_BEHIND_FSYNC'] = os.getenv('WRITE_BEHIND_FSYNC', 'true').lower() == 'true'
+
+    # Request metrics exposed at /api/admin/metrics
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', '200'))
+
+    # Admin-only request profiling via the X-Profile header
+    app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED', 'true').lower() == 'true'
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config['PROFILE_MAX_COUNT'] = int(os.getenv('PROFILE_MAX_COUNT', '100'))
+
+    # Fingerprinted, precompressed static files written by `flask build-assets`
+    app.config['ASSETS_DIR'] = os.getenv('ASSETS_DIR', os.path.join(app.static_folder, 'dist'))
+
+    # gzip/brotli for text responses at least COMPRESS_MIN_SIZE bytes long
+    app.config['COMPRESS_ENABLED'] = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+    app.config['COMPRESS_GZIP_LEVEL'] = int(os.getenv('COMPRESS_GZIP_LEVEL', '5'))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))
+    app.config['COMPRESS_CACHE_SIZE'] = int(os.getenv('COMPRESS_CACHE_SIZE', '256'))
+    app.config['COMPRESS_CACHE_MAX_BYTES'] = int(os.getenv('COMPRESS_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+    # Serialized course and quiz payloads: memory (per process), sqlite (shared by the host's workers) or none
+    app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'memory')
+    app.config['CACHE_MAX_BYTES'] = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    app.config['CACHE_TTL_SECONDS'] = float(os.getenv('CACHE_TTL_SECONDS', '300'))
+    app.config['CACHE_PATH'] = os.getenv('CACHE_PATH', os.path.join(app.instance_path, 'cache.db'))
+
+    # Course list snapshot memory-mapped by every worker on the host
+    app.config['CATALOG_SNAPSHOT_ENABLED'] = os.getenv('CATALOG_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+    app.config['CATALOG_DIR'] = os.getenv('CATALOG_DIR', os.path.join(app.instance_path, 'catalog'))
+    app.config['CATALOG_CHECK_SECONDS'] = float(os.getenv('CATALOG_CHECK_SECONDS', '1'))
+    app.config['CATALOG_MAX_AGE_SECONDS'] = float(os.getenv('CATALOG_MAX_AGE_SECONDS', '60'))
+
+    # Deleted courses are hidden at once; a background purger removes their rows in batches
+    app.config['COURSE_PURGE_SECONDS'] = float(os.getenv('COURSE_PURGE_SECONDS', '60'))
+    app.config['COURSE_PURGE_BATCH'] = int(os.getenv('COURSE_PURGE_BATCH', '1000'))
+    app.config['COURSE_PURGE_PAUSE_MS'] = float(os.getenv('COURSE_PURGE_PAUSE_MS', '10'))
+
+    # GET /api/learner/bootstrap: load the catalog on a worker thread alongside the learner's data
+    app.config['BOOTSTRAP_CONCURRENT'] = os.getenv('BOOTSTRAP_CONCURRENT', 'false').lower() == 'true'
+    app.config['BOOTSTRAP_WORKERS'] = int(os.getenv('BOOTSTRAP_WORKERS', '4'))
+
+    # Server-Sent Events at /api/learner/events
+    app.config['SSE_ENABLED'] = os.getenv('SSE_ENABLED', 'true').lower() == 'true'
+    app.config['SSE_QUEUE_SIZE'] = int(os.getenv('SSE_QUEUE_SIZE', '100'))
+    app.config['SSE_MAX_CONNECTIONS'] = int(os.getenv('SSE_MAX_CONNECTIONS', '10000'))
+    app.config['SSE_HEARTBEAT_SECONDS'] = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+
+    # Precomputed recommendation lists; stale users are recomputed in the background
+    app.config['RECOMMENDATIONS_PRECOMPUTED'] = os.getenv('RECOMMENDATIONS_PRECOMPUTED', 'true').lower() == 'true'
+    app.config['RECOMMENDATIONS_REFRESH_SECONDS'] = float(os.getenv('RECOMMENDATIONS_REFRESH_SECONDS', '5'))
+    app.config['RECOMMENDATIONS_REFRESH_BATCH'] = int(os.getenv('RECOMMENDATIONS_REFRESH_BATCH', '500'))
+    app.config['RECOMMENDATIONS_MAX_AGE_SECONDS'] = float(os.getenv('RECOMMENDATIONS_MAX_AGE_SECONDS', '3600'))
+
+    # Similar courses; stale course vectors are recomputed in the background
+    app.config['SIMILARITY_DIMENSIONS'] = int(os.getenv('SIMILARITY_DIMENSIONS', '256'))
+    app.config['SIMILARITY_NEIGHBORS'] = int(os.getenv('SIMILARITY_NEIGHBORS', '20'))
+    app.config['SIMILARITY_REFRESH_SECONDS'] = float(os.getenv('SIMILARITY_REFRESH_SECONDS', '5'))
+    app.config['SIMILARITY_REFRESH_BATCH'] = int(os.getenv('SIMILARITY_REFRESH_BATCH', '200'))
+
+    # Activity rollups; a background job folds every closed hour into them
+    app.config['ROLLUP_REFRESH_SECONDS'] = float(os.getenv('ROLLUP_REFRESH_SECONDS', '60'))
+    app.config['ROLLUP_LAG_SECONDS'] = int(os.getenv('ROLLUP_LAG_SECONDS', '300'))
+    app.config['ROLLUP_BATCH_HOURS'] = int(os.getenv('ROLLUP_BATCH_HOURS', '168'))
+    app.config['ROLLUP_HOURLY_RETENTION_DAYS'] = int(os.getenv('ROLLUP_HOURLY_RETENTION_DAYS', '31'))
+
+    # Score and active-learner sketches; each process merges what it buffered every interval
+    app.config['SKETCH_FLUSH_SECONDS'] = float(os.getenv('SKETCH_FLUSH_SECONDS', '10'))
+
+    # ASGI mode (asgi:app): async engine pool, AI thread pool and the pool running Flask-only routes
+    app.config['ASYNC_DATABASE_URL'] = os.getenv('ASYNC_DATABASE_URL')
+    app.config['ASYNC_POOL_SIZE'] = int(os.getenv('ASYNC_POOL_SIZE', '20'))
+    app.config['ASYNC_MAX_OVERFLOW'] = int(os.getenv('ASYNC_MAX_OVERFLOW', '20'))
+    app.config['ASYNC_AI_WORKERS'] = int(os.getenv('ASYNC_AI_WORKERS', '4'))
+    app.config['ASYNC_WSGI_WORKERS'] = int(os.getenv('ASYNC_WSGI_WORKERS', '16'))
+
+    # Requests served in-process before the worker takes traffic (comma separated)
+    app.config['WARMUP_ON_START'] = os.getenv('WARMUP_ON_START', 'false').lower() == 'true'
+    app.config['WARMUP_PATHS'] = os.getenv('WARMUP_PATHS', '/api/courses/')
+
+    if config:
+        app.config.update(config)
+
+    from flask_jwt_extended import JWTManager
+    from flask_cors import CORS
+    from models import db
+    db.init_app(app)
+    JWTManager(app)
+    CORS(app)
+
+    from routes import register_routes
+    register_routes(app)
+
+    from write_behind import init_write_behind
+    init_write_behind(app)
+
+    from metrics import init_metrics
+    init_metrics(app)
+
+    from profiling import init_profiling
+    init_profiling(app)
+
+    from assets import init_assets
+    init_assets(app)
+
+    from compression import init_compression
+    init_compression(app)
+
+    from cache import init_cache
+    init_cache(app)
+
+    from catalog import init_catalog
+    init_catalog(app)
+
+    from purge import init_purge
+    init_purge(app)
+
+    from events import init_events
+    init_events(app)
+
+    from recommendations import init_recommendations
+    init_recommendations(app)
+
+    from similarity import init_similarity
+    init_similarity(app)
+
+    from calibration import init_calibration
+    init_calibration(app)
+
+    from item_analysis import init_item_analysis
+    init_item_analysis(app)
+
+    from rollups import init_rollups
+    init_rollups(app)
+
+    from sketches import init_sketches
+    init_sketches(app)
+
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(warmup_command)
+
+    if app.config['WARMUP_ON_START']:
+        warm_up(app)
+
+    return app
+
+
+def warm_up(app):
+    """
+    Serve the WARMUP_PATHS requests in-process so that connection pools,
+    compiled SQL, templates and lazily imported modules are ready before the
+    first real request. Returns {path: (status, milliseconds)}.
+    """
+    timings = {}
+    client = app.test_client()
+    for path in filter(None, (p.strip() for p in app.config['WARMUP_PATHS'].split(','))):
+        start = time.perf_counter()
+        response = client.get(path)
+        timings[path] = (response.status_code, round((time.perf_counter() - start) * 1000, 3))
+    return timings
+
+
+@click.command('init-db')
+@click.option('--sample-data/--no-sample-data', default=True, help='Add the default accounts and courses.')
+def init_db_command(sample_data):
+    """Create the database tables and, if empty, the sample data."""
+    from models import db, upgrade_schema
+    db.create_all()
+    click.echo('✓ Tables created')
+    for column in upgrade_schema():
+        click.echo(f'✓ Column {column} added')
+    if sample_data:
+        from setup_db import create_sample_data
+        create_sample_data()
+
+
+@click.command('warmup')
+def warmup_command():
+    """Serve the warm-up requests once and report their timings."""
+    from flask import current_app
+    for path, (status, elapsed) in warm_up(current_app).items():
+        click.echo(f'{path}: {status} in {elapsed} ms')
+
 
 if __name__ == '__main__':
-    initialize_db()
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,8 @@
+"""
+ASGI entry point for LearnSmart
+    uvicorn asgi:app --workers 4
+"""
+
+from async_app import create_asgi_app
+
+app = create_asgi_app()
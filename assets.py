@@ -0,0 +1,144 @@
+"""
+Fingerprinted static assets for LearnSmart
+`flask --app app build-assets` copies every file under static/ to
+static/dist/ with a content hash in its name, precompresses text assets with
+gzip (and brotli when the brotli package is installed) and writes a
+manifest. Templates call asset_url() so that, once built, pages reference the
+hashed files, which are served from memory with immutable caching. In debug
+mode, or before a build, asset_url() falls back to the plain static URL.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import Response, abort, current_app, request, url_for
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip variants are built without it
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.json', '.txt', '.map')
+# File suffix per encoding, most preferred first when the client accepts several
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def fingerprint(name, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, extension = os.path.splitext(name)
+    return f'{stem}.{digest}{extension}', digest
+
+
+def build(static_folder, output_dir):
+    """Write hashed and precompressed copies of static files plus the manifest; return the manifest"""
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != output_dir)
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed, digest = fingerprint(name, data)
+
+            variants = {}
+            if filename.endswith(COMPRESSIBLE):
+                # mtime=0 keeps the gzip output byte-for-byte reproducible
+                variants['gzip'] = gzip.compress(data, 9, mtime=0)
+                if brotli is not None:
+                    variants['br'] = brotli.compress(data, quality=11)
+            # A variant that is not smaller than the original is not worth serving
+            variants = {e: body for e, body in variants.items() if len(body) < len(data)}
+
+            target = os.path.join(output_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            for encoding, body in variants.items():
+                with open(target + ENCODINGS[encoding], 'wb') as f:
+                    f.write(body)
+            manifest[name] = {'path': hashed, 'hash': digest, 'encodings': sorted(variants)}
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetStore:
+    """The built manifest plus every variant's bytes, keyed by hashed path"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.manifest = {}
+        self.files = {}
+        path = os.path.join(output_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            self.manifest = json.load(f)
+        for name, entry in self.manifest.items():
+            target = os.path.join(output_dir, entry['path'])
+            variants = {}
+            for encoding in ['identity'] + entry['encodings']:
+                with open(target + ENCODINGS.get(encoding, ''), 'rb') as f:
+                    variants[encoding] = f.read()
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            self.files[entry['path']] = (mimetype, entry['hash'], variants)
+
+    def url_for(self, filename):
+        entry = self.manifest.get(filename)
+        if entry is None or current_app.debug:
+            return url_for('static', filename=filename)
+        return url_for('asset', filename=entry['path'])
+
+
+def serve_asset(filename):
+    store = current_app.extensions['assets']
+    if filename not in store.files:
+        abort(404)
+    mimetype, digest, variants = store.files[filename]
+
+    encoding = 'identity'
+    for candidate in ENCODINGS:
+        if candidate in variants and request.accept_encodings[candidate] > 0:
+            encoding = candidate
+            break
+
+    response = Response(variants[encoding], mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.set_etag(f'{digest}-{encoding}')
+    return response.make_conditional(request)
+
+
+@click.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress the files under static/."""
+    output_dir = current_app.config['ASSETS_DIR']
+    manifest = build(current_app.static_folder, output_dir)
+    for name, entry in sorted(manifest.items()):
+        click.echo(f"{name} -> {entry['path']} ({', '.join(entry['encodings']) or 'uncompressed'})")
+    if brotli is None:
+        click.echo('brotli is not installed; only gzip variants were built')
+
+
+def init_assets(app):
+    """Load the built manifest and register asset_url() and the /assets route"""
+    store = AssetStore(app.config['ASSETS_DIR'])
+    app.extensions['assets'] = store
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
+    app.add_template_global(store.url_for, 'asset_url')
+    app.cli.add_command(build_assets_command)
+    return store
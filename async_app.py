@@ -0,0 +1,598 @@
+"""
+Async serving for LearnSmart
+An ASGI application around the Flask app. The read-heavy learner and catalog
+endpoints are served on the event loop: their queries run through
+SQLAlchemy's async engine (aiosqlite for SQLite, aiomysql/asyncpg for MySQL
+and PostgreSQL) and the CPU-bound ai_features work runs on a small thread
+pool, so a request waiting on the database holds a coroutine, not a worker
+thread. Event streams wait on the loop as well. Every other route is handed
+unchanged to the Flask app on a bounded thread pool.
+
+    pip install "sqlalchemy[asyncio]" aiosqlite uvicorn
+    uvicorn asgi:app --workers 4
+
+Native routes reuse the query builders and serializers in routes.py, answer
+with the same JSON, and are recorded in the request metrics under their
+Flask endpoint names. Flask hooks (profiling, query budgets) apply only to
+routes served by Flask.
+"""
+
+import asyncio
+import contextvars
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qsl
+
+from flask_jwt_extended import decode_token
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_accept_header
+from werkzeug.routing import Map, Rule
+
+from cache import user_version_query
+from calibration import expected_scores_from_rows, expected_scores_query, set_expected_scores
+from events import format_event
+from models import db, User, Course, Lesson, Quiz, Enrollment, LessonProgress, QuizAttempt
+from read_models import CourseRead, EnrollmentRead, QuizAttemptRead
+from recommendations import INTERESTS, stored_recommendation_queries
+from routes import (
+    course_count_queries, dashboard_queries, dashboard_to_dict, insights_to_dict, bootstrap_to_dict,
+    catalog_course_dicts, live_catalog_recommendations
+)
+
+# Async driver per database backend
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+# Returned by a handler to let the Flask app answer instead (e.g. missing or bad token)
+FALLBACK = object()
+
+# [statements, sql_seconds] of the request being served by the current task
+_request_sql = contextvars.ContextVar('asgi_request_sql', default=None)
+
+
+def async_database_url(url):
+    """The async-driver equivalent of a synchronous SQLAlchemy URL"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def wsgi_environ(scope, body):
+    """Build a PEP 3333 environ for an ASGI HTTP scope"""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf8').decode('latin1'),
+        'PATH_INFO': path.encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name in ('content-type', 'content-length'):
+            key = name.upper().replace('-', '_')
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.asgi_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counters = _request_sql.get()
+    if counters is not None:
+        counters[0] += 1
+        counters[1] += time.perf_counter() - context.asgi_start
+
+
+class AsyncRequest:
+    """The parts of an ASGI HTTP scope the native handlers read"""
+
+    __slots__ = ('method', 'path', 'headers', 'args')
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = Headers([(k.decode('latin1'), v.decode('latin1')) for k, v in scope['headers']])
+        self.args = dict(parse_qsl(scope['query_string'].decode('latin1')))
+
+
+class EventStream:
+    """Handler result for a text/event-stream response fed by an async generator"""
+
+    def __init__(self, frames):
+        self.frames = frames
+
+
+class AsyncApp:
+    """ASGI callable: native async handlers for hot reads, the Flask app for everything else"""
+
+    # Flask endpoint -> AsyncApp method serving it on the event loop
+    NATIVE_ENDPOINTS = {
+        'courses.get_courses': 'get_courses',
+        'courses.get_course': 'get_course',
+        'courses.get_courses_by_category': 'get_courses_by_category',
+        'learner.get_dashboard': 'get_dashboard',
+        'learner.get_bootstrap': 'get_bootstrap',
+        'learner.stream_events': 'stream_events',
+        'ai.get_user_insights': 'get_user_insights',
+        'ai.summarize_course': 'summarize_course',
+    }
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+
+        with flask_app.app_context():
+            # Flask-SQLAlchemy has already resolved relative SQLite paths
+            url = make_url(config.get('ASYNC_DATABASE_URL') or async_database_url(db.engine.url))
+        options = dict(config.get('ASYNC_ENGINE_OPTIONS') or {})
+        if url.database not in (None, '', ':memory:'):
+            options.setdefault('pool_size', config.get('ASYNC_POOL_SIZE', 20))
+            options.setdefault('max_overflow', config.get('ASYNC_MAX_OVERFLOW', 20))
+        self.engine = create_async_engine(url, **options)
+        event.listen(self.engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(self.engine.sync_engine, 'after_cursor_execute', after_cursor_execute)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        self.ai_executor = ThreadPoolExecutor(config.get('ASYNC_AI_WORKERS', 4), thread_name_prefix='asgi-ai')
+        self.wsgi_executor = ThreadPoolExecutor(config.get('ASYNC_WSGI_WORKERS', 16), thread_name_prefix='asgi-wsgi')
+
+        # Same rules as the blueprints, so native and Flask routing cannot drift apart
+        self.url_map = Map([
+            Rule(rule.rule, endpoint=rule.endpoint, methods=rule.methods)
+            for rule in flask_app.url_map.iter_rules() if rule.endpoint in self.NATIVE_ENDPOINTS
+        ])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        try:
+            endpoint, kwargs = self.url_map.bind('localhost').match(scope['path'], scope['method'])
+        except HTTPException:
+            # 404s, 405s and slash redirects are answered exactly as Flask answers them
+            await self.call_flask(scope, receive, send)
+            return
+
+        request = AsyncRequest(scope)
+        handler = getattr(self, self.NATIVE_ENDPOINTS[endpoint])
+        metrics = self.flask_app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.request_started()
+        counters = [0, 0.0]
+        token = _request_sql.set(counters)
+        start = time.perf_counter()
+        try:
+            try:
+                result = await handler(request, **kwargs)
+            except Exception as e:
+                self.flask_app.logger.exception('Error in %s', endpoint)
+                result = {'error': str(e)}, 500
+            if result is FALLBACK:
+                await self.call_flask(scope, receive, send)
+                return
+
+            if isinstance(result, EventStream):
+                status, size = 200, None
+                record = partial(self.send_stream, receive, send, result.frames, request)
+            else:
+                payload, status = result if isinstance(result, tuple) else (result, 200)
+                body, headers = self.encode_json(request, payload)
+                size = len(body)
+                record = partial(self.send_body, send, status, headers, body)
+            if metrics is not None:
+                metrics.record(endpoint, request.method, status, time.perf_counter() - start,
+                               counters[0], counters[1], size)
+            await record()
+        finally:
+            _request_sql.reset(token)
+            if metrics is not None:
+                metrics.request_finished()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        await self.engine.dispose()
+        self.ai_executor.shutdown(wait=False)
+        self.wsgi_executor.shutdown(wait=False)
+
+    # Responses
+
+    def encode_json(self, request, payload):
+        """Serialize like jsonify (unless already bytes), then compress and add CORS as the Flask hooks would"""
+        body = payload if isinstance(payload, bytes) else self.flask_app.json.response(payload).get_data()
+        headers = [(b'content-type', b'application/json')]
+        if 'Origin' in request.headers:
+            headers.append((b'access-control-allow-origin', b'*'))
+
+        compressor = self.flask_app.extensions.get('compression')
+        if compressor is not None and len(body) >= compressor.min_size:
+            headers.append((b'vary', b'Accept-Encoding'))
+            encoding = compressor.choose_encoding(parse_accept_header(request.headers.get('Accept-Encoding')))
+            if encoding is not None:
+                compressed = compressor.compress(body, encoding)
+                if len(compressed) < len(body):
+                    compressor.count(encoding, len(body), len(compressed))
+                    body = compressed
+                    headers.append((b'content-encoding', encoding.encode()))
+        headers.append((b'content-length', str(len(body)).encode()))
+        return body, headers
+
+    async def send_body(self, send, status, headers, body):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def send_stream(self, receive, send, frames, request):
+        headers = [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]
+        if 'Origin' in request.headers:
+            headers.append((b'access-control-allow-origin', b'*'))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            while True:
+                frame = asyncio.ensure_future(frames.__anext__())
+                await asyncio.wait({frame, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not frame.done():
+                    # Cancelling the pending frame closes the generator and its subscription
+                    frame.cancel()
+                    await asyncio.wait({frame})
+                    return
+                try:
+                    data = frame.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': data.encode(), 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            disconnected.cancel()
+            await frames.aclose()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # Flask fallback
+
+    async def call_flask(self, scope, receive, send):
+        """Run the request through the Flask app on the WSGI thread pool"""
+        body = io.BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await loop.run_in_executor(self.wsgi_executor, self.run_wsgi, scope, body, send, loop, disconnected)
+        finally:
+            disconnected.cancel()
+
+    def run_wsgi(self, scope, body, send, loop, disconnected):
+        """Runs on a WSGI pool thread; streams each chunk back to the event loop"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin1'), value.encode('latin1'))
+                                  for name, value in headers]
+
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        chunks = self.flask_app(wsgi_environ(scope, body), start_response)
+        try:
+            emit({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            for chunk in chunks:
+                if disconnected.done():
+                    break
+                if chunk:
+                    emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            emit({'type': 'http.response.body'})
+        finally:
+            # Closing runs call_on_close callbacks and ends streamed generators
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    # Helpers for native handlers
+
+    def identity(self, request, query_string=False):
+        """The JWT identity of the request, or None to let Flask produce its auth error"""
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not token:
+            token = request.args.get(self.flask_app.config['JWT_QUERY_STRING_NAME']) if query_string else None
+        if not token:
+            return None
+        try:
+            with self.flask_app.app_context():
+                claims = decode_token(token)
+        except Exception:
+            return None
+        if claims.get('type') != 'access':
+            return None
+        return claims[self.flask_app.config['JWT_IDENTITY_CLAIM']]
+
+    async def run_cpu(self, function, *args):
+        """Run CPU-bound work (ai_features) off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self.ai_executor, partial(function, *args))
+
+    async def wait_for_own_writes(self, user_id):
+        queue = self.flask_app.extensions.get('write_behind')
+        if queue:
+            await asyncio.get_running_loop().run_in_executor(self.wsgi_executor, queue.wait_for_user, user_id)
+
+    async def course_counts(self, session, course_ids):
+        if not course_ids:
+            return {}, {}
+        lessons_query, enrollments_query = course_count_queries(course_ids)
+        return (dict((await session.execute(lessons_query)).all()),
+                dict((await session.execute(enrollments_query)).all()))
+
+    async def load_catalog(self):
+        async with self.sessions() as session:
+            courses = (await session.scalars(select(Course))).all()
+            lesson_counts, enrollment_counts = await self.course_counts(session, [c.id for c in courses])
+        return courses, lesson_counts, enrollment_counts
+
+    async def courses_to_dicts(self, session, courses):
+        lesson_counts, enrollment_counts = await self.course_counts(session, list({c.id for c in courses}))
+        return [course.to_dict(lesson_count=lesson_counts.get(course.id, 0),
+                               enrollment_count=enrollment_counts.get(course.id, 0))
+                for course in courses]
+
+    async def recommended_course_dicts(self, user, enrollments, courses, lesson_counts, enrollment_counts):
+        """routes.recommended_course_dicts over a loaded catalog: stored list while fresh, else scored live"""
+        async with self.sessions() as session:
+            stored = None
+            if self.flask_app.config.get('RECOMMENDATIONS_PRECOMPUTED', True):
+                status_query, rows_query = stored_recommendation_queries(user.id, INTERESTS)
+                stale = await session.scalar(status_query)
+                if stale is not None and not stale:
+                    stored = (await session.execute(rows_query)).all()
+            recommended = ([course for course, _, _ in stored] if stored is not None
+                           else live_catalog_recommendations(user, enrollments, courses))
+            courses_data = catalog_course_dicts(recommended, lesson_counts, enrollment_counts)
+            scores = {}
+            if courses_data:
+                scores = expected_scores_from_rows((await session.execute(
+                    expected_scores_query(user.id, [course['id'] for course in courses_data])
+                )).all())
+        return set_expected_scores(courses_data, scores)
+
+    async def cached_user_payload(self, entity, user_id, build):
+        """Like cache.cached_user_json: bytes cached under the user's version, else await build()"""
+        cache = self.flask_app.extensions.get('cache')
+        if cache is None:
+            return await build()
+        async with self.sessions() as session:
+            version = await session.scalar(user_version_query(user_id)) or 0
+        key, body = cache.lookup(entity, user_id, version)
+        if body is not None:
+            return body
+        result = await build()
+        if isinstance(result, tuple):
+            return result  # errors are not cached
+        body = self.flask_app.json.response(result).get_data()
+        cache.store(key, body)
+        return body
+
+    # Native handlers, one per entry in NATIVE_ENDPOINTS
+
+    def catalog_snapshot(self):
+        store = self.flask_app.extensions.get('catalog')
+        return store.current() if store is not None else None
+
+    async def get_courses(self, request):
+        # Same shared catalog snapshot as the Flask route
+        snapshot = self.catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.courses_json()
+        async with self.sessions() as session:
+            courses = CourseRead.from_rows(await session.execute(CourseRead.select()))
+            return await self.courses_to_dicts(session, courses)
+
+    async def get_courses_by_category(self, request, category):
+        snapshot = self.catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.category_json(category)
+        async with self.sessions() as session:
+            courses = CourseRead.from_rows(await session.execute(CourseRead.select(Course.category == category)))
+            return await self.courses_to_dicts(session, courses)
+
+    async def get_course(self, request, course_id):
+        # Same payload cache entries as the Flask route
+        cache = self.flask_app.extensions.get('cache')
+        if cache is not None:
+            key, body = cache.lookup('course', course_id)
+            if body is not None:
+                return body
+        async with self.sessions() as session:
+            course = await session.get(Course, course_id)
+            if not course:
+                return {'error': 'Course not found'}, 404
+            lessons = (await session.scalars(select(Lesson).where(Lesson.course_id == course_id))).all()
+            quizzes = (await session.scalars(select(Quiz).where(Quiz.course_id == course_id))).all()
+            _, enrollment_counts = await self.course_counts(session, [course_id])
+
+        course_data = course.to_dict(lesson_count=len(lessons), enrollment_count=enrollment_counts.get(course_id, 0))
+        course_data['lessons'] = [lesson.to_dict() for lesson in lessons]
+        course_data['quizzes'] = [quiz.to_dict() for quiz in quizzes]
+        if cache is None:
+            return course_data
+        body = self.flask_app.json.response(course_data).get_data()
+        cache.store(key, body)
+        return body
+
+    async def get_dashboard(self, request):
+        user_id = self.identity(request)
+        if user_id is None:
+            return FALLBACK
+        await self.wait_for_own_writes(user_id)
+
+        async def build():
+            enrollments_query, attempts_query, totals_query = dashboard_queries(user_id)
+            async with self.sessions() as session:
+                enrollments = EnrollmentRead.from_rows(await session.execute(enrollments_query))
+                recent_attempts = QuizAttemptRead.from_rows(await session.execute(attempts_query))
+                quiz_totals = (await session.execute(totals_query)).one()
+                lesson_counts, enrollment_counts = await self.course_counts(
+                    session, [e.course_id for e in enrollments])
+            return dashboard_to_dict(enrollments, recent_attempts, quiz_totals, lesson_counts, enrollment_counts)
+
+        return await self.cached_user_payload('dashboard', user_id, build)
+
+    async def load_learner(self, user_id, lesson_loader):
+        """The user, their enrollments (course and lessons loaded), attempts and progress"""
+        async with self.sessions() as session:
+            user = await session.get(User, user_id)
+            if not user:
+                return None
+            enrollments = (await session.scalars(
+                select(Enrollment).options(joinedload(Enrollment.course).options(lesson_loader))
+                .where(Enrollment.user_id == user_id)
+            )).all()
+            quiz_attempts = (await session.scalars(select(QuizAttempt).where(QuizAttempt.user_id == user_id))).all()
+            lesson_progress = (await session.scalars(
+                select(LessonProgress).where(LessonProgress.user_id == user_id)
+            )).all()
+        return user, enrollments, quiz_attempts, lesson_progress
+
+    async def get_bootstrap(self, request):
+        """The learner's rows and the catalog load concurrently on two connections"""
+        user_id = self.identity(request)
+        if user_id is None:
+            return FALLBACK
+        await self.wait_for_own_writes(user_id)
+
+        learner, catalog = await asyncio.gather(
+            self.load_learner(user_id, selectinload(Course.lessons).load_only(Lesson.id)),
+            self.load_catalog()
+        )
+        if learner is None:
+            return {'error': 'User not found'}, 404
+        user, enrollments = learner[:2]
+        recommendations = await self.recommended_course_dicts(user, enrollments, *catalog)
+        return await self.run_cpu(bootstrap_to_dict, *learner, *catalog, recommendations)
+
+    async def get_user_insights(self, request):
+        user_id = self.identity(request)
+        if user_id is None:
+            return FALLBACK
+        await self.wait_for_own_writes(user_id)
+
+        async def build():
+            learner = await self.load_learner(user_id, selectinload(Course.lessons))
+            if learner is None:
+                return {'error': 'User not found'}, 404
+            _, enrollments, quiz_attempts, lesson_progress = learner
+            return await self.run_cpu(insights_to_dict, user_id, [e.course for e in enrollments],
+                                      quiz_attempts, lesson_progress)
+
+        return await self.cached_user_payload('insights', user_id, build)
+
+    async def summarize_course(self, request, course_id):
+        from ai_features import generate_course_summary
+        if self.identity(request) is None:
+            return FALLBACK
+
+        async with self.sessions() as session:
+            course = await session.get(Course, course_id)
+            if not course:
+                return {'error': 'Course not found'}, 404
+            lessons = (await session.scalars(select(Lesson).where(Lesson.course_id == course_id))).all()
+
+        content = course.description
+        for lesson in lessons:
+            content += " " + (lesson.content or "")
+        return {
+            'course_id': course_id,
+            'course_title': course.title,
+            'ai_summary': await self.run_cpu(generate_course_summary, content)
+        }
+
+    async def stream_events(self, request):
+        broker = self.flask_app.extensions.get('events')
+        user_id = self.identity(request, query_string=True)
+        if broker is None or user_id is None:
+            return FALLBACK
+
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        # Publishers run on WSGI threads; wake this coroutine through the loop
+        subscription = broker.subscribe(user_id, notify=lambda: loop.call_soon_threadsafe(ready.set))
+        if subscription is None:
+            return {'error': 'Too many open event streams'}, 503
+        return EventStream(self.event_frames(broker, subscription, ready))
+
+    async def event_frames(self, broker, subscription, ready):
+        heartbeat_seconds = self.flask_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    await asyncio.wait_for(ready.wait(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                ready.clear()
+                for event in subscription.drain():
+                    yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+
+def create_asgi_app(config=None):
+    """Build the Flask app and wrap it for an ASGI server"""
+    from app import create_app
+    return AsyncApp(create_app(config))
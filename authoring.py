@@ -0,0 +1,345 @@
+"""
+Course tree authoring for LearnSmart
+A whole course (its fields, lessons, and quizzes with their questions) is
+written in one request and one transaction instead of one POST per item:
+
+    {"title": "SQL", "description": "...", "category": "database",
+     "lessons": [{"title": "Joins", "content": "..."}],
+     "quizzes": [{"title": "Check", "questions": [
+         {"question_text": "...", "options": ["a", "b"], "correct_answer": 0}]}]}
+
+The tree is validated up front, and problems are reported by path, for
+example lessons[2].title. It is then written with one executemany INSERT
+per table. Quiz question counts are set by a single UPDATE ... SELECT
+COUNT over the affected quizzes.
+
+update_tree() applies the same shape to an existing course as a diff.
+Course fields that are present replace the stored ones. Lessons, quizzes
+and questions that carry an id are compared with the stored rows, and only
+those that differ are updated, in one bulk UPDATE per table. Items without
+an id are inserted. Items that are left out stay as they are; nothing is
+deleted.
+"""
+
+import json
+
+from sqlalchemy import func, insert, select, update
+
+from models import db, Course, Lesson, Quiz, Question, CourseVector
+
+# Lessons, quizzes and questions per request
+MAX_TREE_ITEMS = 5000
+
+# name: (accepted types, required for new items, default)
+COURSE_FIELDS = {
+    'title': (str, True, None),
+    'description': (str, True, None),
+    'category': (str, True, None),
+    'difficulty_level': (str, False, 'beginner'),
+    'duration_hours': ((int, float), False, 0),
+    'instructor': (str, False, ''),
+}
+LESSON_FIELDS = {
+    'title': (str, True, None),
+    'content': (str, True, None),
+    'order_index': (int, False, None),  # defaults to the lesson's position in the list; in a diff, after the course's last lesson
+    'duration_minutes': (int, False, 0),
+}
+QUIZ_FIELDS = {
+    'title': (str, True, None),
+    'description': (str, False, ''),
+    'passing_score': (int, False, 70),
+    'time_limit_minutes': (int, False, 30),
+}
+QUESTION_FIELDS = {
+    'question_text': (str, True, None),
+    'options': (list, True, None),
+    'correct_answer': (int, True, None),
+    'explanation': (str, False, ''),
+    'points': (int, False, 1),
+}
+TYPE_NAMES = {str: 'a string', int: 'an integer', list: 'a list', (int, float): 'a number'}
+
+
+class TreeError(ValueError):
+    """A course tree that cannot be written; problems lists what is wrong, by path"""
+
+    def __init__(self, problems):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+
+
+def check_item(item, fields, path, problems, diff=False, children=()):
+    """
+    Type and presence checks of one item's fields. In diff mode an item may
+    carry the id of a stored row, and then needs none of its fields.
+    """
+    prefix = f'{path}.' if path else ''
+    if not isinstance(item, dict):
+        problems.append(f'{path} must be an object')
+        return False
+    partial = diff and 'id' in item
+    for name, (types, required, _) in fields.items():
+        if name not in item:
+            if required and not partial:
+                problems.append(f'{prefix}{name} is required')
+            continue
+        value = item[name]
+        if isinstance(value, bool) or not isinstance(value, types):
+            problems.append(f'{prefix}{name} must be {TYPE_NAMES[types]}')
+    for name in sorted(item.keys() - fields.keys() - set(children) - ({'id'} if diff else set())):
+        problems.append(f'{prefix}{name} is not a known field')
+    if partial and (isinstance(item['id'], bool) or not isinstance(item['id'], int)):
+        problems.append(f'{prefix}id must be an integer')
+    return True
+
+
+def check_question(question, path, problems):
+    options = question.get('options')
+    if isinstance(options, list):
+        if not options or not all(isinstance(option, str) for option in options):
+            problems.append(f'{path}.options must be a non-empty list of strings')
+        else:
+            answer = question.get('correct_answer')
+            if isinstance(answer, int) and not 0 <= answer < len(options):
+                problems.append(f'{path}.correct_answer must index one of the {len(options)} options')
+
+
+def child_list(item, name, path, problems):
+    """item[name] as a list of items (empty when absent)"""
+    value = item.get(name, [])
+    if not isinstance(value, list):
+        problems.append(f'{path}{name} must be a list')
+        return []
+    ids = [child['id'] for child in value if isinstance(child, dict) and 'id' in child]
+    if len(ids) != len(set(ids)):
+        problems.append(f'{path}{name} lists the same id twice')
+    return value
+
+
+def validate_tree(data, diff=False):
+    """
+    Every problem with a course tree, as messages naming the offending
+    path. In diff mode the course fields are optional, and so are the
+    fields of items that carry an id.
+    """
+    problems = []
+    if not check_item(data, COURSE_FIELDS, '', problems, children=('lessons', 'quizzes')):
+        return ['The course tree must be a JSON object']
+    if diff:
+        problems = [problem for problem in problems if not problem.endswith(' is required')]
+
+    lessons = child_list(data, 'lessons', '', problems)
+    quizzes = child_list(data, 'quizzes', '', problems)
+    items = len(lessons) + len(quizzes)
+    for i, lesson in enumerate(lessons):
+        check_item(lesson, LESSON_FIELDS, f'lessons[{i}]', problems, diff)
+    for i, quiz in enumerate(quizzes):
+        path = f'quizzes[{i}]'
+        if not check_item(quiz, QUIZ_FIELDS, path, problems, diff, children=('questions',)):
+            continue
+        questions = child_list(quiz, 'questions', f'{path}.', problems)
+        items += len(questions)
+        for j, question in enumerate(questions):
+            question_path = f'{path}.questions[{j}]'
+            if check_item(question, QUESTION_FIELDS, question_path, problems, diff):
+                check_question(question, question_path, problems)
+    if items > MAX_TREE_ITEMS:
+        problems.append(f'At most {MAX_TREE_ITEMS} lessons, quizzes and questions per request')
+    return problems
+
+
+def insert_rows(model, rows, parent, new_parents=False):
+    """
+    Insert rows, children of the foreign key column parent, with one
+    statement; returns their new ids in row order. new_parents says the
+    parents were created by this transaction, so they have no other rows.
+    """
+    if not rows:
+        return []
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Batched RETURNING in parameter order
+        return db.session.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows).all()
+
+    # SQLite returns ordered ids only one row per statement, and MySQL has no
+    # RETURNING: insert with executemany and read the new ids back. Ids grow
+    # in row order within a statement, and no other writer's rows appear in
+    # between (SQLite serializes writers, MySQL reads one snapshot).
+    siblings = select(model.id).where(parent.in_({row[parent.key] for row in rows}))
+    before = set() if new_parents else set(db.session.scalars(siblings))
+    db.session.execute(insert(model), rows)
+    return [row_id for row_id in db.session.scalars(siblings.order_by(model.id)) if row_id not in before]
+
+
+def refresh_question_counts(quiz_ids):
+    """Set total_questions of quiz_ids from their questions in one UPDATE (current session)"""
+    if not quiz_ids:
+        return
+    db.session.execute(
+        update(Quiz).where(Quiz.id.in_(quiz_ids))
+        .values(total_questions=select(func.count(Question.id)).where(Question.quiz_id == Quiz.id).scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def stored_value(name, value):
+    # Options are stored as JSON text, like Question.set_options
+    return json.dumps(value) if name == 'options' else value
+
+
+def new_row(item, fields, position=None, **parent):
+    row = {name: stored_value(name, item.get(name, default)) for name, (_, _, default) in fields.items()}
+    if 'order_index' in row and row['order_index'] is None:
+        row['order_index'] = position
+    row.update(parent)
+    return row
+
+
+def insert_questions(quizzes, quiz_ids, new_quizzes=False):
+    """Insert the questions of quizzes (parallel to quiz_ids); returns their ids per quiz"""
+    rows = [new_row(question, QUESTION_FIELDS, quiz_id=quiz_id)
+            for quiz, quiz_id in zip(quizzes, quiz_ids) for question in quiz.get('questions', [])]
+    ids = iter(insert_rows(Question, rows, Question.quiz_id, new_quizzes))
+    return [[next(ids) for _ in quiz.get('questions', [])] for quiz in quizzes]
+
+
+def create_tree(data):
+    """
+    Insert a validated course tree (current session; the caller commits).
+    Returns the course and the created ids, in request order.
+    """
+    course = Course(**new_row(data, COURSE_FIELDS))
+    db.session.add(course)
+    db.session.flush()
+    db.session.add(CourseVector(course_id=course.id, stale=True))
+
+    lessons = data.get('lessons', [])
+    lesson_ids = insert_rows(Lesson, [new_row(lesson, LESSON_FIELDS, i, course_id=course.id)
+                                      for i, lesson in enumerate(lessons)], Lesson.course_id, new_parents=True)
+    quizzes = data.get('quizzes', [])
+    quiz_ids = insert_rows(Quiz, [new_row(quiz, QUIZ_FIELDS, course_id=course.id) for quiz in quizzes],
+                           Quiz.course_id, new_parents=True)
+    question_ids = insert_questions(quizzes, quiz_ids, new_quizzes=True)
+    refresh_question_counts(quiz_ids)
+    return course, {
+        'course_id': course.id,
+        'lesson_ids': lesson_ids,
+        'quizzes': [{'id': quiz_id, 'question_ids': ids} for quiz_id, ids in zip(quiz_ids, question_ids)],
+    }
+
+
+def stored_rows(model, fields, *where):
+    """{id: {field: stored value}} of the matching rows"""
+    columns = [model.id] + [getattr(model, name) for name in fields]
+    return {row[0]: dict(zip(fields, row[1:])) for row in db.session.execute(select(*columns).where(*where))}
+
+
+def diff_rows(items, stored, fields, path, problems):
+    """
+    Full rows (id plus every field) of the items whose given fields differ
+    from the stored ones. Ids missing from stored are reported as problems.
+    """
+    changed = []
+    for i, item in items:
+        current = stored.get(item['id'])
+        if current is None:
+            problems.append(f"{path}[{i}].id {item['id']} is not part of this course")
+            continue
+        row = dict(current)
+        row.update((name, stored_value(name, item[name])) for name in fields if name in item)
+        if row != current:
+            changed.append(dict(row, id=item['id']))
+    return changed
+
+
+def update_tree(course, data):
+    """
+    Apply a validated diff to course (current session; the caller commits).
+    Returns (ids in request order, {what: rows changed or created}); raises
+    TreeError, before writing anything, when an id does not belong to the
+    course or an answer would no longer index its options.
+    """
+    problems = []
+    lessons = list(enumerate(data.get('lessons', [])))
+    quizzes = list(enumerate(data.get('quizzes', [])))
+    existing_lessons = [(i, lesson) for i, lesson in lessons if 'id' in lesson]
+    existing_quizzes = [(i, quiz) for i, quiz in quizzes if 'id' in quiz]
+    existing_questions = [(f'quizzes[{i}].questions', j, quiz['id'], question)
+                          for i, quiz in existing_quizzes
+                          for j, question in enumerate(quiz.get('questions', [])) if 'id' in question]
+
+    course_values = {name: getattr(course, name) for name in COURSE_FIELDS}
+    course_changes = {name: data[name] for name in COURSE_FIELDS if name in data and data[name] != course_values[name]}
+    lesson_changes = diff_rows(existing_lessons, stored_rows(
+        Lesson, LESSON_FIELDS, Lesson.course_id == course.id, Lesson.id.in_([l['id'] for _, l in existing_lessons])
+    ) if existing_lessons else {}, LESSON_FIELDS, 'lessons', problems)
+    quiz_changes = diff_rows(existing_quizzes, stored_rows(
+        Quiz, QUIZ_FIELDS, Quiz.course_id == course.id, Quiz.id.in_([q['id'] for _, q in existing_quizzes])
+    ) if existing_quizzes else {}, QUIZ_FIELDS, 'quizzes', problems)
+
+    question_changes = []
+    if existing_questions:
+        stored = stored_rows(Question, list(QUESTION_FIELDS) + ['quiz_id'],
+                             Question.id.in_([question['id'] for *_, question in existing_questions]))
+        for path, j, quiz_id, question in existing_questions:
+            current = stored.get(question['id'])
+            if current is None or current['quiz_id'] != quiz_id:
+                problems.append(f"{path}[{j}].id {question['id']} is not a question of quiz {quiz_id}")
+                continue
+            row = dict(current)
+            row.update((name, stored_value(name, question[name])) for name in QUESTION_FIELDS if name in question)
+            if not 0 <= row['correct_answer'] < len(json.loads(row['options'] or '[]')):
+                problems.append(f'{path}[{j}].correct_answer must index one of the options')
+            elif row != current:
+                question_changes.append(dict(row, id=question['id']))
+    if problems:
+        raise TreeError(problems)
+
+    if course_changes:
+        for name, value in course_changes.items():
+            setattr(course, name, value)
+    for model, rows in ((Lesson, lesson_changes), (Quiz, quiz_changes), (Question, question_changes)):
+        if rows:
+            # Bulk UPDATE by primary key: one executemany per table
+            db.session.execute(update(model), rows)
+
+    new_lessons = [(i, lesson) for i, lesson in lessons if 'id' not in lesson]
+    # Unplaced new lessons go after the stored ones (as updated above), in request order
+    first = 0
+    if any(lesson.get('order_index') is None for _, lesson in new_lessons):
+        last = db.session.scalar(select(func.max(Lesson.order_index)).where(Lesson.course_id == course.id))
+        first = 0 if last is None else last + 1
+    created_lessons = dict(zip((i for i, _ in new_lessons), insert_rows(
+        Lesson, [new_row(lesson, LESSON_FIELDS, first + n, course_id=course.id)
+                 for n, (_, lesson) in enumerate(new_lessons)], Lesson.course_id
+    )))
+    new_quizzes = [(i, quiz) for i, quiz in quizzes if 'id' not in quiz]
+    created_quizzes = dict(zip((i for i, _ in new_quizzes), insert_rows(
+        Quiz, [new_row(quiz, QUIZ_FIELDS, course_id=course.id) for _, quiz in new_quizzes], Quiz.course_id
+    )))
+    quiz_ids = [created_quizzes.get(i) or quiz['id'] for i, quiz in quizzes]
+    new_questions = [{'questions': [question for question in quiz.get('questions', []) if 'id' not in question]}
+                     for _, quiz in quizzes]
+    created_questions = insert_questions(new_questions, quiz_ids)
+    refresh_question_counts([quiz_id for quiz_id, ids in zip(quiz_ids, created_questions) if ids])
+
+    question_ids = []
+    for (_, quiz), created in zip(quizzes, created_questions):
+        created = iter(created)
+        question_ids.append([question['id'] if 'id' in question else next(created)
+                             for question in quiz.get('questions', [])])
+    ids = {
+        'course_id': course.id,
+        'lesson_ids': [created_lessons.get(i) or lesson['id'] for i, lesson in lessons],
+        'quizzes': [{'id': quiz_id, 'question_ids': ids} for quiz_id, ids in zip(quiz_ids, question_ids)],
+    }
+    changes = {
+        'course_fields': sorted(course_changes),
+        'lessons_updated': len(lesson_changes),
+        'lessons_created': len(created_lessons),
+        'quizzes_updated': len(quiz_changes),
+        'quizzes_created': len(created_quizzes),
+        'questions_updated': len(question_changes),
+        'questions_created': sum(len(ids) for ids in created_questions),
+    }
+    return ids, changes
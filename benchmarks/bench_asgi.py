@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Compare the WSGI deployment (gunicorn, one gthread worker) with the ASGI
+deployment (uvicorn, one worker) at increasing numbers of open connections
+when every SQL statement waits on simulated database I/O. Both servers run
+as real processes against the same seeded SQLite file; the load generator
+keeps --concurrency keep-alive connections busy for --duration seconds each
+and reports throughput, latency percentiles and failed requests.
+
+    pip install gunicorn uvicorn "sqlalchemy[asyncio]" aiosqlite
+    python benchmarks/bench_asgi.py --io-wait-ms 10 --concurrency 16,64,256,1024
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from common import ROOT, load_app, seed_dataset, percentile
+
+# The default requests: a learner dashboard (5 statements) and a course page (4)
+PATHS = ('/api/learner/dashboard', '/api/courses/{course_id}')
+
+
+def io_wait(seconds):
+    """SQLite trace callback that blocks the executing thread like a network round trip"""
+    def wait(statement):
+        time.sleep(seconds)
+    return wait
+
+
+def serve(args):
+    """Child process: run one server with simulated I/O wait"""
+    from app import create_app
+    from models import db
+    from sqlalchemy import event
+
+    wait = io_wait(args.io_wait_ms / 1000.0)
+    config = {'COMPRESS_ENABLED': False}
+    if args.serve == 'asgi':
+        import aiosqlite
+
+        async def connect():
+            connection = await aiosqlite.connect(args.database)
+            await connection.set_trace_callback(wait)
+            return connection
+
+        config['ASYNC_ENGINE_OPTIONS'] = {'async_creator': connect}
+    app = create_app(config)
+    with app.app_context():
+        event.listen(db.engine, 'connect', lambda connection, record: connection.set_trace_callback(wait))
+
+    if args.serve == 'wsgi':
+        from gunicorn.app.base import BaseApplication
+
+        class Server(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', f'127.0.0.1:{args.port}')
+                self.cfg.set('workers', 1)
+                self.cfg.set('worker_class', 'gthread')
+                self.cfg.set('threads', args.threads)
+                self.cfg.set('worker_connections', args.max_connections)
+                self.cfg.set('backlog', args.max_connections)
+                self.cfg.set('loglevel', 'warning')
+
+            def load(self):
+                return app
+
+        Server().run()
+    else:
+        import uvicorn
+        from async_app import AsyncApp
+        uvicorn.run(AsyncApp(app), host='127.0.0.1', port=args.port, log_level='warning',
+                    backlog=args.max_connections, limit_concurrency=args.max_connections)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, args, database):
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), '--serve', kind, '--port', str(port),
+               '--database', database, '--io-wait-ms', str(args.io_wait_ms), '--threads', str(args.threads),
+               '--max-connections', str(max(args.concurrency) + 64)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(('127.0.0.1', port), timeout=1):
+            return process, port
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{kind} server did not start')
+
+
+async def get(reader, writer, request):
+    writer.write(request)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def connection_loop(port, requests, deadline, timeout, latencies, failures):
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        failures.append('connect')
+        return
+    try:
+        i = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status = await asyncio.wait_for(get(reader, writer, requests[i % len(requests)]), timeout)
+            if status != 200:
+                failures.append(status)
+            latencies.append((time.perf_counter() - start) * 1000)
+            i += 1
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+        failures.append('timeout or reset')
+    finally:
+        writer.close()
+
+
+async def run_load(port, requests, concurrency, duration, timeout):
+    latencies, failures = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[
+        connection_loop(port, requests[i::concurrency] or requests, deadline, timeout, latencies, failures)
+        for i in range(concurrency)
+    ])
+    wall = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'failed': len(failures),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--io-wait-ms', type=float, default=10, help='simulated database latency per statement')
+    parser.add_argument('--concurrency', type=lambda s: [int(c) for c in s.split(',')], default=[16, 64, 256, 1024],
+                        help='comma-separated numbers of open connections')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency level')
+    parser.add_argument('--timeout', type=float, default=10, help='seconds before a request counts as failed')
+    parser.add_argument('--threads', type=int, default=16, help='gthread threads of the WSGI worker')
+    parser.add_argument('--learners', type=int, default=200)
+    parser.add_argument('--servers', default='wsgi,asgi')
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    parser.add_argument('--max-connections', type=int, default=2048, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, workdir = load_app(METRICS_ENABLED='false')
+        ids = seed_dataset(app, courses=50, learners=args.learners)
+    from flask_jwt_extended import create_access_token
+    from models import User
+    with app.app_context():
+        tokens = [create_access_token(identity=user.id) for user in User.query.filter_by(role='learner')]
+    requests = [
+        (f'GET {path.format(course_id=ids["course_id"])} HTTP/1.1\r\nHost: localhost\r\n'
+         f'Authorization: Bearer {token}\r\n\r\n').encode()
+        for token in tokens for path in PATHS
+    ]
+    database = os.path.join(workdir, 'bench.db')
+
+    report = {'io_wait_ms': args.io_wait_ms, 'wsgi_threads': args.threads, 'paths': list(PATHS), 'servers': {}}
+    for kind in args.servers.split(','):
+        process, port = start_server(kind, args, database)
+        try:
+            asyncio.run(run_load(port, requests, 4, 1, args.timeout))  # warm-up
+            report['servers'][kind] = [
+                asyncio.run(run_load(port, requests, concurrency, args.duration, args.timeout))
+                for concurrency in args.concurrency
+            ]
+        finally:
+            process.terminate()
+            process.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
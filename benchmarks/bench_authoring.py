@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Authoring a course of --lessons lessons and --quizzes quizzes of
+--questions questions each: one POST per course, lesson, quiz and question
+through the admin endpoints, against a single POST /api/admin/course-trees.
+Reports requests, SQL statements and wall time (median of --runs), and
+checks that both ways store the same course. Then times one PATCH that
+edits a tenth of the lessons and questions and adds a lesson and a
+question per quiz, with its statements and what it changed.
+
+    python benchmarks/bench_authoring.py --lessons 40 --quizzes 10 --questions 20
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import time
+
+from common import load_app, auth_headers
+
+
+def course_tree(lessons, quizzes, questions):
+    return {
+        'title': 'Authored course', 'description': 'A course written in one go.', 'category': 'design',
+        'lessons': [{'title': f'Lesson {i}', 'content': f'Lesson {i} text. ' * 20, 'order_index': i}
+                    for i in range(lessons)],
+        'quizzes': [{'title': f'Quiz {i}', 'questions': [
+            {'question_text': f'Question {i}.{j}?', 'options': ['a', 'b', 'c', 'd'], 'correct_answer': j % 4}
+            for j in range(questions)
+        ]} for i in range(quizzes)],
+    }
+
+
+def post_items(client, headers, tree):
+    """The tree through the per-item endpoints; returns (requests, course id)"""
+    fields = {name: value for name, value in tree.items() if name not in ('lessons', 'quizzes')}
+    course_id = client.post('/api/admin/courses', headers=headers, json=fields).get_json()['course']['id']
+    requests = 1
+    for lesson in tree['lessons']:
+        assert client.post(f'/api/admin/courses/{course_id}/lessons', headers=headers, json=lesson).status_code == 201
+        requests += 1
+    for quiz in tree['quizzes']:
+        quiz_fields = {name: value for name, value in quiz.items() if name != 'questions'}
+        quiz_id = client.post(f'/api/admin/courses/{course_id}/quizzes', headers=headers,
+                              json=quiz_fields).get_json()['quiz']['id']
+        requests += 1
+        for question in quiz['questions']:
+            assert client.post(f'/api/admin/quizzes/{quiz_id}/questions', headers=headers,
+                               json=question).status_code == 201
+            requests += 1
+    return requests, course_id
+
+
+def post_tree(client, headers, tree):
+    response = client.post('/api/admin/course-trees', headers=headers, json=tree)
+    assert response.status_code == 201, response.get_json()
+    return 1, response.get_json()['course_id']
+
+
+def course_diff(client, headers, course_id):
+    """A PATCH body editing a tenth of the lessons and questions and adding a lesson and a question per quiz"""
+    tree = client.get(f'/api/courses/{course_id}').get_json()
+    quizzes = []
+    for quiz in tree['quizzes']:
+        questions = client.get(f"/api/learner/quiz/{quiz['id']}", headers=headers).get_json()['questions']
+        quizzes.append({'id': quiz['id'], 'questions': [
+            {'id': question['id'], 'explanation': 'Edited.'} for question in questions[::10]
+        ] + [{'question_text': 'Added?', 'options': ['a', 'b'], 'correct_answer': 1}]})
+    return {
+        'lessons': [{'id': lesson['id'], 'content': 'Edited.'} for lesson in tree['lessons'][::10]]
+        + [{'title': 'Added lesson', 'content': 'Added.'}],
+        'quizzes': quizzes,
+    }
+
+
+def stored_course(app, course_id):
+    """The course's lessons and quizzes with questions, without ids or timestamps"""
+    from models import db, Course
+    with app.app_context():
+        course = db.session.get(Course, course_id)
+        return (
+            [(lesson.title, lesson.content, lesson.order_index) for lesson in sorted(course.lessons, key=lambda l: l.id)],
+            [(quiz.title, quiz.total_questions,
+              [(question.question_text, question.options, question.correct_answer)
+               for question in sorted(quiz.questions, key=lambda q: q.id)])
+             for quiz in sorted(course.quizzes, key=lambda q: q.id)],
+        )
+
+
+def measure(app, author, tree, runs):
+    """(median ms, requests, statements, last course id) of author(client, headers, tree)"""
+    from query_budget import QueryRecorder
+
+    client = app.test_client()
+    headers = auth_headers(app, 1)
+    timings = []
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()), QueryRecorder() as recorder:
+            start = time.perf_counter()
+            requests, course_id = author(client, headers, tree)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), requests, recorder.count, course_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lessons', type=int, default=40)
+    parser.add_argument('--quizzes', type=int, default=10)
+    parser.add_argument('--questions', type=int, default=20, help='questions per quiz')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app(METRICS_ENABLED='false', CATALOG_SNAPSHOT_ENABLED='false', CACHE_BACKEND='none')
+        from models import db, User
+        with app.app_context():
+            db.session.add(User(id=1, username='admin', email='admin@example.com', password_hash='x', role='admin'))
+            db.session.commit()
+
+    from query_budget import QueryRecorder
+    tree = course_tree(args.lessons, args.quizzes, args.questions)
+    report = {'lessons': args.lessons, 'quizzes': args.quizzes, 'questions': args.quizzes * args.questions}
+    for name, author in (('per_item', post_items), ('tree', post_tree)):
+        ms, requests, statements, course_id = measure(app, author, tree, args.runs)
+        report[name] = {'ms': round(ms, 1), 'requests': requests, 'statements': statements}
+        report[name + '_course'] = course_id
+    report['same_course'] = stored_course(app, report.pop('per_item_course')) == \
+        stored_course(app, report['tree_course'])
+
+    client = app.test_client()
+    headers = auth_headers(app, 1)
+    course_id = report.pop('tree_course')
+    with contextlib.redirect_stdout(io.StringIO()):
+        patch = course_diff(client, headers, course_id)
+        with QueryRecorder() as recorder:
+            start = time.perf_counter()
+            response = client.patch(f'/api/admin/course-trees/{course_id}', headers=headers, json=patch)
+            ms = (time.perf_counter() - start) * 1000
+    assert response.status_code == 200, response.get_json()
+    report['diff'] = {'ms': round(ms, 1), 'statements': recorder.count, 'changes': response.get_json()['changes']}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Course-detail, quiz and dashboard requests against a generated dataset
+with the cache off, with the per-process memory backend and with the
+shared SQLite backend. Courses and quizzes are requested with a Zipf
+popularity, as learners do, and dashboards are refreshed by a pool of
+learners with no new activity in between; reports p50/p99 latency,
+statements per request, hit rate and cache memory, and checks that cached
+responses match uncached ones.
+
+    python benchmarks/bench_cache.py --preset small --requests 5000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, auth_headers, percentile
+
+
+def zipf_choices(ids, count, rng, exponent=1.1):
+    weights = [1 / (rank + 1) ** exponent for rank in range(len(ids))]
+    return rng.choices(ids, weights, k=count)
+
+
+def run(app, requests):
+    """Time (path, user_id) GETs; returns latencies, statements per request and the last body per request"""
+    from query_budget import QueryRecorder
+
+    client = app.test_client()
+    headers = {}
+    latencies, statements, bodies = [], 0, {}
+    for path, user_id in requests:
+        if user_id not in headers:
+            headers[user_id] = auth_headers(app, user_id)
+        with contextlib.redirect_stdout(io.StringIO()), QueryRecorder() as recorder:
+            start = time.perf_counter()
+            response = client.get(path, headers=headers[user_id])
+            latencies.append((time.perf_counter() - start) * 1000)
+        statements += recorder.count
+        bodies[(path, user_id)] = response.get_json()
+    return latencies, statements / len(requests), bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', default='small', help='generate_dataset.py preset')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per endpoint and backend')
+    parser.add_argument('--learners', type=int, default=500, help='learners refreshing their dashboards')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='learnsmart-bench-')
+    database = os.path.join(workdir, 'cache.db')
+    subprocess.run([sys.executable, os.path.join(ROOT, 'generate_dataset.py'), '--preset', args.preset,
+                    '--database', database], check=True, stdout=subprocess.DEVNULL)
+    os.environ.update(DATABASE_URL='sqlite:///' + database, METRICS_ENABLED='false', COMPRESS_ENABLED='false')
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import create_app
+        apps = {
+            'none': create_app({'CACHE_BACKEND': 'none'}),
+            'memory': create_app({'CACHE_BACKEND': 'memory'}),
+            'sqlite': create_app({'CACHE_BACKEND': 'sqlite', 'CACHE_PATH': os.path.join(workdir, 'payloads.db')}),
+        }
+
+    from models import db, Course, Quiz, Enrollment
+    with apps['none'].app_context():
+        course_ids = [course_id for (course_id,) in db.session.query(Course.id).order_by(Course.id)]
+        quiz_ids = [quiz_id for (quiz_id,) in db.session.query(Quiz.id).order_by(Quiz.id)]
+        learner_ids = [user_id for (user_id,) in db.session.query(Enrollment.user_id).distinct()
+                       .order_by(Enrollment.user_id).limit(args.learners)]
+    rng = random.Random(5)
+    workloads = {
+        'course': [(f'/api/courses/{course_id}', 2) for course_id in zipf_choices(course_ids, args.requests, rng)],
+        'quiz': [(f'/api/learner/quiz/{quiz_id}', 2) for quiz_id in zipf_choices(quiz_ids, args.requests, rng)],
+        'dashboard': [('/api/learner/dashboard', rng.choice(learner_ids)) for _ in range(args.requests)],
+    }
+
+    report = {'preset': args.preset, 'courses': len(course_ids), 'quizzes': len(quiz_ids)}
+    baseline = {}
+    for backend, app in apps.items():
+        for entity, requests in workloads.items():
+            latencies, statements, bodies = run(app, requests)
+            result = {
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'statements_per_request': round(statements, 2),
+            }
+            if backend == 'none':
+                baseline[entity] = bodies
+            else:
+                result['mismatches'] = sum(body != baseline[entity][request] for request, body in bodies.items())
+                cache = app.extensions['cache']
+                hits, misses, _ = cache.stats[entity]
+                result['hit_rate'] = round(hits / (hits + misses), 3)
+            report[f'{entity}_{backend}'] = result
+        if backend != 'none':
+            entries, size, evictions = app.extensions['cache'].backend.usage()
+            report[f'{backend}_cache'] = {'entries': entries, 'megabytes': round(size / 1e6, 2), 'evictions': evictions}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Calibrate questions from synthetic quiz attempts drawn from a known 2PL
+model and measure: loading responses from question_response, the fit
+(responses/sec, iterations), storing the results, and how well difficulty,
+discrimination and ability are recovered. Then times GET /api/learner/quiz
+with calibrations attached.
+
+    pip install numpy
+    python benchmarks/bench_calibration.py --learners 100000 --quizzes 1000
+    python benchmarks/bench_calibration.py --fit-only --learners 400000 --quizzes 1000 --attempts 5
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+
+from common import auth_headers, load_app, percentile
+
+
+def simulate(learners, quizzes, questions_per_quiz, attempts_per_learner, seed=7):
+    """True parameters and (learner, question, correct) for each simulated answer"""
+    rng = np.random.default_rng(seed)
+    n_questions = quizzes * questions_per_quiz
+    ability = rng.normal(size=learners)
+    difficulty = rng.normal(size=n_questions)
+    discrimination = np.exp(rng.normal(0, 0.3, size=n_questions))
+    taken = rng.integers(0, quizzes, size=(learners, attempts_per_learner))
+    users = np.repeat(np.arange(learners), attempts_per_learner * questions_per_quiz)
+    questions = (taken[:, :, None] * questions_per_quiz + np.arange(questions_per_quiz)).ravel()
+    expected = 1 / (1 + np.exp(-discrimination[questions] * (ability[users] - difficulty[questions])))
+    correct = rng.random(len(users)) < expected
+    return (ability, difficulty, discrimination), (users, questions, correct)
+
+
+def seed_attempts(app, learners, quizzes, questions_per_quiz, attempts_per_learner, responses):
+    """Insert learners, one course and quiz per quiz index, questions and the attempts"""
+    from models import db, User, Course, Quiz, Question, QuizAttempt, QuestionResponse
+    from sqlalchemy import insert
+
+    users, questions, correct = responses
+    per_attempt = questions_per_quiz
+    with app.app_context():
+        for start in range(0, learners, 10000):
+            db.session.execute(insert(User), [
+                {'id': i + 1, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+                for i in range(start, min(learners, start + 10000))
+            ])
+        db.session.execute(insert(Course), [{'id': i + 1, 'title': f'Course {i}', 'category': 'programming'}
+                                            for i in range(quizzes)])
+        db.session.execute(insert(Quiz), [{'id': i + 1, 'course_id': i + 1, 'title': f'Quiz {i}',
+                                           'total_questions': questions_per_quiz} for i in range(quizzes)])
+        db.session.execute(insert(Question), [
+            {'id': q + 1, 'quiz_id': q // questions_per_quiz + 1, 'question_text': f'Question {q}?',
+             'options': json.dumps(['a', 'b', 'c', 'd']), 'correct_answer': 0}
+            for q in range(quizzes * questions_per_quiz)
+        ])
+        rows, response_rows = [], []
+        for attempt_id, start in enumerate(range(0, len(users), per_attempt), start=1):
+            right = correct[start:start + per_attempt]
+            attempt_questions = [int(q) + 1 for q in questions[start:start + per_attempt]]
+            answers = {str(q): 0 if ok else 1 for q, ok in zip(attempt_questions, right)}
+            count = int(right.sum())
+            rows.append({'id': attempt_id, 'user_id': int(users[start]) + 1,
+                         'quiz_id': (attempt_questions[0] - 1) // questions_per_quiz + 1,
+                         'score': count, 'total_questions': per_attempt, 'correct_answers': count,
+                         'percentage': 100.0 * count / per_attempt, 'answers': json.dumps(answers)})
+            response_rows.extend({'attempt_id': attempt_id, 'question_id': q, 'chosen': 0 if ok else 1,
+                                  'correct': bool(ok)} for q, ok in zip(attempt_questions, right))
+            if len(rows) == 10000:
+                db.session.execute(insert(QuizAttempt), rows)
+                db.session.execute(insert(QuestionResponse), response_rows)
+                rows, response_rows = [], []
+        if rows:
+            db.session.execute(insert(QuizAttempt), rows)
+            db.session.execute(insert(QuestionResponse), response_rows)
+        db.session.commit()
+
+
+def recovery(truth, responses, result):
+    """Correlation of estimates with the simulated parameters"""
+    ability, difficulty, discrimination = truth
+    # Database ids are simulation indexes + 1
+    questions = responses.question_ids - 1
+    users = responses.user_ids - 1
+    return {
+        'difficulty_corr': round(float(np.corrcoef(result.difficulty, difficulty[questions])[0, 1]), 4),
+        'discrimination_corr': round(float(np.corrcoef(result.discrimination, discrimination[questions])[0, 1]), 4),
+        'ability_corr': round(float(np.corrcoef(result.ability, ability[users])[0, 1]), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--learners', type=int, default=20000)
+    parser.add_argument('--quizzes', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=5, help='questions per quiz')
+    parser.add_argument('--attempts', type=int, default=5, help='quiz attempts per learner')
+    parser.add_argument('--model', choices=['1pl', '2pl'], default='2pl')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--fit-only', action='store_true',
+                        help='skip the database and fit the simulated responses directly')
+    args = parser.parse_args()
+
+    truth, simulated = simulate(args.learners, args.quizzes, args.questions, args.attempts)
+    report = {'responses': len(simulated[0]), 'learners': args.learners,
+              'questions': args.quizzes * args.questions, 'model': args.model}
+
+    if args.fit_only:
+        from calibration import Responses, fit
+        users, questions, correct = simulated
+        responses = Responses(np.arange(args.learners) + 1, np.arange(args.quizzes * args.questions) + 1,
+                              users.astype(np.int32), questions.astype(np.int32), correct.astype(np.float64))
+        start = time.perf_counter()
+        result = fit(responses, args.model)
+        elapsed = time.perf_counter() - start
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            app, _ = load_app(METRICS_ENABLED='false', COMPRESS_ENABLED='false')
+        start = time.perf_counter()
+        seed_attempts(app, args.learners, args.quizzes, args.questions, args.attempts, simulated)
+        report['seed_seconds'] = round(time.perf_counter() - start, 1)
+
+        from models import db
+        from calibration import load_responses, fit, store_calibration
+        with app.app_context():
+            start = time.perf_counter()
+            responses = load_responses(db.session.connection())
+            report['load_seconds'] = round(time.perf_counter() - start, 2)
+            start = time.perf_counter()
+            result = fit(responses, args.model)
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            store_calibration(responses, result)
+            db.session.commit()
+            report['store_seconds'] = round(time.perf_counter() - start, 2)
+
+    report['fit_seconds'] = round(elapsed, 2)
+    report['responses_per_second_per_iteration'] = round(len(responses.correct) * result.iterations / elapsed)
+    report['iterations'] = result.iterations
+    report['converged'] = result.converged
+    report.update(recovery(truth, responses, result))
+
+    if not args.fit_only:
+        client = app.test_client()
+        rng = np.random.default_rng(1)
+        latencies = []
+        for _ in range(args.requests):
+            user_id = int(rng.integers(1, args.learners + 1))
+            quiz_id = int(rng.integers(1, args.quizzes + 1))
+            headers = auth_headers(app, user_id)
+            start = time.perf_counter()
+            response = client.get(f'/api/learner/quiz/{quiz_id}', headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200 and response.get_json()['expected_score'] is not None
+        report['get_quiz_p50_ms'] = round(percentile(latencies, 50), 2)
+        report['get_quiz_p99_ms'] = round(percentile(latencies, 99), 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Memory per worker process and course-list latency with the shared catalog
+snapshot, against a catalog of --courses courses with a few lessons and
+enrollments each. For each worker count, that many processes run side by
+side in each mode:
+
+- database: no snapshot; every GET /api/courses/ queries and serializes
+- process: each worker holds its own copy of the catalog (entries, list
+  and category bodies), as a per-process catalog cache would
+- snapshot: each worker maps the published snapshot file
+
+and report the memory the catalog holds in each of them once they are all
+running, as proportional set size (shared pages split between the
+processes mapping them; from /proc/self/smaps_rollup, so Linux only), plus
+the p50/p99 of their list requests. Freed heap is returned to the OS
+before measuring, so response buffers a request let go of do not count.
+
+    python benchmarks/bench_catalog.py --courses 20000 --workers 1,2,4,8
+"""
+
+import argparse
+import contextlib
+import ctypes
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import CATEGORIES, load_app, percentile
+
+MODES = ['database', 'process', 'snapshot']
+
+
+def memory():
+    """(proportional, private) bytes of this process after handing freed heap back to the OS"""
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def child(mode, requests):
+    import common  # noqa: F401  (only puts the project root on sys.path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import create_app
+        from catalog import Snapshot, current_version, snapshot_directory, snapshot_path
+        app = create_app({'CATALOG_SNAPSHOT_ENABLED': mode == 'snapshot', 'CATALOG_MAX_AGE_SECONDS': 3600})
+        client = app.test_client()
+        client.get('/api/courses/category/none')  # imports, pools and compiled SQL outside the measurement
+        before = memory()
+
+        held = None  # the process mode's copy, alive until measured
+        if mode == 'process':
+            directory = snapshot_directory(app)
+            snapshot = Snapshot(snapshot_path(directory, current_version(directory)))
+            held = (list(snapshot), bytes(snapshot.courses_json()),
+                    {category: snapshot.category_json(category) for category in snapshot.category_names})
+            del snapshot
+        latencies = []
+        for _ in range(requests if mode != 'process' else 0):
+            start = time.perf_counter()
+            response = client.get('/api/courses/')
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+            del response
+    print(json.dumps({'latencies': latencies}), flush=True)
+    # Measure once every worker of the run has loaded the catalog, and stay alive until all have measured
+    sys.stdin.readline()
+    after = memory()
+    print(json.dumps({'pss_bytes': after[0] - before[0], 'private_bytes': after[1] - before[1]}), flush=True)
+    sys.stdin.read()
+
+
+def seed_catalog(app, courses, rng):
+    """Courses, lessons and enrollments inserted in bulk (the dataset generator is built for far fewer courses)"""
+    from sqlalchemy import insert
+    from models import db, Course, Lesson, Enrollment
+
+    with app.app_context():
+        db.session.execute(insert(Course), [
+            {'id': course_id, 'title': f'Course {course_id}', 'category': rng.choice(CATEGORIES),
+             'description': f'What course {course_id} covers, in a paragraph of about this length. ' * 4,
+             'difficulty_level': rng.choice(['beginner', 'intermediate', 'advanced']),
+             'duration_hours': rng.randrange(1, 40), 'instructor': f'Instructor {course_id % 97}'}
+            for course_id in range(1, courses + 1)
+        ])
+        db.session.execute(insert(Lesson), [
+            {'course_id': course_id, 'title': f'Lesson {index}', 'content': 'Lesson text.', 'order_index': index}
+            for course_id in range(1, courses + 1) for index in range(rng.randrange(1, 8))
+        ])
+        db.session.execute(insert(Enrollment), [
+            {'user_id': user_id, 'course_id': rng.randrange(1, courses + 1)} for user_id in range(1, 5 * courses)
+        ])
+        db.session.commit()
+
+
+def run(mode, workers, requests):
+    processes = [subprocess.Popen([sys.executable, __file__, '--child', mode, '--requests', str(requests)],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(workers)]
+    latencies = [latency for process in processes for latency in json.loads(process.stdout.readline())['latencies']]
+    for process in processes:
+        process.stdin.write('measure\n')
+        process.stdin.flush()
+    results = [json.loads(process.stdout.readline()) for process in processes]
+    for process in processes:
+        process.stdin.close()
+        process.wait()
+    pss = sum(result['pss_bytes'] for result in results)
+    private = sum(result['private_bytes'] for result in results)
+    report = {'mb_per_worker': round(pss / workers / 1e6, 2), 'private_mb_per_worker': round(private / workers / 1e6, 2),
+              'host_mb': round(pss / 1e6, 2)}
+    if latencies:
+        report.update(p50_ms=round(percentile(latencies, 50), 3), p99_ms=round(percentile(latencies, 99), 3))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=20000, help='courses in the catalog')
+    parser.add_argument('--workers', default='1,2,4,8', help='comma separated worker counts')
+    parser.add_argument('--requests', type=int, default=20, help='list requests per worker')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.requests)
+        return
+
+    catalog_dir = tempfile.mkdtemp(prefix='learnsmart-catalog-')
+    with contextlib.redirect_stdout(io.StringIO()):
+        # The workers inherit the database and settings through the environment
+        app, _ = load_app(CATALOG_DIR=catalog_dir, METRICS_ENABLED='false', COMPRESS_ENABLED='false',
+                          CACHE_BACKEND='none')
+        seed_catalog(app, args.courses, random.Random(3))
+        from catalog import publish_snapshot, snapshot_path
+        with app.app_context():
+            directory = app.extensions['catalog'].directory
+            start = time.perf_counter()
+            version = publish_snapshot(directory)
+            publish_ms = (time.perf_counter() - start) * 1000
+
+    snapshot_bytes = os.path.getsize(snapshot_path(directory, version))
+    report = {'courses': args.courses, 'snapshot_mb': round(snapshot_bytes / 1e6, 2),
+              'publish_ms': round(publish_ms, 1)}
+    for workers in [int(count) for count in args.workers.split(',')]:
+        for mode in MODES:
+            report[f'{mode}_{workers}_workers'] = run(mode, workers, args.requests)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+CPU cost against bytes saved for gzip and brotli at several levels, measured
+on real API payloads (catalog, course detail with lesson content, admin user
+list) from a seeded database. Use it to pick COMPRESS_GZIP_LEVEL and
+COMPRESS_BROTLI_QUALITY.
+
+    python benchmarks/bench_compression.py --courses 200 --repeat 20
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import statistics
+import time
+
+from common import load_app, auth_headers, seed_dataset
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVELS = (1, 3, 5, 6, 7, 9)
+BROTLI_QUALITIES = (0, 1, 3, 4, 5, 7, 9, 11)
+
+
+def payloads(args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app(COMPRESS_ENABLED='false')
+        ids = seed_dataset(app, courses=args.courses, lessons_per_course=args.lessons, learners=args.learners)
+        from models import db, Lesson
+        with app.app_context():
+            # Realistic lesson bodies are paragraphs, not a single sentence
+            for lesson in Lesson.query.all():
+                lesson.content = ' '.join([lesson.content] * args.paragraphs)
+            db.session.commit()
+        client = app.test_client()
+        admin = auth_headers(app, ids['admin_id'])
+        return {
+            'GET /api/courses/': client.get('/api/courses/').get_data(),
+            'GET /api/courses/<id>': client.get(f"/api/courses/{ids['course_id']}").get_data(),
+            'GET /api/admin/users': client.get('/api/admin/users', headers=admin).get_data(),
+        }
+
+
+def measure(compress, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = compress(data)
+        timings.append(time.perf_counter() - start)
+    return len(body), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--lessons', type=int, default=8, help='lessons per course')
+    parser.add_argument('--paragraphs', type=int, default=20, help='sentences per lesson body')
+    parser.add_argument('--learners', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=15)
+    args = parser.parse_args()
+
+    codecs = [(f'gzip-{level}', lambda data, level=level: gzip.compress(data, level)) for level in GZIP_LEVELS]
+    if brotli is not None:
+        codecs += [(f'br-{quality}', lambda data, quality=quality: brotli.compress(data, quality=quality))
+                   for quality in BROTLI_QUALITIES]
+
+    report = {}
+    for label, data in payloads(args).items():
+        rows = []
+        for name, compress in codecs:
+            size, seconds = measure(compress, data, args.repeat)
+            rows.append({
+                'codec': name,
+                'bytes': size,
+                'ratio': round(len(data) / size, 2),
+                'saved_percent': round((1 - size / len(data)) * 100, 1),
+                'cpu_ms': round(seconds * 1000, 3),
+                'mb_per_second': round(len(data) / seconds / 1e6, 1),
+            })
+        report[label] = {'identity_bytes': len(data), 'codecs': rows}
+    if brotli is None:
+        report['note'] = 'brotli is not installed; only gzip levels were measured'
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
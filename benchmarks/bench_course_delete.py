@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Deleting a popular course: every dependent row removed in one transaction
+(the set-based deletes DELETE /api/admin/courses/<id> used to run) against
+the soft delete plus batched purge. The course has --learners enrollments,
+each with lesson progress and a quiz attempt with its responses. While
+each deletion runs, a writer thread keeps updating profiles; the report
+holds the deletion's timings, the longest single write-lock hold and the
+writer's p50/max latency and failures (SQLite gives up on a lock after
+its 5 s busy timeout).
+
+The soft-delete run also checks that the course, its lessons and its quiz
+are gone from the API as soon as the request returns, and that the purge
+leaves no row behind.
+
+    python benchmarks/bench_course_delete.py --learners 50000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+
+from common import load_app, auth_headers, percentile
+
+LESSONS = 10
+QUESTIONS = 10
+
+
+def seed(app, learners):
+    """One popular course (id 1) and a small one, with learners rows of each kind hanging off the first"""
+    from sqlalchemy import insert
+    from models import (
+        db, User, Course, Lesson, Quiz, Question, Enrollment, LessonProgress, QuizAttempt, QuestionResponse
+    )
+
+    with app.app_context():
+        db.session.execute(insert(User), [
+            {'id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com',
+             'password_hash': 'x', 'role': 'admin' if user_id == 1 else 'learner'}
+            for user_id in range(1, learners + 1)
+        ])
+        db.session.execute(insert(Course), [{'id': course_id, 'title': f'Course {course_id}', 'category': 'design'}
+                                            for course_id in (1, 2)])
+        db.session.execute(insert(Lesson), [{'id': lesson_id, 'course_id': 1, 'title': f'Lesson {lesson_id}'}
+                                            for lesson_id in range(1, LESSONS + 1)])
+        db.session.execute(insert(Quiz), [{'id': 1, 'course_id': 1, 'title': 'Quiz', 'total_questions': QUESTIONS}])
+        db.session.execute(insert(Question), [{'id': question_id, 'quiz_id': 1, 'question_text': '?',
+                                               'options': '["a","b"]', 'correct_answer': 0}
+                                              for question_id in range(1, QUESTIONS + 1)])
+        db.session.execute(insert(Enrollment), [{'user_id': user_id, 'course_id': 1}
+                                                for user_id in range(1, learners + 1)])
+        db.session.execute(insert(LessonProgress), [
+            {'user_id': user_id, 'lesson_id': lesson_id}
+            for user_id in range(1, learners + 1) for lesson_id in range(1, LESSONS + 1)
+        ])
+        db.session.execute(insert(QuizAttempt), [{'id': user_id, 'user_id': user_id, 'quiz_id': 1}
+                                                 for user_id in range(1, learners + 1)])
+        db.session.execute(insert(QuestionResponse), [
+            {'attempt_id': user_id, 'question_id': question_id, 'chosen': 0, 'correct': True}
+            for user_id in range(1, learners + 1) for question_id in range(1, QUESTIONS + 1)
+        ])
+        db.session.commit()
+
+
+def delete_at_once(course_id):
+    """The previous delete_course: every dependent row in one transaction"""
+    from sqlalchemy import delete, select
+    from models import (
+        db, Course, Lesson, Quiz, Question, Enrollment, LessonProgress, QuizAttempt, QuestionResponse,
+        QuestionCalibration, UserRecommendation
+    )
+
+    quiz_ids = select(Quiz.id).where(Quiz.course_id == course_id)
+    lesson_ids = select(Lesson.id).where(Lesson.course_id == course_id)
+    question_ids = select(Question.id).where(Question.quiz_id.in_(quiz_ids))
+    for statement in [
+        delete(QuestionResponse).where(QuestionResponse.question_id.in_(question_ids)),
+        delete(QuestionCalibration).where(QuestionCalibration.question_id.in_(question_ids)),
+        delete(QuizAttempt).where(QuizAttempt.quiz_id.in_(quiz_ids)),
+        delete(Question).where(Question.quiz_id.in_(quiz_ids)),
+        delete(LessonProgress).where(LessonProgress.lesson_id.in_(lesson_ids)),
+        delete(Enrollment).where(Enrollment.course_id == course_id),
+        delete(UserRecommendation).where(UserRecommendation.course_id == course_id),
+        delete(Quiz).where(Quiz.course_id == course_id),
+        delete(Lesson).where(Lesson.course_id == course_id),
+        delete(Course).where(Course.id == course_id),
+    ]:
+        db.session.execute(statement.execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+class Writer(threading.Thread):
+    """Updates a learner's profile in a loop, timing each request"""
+
+    def __init__(self, app):
+        super().__init__(daemon=True)
+        self.client = app.test_client()
+        self.headers = auth_headers(app, 2)
+        self.latencies = []
+        self.failures = 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.is_set():
+            start = time.perf_counter()
+            response = self.client.put('/api/auth/profile', headers=self.headers, json={'skill_level': 'intermediate'})
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            self.failures += response.status_code != 200
+            time.sleep(0.005)
+
+    def report(self):
+        self.done.set()
+        self.join()
+        return {'writer_p50_ms': round(percentile(self.latencies, 50), 1),
+                'writer_max_ms': round(max(self.latencies), 1), 'writer_failures': self.failures}
+
+
+def remaining_rows(app):
+    from sqlalchemy import func, select
+    from models import db, Course, Lesson, Quiz, Question, Enrollment, LessonProgress, QuizAttempt, QuestionResponse
+
+    with app.app_context():
+        return sum(db.session.scalar(select(func.count()).select_from(model.__table__))
+                   for model in (Lesson, Quiz, Question, Enrollment, LessonProgress, QuizAttempt, QuestionResponse)) \
+            + db.session.scalar(select(func.count()).select_from(Course.__table__).where(Course.__table__.c.id == 1))
+
+
+def run_at_once(learners):
+    from models import db
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app(METRICS_ENABLED='false', CATALOG_SNAPSHOT_ENABLED='false')
+        seed(app, learners)
+    writer = Writer(app)
+    writer.start()
+    time.sleep(0.2)
+    with app.app_context():
+        start = time.perf_counter()
+        delete_at_once(1)
+        elapsed = (time.perf_counter() - start) * 1000
+        db.session.remove()
+    time.sleep(0.2)
+    return {'delete_ms': round(elapsed, 1), 'longest_lock_ms': round(elapsed, 1), **writer.report(),
+            'rows_left': remaining_rows(app)}
+
+
+def run_soft(learners, batch_size):
+    from purge import purge_step
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # The purger is driven below, batch by batch, instead of by its thread
+        app, _ = load_app(METRICS_ENABLED='false', CATALOG_SNAPSHOT_ENABLED='false', COURSE_PURGE_SECONDS='3600')
+        seed(app, learners)
+    app.extensions['course_purger'] = None
+    client = app.test_client()
+    admin, learner = auth_headers(app, 1), auth_headers(app, 3)
+    writer = Writer(app)
+    writer.start()
+    time.sleep(0.2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        assert client.delete('/api/admin/courses/1', headers=admin).status_code == 200
+        request_ms = (time.perf_counter() - start) * 1000
+        hidden = {
+            'course': client.get('/api/courses/1').status_code == 404,
+            'list': all(course['id'] != 1 for course in client.get('/api/courses/').get_json()),
+            'quiz': client.get('/api/learner/quiz/1', headers=learner).status_code == 404,
+            'lesson': client.post('/api/learner/lesson-progress', headers=learner,
+                                  json={'lesson_id': 1}).status_code == 404,
+            'enroll': client.post('/api/learner/enroll/1', headers=learner).status_code == 404,
+            'my_courses': client.get('/api/learner/my-courses', headers=learner).get_json() == [],
+        }
+
+    batches = []
+    with app.app_context():
+        start = time.perf_counter()
+        while True:
+            batch_start = time.perf_counter()
+            if not purge_step(batch_size):
+                break
+            batches.append((time.perf_counter() - batch_start) * 1000)
+            time.sleep(app.config['COURSE_PURGE_PAUSE_MS'] / 1000)
+        purge_ms = (time.perf_counter() - start) * 1000
+    time.sleep(0.2)
+    return {'request_ms': round(request_ms, 1), 'purge_ms': round(purge_ms, 1), 'batches': len(batches),
+            'batch_p50_ms': round(percentile(batches, 50), 1),
+            'longest_lock_ms': round(max([request_ms] + batches), 1), **writer.report(),
+            'hidden_at_once': hidden, 'rows_left': remaining_rows(app)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--learners', type=int, default=50_000, help='enrollments of the deleted course')
+    parser.add_argument('--batch', type=int, default=1000, help='purge batch size (COURSE_PURGE_BATCH)')
+    args = parser.parse_args()
+
+    rows = args.learners * (2 + LESSONS + QUESTIONS) + LESSONS + QUESTIONS + 2
+    report = {'learners': args.learners, 'dependent_rows': rows,
+              'at_once': run_at_once(args.learners), 'soft_delete': run_soft(args.learners, args.batch)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Hold many idle Server-Sent Events streams open in one thread, then measure
+what they cost: memory per connection, threads in use, fan-out latency from
+publish() to the frame being readable, and cleanup on disconnect.
+
+    python benchmarks/bench_events.py --connections 10000
+"""
+
+import argparse
+import json
+import threading
+import time
+import tracemalloc
+
+from common import load_app, percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2500, help='distinct users the streams belong to')
+    args = parser.parse_args()
+
+    app, _ = load_app(SSE_MAX_CONNECTIONS=args.connections, METRICS_ENABLED='false')
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        tokens = [create_access_token(identity=user_id) for user_id in range(1, args.users + 1)]
+    broker = app.extensions['events']
+    client = app.test_client()
+    threads_before = threading.active_count()
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    streams = []
+    for i in range(args.connections):
+        response = client.get(f'/api/learner/events?token={tokens[i % args.users]}', buffered=False)
+        frames = iter(response.response)
+        next(frames)  # retry: line; the stream is now subscribed and idle
+        streams.append((i % args.users + 1, response, frames))
+    open_seconds = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    rejected = client.get(f'/api/learner/events?token={tokens[0]}').status_code
+
+    latencies = []
+    with app.app_context():
+        for user_id, response, frames in streams[:args.users]:
+            start = time.perf_counter()
+            broker.publish(user_id, 'progress', {'course_id': 1, 'progress_percentage': 50.0})
+            next(frames)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for _, response, _ in streams:
+        response.close()
+    close_seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        'connections': args.connections,
+        'open_seconds': round(open_seconds, 3),
+        'bytes_per_connection': round(memory / args.connections),
+        'extra_threads': threading.active_count() - threads_before,
+        'status_over_limit': rejected,
+        'publish_to_frame_p50_ms': round(percentile(latencies, 50), 4),
+        'publish_to_frame_p99_ms': round(percentile(latencies, 99), 4),
+        'close_seconds': round(close_seconds, 3),
+        'connections_after_close': broker.connections,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Item analysis of generated quizzes two ways: decoding every attempt's JSON
+answers (what per-question statistics used to require) against
+GET /api/admin/quizzes/<id>/item-analysis, which groups question_response
+rows over an index. Also times the backfill of question_response from the
+JSON answers and checks that both ways agree.
+
+    python benchmarks/bench_item_analysis.py --preset small
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, auth_headers, percentile
+
+
+def json_item_analysis(quiz_id):
+    """Per-question (responses, correct) the old way: every attempt's answers decoded"""
+    from models import db, Question, QuizAttempt
+
+    correct_answers = dict(db.session.query(Question.id, Question.correct_answer).filter_by(quiz_id=quiz_id))
+    totals = {question_id: [0, 0] for question_id in correct_answers}
+    for (answers,) in db.session.query(QuizAttempt.answers).filter_by(quiz_id=quiz_id):
+        for question_id, chosen in json.loads(answers or '{}').items():
+            total = totals.get(int(question_id))
+            if total is not None:
+                total[0] += 1
+                total[1] += chosen == correct_answers[int(question_id)]
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', default='small', help='generate_dataset.py preset')
+    parser.add_argument('--quizzes', type=int, default=50, help='quizzes to analyse')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='learnsmart-bench-')
+    database = os.path.join(workdir, 'items.db')
+    subprocess.run([sys.executable, os.path.join(ROOT, 'generate_dataset.py'), '--preset', args.preset,
+                    '--database', database], check=True, stdout=subprocess.DEVNULL)
+    os.environ.update(DATABASE_URL='sqlite:///' + database, METRICS_ENABLED='false', COMPRESS_ENABLED='false')
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import create_app
+        app = create_app()
+
+    from models import db, QuizAttempt, QuestionResponse
+    from item_analysis import backfill_responses
+    from sqlalchemy import func
+
+    report = {'preset': args.preset}
+    with app.app_context():
+        report['attempts'] = db.session.query(func.count(QuizAttempt.id)).scalar()
+        report['responses'] = db.session.query(func.count()).select_from(QuestionResponse).scalar()
+        # The most attempted quizzes are the ones worth analysing
+        quiz_ids = [quiz_id for quiz_id, _ in db.session.query(QuizAttempt.quiz_id, func.count())
+                    .group_by(QuizAttempt.quiz_id).order_by(func.count().desc()).limit(args.quizzes)]
+
+        json_latencies, json_results = [], {}
+        for quiz_id in quiz_ids:
+            start = time.perf_counter()
+            json_results[quiz_id] = json_item_analysis(quiz_id)
+            json_latencies.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+
+    client = app.test_client()
+    headers = auth_headers(app, 1)
+    latencies = []
+    mismatches = 0
+    for quiz_id in quiz_ids:
+        start = time.perf_counter()
+        response = client.get(f'/api/admin/quizzes/{quiz_id}/item-analysis', headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+        for item in response.get_json()['questions']:
+            responses, correct = json_results[quiz_id][item['question_id']]
+            if item['responses'] != responses or (responses and abs(item['p_value'] - correct / responses) > 1e-4):
+                mismatches += 1
+
+    report['json_p50_ms'] = round(percentile(json_latencies, 50), 2)
+    report['item_analysis_p50_ms'] = round(percentile(latencies, 50), 2)
+    report['item_analysis_p99_ms'] = round(percentile(latencies, 99), 2)
+    report['mismatched_questions'] = mismatches
+
+    with app.app_context():
+        db.session.query(QuestionResponse).delete()
+        db.session.commit()
+        start = time.perf_counter()
+        backfill_responses()
+        elapsed = time.perf_counter() - start
+        report['backfill_seconds'] = round(elapsed, 2)
+        report['backfill_attempts_per_second'] = round(report['attempts'] / elapsed)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
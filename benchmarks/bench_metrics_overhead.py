@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of request instrumentation on the catalog endpoint by
+timing GET /api/courses/ on one app with METRICS_ENABLED on, taking the
+metrics middleware out and putting it back between short blocks of
+requests. Alternating which goes first each round cancels out drift, and
+one app for both sides leaves nothing but the middleware between them;
+the overhead is the median of the per-round differences. Exits non-zero
+when it is over --budget percent. The SQL listeners are registered on the
+Engine class for the whole process, so both sides run them.
+
+Every --scrape-every rounds the script renders the metrics, untimed, as a
+Prometheus scrape of /api/admin/metrics would: requests only queue their
+observations, and the scrape buckets them into the histograms.
+
+    python benchmarks/bench_metrics_overhead.py --rounds 1500 --block 20
+
+Pass --control to leave the middleware out on both sides; its overhead
+shows the noise floor of the machine.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import time
+
+from common import load_app
+
+
+def make_client(courses):
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app(METRICS_ENABLED='true')
+    from models import db, Course, Lesson
+
+    with app.app_context():
+        for i in range(courses):
+            course = Course(title=f'Course {i}', description='Benchmark course', category='programming')
+            db.session.add(course)
+            db.session.flush()
+            db.session.add(Lesson(course_id=course.id, title='Intro', content=''))
+        db.session.commit()
+    return app.test_client()
+
+
+def time_block(client, requests):
+    """Mean ms per request over a block of requests"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get('/api/courses/')
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=1500)
+    parser.add_argument('--block', type=int, default=20, help='requests per side per round')
+    parser.add_argument('--courses', type=int, default=20)
+    parser.add_argument('--scrape-every', type=int, default=50, help='rounds between metrics scrapes')
+    parser.add_argument('--budget', type=float, default=2.0, help='maximum overhead in percent')
+    parser.add_argument('--control', action='store_true', help='leave the middleware out on both sides')
+    args = parser.parse_args()
+
+    client = make_client(args.courses)
+    app = client.application
+    registry = app.extensions['metrics']
+    middleware = app.wsgi_app
+
+    def timed(enabled):
+        app.wsgi_app = middleware if enabled and not args.control else middleware.wsgi_app
+        return time_block(client, args.block)
+
+    rounds = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        timed(False), timed(True)
+        for round_no in range(args.rounds):
+            if round_no % 2 == 0:
+                off, on = timed(False), timed(True)
+            else:
+                on, off = timed(True), timed(False)
+            rounds.append((off, on))
+            if round_no % args.scrape_every == args.scrape_every - 1:
+                registry.render()
+
+    overheads = sorted((on - off) / off * 100 for off, on in rounds)
+    overhead = statistics.median(overheads)
+    print(json.dumps({
+        'endpoint': 'GET /api/courses/',
+        'instrumented': not args.control,
+        'rounds': args.rounds,
+        'baseline_median_ms': round(statistics.median(off for off, _ in rounds), 4),
+        'instrumented_median_ms': round(statistics.median(on for _, on in rounds), 4),
+        'overhead_percent': round(overhead, 2),
+        'overhead_iqr_percent': [round(overheads[len(overheads) // 4], 2),
+                                 round(overheads[3 * len(overheads) // 4], 2)],
+        'within_budget': overhead < args.budget,
+    }, indent=2))
+    sys.exit(0 if overhead < args.budget else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Full ORM hydration vs the read models for large read-only responses: --rows
+users (GET /api/admin/users) and --rows courses with their counts (the
+course list without the catalog snapshot). For each, times loading plus
+to_dict() plus JSON encoding (median of --runs, each in a fresh session),
+measures the memory the loaded rows hold and the peak while serializing
+(tracemalloc), checks that both paths produce the same dicts, and times
+the endpoint itself.
+
+    python benchmarks/bench_read_models.py --rows 100000
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import statistics
+import time
+import tracemalloc
+
+from common import CATEGORIES, load_app, auth_headers
+
+
+def seed(app, rows):
+    from sqlalchemy import insert
+    from models import db, User, Course, Lesson, Enrollment
+
+    with app.app_context():
+        db.session.execute(insert(User), [
+            {'id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com',
+             'password_hash': 'x', 'role': 'admin' if user_id == 1 else 'learner',
+             'interests': json.dumps(CATEGORIES[user_id % 5:user_id % 5 + 2]), 'skill_level': 'beginner'}
+            for user_id in range(1, rows + 1)
+        ])
+        db.session.execute(insert(Course), [
+            {'id': course_id, 'title': f'Course {course_id}', 'category': CATEGORIES[course_id % len(CATEGORIES)],
+             'description': f'What course {course_id} covers, in a sentence or two.',
+             'difficulty_level': 'beginner', 'duration_hours': course_id % 40, 'instructor': 'Instructor'}
+            for course_id in range(1, rows + 1)
+        ])
+        db.session.execute(insert(Lesson), [
+            {'course_id': course_id, 'title': 'Lesson', 'content': 'Lesson text.'} for course_id in range(1, rows + 1, 3)
+        ])
+        db.session.execute(insert(Enrollment), [
+            {'user_id': user_id, 'course_id': user_id % rows + 1} for user_id in range(1, rows + 1)
+        ])
+        db.session.commit()
+
+
+def orm_users():
+    from models import User
+    return User.query.all()
+
+
+def read_users():
+    from read_models import UserRead, read
+    return read(UserRead)
+
+
+def orm_courses():
+    from models import Course
+    return Course.query.all()
+
+
+def read_courses():
+    from read_models import CourseRead, read
+    return read(CourseRead)
+
+
+def users_to_dicts(users):
+    return [user.to_dict() for user in users]
+
+
+def measure(app, load, serialize, runs):
+    """(median seconds, loaded rows' bytes, peak bytes, dicts) for load + serialize + encode"""
+    from models import db
+
+    timings = []
+    for _ in range(runs):
+        with app.app_context():
+            gc.collect()
+            start = time.perf_counter()
+            app.json.dumps(serialize(load()))
+            timings.append(time.perf_counter() - start)
+            db.session.remove()
+
+    with app.app_context():
+        gc.collect()
+        tracemalloc.start()
+        rows = load()
+        held, _ = tracemalloc.get_traced_memory()
+        dicts = serialize(rows)
+        app.json.dumps(dicts)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        db.session.remove()
+    return statistics.median(timings), held, peak, dicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help='users and courses in the dataset')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app(METRICS_ENABLED='false', COMPRESS_ENABLED='false', CATALOG_SNAPSHOT_ENABLED='false')
+        seed(app, args.rows)
+    from routes import courses_to_dicts
+
+    report = {'rows': args.rows}
+    workloads = {
+        'users': (orm_users, read_users, users_to_dicts, '/api/admin/users'),
+        'courses': (orm_courses, read_courses, courses_to_dicts, '/api/courses/'),
+    }
+    client = app.test_client()
+    headers = auth_headers(app, 1)
+    for name, (orm_load, read_load, serialize, path) in workloads.items():
+        orm_seconds, orm_held, orm_peak, orm_dicts = measure(app, orm_load, serialize, args.runs)
+        read_seconds, read_held, read_peak, read_dicts = measure(app, read_load, serialize, args.runs)
+        endpoint = []
+        for _ in range(args.runs):
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                assert client.get(path, headers=headers).status_code == 200
+                endpoint.append(time.perf_counter() - start)
+        report[name] = {
+            'orm_ms': round(orm_seconds * 1000, 1),
+            'read_model_ms': round(read_seconds * 1000, 1),
+            'orm_rows_mb': round(orm_held / 1e6, 1),
+            'read_model_rows_mb': round(read_held / 1e6, 1),
+            'orm_peak_mb': round(orm_peak / 1e6, 1),
+            'read_model_peak_mb': round(read_peak / 1e6, 1),
+            'endpoint_ms': round(statistics.median(endpoint) * 1000, 1),
+            'identical': orm_dicts == read_dicts,
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Precompute every learner's recommendation lists with the batch job, check
+that the stored lists match live scoring for every learner, and compare
+endpoint latency when serving stored rows against scoring live. Finally
+enroll one learner and time how long the background refresher takes to
+serve fresh lists again.
+
+    python benchmarks/bench_recommendations.py --learners 2000 --courses 200
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+
+from common import load_app, seed_dataset, auth_headers, percentile
+
+PATHS = ('/api/learner/recommendations', '/api/ai/personalized-path')
+
+
+def timed_gets(client, headers_by_user, path):
+    latencies, bodies = [], {}
+    for user_id, headers in headers_by_user.items():
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        bodies[user_id] = response.get_json()
+    return latencies, bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--learners', type=int, default=500)
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--shard-size', type=int, default=250)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app(METRICS_ENABLED='false', COMPRESS_ENABLED='false', RECOMMENDATIONS_REFRESH_SECONDS=0.2)
+        ids = seed_dataset(app, courses=args.courses, learners=args.learners)
+    from recommendations import refresh_all
+    from models import db, RecommendationStatus
+
+    with app.app_context():
+        start = time.perf_counter()
+        count = refresh_all(args.processes, args.shard_size)
+        batch_seconds = time.perf_counter() - start
+
+    client = app.test_client()
+    headers_by_user = {user_id: auth_headers(app, user_id) for user_id in ids['learner_ids']}
+    report = {'learners': count, 'courses': args.courses, 'batch_seconds': round(batch_seconds, 2),
+              'users_per_second': round(count / batch_seconds), 'endpoints': {}}
+    for path in PATHS:
+        stored_latencies, stored = timed_gets(client, headers_by_user, path)
+        app.config['RECOMMENDATIONS_PRECOMPUTED'] = False
+        live_latencies, live = timed_gets(client, headers_by_user, path)
+        app.config['RECOMMENDATIONS_PRECOMPUTED'] = True
+        report['endpoints'][path] = {
+            'stored_p50_ms': round(percentile(stored_latencies, 50), 2),
+            'stored_p95_ms': round(percentile(stored_latencies, 95), 2),
+            'live_p50_ms': round(percentile(live_latencies, 50), 2),
+            'live_p95_ms': round(percentile(live_latencies, 95), 2),
+            'mismatched_learners': sum(stored[user_id] != live[user_id] for user_id in live),
+        }
+
+    # Incremental refresh: an enrollment marks the learner stale until the refresher catches up
+    learner_id = ids['learner_id']
+    client.post(f'/api/learner/enroll/{ids["open_course_id"]}', headers=headers_by_user[learner_id])
+    start = time.perf_counter()
+    with app.app_context():
+        while db.session.get(RecommendationStatus, learner_id).stale:
+            db.session.remove()
+            time.sleep(0.005)
+    report['refresh_after_enroll_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    stored = client.get(PATHS[1], headers=headers_by_user[learner_id]).get_json()
+    app.config['RECOMMENDATIONS_PRECOMPUTED'] = False
+    live = client.get(PATHS[1], headers=headers_by_user[learner_id]).get_json()
+    report['stored_matches_live_after_enroll'] = stored == live
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
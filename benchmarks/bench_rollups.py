@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Roll up the activity of a generated dataset and compare a year of daily
+activity read from the rollups (GET /api/admin/analytics/activity) with
+the same series grouped from the raw enrollment, lesson_progress and
+quiz_attempt tables. Also times the full rebuild and one incremental
+catch-up after an hour of new activity.
+
+    python benchmarks/bench_rollups.py --preset small
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from common import ROOT, auth_headers, percentile
+
+
+def raw_daily_series(start, end):
+    """Per-day counts straight from the raw tables, as get_analytics would have to"""
+    from models import db, Enrollment, LessonProgress, QuizAttempt, time_bucket
+    from rollups import distinct_learners, DAY
+    from sqlalchemy import func, select
+
+    series = {}
+    for column, metric in ((Enrollment.enrolled_at, 'enrollments'), (Enrollment.completed_at, 'course_completions'),
+                           (LessonProgress.completed_at, 'lesson_completions'),
+                           (QuizAttempt.attempted_at, 'quiz_attempts')):
+        day = time_bucket(column, DAY)
+        for bucket, count in db.session.execute(
+            select(day, func.count()).where(column >= start, column < end).group_by(day)
+        ):
+            series.setdefault(str(bucket)[:10], {})[metric] = count
+    for (bucket, course_id), learners in distinct_learners(start, end, DAY).items():
+        if course_id == 0:
+            series.setdefault(bucket.date().isoformat(), {})['active_learners'] = learners
+    return series
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', default='small', help='generate_dataset.py preset')
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='learnsmart-bench-')
+    database = os.path.join(workdir, 'rollups.db')
+    subprocess.run([sys.executable, os.path.join(ROOT, 'generate_dataset.py'), '--preset', args.preset,
+                    '--database', database], check=True, stdout=subprocess.DEVNULL)
+    os.environ.update(DATABASE_URL='sqlite:///' + database, METRICS_ENABLED='false', COMPRESS_ENABLED='false')
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import create_app
+        app = create_app()
+
+    from models import db, ActivityRollup, Enrollment, RollupState
+    from rollups import catch_up, rebuild, rollup_options
+    from sqlalchemy import func, select
+
+    report = {'preset': args.preset}
+    options = dict(rollup_options(app.config), lag_seconds=0)
+    with app.app_context():
+        start = time.perf_counter()
+        report['hours_rolled_up'] = rebuild(**options)
+        report['rebuild_seconds'] = round(time.perf_counter() - start, 1)
+        report['rollup_rows'] = db.session.scalar(select(func.count()).select_from(ActivityRollup))
+        through = db.session.get(RollupState, 1).days_through
+
+        start = time.perf_counter()
+        raw = raw_daily_series(through - timedelta(days=365), through)
+        report['raw_year_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+    client = app.test_client()
+    headers = auth_headers(app, 1)
+    query = f"/api/admin/analytics/activity?granularity=day&start={(through - timedelta(days=365)).date()}"
+    latencies = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        response = client.get(query, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+    series = response.get_json()['series']
+    report['rollup_year_p50_ms'] = round(percentile(latencies, 50), 2)
+    report['mismatched_days'] = sum(
+        any(day[metric] != raw.get(day['bucket'][:10], {}).get(metric, 0) for metric in
+            ('enrollments', 'course_completions', 'lesson_completions', 'quiz_attempts', 'active_learners'))
+        for day in series
+    )
+
+    # An hour of new enrollments, then the catch-up the background thread would run
+    with app.app_context():
+        state = db.session.get(RollupState, 1)
+        moment = state.watermark + timedelta(minutes=30)
+        db.session.query(Enrollment).filter(Enrollment.id <= 1000).update(
+            {'enrolled_at': moment}, synchronize_session=False)
+        db.session.commit()
+        start = time.perf_counter()
+        catch_up(**dict(options, now=moment + timedelta(minutes=30)))
+        report['catch_up_one_hour_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
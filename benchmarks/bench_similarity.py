@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Build the similar-course index for a synthetic catalog of topic-clustered
+courses and measure: the full build (vectorizing plus every top-k list),
+GET /api/courses/<id>/similar latency, and the background refresh after a
+lesson is added to one course. Also reports how often a course's nearest
+stored neighbor shares its topic.
+
+    pip install numpy
+    python benchmarks/bench_similarity.py --courses 100000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+
+from common import load_app, percentile
+
+
+def words_for(rng, vocabulary, topic_words, count, on_topic=0.7):
+    return ' '.join(rng.choice(topic_words) if rng.random() < on_topic else rng.choice(vocabulary)
+                    for _ in range(count))
+
+
+def seed_catalog(app, courses, topics, lessons_per_course, seed=7):
+    """Insert courses and lessons whose text is drawn mostly from one topic's vocabulary"""
+    from models import db, Course, Lesson
+    from sqlalchemy import insert
+
+    rng = random.Random(seed)
+    vocabulary = [f'term{i}' for i in range(20000)]
+    topic_vocabulary = [rng.sample(vocabulary, 40) for _ in range(topics)]
+    course_topic = {}
+    with app.app_context():
+        for start in range(0, courses, 5000):
+            course_rows, lesson_rows = [], []
+            for course_id in range(start + 1, min(courses, start + 5000) + 1):
+                topic = rng.randrange(topics)
+                course_topic[course_id] = topic
+                words = topic_vocabulary[topic]
+                course_rows.append({'id': course_id, 'title': words_for(rng, vocabulary, words, 4),
+                                    'description': words_for(rng, vocabulary, words, 30),
+                                    'category': f'topic {topic}'})
+                lesson_rows.extend({'course_id': course_id, 'title': words_for(rng, vocabulary, words, 3),
+                                    'content': words_for(rng, vocabulary, words, 60), 'order_index': j}
+                                   for j in range(lessons_per_course))
+            db.session.execute(insert(Course), course_rows)
+            db.session.execute(insert(Lesson), lesson_rows)
+        db.session.commit()
+    return course_topic, topic_vocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=20000)
+    parser.add_argument('--topics', type=int, default=500)
+    parser.add_argument('--lessons', type=int, default=3, help='lessons per course')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app(METRICS_ENABLED='false', COMPRESS_ENABLED='false')
+    course_topic, topic_vocabulary = seed_catalog(app, args.courses, args.topics, args.lessons)
+
+    from models import db, CourseSimilarity, Lesson
+    from similarity import build_all, refresh_courses, mark_course_stale
+    from sqlalchemy import select
+    config = app.config
+    report = {'courses': args.courses, 'dimensions': config['SIMILARITY_DIMENSIONS'],
+              'neighbors': config['SIMILARITY_NEIGHBORS']}
+
+    with app.app_context():
+        start = time.perf_counter()
+        build_all(config['SIMILARITY_DIMENSIONS'], config['SIMILARITY_NEIGHBORS'])
+        db.session.commit()
+        report['build_seconds'] = round(time.perf_counter() - start, 1)
+        first = dict(db.session.execute(
+            select(CourseSimilarity.course_id, CourseSimilarity.similar_course_id).where(CourseSimilarity.rank == 0)
+        ).all())
+        report['top_neighbor_same_topic'] = round(
+            sum(course_topic[a] == course_topic[b] for a, b in first.items()) / max(1, len(first)), 3)
+
+    rng = random.Random(1)
+    client = app.test_client()
+    latencies = []
+    for _ in range(args.requests):
+        course_id = rng.randint(1, args.courses)
+        start = time.perf_counter()
+        response = client.get(f'/api/courses/{course_id}/similar')
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+    report['similar_p50_ms'] = round(percentile(latencies, 50), 2)
+    report['similar_p99_ms'] = round(percentile(latencies, 99), 2)
+
+    # A lesson moves a course towards another topic; time what the refresher does for it
+    with app.app_context():
+        course_id = rng.randint(1, args.courses)
+        db.session.add(Lesson(course_id=course_id, title='New lesson', content=' '.join(topic_vocabulary[0] * 5)))
+        mark_course_stale(course_id)
+        db.session.commit()
+        start = time.perf_counter()
+        affected = refresh_courses([course_id], config['SIMILARITY_NEIGHBORS'])
+        db.session.commit()
+        report['refresh_one_course_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        report['refresh_lists_recomputed'] = affected
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Measure cold start: interpreter launch, importing app.py, create_app() and
+the first GET /api/courses/, each in a fresh process against a seeded
+temporary database. Reports medians over several runs as JSON.
+
+    python benchmarks/bench_startup.py --runs 7 --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json --threshold 0.2
+
+--warmup also reports the first request after WARMUP_ON_START warm-up.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STAGES = ['import_ms', 'create_app_ms', 'first_request_ms', 'total_ms']
+
+
+def child():
+    start = time.perf_counter()
+    import common  # noqa: F401  (only puts the project root on sys.path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+        imported = time.perf_counter()
+        app = app_module.create_app()
+        created = time.perf_counter()
+        status = app.test_client().get('/api/courses/').status_code
+        done = time.perf_counter()
+    print(json.dumps({
+        'status': status,
+        'import_ms': (imported - start) * 1000,
+        'create_app_ms': (created - imported) * 1000,
+        'first_request_ms': (done - created) * 1000,
+        'total_ms': (done - start) * 1000,
+    }))
+
+
+def run_child(warmup):
+    env = dict(os.environ, WARMUP_ON_START='true' if warmup else 'false')
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, __file__, '--child'], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def medians(results):
+    return {key: round(statistics.median(r[key] for r in results), 2) for key in STAGES + ['process_ms']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--courses', type=int, default=30)
+    parser.add_argument('--warmup', action='store_true', help='also measure with WARMUP_ON_START=true')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    from common import load_app, seed_dataset
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app()
+        seed_dataset(app, courses=args.courses)
+
+    report = {'runs': args.runs, 'cold': medians([run_child(False) for _ in range(args.runs)])}
+    if args.warmup:
+        report['warmed'] = medians([run_child(True) for _ in range(args.runs)])
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            previous = json.load(f)['cold']['total_ms']
+        if report['cold']['total_ms'] > previous * (1 + args.threshold):
+            report['regressions'] = [f"cold total {previous} -> {report['cold']['total_ms']} ms"]
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    sys.exit(1 if report.get('regressions') else 0)
+
+
+if __name__ == '__main__':
+    main()
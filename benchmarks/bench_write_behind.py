@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare lesson-progress throughput and latency with synchronous commits
+against write-behind group commit.
+
+    python benchmarks/bench_write_behind.py --events 4000 --concurrency 16
+"""
+
+import argparse
+import json
+import os
+import time
+
+from common import load_app, auth_headers, run_concurrent, summarize
+
+
+def seed(app, users, lessons):
+    from models import db, User, Course, Lesson, Enrollment
+    from werkzeug.security import generate_password_hash
+
+    with app.app_context():
+        password_hash = generate_password_hash('bench')
+        db.session.add_all([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash=password_hash)
+            for i in range(users)
+        ])
+        course = Course(title='Bench course', description='', category='programming')
+        db.session.add(course)
+        db.session.flush()
+        db.session.add_all([
+            Lesson(course_id=course.id, title=f'Lesson {i}', content='', order_index=i)
+            for i in range(lessons)
+        ])
+        db.session.flush()
+        db.session.add_all([Enrollment(user_id=u.id, course_id=course.id) for u in User.query.all()])
+        db.session.commit()
+        return [u.id for u in User.query.all()], [l.id for l in Lesson.query.all()]
+
+
+def make_jobs(app, user_ids, lesson_ids, events):
+    headers = {user_id: auth_headers(app, user_id) for user_id in user_ids}
+    pairs = [(u, l) for l in lesson_ids for u in user_ids][:events]
+
+    def job_for(user_id, lesson_id):
+        def job(client):
+            response = client.post('/api/learner/lesson-progress', headers=headers[user_id],
+                                   json={'lesson_id': lesson_id, 'time_spent_minutes': 5})
+            assert response.status_code in (200, 202), response.get_data(as_text=True)
+        return job
+
+    return [job_for(u, l) for u, l in pairs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    app, workdir = load_app()
+    lessons_needed = args.events // args.users + 1
+    user_ids, lesson_ids = seed(app, args.users, lessons_needed * 2)
+    from write_behind import init_write_behind
+    from models import db, LessonProgress
+
+    results = []
+    half = len(lesson_ids) // 2
+
+    app.extensions.pop('write_behind', None)
+    wall, latencies = run_concurrent(app, make_jobs(app, user_ids, lesson_ids[:half], args.events),
+                                     args.concurrency)
+    results.append(summarize('synchronous', wall, latencies))
+
+    app.config['WRITE_BEHIND_ENABLED'] = True
+    app.config['WRITE_BEHIND_LOG_DIR'] = os.path.join(workdir, 'write_behind')
+    queue = init_write_behind(app)
+    wall, latencies = run_concurrent(app, make_jobs(app, user_ids, lesson_ids[half:], args.events),
+                                     args.concurrency)
+    start = time.perf_counter()
+    queue.flush()
+    drain = time.perf_counter() - start
+    result = summarize('write_behind', wall + drain, latencies)
+    result['drain_seconds'] = round(drain, 3)
+    results.append(result)
+    queue.stop()
+
+    with app.app_context():
+        stored = db.session.query(LessonProgress).count()
+    print(json.dumps({'events_stored': stored, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
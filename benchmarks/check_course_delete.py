@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Check that a soft-deleted course disappears cleanly from every learner
+endpoint: a learner enrolled in the course, with lesson progress and a
+quiz attempt in it, has an admin delete it and then calls each learner
+read endpoint, through Flask and through the ASGI app. Fails on any 5xx,
+and on any response that still names the deleted course or its quiz.
+
+    python benchmarks/check_course_delete.py
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import sys
+
+from common import load_app, auth_headers, seed_dataset
+
+PATHS = [
+    '/api/auth/profile',
+    '/api/courses/',
+    '/api/learner/my-courses',
+    '/api/learner/recommendations',
+    '/api/learner/dashboard',
+    '/api/learner/bootstrap',
+    '/api/ai/analyze-learning-style',
+    '/api/ai/personalized-path',
+    '/api/ai/learning-insights',
+]
+
+
+def leaks(body, course_id, quiz_id):
+    """Whether a JSON body still refers to the deleted course or its quiz"""
+    found = []
+
+    def walk(value):
+        if isinstance(value, dict):
+            if value.get('course_id') == course_id or value.get('quiz_id') == quiz_id:
+                found.append(value)
+            for key, item in value.items():
+                if key in ('course', 'courses') and isinstance(item, dict) and item.get('id') == course_id:
+                    found.append(item)
+                walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    walk(body)
+    return bool(found)
+
+
+def check(name, responses, course_id, quiz_id, failures):
+    report = {}
+    for path, (status, body) in responses.items():
+        report[path] = status
+        if status >= 500:
+            failures.append(f'{name} {path}: {status}')
+        elif status == 200 and leaks(json.loads(body), course_id, quiz_id):
+            failures.append(f'{name} {path}: still lists course {course_id}')
+    return report
+
+
+async def asgi_responses(app, headers):
+    import httpx
+    from async_app import AsyncApp
+
+    transport = httpx.ASGITransport(app=AsyncApp(app))
+    async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+        responses = {}
+        for path in PATHS:
+            response = await client.get(path, headers=dict(headers, **{'Accept-Encoding': 'identity'}))
+            responses[path] = (response.status_code, response.content)
+        return responses
+
+
+def main():
+    with contextlib.redirect_stdout(io.StringIO()):
+        # The purger stays asleep so the course's rows are still there, only hidden
+        app, _ = load_app(COURSE_PURGE_SECONDS='3600')
+        ids = seed_dataset(app)
+    app.extensions['course_purger'] = None
+    client = app.test_client()
+    learner = auth_headers(app, ids['learner_id'])
+    course_id, quiz_id = ids['course_id'], ids['quiz_id']
+
+    failures = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm the per-user caches so stale entries would show
+        for path in PATHS:
+            client.get(path, headers=learner)
+        response = client.delete(f'/api/admin/courses/{course_id}', headers=auth_headers(app, ids['admin_id']))
+        if response.status_code != 200:
+            failures.append(f'DELETE /api/admin/courses/{course_id}: {response.status_code}')
+        flask = {path: (r.status_code, r.get_data()) for path, r in
+                 ((path, client.get(path, headers=learner)) for path in PATHS)}
+    report = {'deleted_course': course_id, 'flask': check('flask', flask, course_id, quiz_id, failures)}
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        report['asgi'] = 'skipped: pip install httpx'
+    else:
+        asgi = asyncio.run(asgi_responses(app, learner))
+        report['asgi'] = check('asgi', asgi, course_id, quiz_id, failures)
+
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f'FAIL {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Call every registered API route against a seeded dataset, count the SQL
+statements each request executes and fail when a route exceeds the budget
+declared next to it in routes.py or repeats a statement shape (N+1).
+
+    python benchmarks/check_query_budgets.py [--verbose]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import sys
+from datetime import datetime, timedelta
+
+from common import load_app, auth_headers, seed_dataset
+
+
+def request_plan(ids):
+    """
+    One representative request per endpoint: (role, method, path, json body).
+    Every API endpoint must appear here; destructive calls come last.
+    """
+    return {
+        'auth.register': ('anonymous', 'post', '/api/auth/register',
+                          {'username': 'newbie', 'email': 'newbie@example.com', 'password': 'pw'}),
+        'auth.login': ('anonymous', 'post', '/api/auth/login', {'username': 'nobody', 'password': 'pw'}),
+        'auth.get_profile': ('learner', 'get', '/api/auth/profile', None),
+        'auth.update_profile': ('learner', 'put', '/api/auth/profile', {'skill_level': 'intermediate'}),
+        'courses.get_courses': ('anonymous', 'get', '/api/courses/', None),
+        'courses.get_course': ('anonymous', 'get', f"/api/courses/{ids['course_id']}", None),
+        'courses.get_courses_by_category': ('anonymous', 'get', '/api/courses/category/programming', None),
+        'courses.get_similar_courses': ('anonymous', 'get', f"/api/courses/{ids['course_id']}/similar", None),
+        'learner.enroll_course': ('learner', 'post', f"/api/learner/enroll/{ids['open_course_id']}", None),
+        'learner.get_my_courses': ('learner', 'get', '/api/learner/my-courses', None),
+        'learner.mark_lesson_complete': ('learner', 'post', '/api/learner/lesson-progress',
+                                         {'lesson_id': ids['open_lesson_id'], 'time_spent_minutes': 10}),
+        'learner.get_quiz': ('learner', 'get', f"/api/learner/quiz/{ids['quiz_id']}", None),
+        'learner.submit_quiz': ('learner', 'post', f"/api/learner/quiz/{ids['quiz_id']}/submit",
+                                {'answers': {}, 'time_taken_minutes': 5}),
+        'learner.get_recommendations': ('learner', 'get', '/api/learner/recommendations', None),
+        'learner.get_dashboard': ('learner', 'get', '/api/learner/dashboard', None),
+        'learner.get_bootstrap': ('learner', 'get', '/api/learner/bootstrap', None),
+        'learner.stream_events': ('learner', 'get', '/api/learner/events', None),
+        'admin.get_users': ('admin', 'get', '/api/admin/users', None),
+        'admin.create_course': ('admin', 'post', '/api/admin/courses',
+                                {'title': 'New', 'description': 'New course', 'category': 'design'}),
+        'admin.update_course': ('admin', 'put', f"/api/admin/courses/{ids['course_id']}", {'title': 'Renamed'}),
+        'admin.create_lesson': ('admin', 'post', f"/api/admin/courses/{ids['course_id']}/lessons",
+                                {'title': 'Extra', 'content': 'Extra lesson content.'}),
+        'admin.create_quiz': ('admin', 'post', f"/api/admin/courses/{ids['course_id']}/quizzes",
+                              {'title': 'Extra quiz'}),
+        'admin.create_question': ('admin', 'post', f"/api/admin/quizzes/{ids['quiz_id']}/questions",
+                                  {'question_text': 'Extra?', 'options': ['a', 'b'], 'correct_answer': 0}),
+        'admin.create_course_tree': ('admin', 'post', '/api/admin/course-trees', {
+            'title': 'Tree', 'description': 'Authored in one request', 'category': 'design',
+            'lessons': [{'title': f'Lesson {i}', 'content': 'Lesson content.'} for i in range(3)],
+            'quizzes': [{'title': 'Tree quiz', 'questions': [
+                {'question_text': f'Question {i}?', 'options': ['a', 'b'], 'correct_answer': 0} for i in range(3)
+            ]}],
+        }),
+        'admin.update_course_tree': ('admin', 'patch', f"/api/admin/course-trees/{ids['course_id']}", {
+            'lessons': [{'id': ids['open_lesson_id'], 'title': 'Retitled lesson'}, {'title': 'New', 'content': 'Text.'}],
+            'quizzes': [{'id': ids['quiz_id'], 'questions': [
+                {'id': ids['question_id'], 'explanation': 'Because.'},
+                {'question_text': 'New?', 'options': ['a', 'b'], 'correct_answer': 1},
+            ]}],
+        }),
+        'admin.get_item_analysis': ('admin', 'get', f"/api/admin/quizzes/{ids['quiz_id']}/item-analysis", None),
+        'admin.get_metrics': ('admin', 'get', '/api/admin/metrics', None),
+        'admin.get_profiles': ('admin', 'get', '/api/admin/profiles', None),
+        'admin.get_profile_detail': ('admin', 'get', f"/api/admin/profiles/{ids['profile_id']}", None),
+        'admin.download_profile': ('admin', 'get', f"/api/admin/profiles/{ids['profile_id']}/pstats", None),
+        'admin.get_activity_series': ('admin', 'get', '/api/admin/analytics/activity?granularity=hour', None),
+        'admin.get_course_activity_series': ('admin', 'get', f"/api/admin/analytics/courses/{ids['course_id']}"
+                                             "/activity?granularity=week", None),
+        'admin.get_quiz_score_distribution': ('admin', 'get',
+                                              f"/api/admin/analytics/quizzes/{ids['quiz_id']}/scores", None),
+        'admin.get_active_learner_estimate': ('admin', 'get', '/api/admin/analytics/learners?start=2000-01-01', None),
+        'admin.get_course_learner_estimate': ('admin', 'get',
+                                              f"/api/admin/analytics/courses/{ids['course_id']}/learners", None),
+        'admin.get_analytics': ('admin', 'get', '/api/admin/analytics', None),
+        'ai.summarize_course': ('learner', 'get', f"/api/ai/summarize-course/{ids['course_id']}", None),
+        'ai.analyze_user_learning_style': ('learner', 'get', '/api/ai/analyze-learning-style', None),
+        'ai.get_personalized_path': ('learner', 'get', '/api/ai/personalized-path', None),
+        'ai.get_user_insights': ('learner', 'get', '/api/ai/learning-insights', None),
+        'ai.generate_ai_quiz': ('admin', 'post', '/api/ai/generate-quiz', {'course_id': ids['course_id']}),
+        'admin.delete_course': ('admin', 'delete', f"/api/admin/courses/{ids['delete_course_id']}", None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--verbose', action='store_true', help='print statement counts for passing routes too')
+    args = parser.parse_args()
+
+    app, _ = load_app()
+    from query_budget import QueryRecorder, check_request
+
+    ids = seed_dataset(app)
+    headers = {
+        'anonymous': {},
+        'learner': auth_headers(app, ids['learner_id']),
+        'admin': auth_headers(app, ids['admin_id']),
+    }
+    client = app.test_client()
+
+    # A stored profile for the profile retrieval routes to find
+    response = client.get('/api/auth/profile', headers=dict(headers['admin'], **{'X-Profile': '1'}))
+    ids['profile_id'] = response.headers.get('X-Profile-Id', '0' * 32)
+
+    # Stored similar-course lists and question calibrations for the routes that read them
+    if importlib.util.find_spec('numpy') is not None:
+        from models import db
+        from similarity import build_all
+        from calibration import calibrate
+        with app.app_context():
+            build_all(app.config['SIMILARITY_DIMENSIONS'], app.config['SIMILARITY_NEIGHBORS'])
+            calibrate()
+            db.session.commit()
+    from rollups import catch_up
+    from sketches import rebuild_sketches
+    with app.app_context():
+        # Close the seeded hours so the activity series have rollups to read, and sketch them
+        catch_up(lag_seconds=0, now=datetime.utcnow() + timedelta(hours=1))
+        rebuild_sketches()
+
+    plan = request_plan(ids)
+    failures = {}
+    report = []
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if '.' in rule.endpoint}
+    for endpoint in sorted(endpoints - set(plan)):
+        failures[endpoint] = ['no request in check_query_budgets.request_plan']
+
+    for endpoint, (role, method, path, body) in plan.items():
+        with contextlib.redirect_stdout(io.StringIO()), QueryRecorder() as recorder:
+            response = getattr(client, method)(path, headers=headers[role], json=body)
+        view = app.view_functions[endpoint]
+        problems = check_request(view, recorder)
+        if response.status_code >= 500:
+            problems.append(f'status {response.status_code}')
+        report.append({
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'statements': recorder.count,
+            'budget': getattr(view, 'query_budget', None),
+        })
+        if problems:
+            failures[endpoint] = problems
+
+    if args.verbose:
+        print(json.dumps(report, indent=2))
+    for endpoint, problems in sorted(failures.items()):
+        print(f'FAIL {endpoint}')
+        for problem in problems:
+            print(f'    {problem}')
+    print(f'{len(report) - len(failures)}/{len(report)} routes within budget')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Check the score and distinct-learner sketches against exact answers and
+fail when they exceed their documented error bounds:
+
+- HyperLogLog estimates, alone and merged, over a range of cardinalities
+  (bound: 4 standard errors)
+- KLL percentiles, from one stream and from merged pieces (bound: the
+  rank error each score response reports)
+- quiz submissions and enrollments made through the API, flushed into
+  the sketch table and read back from the analytics endpoints, against
+  the raw quiz_attempt and activity tables, and again after a rebuild
+
+    python benchmarks/check_sketches.py [--values 200000]
+"""
+
+import argparse
+import bisect
+import contextlib
+import io
+import json
+import random
+import sys
+
+from common import load_app, auth_headers, seed_dataset
+
+
+def rank_error(ordered, value, fraction):
+    """How far, in normalized rank, value is from the fraction-quantile of ordered values"""
+    n = len(ordered)
+    low, high = bisect.bisect_left(ordered, value) / n, bisect.bisect_right(ordered, value) / n
+    return max(0.0, low - fraction, fraction - high)
+
+
+def check_hll(trials, failures):
+    from sketches import HyperLogLog, HLL_ERROR
+
+    report = {}
+    for n in (100, 1_000, 10_000, 100_000):
+        errors = []
+        for trial in range(trials):
+            sketch = HyperLogLog()
+            for value in range(n):
+                sketch.add(trial * 10_000_000 + value)
+            errors.append(abs(HyperLogLog.from_bytes(sketch.to_bytes()).estimate() - n) / n)
+        report[n] = {'mean_error': round(sum(errors) / trials, 4), 'max_error': round(max(errors), 4),
+                     'bytes': len(sketch.to_bytes())}
+        if max(errors) > 4 * HLL_ERROR:
+            failures.append(f'HyperLogLog of {n}: error {max(errors):.3f}')
+
+    # Two overlapping days merged: the union, not the sum
+    first, second = HyperLogLog(), HyperLogLog()
+    for value in range(60_000):
+        first.add(value)
+    for value in range(30_000, 90_000):
+        second.add(value)
+    error = abs(first.merge(second).estimate() - 90_000) / 90_000
+    report['merged_90000'] = {'error': round(error, 4)}
+    if error > 4 * HLL_ERROR:
+        failures.append(f'merged HyperLogLog: error {error:.3f}')
+    return report
+
+
+def check_kll(values, failures):
+    from sketches import KLL, KLL_RANK_ERROR
+
+    rng = random.Random(7)
+    streams = {
+        'normal': [min(100.0, max(0.0, rng.gauss(70, 15))) for _ in range(values)],
+        'uniform': [rng.uniform(0, 100) for _ in range(values)],
+        'sorted': [100.0 * i / values for i in range(values)],
+    }
+    fractions = [i / 100 for i in range(1, 100)]
+    report = {}
+    for name, stream in streams.items():
+        whole = KLL()
+        for value in stream:
+            whole.update(value)
+        # The same stream sketched in ten pieces (ten days, or ten processes) and merged
+        merged = KLL()
+        for piece in range(10):
+            part = KLL()
+            for value in stream[piece::10]:
+                part.update(value)
+            merged.merge(KLL.from_bytes(part.to_bytes()))
+        ordered = sorted(stream)
+        for label, sketch in (('single', KLL.from_bytes(whole.to_bytes())), ('merged', merged)):
+            worst = max(rank_error(ordered, value, fraction)
+                        for value, fraction in zip(sketch.quantiles(fractions), fractions))
+            report[f'{name}_{label}'] = {'max_rank_error': round(worst, 4), 'bytes': len(sketch.to_bytes())}
+            if worst > KLL_RANK_ERROR:
+                failures.append(f'KLL {name} {label}: rank error {worst:.4f}')
+    return report
+
+
+def check_end_to_end(failures):
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app(SKETCH_FLUSH_SECONDS=3600, METRICS_ENABLED='false', COMPRESS_ENABLED='false')
+        ids = seed_dataset(app, learners=200)
+
+    from models import db, Course, Enrollment, Lesson, LessonProgress, Quiz, QuizAttempt, User
+    from sqlalchemy import select
+    from sketches import flush, rebuild_sketches
+
+    rng = random.Random(11)
+    client = app.test_client()
+    with app.app_context():
+        quizzes = {quiz.id: [(question.id, len(question.get_options())) for question in quiz.questions]
+                   for quiz in Quiz.query.all()}
+        learners = [user_id for (user_id,) in db.session.query(User.id).filter(User.role != 'admin')]
+        course_ids = [course_id for (course_id,) in db.session.query(Course.id)]
+
+    # Sketches start from what the seed wrote directly; requests add to them
+    with app.app_context():
+        rebuild_sketches()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id in learners:
+            headers = auth_headers(app, user_id)
+            client.post(f'/api/learner/enroll/{rng.choice(course_ids)}', headers=headers)
+            for quiz_id in rng.sample(list(quizzes), 3):
+                answers = {str(question_id): rng.randrange(options) for question_id, options in quizzes[quiz_id]}
+                response = client.post(f'/api/learner/quiz/{quiz_id}/submit', headers=headers,
+                                       json={'answers': answers, 'time_taken_minutes': 5})
+                assert response.status_code == 200, response.get_data(as_text=True)
+    with app.app_context():
+        flush(app.extensions['sketches'])
+
+    def exact_learners(course_id):
+        """Distinct users with any enrollment, lesson completion or quiz attempt in the course (0: anywhere)"""
+        users = set()
+        for query in (select(Enrollment.user_id, Enrollment.course_id),
+                      select(LessonProgress.user_id, Lesson.course_id).join(Lesson),
+                      select(QuizAttempt.user_id, Quiz.course_id).join(Quiz)):
+            users.update(user_id for user_id, course in db.session.execute(query) if course_id in (0, course))
+        return len(users)
+
+    headers = auth_headers(app, ids['admin_id'])
+    report = {}
+    for phase in ('incremental', 'rebuilt'):
+        if phase == 'rebuilt':
+            with app.app_context():
+                rebuild_sketches()
+        worst_rank, worst_learners = 0.0, 0.0
+        with app.app_context():
+            for quiz_id in quizzes:
+                scores = sorted(percentage for (percentage,) in
+                                db.session.query(QuizAttempt.percentage).filter_by(quiz_id=quiz_id))
+                summary = client.get(f'/api/admin/analytics/quizzes/{quiz_id}/scores', headers=headers).get_json()
+                if summary['attempts'] != len(scores):
+                    failures.append(f'{phase}: quiz {quiz_id} has {summary["attempts"]} of {len(scores)} attempts')
+                    continue
+                for name, value in summary['percentiles'].items():
+                    if value is not None:
+                        worst_rank = max(worst_rank, rank_error(scores, value, int(name[1:]) / 100))
+                if worst_rank > summary['rank_error']:
+                    failures.append(f'{phase}: quiz {quiz_id} rank error {worst_rank:.4f}')
+            for course_id in [0] + course_ids:
+                path = (f'/api/admin/analytics/courses/{course_id}/learners' if course_id
+                        else '/api/admin/analytics/learners')
+                estimate = client.get(path, headers=headers).get_json()
+                exact = exact_learners(course_id)
+                error = abs(estimate['distinct_learners'] - exact) / max(exact, 1)
+                worst_learners = max(worst_learners, error)
+                if error > 4 * estimate['relative_error']:
+                    failures.append(f'{phase}: course {course_id} has ~{estimate["distinct_learners"]} '
+                                    f'of {exact} learners')
+        report[phase] = {'max_rank_error': round(worst_rank, 4), 'max_learner_error': round(worst_learners, 4)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--values', type=int, default=200_000, help='scores per KLL test stream')
+    parser.add_argument('--trials', type=int, default=10, help='HyperLogLog runs per cardinality')
+    args = parser.parse_args()
+
+    failures = []
+    report = {
+        'hyperloglog': check_hll(args.trials, failures),
+        'kll': check_kll(args.values, failures),
+        'end_to_end': check_end_to_end(failures),
+    }
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f'FAIL {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
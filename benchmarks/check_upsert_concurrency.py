@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Fire simultaneous duplicate enrollment and lesson-completion requests and
+check that exactly one succeeds, the rest get a conflict response (never a
+500), and that no request issued more SQL statements than its route is
+meant to: STATEMENTS per route, the count of the winning request. Exits
+non-zero when either check fails.
+
+    python benchmarks/check_upsert_concurrency.py --duplicates 16
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import threading
+from collections import Counter
+
+from common import load_app, auth_headers
+
+# Statements of the request that wins: enroll inserts the enrollment, marks
+# the user's recommendations stale and bumps their version; completing a
+# lesson inserts the progress row, updates the enrollment's progress and
+# marks and bumps the same way
+STATEMENTS = {'enroll': 3, 'lesson_complete': 4}
+
+
+def seed(app):
+    from models import db, User, Course, Lesson
+    with app.app_context():
+        user = User(username='racer', email='racer@example.com', password_hash='x')
+        course = Course(title='Race course', description='', category='programming')
+        db.session.add_all([user, course])
+        db.session.flush()
+        lesson = Lesson(course_id=course.id, title='Only lesson', content='')
+        db.session.add(lesson)
+        db.session.commit()
+        return user.id, course.id, lesson.id
+
+
+def count_statements():
+    """Count statements per thread via engine events"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    local = threading.local()
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        local.count = getattr(local, 'count', 0) + 1
+
+    return local
+
+
+def fire(app, duplicates, method, path, headers, body, local):
+    barrier = threading.Barrier(duplicates)
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        local.count = 0
+        response = getattr(client, method)(path, headers=headers, json=body)
+        with lock:
+            results.append((response.status_code, local.count))
+
+    threads = [threading.Thread(target=worker) for _ in range(duplicates)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def report(name, results, conflict_status):
+    statuses = Counter(status for status, _ in results)
+    statements = max(count for _, count in results)
+    return {
+        'name': name,
+        'ok': (statuses.get(200, 0) == 1 and statuses.get(conflict_status, 0) == len(results) - 1
+               and statements == STATEMENTS[name]),
+        'statuses': dict(statuses),
+        'max_statements_per_request': statements,
+        'expected_statements': STATEMENTS[name],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duplicates', type=int, default=16)
+    args = parser.parse_args()
+
+    # The routes print as they go; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, _ = load_app()
+        user_id, course_id, lesson_id = seed(app)
+        headers = auth_headers(app, user_id)
+        local = count_statements()
+
+        checks = [
+            report('enroll', fire(app, args.duplicates, 'post', f'/api/learner/enroll/{course_id}',
+                                  headers, None, local), 400),
+            report('lesson_complete', fire(app, args.duplicates, 'post', '/api/learner/lesson-progress',
+                                           headers, {'lesson_id': lesson_id}, local), 400),
+        ]
+    print(json.dumps(checks, indent=2))
+    sys.exit(0 if all(c['ok'] for c in checks) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Shared helpers for the LearnSmart benchmark scripts.
+Each script runs the app in-process against a throwaway SQLite file.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_app(**env):
+    """Create an app against a fresh temporary database"""
+    workdir = tempfile.mkdtemp(prefix='learnsmart-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    for key, value in env.items():
+        os.environ[key] = str(value)
+
+    from app import create_app
+    from models import db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    return app, workdir
+
+
+CATEGORIES = ['programming', 'web development', 'database', 'machine learning', 'design']
+
+
+def seed_dataset(app, courses=12, lessons_per_course=6, questions_per_quiz=5, learners=20,
+                 enrollments_per_learner=6, seed=42):
+    """
+    Build a small but realistic dataset: courses with lessons and a quiz each,
+    and learners with enrollments, lesson progress and quiz attempts.
+    Returns a dict of ids the scripts address their requests to.
+    """
+    from models import db, User, Course, Lesson, Quiz, Question, Enrollment, LessonProgress, QuizAttempt
+    from item_analysis import record_responses
+
+    rng = random.Random(seed)
+    with app.app_context():
+        admin = User(username='admin', email='admin@example.com', password_hash='x', role='admin')
+        learner = User(username='learner', email='learner@example.com', password_hash='x')
+        learner.set_interests(['programming', 'web development', 'database'])
+        others = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+                  for i in range(learners)]
+        for user in others:
+            user.set_interests(rng.sample(CATEGORIES, 2))
+        db.session.add_all([admin, learner] + others)
+        db.session.flush()
+
+        catalog = []
+        for i in range(courses):
+            course = Course(title=f'Course {i}', description=f'Description of course {i}. ' * 3,
+                            category=CATEGORIES[i % len(CATEGORIES)],
+                            difficulty_level=['beginner', 'intermediate', 'advanced'][i % 3])
+            db.session.add(course)
+            db.session.flush()
+            lessons = [Lesson(course_id=course.id, title=f'Lesson {j}', order_index=j,
+                              content=f'Lesson {j} of course {i} explains an important concept in detail.')
+                       for j in range(lessons_per_course)]
+            quiz = Quiz(course_id=course.id, title=f'Quiz {i}', total_questions=questions_per_quiz)
+            db.session.add_all(lessons + [quiz])
+            db.session.flush()
+            questions = []
+            for k in range(questions_per_quiz):
+                question = Question(quiz_id=quiz.id, question_text=f'Question {k}?', correct_answer=k % 4)
+                question.set_options(['a', 'b', 'c', 'd'])
+                questions.append(question)
+            db.session.add_all(questions)
+            db.session.flush()
+            catalog.append((course, lessons, quiz, questions))
+
+        for user in [learner] + others:
+            for course, lessons, quiz, questions in rng.sample(catalog, min(enrollments_per_learner, len(catalog))):
+                db.session.add(Enrollment(user_id=user.id, course_id=course.id))
+                # Always leave a lesson open so there is progress left to record
+                for lesson in lessons[:rng.randint(1, max(1, lessons_per_course - 1))]:
+                    db.session.add(LessonProgress(user_id=user.id, lesson_id=lesson.id,
+                                                  time_spent_minutes=rng.randint(5, 60)))
+                attempt = QuizAttempt(user_id=user.id, quiz_id=quiz.id, score=3, total_questions=5,
+                                      correct_answers=3, percentage=60.0)
+                # The first three questions right, the rest wrong
+                answers = {str(q.id): q.correct_answer if k < 3 else (q.correct_answer + 1) % 4
+                           for k, q in enumerate(questions)}
+                attempt.set_answers(answers)
+                db.session.add(attempt)
+                db.session.flush()
+                record_responses(attempt.id, [(q.id, q.correct_answer) for q in questions], answers)
+        db.session.commit()
+
+        enrolled = {e.course_id for e in Enrollment.query.filter_by(user_id=learner.id)}
+        progressed = {p.lesson_id for p in LessonProgress.query.filter_by(user_id=learner.id)}
+        target = next(c for c in catalog if c[0].id in enrolled)
+        return {
+            'admin_id': admin.id,
+            'learner_id': learner.id,
+            'learner_ids': [learner.id] + [u.id for u in others],
+            'course_id': target[0].id,
+            'quiz_id': target[2].id,
+            'question_id': target[3][0].id,
+            'open_course_id': next(c[0].id for c in catalog if c[0].id not in enrolled),
+            'open_lesson_id': next(l.id for l in target[1] if l.id not in progressed),
+            'delete_course_id': catalog[-1][0].id,
+        }
+
+
+def auth_headers(app, user_id):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        token = create_access_token(identity=user_id)
+    return {'Authorization': f'Bearer {token}'}
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_concurrent(app, jobs, concurrency):
+    """
+    Run callables of the form job(client) across worker threads.
+    Returns (wall_seconds, per-job latencies in ms).
+    """
+    latencies = []
+    lock = threading.Lock()
+    pending = list(jobs)
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                if not pending:
+                    return
+                job = pending.pop()
+            start = time.perf_counter()
+            job(client)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies
+
+
+def summarize(name, wall, latencies):
+    return {
+        'name': name,
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else 0,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark covering every API blueprint.
+
+Virtual users run a mixed workload (browse, enroll, complete lessons, take
+quizzes, view dashboards and AI insights, admin analytics) concurrently and
+the script reports p50/p95/p99 latency and throughput per endpoint as JSON.
+
+In-process against a seeded temporary database:
+    python benchmarks/load_test.py --users 32 --duration 30 --output load.json
+
+Against a running server:
+    python benchmarks/load_test.py --url http://localhost:5000 --admin-password admin123
+
+Compare with a stored baseline (exit status 1 on regression):
+    python benchmarks/load_test.py --baseline baseline.json --threshold 0.25
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from common import load_app, auth_headers, seed_dataset, percentile
+
+# (weight, action name); weights are relative
+LEARNER_MIX = [
+    (30, 'browse'),
+    (5, 'enroll'),
+    (15, 'complete_lesson'),
+    (10, 'take_quiz'),
+    (20, 'dashboard'),
+    (15, 'ai'),
+    (5, 'profile'),
+]
+ADMIN_MIX = [
+    (40, 'admin_analytics'),
+    (30, 'admin_users'),
+    (30, 'browse'),
+]
+
+
+class InProcessClient:
+    """Drive the app through the Flask test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers or {})
+        try:
+            data = json.loads(response.get_data()) if response.is_json else None
+        except ValueError:
+            data = None
+        return response.status_code, data
+
+
+class HttpClient:
+    """Drive a running server over HTTP with the standard library"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        try:
+            return status, json.loads(payload)
+        except ValueError:
+            return status, None
+
+
+class Catalog:
+    """Course, lesson and quiz ids discovered through the public API"""
+
+    def __init__(self, client):
+        status, courses = client.request('GET', '/api/courses/')
+        if status != 200 or not courses:
+            raise SystemExit('No courses to benchmark against; seed the database first')
+        self.courses = []
+        for course in courses:
+            _, detail = client.request('GET', f"/api/courses/{course['id']}")
+            self.courses.append({
+                'id': course['id'],
+                'category': course['category'],
+                'lessons': [lesson['id'] for lesson in detail.get('lessons', [])],
+                'quizzes': [quiz['id'] for quiz in detail.get('quizzes', [])],
+            })
+
+
+class VirtualUser:
+    def __init__(self, client, headers, catalog, mix, rng, samples):
+        self.client = client
+        self.headers = headers
+        self.catalog = catalog
+        self.rng = rng
+        self.samples = samples
+        self.actions = [name for weight, name in mix for _ in range(weight)]
+
+    def call(self, label, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, body, self.headers)
+        except Exception:
+            status, data = 599, None
+        self.samples.append((label, (time.perf_counter() - start) * 1000, status))
+        return status, data
+
+    def course(self):
+        return self.rng.choice(self.catalog.courses)
+
+    def run_once(self):
+        getattr(self, 'do_' + self.rng.choice(self.actions))()
+
+    def do_browse(self):
+        self.call('GET /api/courses/', 'GET', '/api/courses/')
+        course = self.course()
+        self.call('GET /api/courses/<course_id>', 'GET', f"/api/courses/{course['id']}")
+        self.call('GET /api/courses/category/<category>', 'GET', f"/api/courses/category/{course['category']}")
+
+    def do_enroll(self):
+        course = self.course()
+        self.call('POST /api/learner/enroll/<course_id>', 'POST', f"/api/learner/enroll/{course['id']}")
+
+    def do_complete_lesson(self):
+        course = self.course()
+        if course['lessons']:
+            self.call('POST /api/learner/lesson-progress', 'POST', '/api/learner/lesson-progress',
+                      {'lesson_id': self.rng.choice(course['lessons']), 'time_spent_minutes': self.rng.randint(5, 60)})
+
+    def do_take_quiz(self):
+        course = self.course()
+        if not course['quizzes']:
+            return
+        quiz_id = self.rng.choice(course['quizzes'])
+        status, quiz = self.call('GET /api/learner/quiz/<quiz_id>', 'GET', f'/api/learner/quiz/{quiz_id}')
+        if status != 200:
+            return
+        answers = {str(q['id']): self.rng.randrange(max(1, len(q['options']))) for q in quiz['questions']}
+        self.call('POST /api/learner/quiz/<quiz_id>/submit', 'POST', f'/api/learner/quiz/{quiz_id}/submit',
+                  {'answers': answers, 'time_taken_minutes': self.rng.randint(1, 30)})
+
+    def do_dashboard(self):
+        self.call('GET /api/learner/dashboard', 'GET', '/api/learner/dashboard')
+        self.call('GET /api/learner/my-courses', 'GET', '/api/learner/my-courses')
+
+    def do_ai(self):
+        choice = self.rng.randrange(5)
+        if choice == 0:
+            self.call('GET /api/ai/learning-insights', 'GET', '/api/ai/learning-insights')
+        elif choice == 1:
+            self.call('GET /api/ai/personalized-path', 'GET', '/api/ai/personalized-path')
+        elif choice == 2:
+            self.call('GET /api/ai/analyze-learning-style', 'GET', '/api/ai/analyze-learning-style')
+        elif choice == 3:
+            self.call('GET /api/learner/recommendations', 'GET', '/api/learner/recommendations')
+        else:
+            self.call('GET /api/ai/summarize-course/<course_id>', 'GET',
+                      f"/api/ai/summarize-course/{self.course()['id']}")
+
+    def do_profile(self):
+        self.call('GET /api/auth/profile', 'GET', '/api/auth/profile')
+
+    def do_admin_analytics(self):
+        self.call('GET /api/admin/analytics', 'GET', '/api/admin/analytics')
+
+    def do_admin_users(self):
+        self.call('GET /api/admin/users', 'GET', '/api/admin/users')
+
+
+def setup_in_process(args):
+    app, _ = load_app()
+    ids = seed_dataset(app, courses=args.courses, learners=max(args.users, 20))
+    learner_headers = [auth_headers(app, user_id) for user_id in ids['learner_ids']]
+    admin_headers = auth_headers(app, ids['admin_id'])
+    return (lambda: InProcessClient(app)), learner_headers, admin_headers
+
+
+def setup_http(args):
+    client = HttpClient(args.url)
+    status, data = client.request('POST', '/api/auth/login',
+                                  {'username': args.admin_username, 'password': args.admin_password})
+    if status != 200:
+        raise SystemExit(f'Admin login failed with status {status}')
+    admin_headers = {'Authorization': f"Bearer {data['access_token']}"}
+
+    run_id = uuid.uuid4().hex[:8]
+    learner_headers = []
+    for i in range(args.users):
+        status, data = client.request('POST', '/api/auth/register', {
+            'username': f'load_{run_id}_{i}',
+            'email': f'load_{run_id}_{i}@example.com',
+            'password': 'load-test',
+            'interests': ['programming', 'web development'],
+        })
+        if status != 201:
+            raise SystemExit(f'Registering virtual user failed with status {status}')
+        learner_headers.append({'Authorization': f"Bearer {data['access_token']}"})
+    return (lambda: HttpClient(args.url)), learner_headers, admin_headers
+
+
+def run(args):
+    # The app prints debug lines per request; keep stdout for the JSON report
+    with contextlib.redirect_stdout(io.StringIO()):
+        make_client, learner_headers, admin_headers = setup_http(args) if args.url else setup_in_process(args)
+        catalog = Catalog(make_client())
+
+    per_thread = []
+    deadline = time.perf_counter() + args.duration
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        is_admin = args.admin_every and index % args.admin_every == 0
+        samples = []
+        per_thread.append(samples)
+        user = VirtualUser(make_client(), admin_headers if is_admin else learner_headers[index % len(learner_headers)],
+                           catalog, ADMIN_MIX if is_admin else LEARNER_MIX, rng, samples)
+        while time.perf_counter() < deadline:
+            user.run_once()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.users)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - start
+
+    samples = [sample for thread_samples in per_thread for sample in thread_samples]
+    return report(samples, wall, args)
+
+
+def report(samples, wall, args):
+    by_endpoint = {}
+    for label, latency, status in samples:
+        by_endpoint.setdefault(label, []).append((latency, status))
+
+    endpoints = {}
+    for label, rows in sorted(by_endpoint.items()):
+        latencies = [latency for latency, _ in rows]
+        endpoints[label] = {
+            'requests': len(rows),
+            'errors': sum(1 for _, status in rows if status >= 500),
+            'throughput_rps': round(len(rows) / wall, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+        }
+
+    latencies = [latency for _, latency, _ in samples]
+    return {
+        'config': {
+            'target': args.url or 'in-process',
+            'users': args.users,
+            'duration_seconds': args.duration,
+            'seed': args.seed,
+        },
+        'totals': {
+            'requests': len(samples),
+            'errors': sum(1 for _, _, status in samples if status >= 500),
+            'throughput_rps': round(len(samples) / wall, 2),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+        },
+        'endpoints': endpoints,
+    }
+
+
+def compare(result, baseline, threshold):
+    """List regressions: p95 latency up or throughput down by more than threshold"""
+    regressions = []
+    for label, current in result['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(label)
+        if not previous or previous['requests'] < 20:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f"{label}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{label}: errors {previous['errors']} -> {current['errors']}")
+    previous_total = baseline.get('totals', {}).get('throughput_rps')
+    if previous_total and result['totals']['throughput_rps'] < previous_total * (1 - threshold):
+        regressions.append(f"total throughput {previous_total} -> {result['totals']['throughput_rps']} rps")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='base URL of a running server; default runs in-process')
+    parser.add_argument('--users', type=int, default=16, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run')
+    parser.add_argument('--courses', type=int, default=30, help='courses to seed in-process')
+    parser.add_argument('--admin-every', type=int, default=16, help='every Nth virtual user is an admin (0: none)')
+    parser.add_argument('--admin-username', default='admin')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            result['regressions'] = compare(result, json.load(f), args.threshold)
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    sys.exit(1 if result.get('regressions') else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""
+Payload cache for LearnSmart
+Serialized JSON bodies of rarely changing entities (a course with its
+lessons and quizzes, a quiz with its questions) are cached as bytes, so a
+hit skips both the ORM loading and the JSON encoding. Entries are keyed by
+entity, id and version: the admin routes that change an entity bump its
+version after committing instead of deleting entries, so a request that
+read the old rows before the commit can only store them under a version
+nobody reads any more. Orphaned entries age out of the LRU.
+
+Backends are pluggable (CACHE_BACKEND):
+- memory: a per-process LRU bounded to CACHE_MAX_BYTES, entries expire
+  after CACHE_TTL_SECONDS. Invalidations reach only the process that made
+  them; the others serve the old payload until it expires.
+- sqlite: the same LRU in a local SQLite file (CACHE_PATH) shared by every
+  worker process on the host, so invalidations reach all of them.
+- a 'package.module:Class' import path for anything else implementing
+  CacheBackend.
+
+Per-user responses (dashboard, insights, learning style) share the cache
+but are keyed by the user's version in the user_version table instead,
+which the write paths bump in the transaction that changes the user's
+enrollments, progress or attempts (and, for everyone enrolled, a change to
+the course). Since the version lives in the database, every process sees a
+bump, whatever the backend; a fresh response costs one primary-key lookup.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import literal, select
+from werkzeug.utils import import_string
+
+from models import db, Enrollment, UserVersion, insert_or_increment
+
+# Rough per-entry bookkeeping cost of the memory backend beyond key and value
+ENTRY_OVERHEAD = 200
+
+
+class CacheBackend:
+    """
+    Storage for cache entries and entity versions. Versions must never be
+    evicted: losing one would make entries stored under an older version
+    readable again.
+    """
+
+    def get(self, key):
+        """The stored bytes, or None when missing or expired"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def versions(self, names):
+        """Current version of each name (0 when never bumped)"""
+        raise NotImplementedError
+
+    def bump(self, names):
+        raise NotImplementedError
+
+    def usage(self):
+        """(entries, bytes, evictions so far by this process)"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """Process-local LRU bounded by the bytes it holds"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires, value)
+        self.version_numbers = {}
+        self.bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.bytes += len(key) + len(value) + ENTRY_OVERHEAD
+            while self.bytes > self.max_bytes and self.entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, value = self.entries.pop(key)
+        self.bytes -= len(key) + len(value) + ENTRY_OVERHEAD
+
+    def versions(self, names):
+        with self.lock:
+            return [self.version_numbers.get(name, 0) for name in names]
+
+    def bump(self, names):
+        with self.lock:
+            for name in names:
+                self.version_numbers[name] = self.version_numbers.get(name, 0) + 1
+
+    def usage(self):
+        with self.lock:
+            return len(self.entries), self.bytes, self.evictions
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    LRU in a SQLite file shared by the worker processes of one host. Last
+    use is only rewritten when it is more than a second old, so hits stay
+    reads; eviction runs on writes and drops the least recently used
+    entries until the file holds at most max_bytes of values.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.local = threading.local()
+
+    def _connection(self):
+        # One connection per thread, opened (and the file created) on first use
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS entry (
+                    key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,
+                    expires REAL NOT NULL, used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entry_used ON entry (used);
+                CREATE TABLE IF NOT EXISTS version (name TEXT PRIMARY KEY, number INTEGER NOT NULL);
+            ''')
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute('SELECT value, expires, used FROM entry WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires, used = row
+        now = time.time()
+        if expires < now:
+            connection.execute('DELETE FROM entry WHERE key = ? AND expires < ?', (key, now))
+            return None
+        if now - used > 1:
+            connection.execute('UPDATE entry SET used = ? WHERE key = ?', (now, key))
+        return value
+
+    def set(self, key, value, ttl):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('INSERT OR REPLACE INTO entry (key, value, size, expires, used) VALUES (?, ?, ?, ?, ?)',
+                           (key, value, len(key) + len(value), now + ttl, now))
+        (total,) = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entry').fetchone()
+        if total > self.max_bytes:
+            evicted = 0
+            for key, size in connection.execute('SELECT key, size FROM entry ORDER BY used').fetchall():
+                if total <= self.max_bytes:
+                    break
+                total -= size
+                evicted += connection.execute('DELETE FROM entry WHERE key = ?', (key,)).rowcount
+            self.evictions += evicted
+
+    def versions(self, names):
+        placeholders = ', '.join('?' for _ in names)
+        numbers = dict(self._connection().execute(
+            f'SELECT name, number FROM version WHERE name IN ({placeholders})', list(names)
+        ).fetchall())
+        return [numbers.get(name, 0) for name in names]
+
+    def bump(self, names):
+        self._connection().executemany(
+            'INSERT INTO version (name, number) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET number = number + 1',
+            [(name,) for name in names]
+        )
+
+    def usage(self):
+        entries, size = self._connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entry').fetchone()
+        return entries, size, self.evictions
+
+    def clear(self):
+        self._connection().execute('DELETE FROM entry')
+
+
+class PayloadCache:
+    """Versioned lookups, invalidation and hit counters over a backend"""
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.stats = {}  # entity -> [hits, misses, invalidations]
+
+    def _count(self, entity, index, amount=1):
+        with self.lock:
+            self.stats.setdefault(entity, [0, 0, 0])[index] += amount
+
+    def lookup(self, entity, entity_id, version=None):
+        """
+        (key, cached bytes or None); store a miss's payload under the
+        returned key. Without a version the backend's versions of the entity
+        are used.
+        """
+        if version is None:
+            generation, version = self.backend.versions((f'{entity}:*', f'{entity}:{entity_id}'))
+            version = f'{generation}.{version}'
+        key = f'{entity}:{entity_id}:{version}'
+        body = self.backend.get(key)
+        self._count(entity, 0 if body is not None else 1)
+        return key, body
+
+    def store(self, key, body):
+        self.backend.set(key, body, self.ttl)
+
+    def invalidate(self, entity, *entity_ids):
+        """Retire the cached payloads of entity_ids, or of every entity of the kind when none are given"""
+        names = [f'{entity}:{entity_id}' for entity_id in entity_ids] or [f'{entity}:*']
+        self.backend.bump(names)
+        self._count(entity, 2, len(names))
+
+    def metric_lines(self):
+        with self.lock:
+            stats = {entity: list(counts) for entity, counts in self.stats.items()}
+        entries, size, evictions = self.backend.usage()
+        lines = [
+            '# HELP learnsmart_cache_requests_total Payload cache lookups',
+            '# TYPE learnsmart_cache_requests_total counter',
+        ]
+        for entity, (hits, misses, _) in sorted(stats.items()):
+            lines.append(f'learnsmart_cache_requests_total{{entity="{entity}",result="hit"}} {hits}')
+            lines.append(f'learnsmart_cache_requests_total{{entity="{entity}",result="miss"}} {misses}')
+        lines += [
+            '# HELP learnsmart_cache_invalidations_total Payload cache version bumps',
+            '# TYPE learnsmart_cache_invalidations_total counter',
+        ]
+        for entity, (_, _, invalidations) in sorted(stats.items()):
+            lines.append(f'learnsmart_cache_invalidations_total{{entity="{entity}"}} {invalidations}')
+        lines += [
+            '# HELP learnsmart_cache_entries Payloads held by the cache backend',
+            '# TYPE learnsmart_cache_entries gauge',
+            f'learnsmart_cache_entries {entries}',
+            '# HELP learnsmart_cache_bytes Approximate memory held by cached payloads',
+            '# TYPE learnsmart_cache_bytes gauge',
+            f'learnsmart_cache_bytes {size}',
+            '# HELP learnsmart_cache_evictions_total Entries evicted to stay within CACHE_MAX_BYTES',
+            '# TYPE learnsmart_cache_evictions_total counter',
+            f'learnsmart_cache_evictions_total {evictions}',
+        ]
+        return lines
+
+
+def with_members(body, app, **members):
+    """A cached JSON object's bytes with per-request members appended"""
+    extra = b''.join(b',' + app.json.dumps(name).encode() + b':' + app.json.dumps(value).encode()
+                     for name, value in members.items())
+    return body.rstrip()[:-1] + extra + b'}\n'
+
+
+def get_cache():
+    return current_app.extensions.get('cache')
+
+
+def user_version_query(user_id):
+    return select(UserVersion.version).where(UserVersion.user_id == user_id)
+
+
+def bump_user_versions(user_ids):
+    """Retire the cached responses of users whose activity changed (current session, one statement)"""
+    rows = [{'user_id': user_id, 'version': 1} for user_id in set(user_ids)]
+    if rows:
+        db.session.execute(insert_or_increment(UserVersion, 'version'), rows)
+
+
+def bump_course_learners(course_id):
+    """Retire the cached responses of everyone enrolled in a course (current session, one statement)"""
+    db.session.execute(insert_or_increment(UserVersion, 'version').from_select(
+        ['user_id', 'version'],
+        select(Enrollment.user_id, literal(1)).where(Enrollment.course_id == course_id)
+    ))
+
+
+def cached_user_json(entity, user_id, build):
+    """
+    The JSON bytes of one of a user's responses, cached under the user's
+    current version: one primary-key lookup when nothing changed, else
+    build()'s dict serialized and stored. None when build() finds nothing.
+    """
+    cache = get_cache()
+    if cache is None:
+        payload = build()
+        return current_app.json.response(payload).get_data() if payload is not None else None
+    key, body = cache.lookup(entity, user_id, db.session.scalar(user_version_query(user_id)) or 0)
+    if body is not None:
+        return body
+    payload = build()
+    if payload is None:
+        return None
+    body = current_app.json.response(payload).get_data()
+    cache.store(key, body)
+    return body
+
+
+def cached_json(entity, entity_id, build):
+    """
+    The JSON bytes of an entity's payload: cached, or build()'s dict
+    serialized as jsonify would and stored. None when build() finds nothing.
+    """
+    cache = get_cache()
+    if cache is not None:
+        key, body = cache.lookup(entity, entity_id)
+        if body is not None:
+            return body
+    payload = build()
+    if payload is None:
+        return None
+    body = current_app.json.response(payload).get_data()
+    if cache is not None:
+        cache.store(key, body)
+    return body
+
+
+def invalidate(entity, *entity_ids):
+    """Retire cached payloads after committing a change (no-op when caching is off)"""
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate(entity, *entity_ids)
+
+
+def create_backend(config):
+    name = config.get('CACHE_BACKEND', 'memory')
+    max_bytes = config.get('CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    if name == 'memory':
+        return MemoryBackend(max_bytes)
+    if name == 'sqlite':
+        return SQLiteBackend(config['CACHE_PATH'], max_bytes)
+    return import_string(name)(config)
+
+
+def init_cache(app):
+    """Attach the payload cache unless CACHE_BACKEND is 'none'"""
+    if app.config.get('CACHE_BACKEND', 'memory') == 'none':
+        return None
+    cache = PayloadCache(create_backend(app.config), ttl=app.config.get('CACHE_TTL_SECONDS', 300))
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.collectors.append(cache.metric_lines)
+    app.extensions['cache'] = cache
+    return cache
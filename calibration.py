@@ -0,0 +1,336 @@
+"""
+Item response theory calibration for LearnSmart
+Every question_response row (see item_analysis.py) is one response: the
+learner got the question right or wrong. The two-parameter logistic (2PL) model says
+
+    P(correct) = 1 / (1 + exp(-a * (theta - b)))
+
+for a question of difficulty b and discrimination a and a learner of
+ability theta; the one-parameter (Rasch, 1PL) model fixes a = 1.
+
+`flask --app app calibrate-questions` estimates all of them by penalized
+joint maximum likelihood. Responses are held as three coordinate arrays
+(learner index, question index, outcome), i.e. a sparse learner x question
+matrix, and every iteration is one vectorized pass over them in chunks that
+accumulates Newton steps for every learner, then for every question.
+Normal priors on theta, b and log a keep estimates finite for all-correct
+or all-wrong rows, and abilities are standardized every iteration to fix
+the scale. Results replace the question_calibration and learner_ability
+tables; quiz, recommendation and quiz-generation endpoints read them.
+Fitting needs numpy, which only the loading, fitting and storing functions
+import; reading the stored tables does not.
+"""
+
+import importlib.util
+import math
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from sqlalchemy import delete, func, insert, select
+
+from cache import invalidate
+from models import db, Question, Quiz, QuizAttempt, QuestionResponse, QuestionCalibration, LearnerAbility
+
+ONE_PL = '1pl'
+TWO_PL = '2pl'
+
+# Prior variances of theta, b and log a
+ABILITY_PRIOR = 1.0
+DIFFICULTY_PRIOR = 1.0
+LOG_DISCRIMINATION_PRIOR = 0.25
+# Newton steps are clipped so that early iterations cannot overshoot
+MAX_STEP = 1.0
+# Difficulties live in [-6, 6] and discriminations in [0.2, 5]
+PARAMETER_BOUND = 6.0
+LOG_DISCRIMINATION_BOUND = math.log(5)
+# Responses per vectorized chunk; bounds the temporaries to a few hundred MB
+CHUNK_SIZE = 4_000_000
+# Responses fetched per round trip while loading
+RESPONSE_BATCH = 100_000
+
+Responses = namedtuple('Responses', 'user_ids question_ids user_index question_index correct')
+Fit = namedtuple('Fit', 'ability ability_se difficulty difficulty_se discrimination iterations converged')
+
+
+def load_responses(connection):
+    """
+    Every recorded response (see item_analysis.py) as a Responses tuple.
+    Repeated attempts contribute one response each.
+    """
+    import numpy as np
+    users, questions, outcomes = array('i'), array('i'), array('b')
+    result = connection.execution_options(yield_per=RESPONSE_BATCH).execute(
+        select(QuizAttempt.user_id, QuestionResponse.question_id, QuestionResponse.correct)
+        .join(QuizAttempt, QuizAttempt.id == QuestionResponse.attempt_id)
+    )
+    for partition in result.partitions():
+        user_column, question_column, correct_column = zip(*partition)
+        users.extend(user_column)
+        questions.extend(question_column)
+        outcomes.extend(correct_column)
+
+    user_ids, user_index = np.unique(np.frombuffer(users, dtype=np.int32), return_inverse=True)
+    question_ids, question_index = np.unique(np.frombuffer(questions, dtype=np.int32), return_inverse=True)
+    return Responses(user_ids, question_ids, user_index.astype(np.int32), question_index.astype(np.int32),
+                     np.frombuffer(outcomes, dtype=np.int8).astype(np.float64))
+
+
+def _chunks(responses, chunk_size):
+    for start in range(0, len(responses.correct), chunk_size):
+        end = start + chunk_size
+        yield responses.user_index[start:end], responses.question_index[start:end], responses.correct[start:end]
+
+
+def fit(responses, model=TWO_PL, max_iterations=100, tolerance=1e-4, chunk_size=CHUNK_SIZE):
+    """
+    Penalized joint maximum likelihood estimates for every learner and
+    question in responses. Each iteration is a Newton step for all
+    abilities with the questions fixed, then one for all questions (a 2x2
+    step in b and log a under 2PL) with the abilities fixed; the sums behind
+    both are accumulated chunk by chunk with np.bincount.
+    """
+    import numpy as np
+    n_users, n_questions = len(responses.user_ids), len(responses.question_ids)
+    two_pl = model == TWO_PL
+
+    # Start difficulties at the logit of each question's error rate
+    counts = np.bincount(responses.question_index, minlength=n_questions)
+    right = np.bincount(responses.question_index, weights=responses.correct, minlength=n_questions)
+    p = (right + 0.5) / (counts + 1.0)
+    difficulty = np.log((1 - p) / p)
+    log_discrimination = np.zeros(n_questions)
+    ability = np.zeros(n_users)
+
+    converged = False
+    for iteration in range(1, max_iterations + 1):
+        previous = (difficulty.copy(), log_discrimination.copy())
+        discrimination = np.exp(log_discrimination)
+
+        # Abilities, questions fixed
+        gradient = -ability / ABILITY_PRIOR
+        ability_information = np.full(n_users, 1 / ABILITY_PRIOR)
+        for users, questions, correct in _chunks(responses, chunk_size):
+            a = discrimination[questions]
+            expected = 1 / (1 + np.exp(-a * (ability[users] - difficulty[questions])))
+            gradient += np.bincount(users, weights=a * (correct - expected), minlength=n_users)
+            ability_information += np.bincount(users, weights=a * a * expected * (1 - expected), minlength=n_users)
+        ability += np.clip(gradient / ability_information, -MAX_STEP, MAX_STEP)
+
+        # Questions, abilities fixed
+        b_gradient = -difficulty / DIFFICULTY_PRIOR
+        b_information = np.full(n_questions, 1 / DIFFICULTY_PRIOR)
+        slope_gradient = -log_discrimination / LOG_DISCRIMINATION_PRIOR
+        slope_information = np.full(n_questions, 1 / LOG_DISCRIMINATION_PRIOR)
+        cross_information = np.zeros(n_questions)
+        for users, questions, correct in _chunks(responses, chunk_size):
+            a = discrimination[questions]
+            gap = ability[users] - difficulty[questions]
+            expected = 1 / (1 + np.exp(-a * gap))
+            residual = correct - expected
+            weight = a * a * expected * (1 - expected)
+            b_gradient -= np.bincount(questions, weights=a * residual, minlength=n_questions)
+            b_information += np.bincount(questions, weights=weight, minlength=n_questions)
+            if two_pl:
+                slope_gradient += np.bincount(questions, weights=a * gap * residual, minlength=n_questions)
+                slope_information += np.bincount(questions, weights=weight * gap * gap, minlength=n_questions)
+                cross_information -= np.bincount(questions, weights=weight * gap, minlength=n_questions)
+        if two_pl:
+            determinant = b_information * slope_information - cross_information ** 2
+            b_step = (slope_information * b_gradient - cross_information * slope_gradient) / determinant
+            slope_step = (b_information * slope_gradient - cross_information * b_gradient) / determinant
+            # Shrink both components together; clipping them separately
+            # would turn the step away from the Newton direction
+            scale = np.minimum(1, MAX_STEP / np.maximum(np.abs(b_step), np.abs(slope_step)).clip(min=1e-12))
+            b_step *= scale
+            log_discrimination += slope_step * scale
+        else:
+            b_step = np.clip(b_gradient / b_information, -MAX_STEP, MAX_STEP)
+        difficulty += b_step
+
+        # Fix the scale: abilities standardized, questions transformed so
+        # that every probability is unchanged (a 1PL scale is fixed by a = 1)
+        if n_users > 1:
+            center = ability.mean()
+            spread = ability.std() if two_pl else 1.0
+            if spread > 0:
+                ability = (ability - center) / spread
+                difficulty = (difficulty - center) / spread
+                log_discrimination += math.log(spread)
+        # A question nearly everyone gets right (or wrong) has a ridge of
+        # equally good fits running off to b = -inf, a = 0; the bounds keep
+        # the rescaling above from walking it down that ridge forever
+        np.clip(difficulty, -PARAMETER_BOUND, PARAMETER_BOUND, out=difficulty)
+        np.clip(log_discrimination, -LOG_DISCRIMINATION_BOUND, LOG_DISCRIMINATION_BOUND, out=log_discrimination)
+
+        # Convergence is judged on the questions: abilities are a Newton fit
+        # against them each pass and settle far more slowly along the scale
+        largest = max(np.abs(current - before).max(initial=0)
+                      for current, before in zip((difficulty, log_discrimination), previous))
+        if largest < tolerance:
+            converged = True
+            break
+
+    return Fit(ability, 1 / np.sqrt(ability_information), difficulty, 1 / np.sqrt(b_information),
+               np.exp(log_discrimination), iteration, converged)
+
+
+def store_calibration(responses, result):
+    """Replace the stored calibration with result (current session)"""
+    import numpy as np
+    now = datetime.utcnow()
+    question_counts = np.bincount(responses.question_index, minlength=len(responses.question_ids))
+    question_right = np.bincount(responses.question_index, weights=responses.correct,
+                                 minlength=len(responses.question_ids))
+    user_counts = np.bincount(responses.user_index, minlength=len(responses.user_ids))
+
+    db.session.execute(delete(QuestionCalibration))
+    db.session.execute(delete(LearnerAbility))
+    question_rows = [
+        {'question_id': int(question_id), 'difficulty': float(b), 'discrimination': float(a),
+         'standard_error': float(se), 'responses': int(count), 'proportion_correct': round(float(right / count), 4),
+         'calibrated_at': now}
+        for question_id, b, a, se, count, right in zip(responses.question_ids, result.difficulty,
+                                                       result.discrimination, result.difficulty_se,
+                                                       question_counts, question_right)
+    ]
+    user_rows = [
+        {'user_id': int(user_id), 'ability': float(theta), 'standard_error': float(se), 'responses': int(count),
+         'calibrated_at': now}
+        for user_id, theta, se, count in zip(responses.user_ids, result.ability, result.ability_se, user_counts)
+    ]
+    for model, rows in ((QuestionCalibration, question_rows), (LearnerAbility, user_rows)):
+        for start in range(0, len(rows), 10000):
+            db.session.execute(insert(model), rows[start:start + 10000])
+
+
+def calibrate(model=TWO_PL, max_iterations=100, tolerance=1e-4):
+    """Load every response, fit the model and store it (current session); returns (responses, fit)"""
+    responses = load_responses(db.session.connection())
+    result = fit(responses, model, max_iterations, tolerance)
+    store_calibration(responses, result)
+    return responses, result
+
+
+def probability_correct(ability, difficulty, discrimination=1.0):
+    return 1 / (1 + math.exp(-discrimination * (ability - difficulty)))
+
+
+def expected_score(ability, calibrations):
+    """Expected proportion correct of a LearnerAbility on calibrated questions, or None"""
+    calibrations = list(calibrations)
+    if ability is None or not calibrations:
+        return None
+    return round(sum(probability_correct(ability.ability, calibration.difficulty, calibration.discrimination)
+                     for calibration in calibrations) / len(calibrations), 3)
+
+
+def quiz_expected_score(user_id, quiz_id):
+    """The learner's expected proportion correct on a quiz's calibrated questions, in one query; or None"""
+    rows = db.session.execute(
+        select(LearnerAbility.ability, QuestionCalibration.difficulty, QuestionCalibration.discrimination)
+        .select_from(QuestionCalibration)
+        .join(Question, Question.id == QuestionCalibration.question_id)
+        .join(LearnerAbility, LearnerAbility.user_id == user_id)
+        .where(Question.quiz_id == quiz_id)
+    ).all()
+    if not rows:
+        return None
+    return round(sum(probability_correct(*row) for row in rows) / len(rows), 3)
+
+
+def difficulty_label(difficulty):
+    """The course difficulty vocabulary for a difficulty on the ability scale"""
+    if difficulty < -0.5:
+        return 'beginner'
+    if difficulty > 0.5:
+        return 'advanced'
+    return 'intermediate'
+
+
+def question_calibrations(question_ids):
+    """{question_id: QuestionCalibration} for the calibrated ones among question_ids"""
+    if not question_ids:
+        return {}
+    return {calibration.question_id: calibration for calibration in db.session.scalars(
+        select(QuestionCalibration).where(QuestionCalibration.question_id.in_(question_ids))
+    )}
+
+
+def expected_scores(user_id, course_ids):
+    """
+    {course_id: the learner's expected proportion correct on the course's
+    calibrated questions}, in one query; empty when the learner has no
+    ability estimate yet.
+    """
+    if not course_ids:
+        return {}
+    return expected_scores_from_rows(db.session.execute(expected_scores_query(user_id, course_ids)).all())
+
+
+def expected_scores_query(user_id, course_ids):
+    """(course id, ability, difficulty, discrimination) per calibrated question of the courses"""
+    return (
+        select(Quiz.course_id, LearnerAbility.ability, QuestionCalibration.difficulty,
+               QuestionCalibration.discrimination)
+        .join(Question, Question.quiz_id == Quiz.id)
+        .join(QuestionCalibration, QuestionCalibration.question_id == Question.id)
+        .join(LearnerAbility, LearnerAbility.user_id == user_id)
+        .where(Quiz.course_id.in_(course_ids))
+    )
+
+
+def expected_scores_from_rows(rows):
+    """expected_scores from the rows of expected_scores_query"""
+    totals = {}
+    for course_id, ability, difficulty, discrimination in rows:
+        total = totals.setdefault(course_id, [0.0, 0])
+        total[0] += probability_correct(ability, difficulty, discrimination)
+        total[1] += 1
+    return {course_id: round(total / count, 3) for course_id, (total, count) in totals.items()}
+
+
+def add_expected_scores(user_id, courses_data):
+    """Set expected_score on serialized courses (None where there is no calibration)"""
+    return set_expected_scores(courses_data, expected_scores(user_id, [course['id'] for course in courses_data]))
+
+
+def set_expected_scores(courses_data, scores):
+    for course in courses_data:
+        course['expected_score'] = scores.get(course['id'])
+    return courses_data
+
+
+def course_difficulty(course_id):
+    """Mean calibrated difficulty of a course's questions, or None"""
+    return db.session.scalar(
+        select(func.avg(QuestionCalibration.difficulty))
+        .join(Question, Question.id == QuestionCalibration.question_id)
+        .join(Quiz, Quiz.id == Question.quiz_id)
+        .where(Quiz.course_id == course_id)
+    )
+
+
+@click.command('calibrate-questions')
+@click.option('--model', type=click.Choice([ONE_PL, TWO_PL]), default=TWO_PL, help='IRT model to fit.')
+@click.option('--max-iterations', type=int, default=100)
+@click.option('--tolerance', type=float, default=1e-4, help='Stop when no question parameter moves more than this.')
+def calibrate_questions_command(model, max_iterations, tolerance):
+    """Estimate question difficulty and learner ability from every quiz attempt."""
+    if importlib.util.find_spec('numpy') is None:
+        raise click.ClickException('calibrate-questions requires numpy (pip install numpy)')
+    start = time.perf_counter()
+    responses, result = calibrate(model, max_iterations, tolerance)
+    db.session.commit()
+    # Quiz payloads carry each question's calibration
+    invalidate('quiz')
+    status = 'converged' if result.converged else 'stopped'
+    click.echo(f'✓ {len(responses.correct)} responses: {len(responses.question_ids)} questions and '
+               f'{len(responses.user_ids)} learners calibrated ({model}, {status} after {result.iterations} '
+               f'iterations) in {time.perf_counter() - start:.1f}s')
+
+
+def init_calibration(app):
+    app.cli.add_command(calibrate_questions_command)
@@ -0,0 +1,360 @@
+"""
+Shared catalog snapshot for LearnSmart
+The course list endpoints are served from an immutable snapshot file that
+every worker process on the host memory-maps, instead of each process
+querying and serializing the whole catalog or keeping its own copy. The
+file holds a fixed-size record per course (id, category, difficulty,
+lesson and enrollment counts, and where its serialized to_dict() is), the
+serialized courses laid out as the JSON array GET /api/courses/ returns,
+and an index of each category's courses. Its pages sit in the OS page
+cache once per host, so memory per worker stays flat as workers are added.
+
+Snapshots are never modified. Publishing writes catalog-<version>.snap and
+then points the CURRENT file at it with an atomic rename; readers check
+CURRENT at most every CATALOG_CHECK_SECONDS and swap their mapping, while
+requests already holding the old one finish with it. Admin writes that
+change the list wake a background publisher after committing, and the
+publisher also replaces snapshots older than CATALOG_MAX_AGE_SECONDS,
+which bounds how stale enrollment counts get. A file lock makes a single
+process per host do the work.
+
+Layout (little endian):
+
+    header     magic, version, published_at, courses, categories,
+               names offset and length, array offset and length
+    records    per course in id order: id, category, difficulty,
+               lesson_count, enrollment_count, body offset and length
+    categories per category: first position in the category index, count
+    index      record positions grouped by category, in id order
+    names      JSON {"categories": [...], "difficulties": [...]}
+    array      the list response: [body,body,...]
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+
+from refresher import BackgroundRefresher
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishers are not serialized across processes
+    fcntl = None
+
+MAGIC = b'LSCATv1\n'
+HEADER = struct.Struct('<8sQdIIQQQQ')
+RECORD = struct.Struct('<IHBxIIQI')
+CATEGORY = struct.Struct('<II')
+POSITION = struct.Struct('<I')
+
+# Snapshots kept next to the current one for workers still mapping them
+KEEP_VERSIONS = 3
+
+CatalogEntry = namedtuple('CatalogEntry', 'id category difficulty_level lesson_count enrollment_count')
+
+
+class Snapshot:
+    """One published snapshot, memory-mapped read-only"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.version, self.published_at, self.count, category_count,
+         names_offset, names_length, self.array_offset, self.array_length) = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot')
+        names = json.loads(self.map[names_offset:names_offset + names_length])
+        self.category_names = names['categories']
+        self.difficulty_names = names['difficulties']
+        self.category_numbers = {name: number for number, name in enumerate(self.category_names)}
+        self.categories_offset = HEADER.size + self.count * RECORD.size
+        self.index_offset = self.categories_offset + category_count * CATEGORY.size
+
+    def _record(self, position):
+        return RECORD.unpack_from(self.map, HEADER.size + position * RECORD.size)
+
+    def _entry(self, record):
+        course_id, category, difficulty, lesson_count, enrollment_count, _, _ = record
+        return CatalogEntry(course_id, self.category_names[category], self.difficulty_names[difficulty],
+                            lesson_count, enrollment_count)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Every course's entry, in id order"""
+        for position in range(self.count):
+            yield self._entry(self._record(position))
+
+    def find(self, course_id):
+        """The course's record position (binary search over the id-ordered records), or None"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < course_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._record(low)[0] == course_id:
+            return low
+        return None
+
+    def entry(self, course_id):
+        position = self.find(course_id)
+        return None if position is None else self._entry(self._record(position))
+
+    def course_json(self, course_id):
+        """A course's serialized to_dict(), or None when it is not in the snapshot"""
+        position = self.find(course_id)
+        if position is None:
+            return None
+        *_, offset, length = self._record(position)
+        return self.map[offset:offset + length]
+
+    def courses_json(self):
+        """The GET /api/courses/ response body"""
+        return self.map[self.array_offset:self.array_offset + self.array_length]
+
+    def category_json(self, category):
+        """The GET /api/courses/category/<category> response body"""
+        number = self.category_numbers.get(category)
+        if number is None:
+            return b'[]\n'
+        first, count = CATEGORY.unpack_from(self.map, self.categories_offset + number * CATEGORY.size)
+        bodies = []
+        for (position,) in POSITION.iter_unpack(
+            self.map[self.index_offset + first * POSITION.size:self.index_offset + (first + count) * POSITION.size]
+        ):
+            *_, offset, length = self._record(position)
+            bodies.append(self.map[offset:offset + length])
+        return b'[' + b','.join(bodies) + b']\n'
+
+
+def snapshot_path(directory, version):
+    return os.path.join(directory, f'catalog-{version:012d}.snap')
+
+
+def current_version(directory):
+    """The published version CURRENT points at, or None before the first publish"""
+    try:
+        with open(os.path.join(directory, 'CURRENT')) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def replace_file(path, data):
+    """Write data to path atomically: readers see the old file or the whole new one"""
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+@contextmanager
+def publish_lock(directory):
+    with open(os.path.join(directory, 'publish.lock'), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_snapshot(version):
+    """The bytes of a snapshot of the current catalog (three queries)"""
+    from models import db, Course
+    from read_models import CourseRead
+    from routes import course_counts
+
+    courses = CourseRead.from_rows(db.session.execute(CourseRead.select().order_by(Course.id)))
+    lesson_counts, enrollment_counts = course_counts([course.id for course in courses])
+    json_provider = current_app.json
+    bodies = [
+        json_provider.dumps(course.to_dict(lesson_count=lesson_counts.get(course.id, 0),
+                                           enrollment_count=enrollment_counts.get(course.id, 0)),
+                            separators=(',', ':')).encode()
+        for course in courses
+    ]
+    category_names = sorted({course.category for course in courses})
+    difficulty_names = sorted({course.difficulty_level for course in courses}, key=str)
+    category_numbers = {name: number for number, name in enumerate(category_names)}
+    difficulty_numbers = {name: number for number, name in enumerate(difficulty_names)}
+    names = json.dumps({'categories': category_names, 'difficulties': difficulty_names}).encode()
+
+    by_category = {}
+    for position, course in enumerate(courses):
+        by_category.setdefault(category_numbers[course.category], []).append(position)
+    categories, index = [], []
+    for number in range(len(category_names)):
+        categories.append(CATEGORY.pack(len(index), len(by_category[number])))
+        index.extend(POSITION.pack(position) for position in by_category[number])
+
+    names_offset = HEADER.size + len(courses) * RECORD.size + len(categories) * CATEGORY.size + len(index) * POSITION.size
+    array_offset = names_offset + len(names)
+    records, offset = [], array_offset + 1
+    for course, body in zip(courses, bodies):
+        records.append(RECORD.pack(course.id, category_numbers[course.category],
+                                   difficulty_numbers[course.difficulty_level],
+                                   lesson_counts.get(course.id, 0), enrollment_counts.get(course.id, 0),
+                                   offset, len(body)))
+        offset += len(body) + 1
+    array = b'[' + b','.join(bodies) + b']\n'
+    header = HEADER.pack(MAGIC, version, time.time(), len(courses), len(categories),
+                         names_offset, len(names), array_offset, len(array))
+    return b''.join([header, *records, *categories, *index, names, array])
+
+
+def publish_snapshot(directory, max_age=None):
+    """
+    Build and publish the next snapshot version under the host-wide lock.
+    With max_age, skips (returns None) while the current snapshot is
+    younger, so workers polling together publish once. Returns the version.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with publish_lock(directory):
+        current = current_version(directory)
+        if max_age is not None and current is not None:
+            try:
+                if time.time() - os.stat(snapshot_path(directory, current)).st_mtime < max_age:
+                    return None
+            except OSError:
+                pass
+        version = (current or 0) + 1
+        replace_file(snapshot_path(directory, version), build_snapshot(version))
+        replace_file(os.path.join(directory, 'CURRENT'), str(version).encode())
+
+        # Mapped files stay readable after unlinking (POSIX); elsewhere they are removed on a later publish
+        for name in os.listdir(directory):
+            if name.startswith('catalog-') and name.endswith('.snap') and \
+                    int(name[8:-5]) <= version - KEEP_VERSIONS:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+    return version
+
+
+class CatalogPublisher(BackgroundRefresher):
+    """Publishes a snapshot when asked to after an admin write, and when the current one gets too old"""
+    name = 'catalog'
+
+    def __init__(self, app, store, max_age):
+        super().__init__(app, interval_seconds=max_age / 4, batch_size=1)
+        self.store = store
+        self.max_age = max_age
+        self.requested = False
+
+    def request(self):
+        self.requested = True
+        self.wake()
+
+    def refresh_batch(self):
+        # Cleared before reading, so a write committed before request() is in this build
+        requested, self.requested = self.requested, False
+        if publish_snapshot(self.store.directory, None if requested else self.max_age) is not None:
+            self.store.checked = 0
+        return 0
+
+
+class SnapshotStore:
+    """This process's mapping of the current snapshot, swapped when a new version is published"""
+
+    def __init__(self, directory, check_seconds=1.0):
+        self.directory = directory
+        self.check_seconds = check_seconds
+        self.snapshot = None
+        self.checked = 0
+        self.lock = threading.Lock()
+        self.publisher = None
+
+    def current(self):
+        """The newest published snapshot, or None before the first publish"""
+        now = time.monotonic()
+        if now - self.checked >= self.check_seconds:
+            with self.lock:
+                if now - self.checked >= self.check_seconds:
+                    self.checked = now
+                    self._swap()
+        if self.publisher is not None:
+            self.publisher.start()
+            if self.snapshot is None:
+                self.publisher.request()
+        return self.snapshot
+
+    def _swap(self):
+        version = current_version(self.directory)
+        if version is None or (self.snapshot is not None and self.snapshot.version == version):
+            return
+        try:
+            # The old mapping is released once the last request holding it drops it
+            self.snapshot = Snapshot(snapshot_path(self.directory, version))
+        except (OSError, ValueError) as e:
+            print(f"Catalog snapshot {version} not mapped, keeping the previous one: {str(e)}")
+
+
+def get_store():
+    return current_app.extensions.get('catalog')
+
+
+def catalog_json(category=None):
+    """
+    The course list (or one category's) response body from the snapshot,
+    or None while snapshots are off or none is published yet.
+    """
+    store = get_store()
+    snapshot = store.current() if store is not None else None
+    if snapshot is None:
+        return None
+    return snapshot.courses_json() if category is None else snapshot.category_json(category)
+
+
+def publish_catalog():
+    """Ask for a new snapshot after committing a change to the course list (no-op when snapshots are off)"""
+    store = get_store()
+    if store is not None and store.publisher is not None:
+        store.publisher.request()
+
+
+def snapshot_directory(app):
+    """A directory per database under CATALOG_DIR, so snapshots of different databases never mix"""
+    database = hashlib.sha1(app.config['SQLALCHEMY_DATABASE_URI'].encode()).hexdigest()[:12]
+    return os.path.join(app.config['CATALOG_DIR'], database)
+
+
+@click.command('publish-catalog')
+def publish_catalog_command():
+    """Build and publish a catalog snapshot for the workers on this host."""
+    start = time.perf_counter()
+    directory = snapshot_directory(current_app)
+    version = publish_snapshot(directory)
+    size = os.path.getsize(snapshot_path(directory, version))
+    click.echo(f'✓ Catalog snapshot {version} ({size / 1e6:.1f} MB) published in {time.perf_counter() - start:.1f}s')
+
+
+def init_catalog(app):
+    """Attach the snapshot store and its publisher unless CATALOG_SNAPSHOT_ENABLED is false"""
+    app.cli.add_command(publish_catalog_command)
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not app.config.get('CATALOG_SNAPSHOT_ENABLED', True) or uri in ('sqlite://', 'sqlite:///:memory:'):
+        return None
+    store = SnapshotStore(snapshot_directory(app), app.config.get('CATALOG_CHECK_SECONDS', 1.0))
+    store.publisher = CatalogPublisher(app, store, app.config.get('CATALOG_MAX_AGE_SECONDS', 60.0))
+    app.extensions['catalog'] = store
+
+    import atexit
+    atexit.register(store.publisher.stop)
+    return store
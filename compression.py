@@ -0,0 +1,198 @@
+"""
+Response compression for LearnSmart
+Compresses JSON, HTML and other text responses with brotli (when the brotli
+package is installed) or gzip, whichever the client prefers in
+Accept-Encoding. Bodies under COMPRESS_MIN_SIZE are sent as they are,
+streamed responses are compressed chunk by chunk, and compressed bodies are
+kept in a small LRU cache keyed by a digest of the body, so that a catalog
+page many clients fetch is compressed once however its response is tagged.
+The cache holds at most COMPRESS_CACHE_SIZE bodies and COMPRESS_CACHE_MAX_BYTES
+compressed bytes.
+"""
+
+import gzip
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'text/javascript', 'text/html', 'text/css',
+    'text/plain', 'text/csv', 'image/svg+xml',
+}
+
+
+def _append_vary(response):
+    vary = {v.strip().lower() for v in response.headers.get('Vary', '').split(',') if v.strip()}
+    if 'accept-encoding' not in vary:
+        response.headers['Vary'] = ', '.join(filter(None, [response.headers.get('Vary'), 'Accept-Encoding']))
+
+
+class Compressor:
+    """Per-app compression settings, compressed-body cache and counters"""
+
+    def __init__(self, min_size=1024, gzip_level=5, brotli_quality=4, cache_size=256,
+                 cache_max_bytes=16 * 1024 * 1024):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self.cache_max_bytes = cache_max_bytes
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'responses': {}, 'bytes_in': 0, 'bytes_out': 0, 'cache_hits': 0, 'cache_misses': 0}
+
+    def choose_encoding(self, accept_encodings):
+        """Highest-quality encoding the client accepts; brotli wins ties"""
+        best, best_quality = None, 0
+        for encoding in ('br', 'gzip') if brotli is not None else ('gzip',):
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, self.gzip_level)
+
+    def compress_stream(self, chunks, encoding):
+        """Compress an iterable of chunks, flushing after each so streaming stays incremental"""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            process = lambda chunk: compressor.process(chunk) + compressor.flush()
+            finish = compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            process = lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            finish = compressor.flush
+        try:
+            for chunk in chunks:
+                data = process(chunk.encode() if isinstance(chunk, str) else chunk)
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            # Let the wrapped iterable release its resources (e.g. stream_with_context)
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def cached_compress(self, data, encoding):
+        # Hashing the body costs a fraction of compressing it again
+        key = (hashlib.blake2b(data, digest_size=16).digest(), encoding)
+        with self.lock:
+            body = self.cache.get(key)
+            if body is not None:
+                self.cache.move_to_end(key)
+                self.stats['cache_hits'] += 1
+                return body
+            self.stats['cache_misses'] += 1
+        body = self.compress(data, encoding)
+        # A body worth a quarter of the budget would evict most of the cache
+        if len(body) > self.cache_max_bytes // 4:
+            return body
+        with self.lock:
+            if key not in self.cache:
+                self.cache[key] = body
+                self.cache_bytes += len(body)
+            while len(self.cache) > self.cache_size or self.cache_bytes > self.cache_max_bytes:
+                _, evicted = self.cache.popitem(last=False)
+                self.cache_bytes -= len(evicted)
+        return body
+
+    def count(self, encoding, bytes_in, bytes_out):
+        with self.lock:
+            self.stats['responses'][encoding] = self.stats['responses'].get(encoding, 0) + 1
+            self.stats['bytes_in'] += bytes_in
+            self.stats['bytes_out'] += bytes_out
+
+    def after_request(self, response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+
+        if response.is_streamed:
+            encoding = self.choose_encoding(request.accept_encodings)
+            _append_vary(response)
+            if encoding is None:
+                return response
+            response.response = self.compress_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoding
+            self.count(encoding, 0, 0)
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        _append_vary(response)
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        body = self.cached_compress(data, encoding)
+        if len(body) >= len(data):
+            return response
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # The compressed bytes differ from the identity ones, so the tag can only be weak
+            response.set_etag(etag, weak=True)
+        self.count(encoding, len(data), len(body))
+        return response
+
+    def metric_lines(self):
+        with self.lock:
+            stats = dict(self.stats, responses=dict(self.stats['responses']))
+            cache_bytes = self.cache_bytes
+        lines = [
+            '# HELP learnsmart_compressed_responses_total Responses sent compressed',
+            '# TYPE learnsmart_compressed_responses_total counter',
+        ]
+        for encoding, count in sorted(stats['responses'].items()):
+            lines.append(f'learnsmart_compressed_responses_total{{encoding="{encoding}"}} {count}')
+        lines += [
+            '# HELP learnsmart_compression_bytes_total Bytes before and after compression (buffered responses)',
+            '# TYPE learnsmart_compression_bytes_total counter',
+            f'learnsmart_compression_bytes_total{{stage="in"}} {stats["bytes_in"]}',
+            f'learnsmart_compression_bytes_total{{stage="out"}} {stats["bytes_out"]}',
+            '# HELP learnsmart_compression_cache_total Compressed-body cache lookups by body digest',
+            '# TYPE learnsmart_compression_cache_total counter',
+            f'learnsmart_compression_cache_total{{result="hit"}} {stats["cache_hits"]}',
+            f'learnsmart_compression_cache_total{{result="miss"}} {stats["cache_misses"]}',
+            '# HELP learnsmart_compression_cache_bytes Compressed bytes held by the body cache',
+            '# TYPE learnsmart_compression_cache_bytes gauge',
+            f'learnsmart_compression_cache_bytes {cache_bytes}',
+        ]
+        return lines
+
+
+def init_compression(app):
+    """Register the compressing after_request hook"""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return None
+    compressor = Compressor(
+        min_size=app.config.get('COMPRESS_MIN_SIZE', 1024),
+        gzip_level=app.config.get('COMPRESS_GZIP_LEVEL', 5),
+        brotli_quality=app.config.get('COMPRESS_BROTLI_QUALITY', 4),
+        cache_size=app.config.get('COMPRESS_CACHE_SIZE', 256),
+        cache_max_bytes=app.config.get('COMPRESS_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+    )
+    app.after_request(compressor.after_request)
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.collectors.append(compressor.metric_lines)
+    app.extensions['compression'] = compressor
+    return compressor
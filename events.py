@@ -0,0 +1,191 @@
+"""
+Live updates for LearnSmart
+An in-process publish/subscribe broker behind GET /api/learner/events, a
+Server-Sent Events stream per user. Routes publish small deltas (enrollment,
+lesson progress, quiz attempts) after their commit; each open stream has a
+bounded queue that drops its oldest events when the client falls behind.
+
+Streams wait on an Event rather than polling, so under a gevent worker
+(gunicorn -k gevent) every idle connection is a parked greenlet, not a
+thread. The broker is per process: run one gevent worker per node so that
+a user's streams and requests meet in the same process.
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+
+def format_event(event):
+    event_id, event_type, data = event
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+class Subscription:
+    """
+    One open stream: a drop-oldest queue and a wake-up flag. notify, when
+    set, is also called on every put (the ASGI layer uses it to wake a
+    coroutine instead of a thread).
+    """
+
+    __slots__ = ('user_id', 'queue', 'dropped', 'ready', 'notify')
+
+    def __init__(self, user_id, max_queue, notify=None):
+        self.user_id = user_id
+        self.queue = deque(maxlen=max_queue)
+        self.dropped = 0
+        self.ready = threading.Event()
+        self.notify = notify
+
+    def put(self, event):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(event)
+        self.ready.set()
+        if self.notify is not None:
+            self.notify()
+
+    def drain(self):
+        events = []
+        while self.queue:
+            events.append(self.queue.popleft())
+        return events
+
+    def get(self, timeout):
+        """Wait up to timeout seconds and return every queued event (possibly none)"""
+        if not self.queue:
+            self.ready.wait(timeout)
+        # Clear before draining so a publish racing with the drain re-arms the flag
+        self.ready.clear()
+        return self.drain()
+
+
+class EventBroker:
+    """Per-process fan-out of user events to that user's open streams"""
+
+    def __init__(self, max_queue=100, max_connections=10000):
+        self.max_queue = max_queue
+        self.max_connections = max_connections
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.connections = 0
+        self.published = 0
+        self.ids = itertools.count(1)
+
+    def subscribe(self, user_id, notify=None):
+        """Open a subscription, or return None when the node is at max_connections"""
+        with self.lock:
+            if self.connections >= self.max_connections:
+                return None
+            subscription = Subscription(user_id, self.max_queue, notify)
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+            self.connections += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.user_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self.connections -= 1
+                if not subscriptions:
+                    del self.subscribers[subscription.user_id]
+
+    def has_subscribers(self, user_id):
+        return user_id in self.subscribers
+
+    def publish(self, user_id, event_type, data):
+        """Queue an event for every open stream of the user; never blocks on slow clients"""
+        with self.lock:
+            subscriptions = list(self.subscribers.get(user_id, ()))
+            if not subscriptions:
+                return 0
+            event = (next(self.ids), event_type, data)
+            self.published += 1
+        for subscription in subscriptions:
+            subscription.put(event)
+        return len(subscriptions)
+
+    def stream(self, subscription, heartbeat_seconds):
+        """Yield SSE frames for a subscription until the client disconnects"""
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                started = time.monotonic()
+                events = subscription.get(heartbeat_seconds)
+                for event in events:
+                    yield format_event(event)
+                if not events and time.monotonic() - started >= heartbeat_seconds:
+                    # Comment line: keeps proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+    def metric_lines(self):
+        with self.lock:
+            connections, published = self.connections, self.published
+            dropped = sum(s.dropped for subscriptions in self.subscribers.values() for s in subscriptions)
+        return [
+            '# HELP learnsmart_sse_connections Open Server-Sent Events streams',
+            '# TYPE learnsmart_sse_connections gauge',
+            f'learnsmart_sse_connections {connections}',
+            '# HELP learnsmart_sse_events_published_total Events published to at least one stream',
+            '# TYPE learnsmart_sse_events_published_total counter',
+            f'learnsmart_sse_events_published_total {published}',
+            '# HELP learnsmart_sse_events_dropped Events dropped by open streams that fell behind',
+            '# TYPE learnsmart_sse_events_dropped gauge',
+            f'learnsmart_sse_events_dropped {dropped}',
+        ]
+
+
+def get_broker():
+    return current_app.extensions.get('events')
+
+
+def publish(user_id, event_type, data):
+    broker = get_broker()
+    if broker is not None:
+        broker.publish(user_id, event_type, data)
+
+
+def publish_lesson_progress(user_id, lesson_ids):
+    """
+    Publish the enrollment progress of the courses owning lesson_ids. Only
+    queries when the user has an open stream, so requests without listeners
+    pay nothing.
+    """
+    broker = get_broker()
+    if broker is None or not broker.has_subscribers(user_id):
+        return
+    from models import db, Enrollment, Lesson
+
+    rows = db.session.query(Lesson.id, Enrollment).join(
+        Enrollment, Enrollment.course_id == Lesson.course_id
+    ).filter(Lesson.id.in_(lesson_ids), Enrollment.user_id == user_id).all()
+    for lesson_id, enrollment in rows:
+        broker.publish(user_id, 'progress', {
+            'course_id': enrollment.course_id,
+            'lesson_id': lesson_id,
+            'progress_percentage': enrollment.progress_percentage,
+            'completed': enrollment.completed_at is not None,
+            'completed_at': enrollment.completed_at.isoformat() if enrollment.completed_at else None
+        })
+
+
+def init_events(app):
+    """Attach the broker that backs the per-user event streams"""
+    if not app.config.get('SSE_ENABLED', True):
+        return None
+    broker = EventBroker(
+        max_queue=app.config.get('SSE_QUEUE_SIZE', 100),
+        max_connections=app.config.get('SSE_MAX_CONNECTIONS', 10000)
+    )
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.collectors.append(broker.metric_lines)
+    app.extensions['events'] = broker
+    return broker
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Generate a large, deterministic synthetic dataset for performance work.
+
+Course popularity follows a Zipf distribution, learners mostly enroll in
+courses matching their interests, completion follows a skewed distribution
+where most learners never finish, and quiz answers come from a simple
+ability/difficulty model so that item statistics look plausible.
+The same --seed always produces the same database.
+
+    python generate_dataset.py --preset small --database learnsmart-small.db
+    python generate_dataset.py --preset large --database /data/learnsmart-large.db
+
+SQLite targets are bulk loaded directly with the sqlite3 module; any other
+DATABASE_URL is filled with chunked SQLAlchemy Core executemany inserts.
+All generated learners share the password 'learner123'; user 1 is
+admin/admin123.
+
+Only raw data is generated, plus a stale course_vector row per course as
+creating a course through the API would add. The derived tables are left
+to the app's own commands, printed at the end of a run (DERIVED_COMMANDS):
+until they are run, recommendations are scored live, activity trends and
+sketch-based analytics are empty, and similar-course lists and question
+calibrations are missing. user_version needs no rows; a user without one
+is at version 0.
+"""
+
+import argparse
+import bisect
+import hashlib
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+PRESETS = {
+    'tiny': dict(users=1000, courses=100, lessons=2000, enrollments=20000,
+                 progress=60000, attempts=10000),
+    'small': dict(users=10000, courses=1000, lessons=20000, enrollments=200000,
+                  progress=600000, attempts=100000),
+    'medium': dict(users=100000, courses=10000, lessons=200000, enrollments=2000000,
+                   progress=6000000, attempts=1000000),
+    'large': dict(users=1000000, courses=50000, lessons=2000000, enrollments=50000000,
+                  progress=20000000, attempts=5000000),
+}
+
+CATEGORIES = [
+    'programming', 'web development', 'database', 'machine learning', 'data science',
+    'design', 'cloud computing', 'security', 'mobile development', 'devops',
+    'business', 'mathematics',
+]
+CATEGORY_WEIGHTS = [20, 16, 8, 12, 10, 6, 7, 5, 6, 4, 3, 3]
+DIFFICULTIES = ['beginner', 'intermediate', 'advanced']
+WORDS = (
+    'data function model system design pattern query index cache network service '
+    'client server request response variable loop class object module package test '
+    'deploy scale memory thread process vector matrix graph tree table column row '
+    'schema layer interface protocol security token session state event stream'
+).split()
+
+QUESTIONS_PER_QUIZ = 5
+CHUNK_USERS = 5000
+BATCH_ROWS = 50000
+HISTORY_DAYS = 800
+
+# Builds the derived tables from the generated rows, in this order
+DERIVED_COMMANDS = (
+    ('rollup-activity', 'activity_rollup and rollup_state'),
+    ('build-sketches', 'sketch'),
+    ('refresh-recommendations', 'user_recommendation and recommendation_status'),
+    ('build-similarity', 'course_vector vectors, course_similarity and similarity_stats (needs numpy)'),
+    ('calibrate-questions', 'question_calibration and learner_ability (needs numpy)'),
+)
+
+
+def password_hash(password, rng, iterations=600000):
+    """Werkzeug-compatible pbkdf2 hash with a salt drawn from rng, so output is reproducible"""
+    salt = ''.join(rng.choices('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=16))
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+    return f'pbkdf2:sha256:{iterations}${salt}${digest}'
+
+
+class ZipfSampler:
+    """Draw items with probability proportional to 1 / rank ** s via a cumulative table"""
+
+    def __init__(self, items, s, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)  # popularity rank independent of id order
+        weights = [1.0 / (rank ** s) for rank in range(1, len(self.items) + 1)]
+        self.cumulative = list(itertools.accumulate(weights))
+        self.total = self.cumulative[-1] if self.cumulative else 0.0
+
+    def sample(self, rng):
+        return self.items[bisect.bisect_left(self.cumulative, rng.random() * self.total)]
+
+
+class SQLiteWriter:
+    def __init__(self, path):
+        import sqlite3
+        self.conn = sqlite3.connect(path)
+        # Safe for a build that is simply rerun from scratch on failure
+        self.conn.execute('PRAGMA journal_mode = OFF')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute('PRAGMA cache_size = -262144')
+        self.conn.execute('PRAGMA temp_store = MEMORY')
+
+    def insert(self, table, columns, rows):
+        sql = 'INSERT INTO "%s" (%s) VALUES (%s)' % (table, ', '.join(columns), ', '.join('?' * len(columns)))
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, BATCH_ROWS))
+            if not batch:
+                break
+            self.conn.executemany(sql, batch)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class SQLAlchemyWriter:
+    def __init__(self, engine, metadata):
+        self.conn = engine.connect()
+        self.tables = metadata.tables
+        self.transaction = self.conn.begin()
+
+    def insert(self, table, columns, rows):
+        statement = self.tables[table].insert()
+        rows = iter(rows)
+        while True:
+            batch = [dict(zip(columns, row)) for row in itertools.islice(rows, BATCH_ROWS)]
+            if not batch:
+                break
+            self.conn.execute(statement, batch)
+
+    def commit(self):
+        self.transaction.commit()
+        self.transaction = self.conn.begin()
+
+    def close(self):
+        self.transaction.commit()
+        self.conn.close()
+
+
+class DatasetGenerator:
+    def __init__(self, writer, scale, seed, zipf_s, content_words):
+        self.writer = writer
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.zipf_s = zipf_s
+        self.content_words = content_words
+        # Moments are whole seconds since `origin`; formatting through a per-day
+        # string table is much cheaper than datetime.strftime per row
+        origin = datetime(2026, 1, 1) - timedelta(days=HISTORY_DAYS)
+        self.days = [(origin + timedelta(days=d)).strftime('%Y-%m-%d') for d in range(HISTORY_DAYS + 400)]
+        self.end = HISTORY_DAYS * 86400
+
+    def format_time(self, seconds):
+        days, seconds = divmod(seconds, 86400)
+        minutes, seconds = divmod(seconds, 60)
+        return '%s %02d:%02d:%02d.000000' % (self.days[days], minutes // 60, minutes % 60, seconds)
+
+    def moment(self, max_days=365):
+        return self.end - int(self.rng.random() * max_days * 86400)
+
+    def timestamp(self, max_days=365):
+        return self.format_time(self.moment(max_days))
+
+    def text(self, words):
+        return ' '.join(self.rng.choices(WORDS, k=words)).capitalize() + '.'
+
+    def log(self, message):
+        print(f'[{time.perf_counter() - self.started:7.1f}s] {message}', flush=True)
+
+    def run(self):
+        self.started = time.perf_counter()
+        self.generate_users()
+        self.generate_courses()
+        self.generate_lessons()
+        self.generate_quizzes()
+        self.writer.commit()
+        self.generate_activity()
+        self.writer.commit()
+        self.log('done')
+
+    def generate_users(self):
+        users = self.scale['users']
+        rng = self.rng
+        learner_hash = password_hash('learner123', rng)
+        self.user_interests = [None] * (users + 1)
+
+        def rows():
+            yield (1, 'admin', 'admin@learnsmart.com', password_hash('admin123', rng), 'admin',
+                   '[]', 'advanced', self.timestamp())
+            for user_id in range(2, users + 1):
+                interests = sorted(set(rng.choices(range(len(CATEGORIES)), CATEGORY_WEIGHTS, k=rng.randint(1, 3))))
+                self.user_interests[user_id] = interests
+                yield (user_id, f'learner{user_id}', f'learner{user_id}@example.com', learner_hash, 'learner',
+                       '[' + ', '.join('"%s"' % CATEGORIES[i] for i in interests) + ']',
+                       rng.choices(DIFFICULTIES, (60, 30, 10))[0], self.timestamp())
+
+        self.writer.insert('user', ('id', 'username', 'email', 'password_hash', 'role', 'interests',
+                                    'skill_level', 'created_at'), rows())
+        self.log(f'{users} users')
+
+    def generate_courses(self):
+        courses = self.scale['courses']
+        rng = self.rng
+        self.course_category = [0] * (courses + 1)
+
+        def rows():
+            for course_id in range(1, courses + 1):
+                category = rng.choices(range(len(CATEGORIES)), CATEGORY_WEIGHTS)[0]
+                self.course_category[course_id] = category
+                created = self.timestamp(730)
+                yield (course_id, f'{CATEGORIES[category].title()} course {course_id}', self.text(20),
+                       CATEGORIES[category], rng.choices(DIFFICULTIES, (45, 35, 20))[0],
+                       round(rng.uniform(2, 40), 1), f'Instructor {rng.randint(1, max(1, courses // 20))}',
+                       created, created)
+
+        self.writer.insert('course', ('id', 'title', 'description', 'category', 'difficulty_level',
+                                      'duration_hours', 'instructor', 'created_at', 'updated_at'), rows())
+        # Stale until build-similarity vectorizes them
+        self.writer.insert('course_vector', ('course_id', 'version', 'stale'),
+                           ((course_id, 0, True) for course_id in range(1, courses + 1)))
+
+        # Overall popularity plus per-category samplers for interest-driven enrollment
+        self.popular = ZipfSampler(range(1, courses + 1), self.zipf_s, random.Random(self.rng.random()))
+        by_category = {}
+        for course_id in range(1, courses + 1):
+            by_category.setdefault(self.course_category[course_id], []).append(course_id)
+        self.popular_in = {category: ZipfSampler(ids, self.zipf_s, random.Random(self.rng.random()))
+                           for category, ids in by_category.items()}
+        self.log(f'{courses} courses')
+
+    def generate_lessons(self):
+        courses, lessons = self.scale['courses'], self.scale['lessons']
+        rng = self.rng
+
+        # Vary lesson counts per course around the average, then fix up the total
+        average = lessons / courses
+        counts = [max(1, int(rng.uniform(0.5, 1.5) * average)) for _ in range(courses)]
+        drift = lessons - sum(counts)
+        for i in itertools.cycle(range(courses)):
+            if drift == 0:
+                break
+            step = 1 if drift > 0 else -1
+            if counts[i] + step >= 1:
+                counts[i] += step
+                drift -= step
+        self.lesson_start = [0] * (courses + 2)
+        self.lesson_count = [0] * (courses + 1)
+
+        def rows():
+            lesson_id = 1
+            for course_id in range(1, courses + 1):
+                self.lesson_start[course_id] = lesson_id
+                self.lesson_count[course_id] = counts[course_id - 1]
+                for order in range(counts[course_id - 1]):
+                    yield (lesson_id, course_id, f'Lesson {order + 1}', self.text(self.content_words),
+                           order, rng.randint(5, 45), self.timestamp(730))
+                    lesson_id += 1
+
+        self.writer.insert('lesson', ('id', 'course_id', 'title', 'content', 'order_index',
+                                      'duration_minutes', 'created_at'), rows())
+        self.log(f'{lessons} lessons')
+
+    def generate_quizzes(self):
+        courses = self.scale['courses']
+        rng = self.rng
+        quizzes = [(quiz_id, quiz_id) for quiz_id in range(1, courses + 1)]  # one quiz per course
+        self.question_difficulty = [0.0] * (courses * QUESTIONS_PER_QUIZ + 1)
+        self.question_answer = [0] * (courses * QUESTIONS_PER_QUIZ + 1)
+
+        self.writer.insert('quiz', ('id', 'course_id', 'title', 'description', 'total_questions',
+                                    'passing_score', 'time_limit_minutes', 'created_at'),
+                           ((quiz_id, course_id, f'Quiz {quiz_id}', '', QUESTIONS_PER_QUIZ, 70, 30,
+                             self.timestamp(730)) for quiz_id, course_id in quizzes))
+
+        def rows():
+            question_id = 1
+            for quiz_id, _ in quizzes:
+                for _ in range(QUESTIONS_PER_QUIZ):
+                    answer = rng.randrange(4)
+                    self.question_difficulty[question_id] = rng.gauss(0, 1)
+                    self.question_answer[question_id] = answer
+                    yield (question_id, quiz_id, self.text(10).rstrip('.') + '?',
+                           '["Option A", "Option B", "Option C", "Option D"]', answer, '', 1)
+                    question_id += 1
+
+        self.writer.insert('question', ('id', 'quiz_id', 'question_text', 'options', 'correct_answer',
+                                        'explanation', 'points'), rows())
+        self.log(f'{len(quizzes)} quizzes, {len(quizzes) * QUESTIONS_PER_QUIZ} questions')
+
+    def generate_activity(self):
+        """Enrollments, lesson progress and quiz attempts, streamed per chunk of users"""
+        scale = self.scale
+        rng = self.rng
+        random = rng.random
+        format_time = self.format_time
+        users = scale['users']
+        per_user = scale['enrollments'] / max(1, users - 1)
+
+        # Started enrollments complete on average ~40% of their lessons, so pick
+        # the start and attempt probabilities that land near the requested totals
+        average_lessons = scale['lessons'] / scale['courses']
+        expected_completed = 0.4 * average_lessons
+        start_probability = min(1.0, scale['progress'] / max(1.0, scale['enrollments'] * expected_completed))
+        attempt_probability = min(1.0, scale['attempts'] / max(1.0, scale['enrollments'] * start_probability))
+
+        totals = [0, 0, 0]
+        attempt_id = 1
+        enrollment_id = 1
+        progress_id = 1
+        for chunk_start in range(2, users + 1, CHUNK_USERS):
+            enrollments, progress, attempts, responses = [], [], [], []
+            for user_id in range(chunk_start, min(users + 1, chunk_start + CHUNK_USERS)):
+                interests = self.user_interests[user_id]
+                ability = rng.gauss(0, 1)
+                wanted = min(scale['courses'], max(1, int(rng.expovariate(1 / per_user) + 0.5)))
+                chosen = set()
+                tries = 0
+                while len(chosen) < wanted and tries < wanted * 10:
+                    tries += 1
+                    if random() < 0.7:
+                        sampler = self.popular_in.get(rng.choice(interests))
+                        if sampler is None:
+                            continue
+                        chosen.add(sampler.sample(rng))
+                    else:
+                        chosen.add(self.popular.sample(rng))
+
+                for course_id in chosen:
+                    enrolled = self.moment()
+                    lesson_total = self.lesson_count[course_id]
+                    completed_lessons = 0
+                    completed_at = None
+                    if random() < start_probability:
+                        # Skewed: many stop early, a minority finish
+                        fraction = min(1.0, rng.betavariate(0.6, 0.9) * 1.1)
+                        completed_lessons = max(1, int(round(fraction * lesson_total)))
+                        first = self.lesson_start[course_id]
+                        moment = enrolled
+                        for lesson_id in range(first, first + completed_lessons):
+                            moment += 600 + int(random() * 240000)
+                            progress.append((progress_id, user_id, lesson_id, format_time(moment),
+                                             5 + int(random() * 56)))
+                            progress_id += 1
+                        if completed_lessons >= lesson_total:
+                            completed_at = format_time(moment)
+
+                        if random() < attempt_probability:
+                            attempt_id = self.add_attempt(attempts, responses, attempt_id, user_id, course_id,
+                                                          ability, moment)
+
+                    percentage = completed_lessons / lesson_total * 100 if lesson_total else 0
+                    enrollments.append((enrollment_id, user_id, course_id, format_time(enrolled),
+                                        completed_at, percentage))
+                    enrollment_id += 1
+
+            self.writer.insert('enrollment', ('id', 'user_id', 'course_id', 'enrolled_at', 'completed_at',
+                                              'progress_percentage'), enrollments)
+            self.writer.insert('lesson_progress', ('id', 'user_id', 'lesson_id', 'completed_at',
+                                                   'time_spent_minutes'), progress)
+            self.writer.insert('quiz_attempt', ('id', 'user_id', 'quiz_id', 'score', 'total_questions',
+                                                'correct_answers', 'percentage', 'passed',
+                                                'time_taken_minutes', 'attempted_at', 'answers'), attempts)
+            self.writer.insert('question_response', ('attempt_id', 'question_id', 'chosen', 'correct'), responses)
+            totals[0] += len(enrollments)
+            totals[1] += len(progress)
+            totals[2] += len(attempts)
+            if (chunk_start // CHUNK_USERS) % 20 == 0:
+                self.writer.commit()
+                self.log(f'users up to {min(users, chunk_start + CHUNK_USERS - 1)}: {totals[0]} enrollments, '
+                         f'{totals[1]} progress rows, {totals[2]} quiz attempts')
+        self.log(f'{totals[0]} enrollments, {totals[1]} progress rows, {totals[2]} quiz attempts')
+
+    def add_attempt(self, attempts, responses, attempt_id, user_id, quiz_id, ability, moment):
+        """One quiz attempt whose answers follow P(correct) = 1 / (1 + exp(b - ability)), with its responses"""
+        random = self.rng.random
+        first_question = (quiz_id - 1) * QUESTIONS_PER_QUIZ + 1
+        answers = []
+        correct = 0
+        for question_id in range(first_question, first_question + QUESTIONS_PER_QUIZ):
+            right = self.question_answer[question_id]
+            if random() < 1 / (1 + math.exp(self.question_difficulty[question_id] - ability)):
+                chosen = right
+                correct += 1
+            else:
+                chosen = (right + 1 + int(random() * 3)) % 4
+            answers.append('"%d": %d' % (question_id, chosen))
+            responses.append((attempt_id, question_id, chosen, chosen == right))
+        percentage = correct / QUESTIONS_PER_QUIZ * 100
+        attempts.append((attempt_id, user_id, quiz_id, correct, QUESTIONS_PER_QUIZ, correct, percentage,
+                         percentage >= 70, 3 + int(random() * 28),
+                         self.format_time(moment + 300 + int(random() * 36000)),
+                         '{' + ', '.join(answers) + '}'))
+        return attempt_id + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--database', help='SQLite file to create; defaults to DATABASE_URL')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for course popularity')
+    parser.add_argument('--content-words', type=int, default=40, help='words of generated text per lesson')
+    for name in ('users', 'courses', 'lessons', 'enrollments', 'progress', 'attempts'):
+        parser.add_argument(f'--{name}', type=int, help=f'override the preset number of {name}')
+    args = parser.parse_args()
+
+    scale = dict(PRESETS[args.preset])
+    for name in scale:
+        if getattr(args, name) is not None:
+            scale[name] = getattr(args, name)
+
+    from sqlalchemy import create_engine, text
+    from models import db
+
+    url = f'sqlite:///{os.path.abspath(args.database)}' if args.database else \
+        os.getenv('DATABASE_URL', 'sqlite:///instance/learnsmart.db')
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    with engine.connect() as conn:
+        if conn.execute(text('SELECT COUNT(*) FROM "user"')).scalar():
+            sys.exit(f'{url} already contains users; generate into an empty database')
+
+    if engine.dialect.name == 'sqlite':
+        engine.dispose()
+        writer = SQLiteWriter(engine.url.database)
+    else:
+        writer = SQLAlchemyWriter(engine, db.metadata)
+
+    print(f'Generating preset {args.preset!r} into {url} with seed {args.seed}: {scale}')
+    try:
+        DatasetGenerator(writer, scale, args.seed, args.zipf, args.content_words).run()
+    finally:
+        writer.close()
+
+    print(f'Build the derived tables with DATABASE_URL={url}:')
+    for command, tables in DERIVED_COMMANDS:
+        print(f'    flask --app app {command:<24} # {tables}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Per-question responses and item analysis for LearnSmart
+Every answered question of a quiz attempt is also stored as one narrow
+question_response row (attempt, question, chosen option, correct), written
+in bulk with the attempt. Per-question statistics are then grouped
+aggregates over the (question_id, chosen, correct) index instead of a
+json.loads of every attempt's answers. `flask --app app backfill-responses`
+fills the table from answers recorded before it existed.
+"""
+
+import json
+import time
+
+import click
+from sqlalchemy import func, insert, select
+
+from models import db, Question, QuizAttempt, QuestionResponse, insert_ignore
+
+# Attempts read per batch while backfilling
+BACKFILL_BATCH = 5_000
+
+
+def response_rows(attempt_id, questions, answers):
+    """
+    question_response rows for an attempt's answers. questions are the
+    quiz's (question_id, correct_answer) pairs; answers to other questions
+    are ignored, as they are when scoring.
+    """
+    rows = []
+    for question_id, correct_answer in questions:
+        chosen = answers.get(str(question_id))
+        if chosen is None:
+            continue
+        rows.append({
+            'attempt_id': attempt_id,
+            'question_id': question_id,
+            'chosen': chosen if isinstance(chosen, int) else None,
+            'correct': chosen == correct_answer
+        })
+    return rows
+
+
+def record_responses(attempt_id, questions, answers):
+    """Insert an attempt's responses in one statement (current session)"""
+    rows = response_rows(attempt_id, questions, answers)
+    if rows:
+        db.session.execute(insert(QuestionResponse), rows)
+
+
+def quiz_questions(quiz_ids=None):
+    """{quiz_id: [(question_id, correct_answer), ...]} for quiz_ids (default all) in one query"""
+    query = select(Question.id, Question.quiz_id, Question.correct_answer)
+    if quiz_ids is not None:
+        query = query.where(Question.quiz_id.in_(quiz_ids))
+    questions = {}
+    for question_id, quiz_id, correct_answer in db.session.execute(query):
+        questions.setdefault(quiz_id, []).append((question_id, correct_answer))
+    return questions
+
+
+def backfill_responses(batch_size=BACKFILL_BATCH):
+    """
+    Record the responses of every attempt from its JSON answers, committing
+    per batch. Attempts already recorded are skipped by the conflict clause,
+    so the backfill can be rerun or interrupted. Returns the number of
+    attempts read.
+    """
+    questions = quiz_questions()
+    attempts = 0
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(QuizAttempt.id, QuizAttempt.quiz_id, QuizAttempt.answers)
+            .where(QuizAttempt.id > last_id, QuizAttempt.answers.is_not(None))
+            .order_by(QuizAttempt.id).limit(batch_size)
+        ).all()
+        if not batch:
+            return attempts
+        rows = []
+        for attempt_id, quiz_id, answers in batch:
+            rows.extend(response_rows(attempt_id, questions.get(quiz_id, ()), json.loads(answers)))
+        if rows:
+            db.session.execute(insert_ignore(QuestionResponse), rows)
+        db.session.commit()
+        attempts += len(batch)
+        last_id = batch[-1][0]
+
+
+def item_statistics(quiz):
+    """
+    p-value (proportion correct) and option frequencies of every question
+    of a quiz, from one grouped query over question_response
+    """
+    questions = quiz.questions
+    counts = {}
+    for question_id, chosen, responses, correct in db.session.execute(
+        select(QuestionResponse.question_id, QuestionResponse.chosen, func.count(),
+               func.sum(QuestionResponse.correct.cast(db.Integer)))
+        .where(QuestionResponse.question_id.in_([question.id for question in questions]))
+        .group_by(QuestionResponse.question_id, QuestionResponse.chosen)
+    ):
+        counts.setdefault(question_id, []).append((chosen, responses, correct))
+
+    items = []
+    for question in questions:
+        options = question.get_options()
+        groups = counts.get(question.id, [])
+        total = sum(responses for _, responses, _ in groups)
+        correct = sum(right for _, _, right in groups)
+        by_option = {chosen: responses for chosen, responses, _ in groups}
+        items.append({
+            'question_id': question.id,
+            'question_text': question.question_text,
+            'responses': total,
+            'p_value': round(correct / total, 4) if total else None,
+            'options': [{
+                'index': index,
+                'text': text,
+                'correct': index == question.correct_answer,
+                'count': by_option.get(index, 0),
+                'proportion': round(by_option.get(index, 0) / total, 4) if total else None
+            } for index, text in enumerate(options)],
+            # Answers that are not one of the current options
+            'other': sum(responses for chosen, responses, _ in groups
+                         if chosen is None or not 0 <= chosen < len(options))
+        })
+    return items
+
+
+@click.command('backfill-responses')
+@click.option('--batch-size', type=int, default=BACKFILL_BATCH, help='Attempts per transaction.')
+def backfill_responses_command(batch_size):
+    """Record per-question responses for attempts stored before question_response existed."""
+    start = time.perf_counter()
+    attempts = backfill_responses(batch_size)
+    click.echo(f'✓ Responses of {attempts} attempts recorded in {time.perf_counter() - start:.1f}s')
+
+
+def init_item_analysis(app):
+    app.cli.add_command(backfill_responses_command)
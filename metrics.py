@@ -0,0 +1,340 @@
+"""
+Request metrics for LearnSmart
+Records per-endpoint latency, SQL statement counts and time, response size
+and in-flight requests, and renders them in Prometheus text format.
+Requests queue their observations on per-thread lists without locking; a
+scrape of /api/admin/metrics buckets and merges them.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from functools import partial
+from itertools import groupby
+from operator import is_not, itemgetter
+
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_log = logging.getLogger('learnsmart.slow_query')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    __slots__ = ('buckets', 'counts', 'total')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe_many(self, values):
+        # Bucketed by C-level iteration: fold() feeds thousands of values at once
+        for index, count in Counter(map(partial(bisect_left, self.buckets), values)).items():
+            self.counts[index] += count
+        self.total += sum(values)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        count = cumulative + self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total}')
+        lines.append(f'{name}_count{{{labels}}} {count}')
+        return lines
+
+
+class RequestSeries:
+    """The histograms of one endpoint and method, observed together once per request"""
+
+    __slots__ = ('latency', 'sql_statements', 'sql_seconds', 'response_bytes')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.sql_statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_seconds = Histogram(LATENCY_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.sql_statements.merge(other.sql_statements)
+        self.sql_seconds.merge(other.sql_seconds)
+        self.response_bytes.merge(other.response_bytes)
+
+
+# Pending requests are bucketed in groups of one endpoint, method and status line
+PENDING_KEY = itemgetter(0, 1, 2)
+
+
+class ThreadMetrics:
+    """
+    The metrics recorded by one thread. Only that thread writes the
+    counters and appends to pending; the histograms are only built from
+    pending, by fold(), with the registry lock held.
+    """
+
+    __slots__ = ('in_flight', 'slow_queries', 'statements', 'sql_seconds', 'pending', 'requests', 'series',
+                 'start_response', 'sent')
+
+    def __init__(self):
+        # Requests an event loop on the thread is serving; a WSGI thread is
+        # serving one while start_response is set
+        self.in_flight = 0
+        self.slow_queries = 0
+        # SQL of the WSGI request the thread is serving
+        self.statements = 0
+        self.sql_seconds = 0.0
+        # (endpoint, method, status line, seconds, statements, sql seconds, size or None) per request,
+        # not yet in the histograms
+        self.pending = []
+        self.requests = {}
+        self.series = {}  # (endpoint, method) -> RequestSeries
+        # The WSGI request the thread is serving: its start_response, and what was sent through it
+        self.start_response = None
+        self.sent = None
+
+    def capture_status(self, status, headers, exc_info=None):
+        """start_response for the request being served; Flask calls it inside the request context"""
+        self.sent = (status, headers, request._get_current_object().url_rule)
+        return self.start_response(status, headers, exc_info)
+
+    def fold(self):
+        """Move the pending requests into the histograms (registry lock held)"""
+        # The owning thread may append meanwhile; it only ever appends past count
+        count = len(self.pending)
+        batch = self.pending[:count]
+        batch.sort(key=PENDING_KEY)
+        for (endpoint, method, status), group in groupby(batch, PENDING_KEY):
+            _, _, _, seconds, statements, sql_seconds, sizes = zip(*group)
+            count_key = (endpoint, method, status[:3])
+            self.requests[count_key] = self.requests.get(count_key, 0) + len(seconds)
+            series = self.series.get((endpoint, method))
+            if series is None:
+                series = self.series[(endpoint, method)] = RequestSeries()
+            series.latency.observe_many(seconds)
+            series.sql_statements.observe_many(statements)
+            series.sql_seconds.observe_many(sql_seconds)
+            series.response_bytes.observe_many(list(filter(partial(is_not, None), sizes)))
+        del self.pending[:count]
+
+    def merge(self, other):
+        """Add another thread's metrics to these (registry lock held)"""
+        other.fold()
+        self.slow_queries += other.slow_queries
+        for count_key, count in other.requests.items():
+            self.requests[count_key] = self.requests.get(count_key, 0) + count
+        for key, series in other.series.items():
+            if key not in self.series:
+                self.series[key] = RequestSeries()
+            self.series[key].merge(series)
+
+
+class MetricsRegistry:
+    """
+    Process-local store for all request metrics. Each thread appends its
+    requests to its own ThreadMetrics without taking a lock; they are
+    bucketed into histograms when a scrape merges them, or by the thread
+    itself every FOLD_REQUESTS requests, under the lock. The metrics of
+    threads that have exited are folded into one retired set.
+    """
+
+    # Sweep exited threads' metrics once this many threads have recorded
+    SWEEP_THREADS = 64
+    # Bound on the requests a thread keeps pending between scrapes
+    FOLD_REQUESTS = 4096
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.threads = []
+        self.retired = ThreadMetrics()
+        self.slow_query_seconds = 0.2
+        self.collectors = []
+
+    def current(self):
+        """The calling thread's metrics, registered on first use"""
+        try:
+            return self.local.metrics
+        except AttributeError:
+            metrics = self.local.metrics = ThreadMetrics()
+            with self.lock:
+                if len(self.threads) >= self.SWEEP_THREADS:
+                    self.sweep()
+                self.threads.append((threading.current_thread(), metrics))
+            return metrics
+
+    def sweep(self):
+        """Fold the metrics of exited threads into the retired set (lock held)"""
+        alive = []
+        for thread, metrics in self.threads:
+            if thread.is_alive():
+                alive.append((thread, metrics))
+            else:
+                self.retired.merge(metrics)
+        self.threads = alive
+
+    def request_started(self):
+        self.current().in_flight += 1
+
+    def request_finished(self):
+        self.current().in_flight -= 1
+
+    def record(self, endpoint, method, status, seconds, statements, sql_seconds, size):
+        """Queue one served request on the calling thread's metrics"""
+        metrics = self.current()
+        metrics.pending.append((endpoint, method, str(status), seconds, statements, sql_seconds, size))
+        if len(metrics.pending) >= self.FOLD_REQUESTS:
+            self.fold(metrics)
+
+    def fold(self, metrics):
+        with self.lock:
+            metrics.fold()
+
+    def snapshot(self):
+        """Every thread's metrics merged into one ThreadMetrics"""
+        total = ThreadMetrics()
+        with self.lock:
+            self.sweep()
+            total.merge(self.retired)
+            for _, metrics in self.threads:
+                total.merge(metrics)
+                total.in_flight += metrics.in_flight + (metrics.start_response is not None)
+        return total
+
+    def render(self):
+        """Render every metric in Prometheus text exposition format"""
+        total = self.snapshot()
+        lines = []
+        lines.append('# HELP learnsmart_requests_in_flight Requests currently being served')
+        lines.append('# TYPE learnsmart_requests_in_flight gauge')
+        lines.append(f'learnsmart_requests_in_flight {total.in_flight}')
+
+        lines.append('# HELP learnsmart_requests_total Requests served')
+        lines.append('# TYPE learnsmart_requests_total counter')
+        for (endpoint, method, status), count in sorted(total.requests.items()):
+            lines.append(
+                f'learnsmart_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}'
+            )
+
+        histograms = (
+            ('learnsmart_request_duration_seconds', 'Request latency', 'latency'),
+            ('learnsmart_request_sql_statements', 'SQL statements per request', 'sql_statements'),
+            ('learnsmart_request_sql_seconds', 'Total SQL time per request', 'sql_seconds'),
+            ('learnsmart_response_bytes', 'Response body size', 'response_bytes'),
+        )
+        for name, help_text, attribute in histograms:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (endpoint, method), series in sorted(total.series.items()):
+                histogram = getattr(series, attribute)
+                if histogram.count:
+                    lines.extend(histogram.render(name, f'endpoint="{endpoint}",method="{method}"'))
+
+        lines.append('# HELP learnsmart_slow_queries_total SQL statements over the slow-query threshold')
+        lines.append('# TYPE learnsmart_slow_queries_total counter')
+        lines.append(f'learnsmart_slow_queries_total {total.slow_queries}')
+
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def metrics_middleware(wsgi_app):
+    """
+    Wrap a WSGI app to record each of its requests: one call per request,
+    where before/after/teardown hooks cost three Flask dispatches plus a
+    request proxy lookup per attribute. The wrapper is a plain function,
+    and the app gets the thread's bound capture_status as start_response;
+    a class with __call__, or a new closure per request, measured dearer.
+    It only queues the request's observations; see MetricsRegistry.
+    """
+    local, perf_counter = registry.local, time.perf_counter
+
+    def record_request(environ, start_response):
+        try:
+            metrics = local.metrics
+        except AttributeError:
+            metrics = registry.current()
+        metrics.start_response, metrics.sent = start_response, None
+        metrics.statements, metrics.sql_seconds = 0, 0.0
+        start = perf_counter()
+        try:
+            return wsgi_app(environ, metrics.capture_status)
+        finally:
+            seconds = perf_counter() - start
+            metrics.start_response = None
+            if metrics.sent is not None:
+                status, headers, rule = metrics.sent
+                # Streamed responses have no Content-Length; their size is unknown here
+                size = None
+                for name, value in headers:
+                    if name == 'Content-Length':
+                        size = int(value)
+                        break
+                # MetricsRegistry.record inlined
+                pending = metrics.pending
+                pending.append((rule.endpoint if rule is not None else 'unmatched', environ['REQUEST_METHOD'],
+                                status, seconds, metrics.statements, metrics.sql_seconds, size))
+                if len(pending) >= registry.FOLD_REQUESTS:
+                    registry.fold(metrics)
+
+    record_request.wsgi_app = wsgi_app
+    return record_request
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_start
+    metrics = registry.current()
+    metrics.statements += 1
+    metrics.sql_seconds += elapsed
+    if elapsed >= registry.slow_query_seconds:
+        metrics.slow_queries += 1
+        slow_query_log.warning(
+            'Slow query (%.1f ms) on %s: %s',
+            elapsed * 1000,
+            request.endpoint if has_request_context() else 'background',
+            ' '.join(statement.split())
+        )
+
+
+def init_metrics(app):
+    """Register the request hooks and SQL engine listeners"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+
+    registry.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000.0
+    app.wsgi_app = metrics_middleware(app.wsgi_app)
+
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    app.extensions['metrics'] = registry
+    return registry
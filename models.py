@@ -1,10 +1,71 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session, configure_mappers, with_loader_criteria
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import json
 
 db = SQLAlchemy()
 
+def insert_ignore(model):
+    """
+    Build a dialect-aware INSERT that silently skips rows violating a unique
+    constraint (ON CONFLICT DO NOTHING / ON DUPLICATE KEY UPDATE <primary key> =
+    <primary key>).
+    """
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        key = list(table.primary_key.columns)[0]
+        return insert(table).on_duplicate_key_update({key.name: key})
+    
+    from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
+
+def insert_or_increment(model, column):
+    """
+    Build a dialect-aware INSERT that adds one to column of the existing row
+    instead when the primary key is taken (ON CONFLICT DO UPDATE / ON
+    DUPLICATE KEY UPDATE).
+    """
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    increment = {column: table.c[column] + 1}
+    
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        return insert(table).on_duplicate_key_update(increment)
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_update(index_elements=list(table.primary_key.columns), set_=increment)
+
+def time_bucket(column, granularity):
+    """
+    A dialect-aware expression truncating a timestamp column to the start of
+    its hour or day. SQLite and MySQL return text ('YYYY-MM-DD HH:00:00'),
+    PostgreSQL a timestamp.
+    """
+    from sqlalchemy import func
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect == 'postgresql':
+        return func.date_trunc(granularity, column)
+    pattern = '%Y-%m-%d %H:00:00' if granularity == 'hour' else '%Y-%m-%d 00:00:00'
+    if dialect in ('mysql', 'mariadb'):
+        return func.date_format(column, pattern)
+    return func.strftime(pattern, column)
+
+def supports_returning():
+    """Whether INSERT ... RETURNING is available on the current database"""
+    return db.session.get_bind().dialect.insert_returning
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -54,13 +115,17 @@ class Course(db.Model):
     instructor = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set by delete_course; the purger (see purge.py) removes the rows later
+    deleted_at = db.Column(db.DateTime, index=True)
     
     # Relationships
     lessons = db.relationship('Lesson', backref='course', lazy=True, cascade='all, delete-orphan')
     enrollments = db.relationship('Enrollment', backref='course', lazy=True)
     quizzes = db.relationship('Quiz', backref='course', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
+    def to_dict(self, lesson_count=None, enrollment_count=None):
+        # Callers serializing many courses pass precomputed counts to avoid
+        # lazy-loading both relationships once per course
         return {
             'id': self.id,
             'title': self.title,
@@ -71,13 +136,13 @@ class Course(db.Model):
             'instructor': self.instructor,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'lesson_count': len(self.lessons),
-            'enrollment_count': len(self.enrollments)
+            'lesson_count': len(self.lessons) if lesson_count is None else lesson_count,
+            'enrollment_count': len(self.enrollments) if enrollment_count is None else enrollment_count
         }
 
 class Lesson(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text)
     order_index = db.Column(db.Integer, default=0)
@@ -155,9 +220,9 @@ class Question(db.Model):
 class Enrollment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
-    enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
-    completed_at = db.Column(db.DateTime)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, index=True)
+    enrolled_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    completed_at = db.Column(db.DateTime, index=True)
     progress_percentage = db.Column(db.Float, default=0)
     
     __table_args__ = (db.UniqueConstraint('user_id', 'course_id'),)
@@ -176,7 +241,7 @@ class LessonProgress(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id'), nullable=False)
-    completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     time_spent_minutes = db.Column(db.Integer, default=0)
     
     __table_args__ = (db.UniqueConstraint('user_id', 'lesson_id'),)
@@ -200,8 +265,10 @@ class QuizAttempt(db.Model):
     percentage = db.Column(db.Float, default=0)
     passed = db.Column(db.Boolean, default=False)
     time_taken_minutes = db.Column(db.Integer, default=0)
-    attempted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempted_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     answers = db.Column(db.Text)  # JSON string of user answers
+    # Id of the write-behind event that recorded it, so a replayed log skips it
+    event_id = db.Column(db.String(32), unique=True, index=True)
     
     def get_answers(self):
         if self.answers:
@@ -225,3 +292,192 @@ class QuizAttempt(db.Model):
             'attempted_at': self.attempted_at.isoformat(),
             'answers': self.get_answers()
         }
+
+class QuestionResponse(db.Model):
+    """One answered question of a quiz attempt (see item_analysis.py)"""
+    attempt_id = db.Column(db.Integer, db.ForeignKey('quiz_attempt.id'), primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    chosen = db.Column(db.Integer)  # option index; None when the answer was not an index
+    correct = db.Column(db.Boolean, nullable=False)
+    
+    # Covers the per-question aggregates of item analysis
+    __table_args__ = (db.Index('ix_question_response_item', 'question_id', 'chosen', 'correct'),)
+
+class UserRecommendation(db.Model):
+    """One course of a user's precomputed recommendation list (see recommendations.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # interests, path
+    rank = db.Column(db.Integer, nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    score = db.Column(db.Float)
+    reason = db.Column(db.Text)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'kind', 'rank'),)
+
+class RecommendationStatus(db.Model):
+    """Whether a user's stored recommendations still reflect their data"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)  # bumped by every relevant change
+    stale = db.Column(db.Boolean, default=True, nullable=False, index=True)
+    computed_at = db.Column(db.DateTime)
+
+class CourseVector(db.Model):
+    """A course's TF-IDF vector and the state of its similar-course list (see similarity.py)"""
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)  # bumped when the course text changes
+    stale = db.Column(db.Boolean, default=True, nullable=False, index=True)
+    vector = db.Column(db.LargeBinary)  # L2-normalized float32
+    neighbor_floor = db.Column(db.Float)  # score of the last stored neighbor
+    updated_at = db.Column(db.DateTime)
+
+class CourseSimilarity(db.Model):
+    """One entry of a course's precomputed similar-course list"""
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    similar_course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('course_id', 'rank'),)
+
+class SimilarityStats(db.Model):
+    """Corpus statistics of the last full similarity build (single row)"""
+    id = db.Column(db.Integer, primary_key=True)
+    documents = db.Column(db.Integer, nullable=False)
+    dimensions = db.Column(db.Integer, nullable=False)
+    document_frequencies = db.Column(db.LargeBinary, nullable=False)  # int32 per hashed term slot
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class QuestionCalibration(db.Model):
+    """IRT parameters of a question from the last calibration (see calibration.py)"""
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    difficulty = db.Column(db.Float, nullable=False)  # b, on the ability scale
+    discrimination = db.Column(db.Float, nullable=False)  # a; 1 under the 1PL model
+    standard_error = db.Column(db.Float)  # of the difficulty
+    responses = db.Column(db.Integer, nullable=False)
+    proportion_correct = db.Column(db.Float)
+    calibrated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'difficulty': round(self.difficulty, 3),
+            'discrimination': round(self.discrimination, 3),
+            'standard_error': round(self.standard_error, 3) if self.standard_error is not None else None,
+            'responses': self.responses,
+            'proportion_correct': self.proportion_correct,
+            'calibrated_at': self.calibrated_at.isoformat()
+        }
+
+class LearnerAbility(db.Model):
+    """A learner's IRT ability estimate from the last calibration"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    ability = db.Column(db.Float, nullable=False)  # theta
+    standard_error = db.Column(db.Float)
+    responses = db.Column(db.Integer, nullable=False)
+    calibrated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserVersion(db.Model):
+    """Bumped whenever the user's own activity changes; keys the per-user response cache (see cache.py)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+class ActivityRollup(db.Model):
+    """Activity counts of one hour or day, per course and platform-wide (see rollups.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(4), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    course_id = db.Column(db.Integer, nullable=False)  # 0 for the whole platform; kept after course deletion
+    enrollments = db.Column(db.Integer, default=0, nullable=False)
+    course_completions = db.Column(db.Integer, default=0, nullable=False)
+    lesson_completions = db.Column(db.Integer, default=0, nullable=False)
+    quiz_attempts = db.Column(db.Integer, default=0, nullable=False)
+    quizzes_passed = db.Column(db.Integer, default=0, nullable=False)
+    active_learners = db.Column(db.Integer, default=0, nullable=False)  # distinct within the bucket
+    
+    __table_args__ = (db.UniqueConstraint('granularity', 'course_id', 'bucket_start'),)
+
+class RollupState(db.Model):
+    """How far activity has been rolled up (single row)"""
+    id = db.Column(db.Integer, primary_key=True)
+    watermark = db.Column(db.DateTime)  # hours before this are in the hourly rollups
+    days_through = db.Column(db.DateTime)  # days before this are in the daily rollups
+    updated_at = db.Column(db.DateTime)
+
+class Sketch(db.Model):
+    """A serialized score or distinct-learner sketch of one day, or of all time (see sketches.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # quiz_scores, course_learners
+    subject_id = db.Column(db.Integer, nullable=False)  # quiz or course id; 0 for the whole platform
+    bucket_start = db.Column(db.DateTime, nullable=False)  # day, or 1970-01-01 for all time
+    version = db.Column(db.Integer, default=1, nullable=False)  # bumped by every merge
+    data = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.UniqueConstraint('kind', 'subject_id', 'bucket_start'),)
+
+# Columns added to existing tables after their first release; create_all()
+# only creates missing tables, so upgrade_schema() adds these
+ADDED_COLUMNS = [('course', 'deleted_at'), ('quiz_attempt', 'event_id')]
+
+def upgrade_schema():
+    """Add the ADDED_COLUMNS (and their indexes) an older database lacks; returns their names"""
+    inspector = inspect(db.engine)
+    added = []
+    for table_name, column_name in ADDED_COLUMNS:
+        if column_name in {column['name'] for column in inspector.get_columns(table_name)}:
+            continue
+        table = db.metadata.tables[table_name]
+        column = table.c[column_name]
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column.type.compile(db.engine.dialect)}'
+            ))
+            for index in table.indexes:
+                if column_name in index.columns:
+                    index.create(connection)
+        added.append(f'{table_name}.{column_name}')
+    return added
+
+def deleted_course_ids():
+    """Ids of the soft-deleted courses the purger has not removed yet"""
+    # Core columns, so the Course criteria below does not apply inside it
+    course = Course.__table__
+    return select(course.c.id).where(course.c.deleted_at.isnot(None))
+
+def deleted_lesson_ids():
+    lesson = Lesson.__table__
+    return select(lesson.c.id).where(lesson.c.course_id.in_(deleted_course_ids()))
+
+def deleted_quiz_ids():
+    quiz = Quiz.__table__
+    return select(quiz.c.id).where(quiz.c.course_id.in_(deleted_course_ids()))
+
+@event.listens_for(Session, 'do_orm_execute')
+def hide_deleted_courses(state):
+    """
+    Leave soft-deleted courses, their lessons and quizzes, and the learners'
+    enrollments, lesson progress and quiz attempts in them out of every ORM
+    SELECT. Statements run with execution_options(include_deleted=True)
+    (the purger) see them; INSERT ... SELECT and Core connection statements
+    are not ORM SELECTs and filter explicitly.
+    """
+    if (state.is_select and not state.is_column_load and not state.is_relationship_load
+            and not state.execution_options.get('include_deleted', False)):
+        state.statement = state.statement.options(
+            with_loader_criteria(Course, lambda cls: cls.deleted_at.is_(None), include_aliases=True),
+            with_loader_criteria(Lesson, lambda cls: cls.course_id.notin_(deleted_course_ids()),
+                                 include_aliases=True),
+            with_loader_criteria(Quiz, lambda cls: cls.course_id.notin_(deleted_course_ids()),
+                                 include_aliases=True),
+            with_loader_criteria(Enrollment, lambda cls: cls.course_id.notin_(deleted_course_ids()),
+                                 include_aliases=True),
+            with_loader_criteria(LessonProgress, lambda cls: cls.lesson_id.notin_(deleted_lesson_ids()),
+                                 include_aliases=True),
+            with_loader_criteria(QuizAttempt, lambda cls: cls.quiz_id.notin_(deleted_quiz_ids()),
+                                 include_aliases=True)
+        )
+
+# Backrefs such as Enrollment.course only exist once the mappers are
+# configured; do it now so query builders can name them before any query runs
+configure_mappers()
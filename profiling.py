@@ -0,0 +1,177 @@
+"""
+On-demand request profiling for LearnSmart
+An admin can send a single request with the X-Profile header to run it under
+cProfile and capture every SQL statement it executed. The profile is stored
+under PROFILE_DIR and its id is returned in the X-Profile-Id response header.
+Only the PROFILE_MAX_COUNT most recent profiles are kept; older ones are
+removed whenever a new one is written.
+"""
+
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from flask import g, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# SQL capture for the profiled request; only ever set on the thread serving it
+capture = threading.local()
+_listeners_lock = threading.Lock()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(capture, 'sql', None) is not None:
+        context.profile_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements = getattr(capture, 'sql', None)
+    if statements is not None:
+        statements.append({
+            'statement': ' '.join(statement.split()),
+            'parameters': repr(parameters)[:500],
+            'executemany': executemany,
+            'duration_ms': round((time.perf_counter() - context.profile_start) * 1000, 3)
+        })
+
+
+def _install_sql_listeners():
+    # Installed on the first profiled request, so unprofiled traffic never runs them before that
+    with _listeners_lock:
+        if not event.contains(Engine, 'after_cursor_execute', after_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def _is_admin_request():
+    from models import User
+
+    try:
+        verify_jwt_in_request()
+    except Exception:
+        return False
+    user = User.query.get(get_jwt_identity())
+    return user is not None and user.role == 'admin'
+
+
+def before_request():
+    if PROFILE_HEADER not in request.headers:
+        return
+    if not _is_admin_request():
+        # Never profile on behalf of anyone else; serve the request normally
+        return
+
+    _install_sql_listeners()
+    capture.sql = []
+    profiler = cProfile.Profile()
+    g.profile = {'profiler': profiler, 'started': time.perf_counter()}
+    profiler.enable()
+
+
+def after_request(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    profile['profiler'].disable()
+    statements, capture.sql = capture.sql, None
+    elapsed = time.perf_counter() - profile['started']
+
+    from flask import current_app
+    profile_dir = current_app.config['PROFILE_DIR']
+    os.makedirs(profile_dir, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+
+    profile['profiler'].dump_stats(os.path.join(profile_dir, f'{profile_id}.pstats'))
+    with open(os.path.join(profile_dir, f'{profile_id}.json'), 'w') as f:
+        json.dump({
+            'id': profile_id,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'profiled_by': get_jwt_identity(),
+            'created_at': time.time(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'sql_statement_count': len(statements),
+            'sql_total_ms': round(sum(s['duration_ms'] for s in statements), 3),
+            'sql': statements
+        }, f, indent=2)
+
+    prune_profiles(profile_dir, current_app.config.get('PROFILE_MAX_COUNT', 100))
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def prune_profiles(profile_dir, keep):
+    """Remove both files of every profile but the keep most recently written"""
+    written = {}
+    with os.scandir(profile_dir) as entries:
+        for entry in entries:
+            profile_id, _, extension = entry.name.partition('.')
+            if extension in ('json', 'pstats') and PROFILE_ID_PATTERN.match(profile_id):
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                written[profile_id] = max(written.get(profile_id, 0), mtime)
+    if len(written) <= keep:
+        return
+    for profile_id in sorted(written, key=written.get)[:len(written) - keep]:
+        for extension in ('json', 'pstats'):
+            try:
+                os.remove(os.path.join(profile_dir, f'{profile_id}.{extension}'))
+            except FileNotFoundError:
+                # Pruned meanwhile by another worker
+                pass
+
+
+def teardown_request(exc):
+    # An exception between the hooks must not leave capture on for the next request
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile['profiler'].disable()
+        capture.sql = None
+
+
+def profile_path(profile_dir, profile_id, extension):
+    """Resolve a stored profile file, or None for unknown or malformed ids"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(profile_dir, f'{profile_id}.{extension}')
+    return path if os.path.exists(path) else None
+
+
+def list_profiles(profile_dir):
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for name in os.listdir(profile_dir):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(profile_dir, name)) as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                # Pruned by a worker writing a new profile
+                continue
+            data.pop('sql', None)
+            profiles.append(data)
+    return sorted(profiles, key=lambda p: p['created_at'], reverse=True)
+
+
+def init_profiling(app):
+    """Register the hooks that honour the X-Profile header for admins"""
+    if not app.config.get('PROFILING_ENABLED', True):
+        return
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
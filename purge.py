@@ -0,0 +1,141 @@
+"""
+Course purging for LearnSmart
+DELETE /api/admin/courses/<id> only stamps the course's deleted_at, which
+hides it, its lessons and quizzes, and the enrollments, lesson progress
+and quiz attempts in it from every query at once (see
+hide_deleted_courses in models.py). The rows that hang off it are removed
+here afterwards, by a background thread, in small batches: each batch reads
+up to COURSE_PURGE_BATCH ids of one table and deletes exactly those rows in
+its own short transaction, children before parents, so that no statement
+holds the write lock for long however popular the course was. The course
+row itself goes last, once nothing references it. Between batches the
+purger sleeps COURSE_PURGE_PAUSE_MS, so that writers waiting on the lock
+get it instead of the purger taking it straight back.
+
+Courses left soft-deleted by a process that stopped mid-purge are picked
+up by the next one that deletes a course, or with
+
+    flask --app app purge-courses
+"""
+
+import time
+
+import click
+from flask import current_app
+from sqlalchemy import delete, func, select
+
+from models import (
+    db, Course, Lesson, Quiz, Question, Enrollment, LessonProgress, QuizAttempt, QuestionResponse,
+    QuestionCalibration, UserRecommendation
+)
+from refresher import BackgroundRefresher
+
+
+def dependent_batches(course_id):
+    """
+    The course's dependent tables in purge order, as (id column, filter,
+    [(table, column) rows to delete with each batch of ids]).
+    """
+    quiz_ids = select(Quiz.id).where(Quiz.course_id == course_id)
+    lesson_ids = select(Lesson.id).where(Lesson.course_id == course_id)
+    return [
+        (QuizAttempt.id, QuizAttempt.quiz_id.in_(quiz_ids),
+         [(QuestionResponse, QuestionResponse.attempt_id), (QuizAttempt, QuizAttempt.id)]),
+        (Question.id, Question.quiz_id.in_(quiz_ids),
+         [(QuestionResponse, QuestionResponse.question_id), (QuestionCalibration, QuestionCalibration.question_id),
+          (Question, Question.id)]),
+        (LessonProgress.id, LessonProgress.lesson_id.in_(lesson_ids), [(LessonProgress, LessonProgress.id)]),
+        (Enrollment.id, Enrollment.course_id == course_id, [(Enrollment, Enrollment.id)]),
+        (UserRecommendation.id, UserRecommendation.course_id == course_id,
+         [(UserRecommendation, UserRecommendation.id)]),
+        (Quiz.id, Quiz.course_id == course_id, [(Quiz, Quiz.id)]),
+        (Lesson.id, Lesson.course_id == course_id, [(Lesson, Lesson.id)]),
+    ]
+
+
+def purge_step(batch_size):
+    """
+    Delete up to batch_size dependent rows of the longest-deleted course, or
+    the course row once it has none left, and commit. Returns the number of
+    rows the batch was keyed on; 0 when no course is waiting.
+    """
+    course_id = db.session.scalar(
+        select(Course.id).where(Course.deleted_at.isnot(None)).order_by(Course.deleted_at, Course.id).limit(1)
+        .execution_options(include_deleted=True)
+    )
+    if course_id is None:
+        return 0
+    for key, where, targets in dependent_batches(course_id):
+        ids = db.session.scalars(
+            select(key).where(where).limit(batch_size).execution_options(include_deleted=True)
+        ).all()
+        if ids:
+            for model, column in targets:
+                db.session.execute(delete(model).where(column.in_(ids)).execution_options(synchronize_session=False))
+            db.session.commit()
+            return len(ids)
+    db.session.execute(delete(Course).where(Course.id == course_id).execution_options(synchronize_session=False))
+    db.session.commit()
+    return 1
+
+
+def purge(batch_size, pause_seconds=0.0):
+    """Run purge steps until batch_size rows are gone or nothing is left; returns the rows"""
+    purged = 0
+    while purged < batch_size:
+        deleted = purge_step(batch_size - purged)
+        if not deleted:
+            break
+        purged += deleted
+        time.sleep(pause_seconds)
+    return purged
+
+
+def pending_courses():
+    return db.session.scalar(
+        select(func.count(Course.id)).where(Course.deleted_at.isnot(None)).execution_options(include_deleted=True)
+    )
+
+
+class CoursePurger(BackgroundRefresher):
+    """Purges soft-deleted courses batch by batch while any are left"""
+    name = 'course purger'
+
+    def refresh_batch(self):
+        return purge(self.batch_size, self.app.config.get('COURSE_PURGE_PAUSE_MS', 10) / 1000)
+
+
+def schedule_purge():
+    """Ask the purger to start on courses soft-deleted by the committed transaction"""
+    purger = current_app.extensions.get('course_purger')
+    if purger is not None:
+        purger.wake()
+
+
+@click.command('purge-courses')
+def purge_courses_command():
+    """Delete the rows of every soft-deleted course now."""
+    start = time.perf_counter()
+    courses = pending_courses()
+    rows = 0
+    while True:
+        purged = purge(current_app.config['COURSE_PURGE_BATCH'], current_app.config['COURSE_PURGE_PAUSE_MS'] / 1000)
+        if not purged:
+            break
+        rows += purged
+    click.echo(f'✓ {courses} courses purged ({rows} batched rows) in {time.perf_counter() - start:.1f}s')
+
+
+def init_purge(app):
+    """Attach the course purger and the purge command"""
+    app.cli.add_command(purge_courses_command)
+    purger = CoursePurger(
+        app,
+        interval_seconds=app.config.get('COURSE_PURGE_SECONDS', 60.0),
+        batch_size=app.config.get('COURSE_PURGE_BATCH', 1000)
+    )
+    app.extensions['course_purger'] = purger
+
+    import atexit
+    atexit.register(purger.stop)
+    return purger
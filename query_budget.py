@@ -0,0 +1,99 @@
+"""
+Query budgets for LearnSmart routes
+Each view declares how many SQL statements a single request may execute with
+the query_budget decorator, placed next to its route. QueryRecorder counts
+statements during a request and flags repeated identical-shape statements,
+the signature of an N+1 lazy-load loop.
+"""
+
+import re
+import threading
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# A statement shape repeated this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+_IN_LIST = re.compile(r'\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))*\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def query_budget(max_statements):
+    """Declare the maximum number of SQL statements a view may execute"""
+    def decorator(view):
+        view.query_budget = max_statements
+        return view
+    return decorator
+
+
+def statement_shape(statement):
+    """Normalize a statement so that calls differing only in parameters compare equal"""
+    shape = _STRING.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryRecorder:
+    """
+    Record every statement executed on the current thread while active.
+
+        with QueryRecorder() as recorder:
+            client.get('/api/courses/')
+        recorder.count, recorder.repeated()
+    """
+
+    _local = threading.local()
+    _installed = False
+    _install_lock = threading.Lock()
+
+    def __init__(self):
+        self.statements = []
+
+    @classmethod
+    def _install(cls):
+        with cls._install_lock:
+            if not cls._installed:
+                event.listen(Engine, 'before_cursor_execute', cls._on_execute)
+                cls._installed = True
+
+    @classmethod
+    def _on_execute(cls, conn, cursor, statement, parameters, context, executemany):
+        recorder = getattr(cls._local, 'recorder', None)
+        if recorder is not None:
+            recorder.statements.append(statement)
+
+    def __enter__(self):
+        self._install()
+        self._local.recorder = self
+        return self
+
+    def __exit__(self, *exc):
+        self._local.recorder = None
+        return False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Statement shapes executed at least threshold times, with their counts"""
+        shapes = Counter(statement_shape(s) for s in self.statements)
+        return {shape: n for shape, n in shapes.items() if n >= threshold}
+
+
+def check_request(view, recorder, threshold=N_PLUS_ONE_THRESHOLD):
+    """Return a list of problems for one recorded request against its view's budget"""
+    problems = []
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        problems.append('no query budget declared')
+    elif recorder.count > budget:
+        problems.append(f'{recorder.count} statements exceed budget of {budget}')
+    for shape, n in recorder.repeated(threshold).items():
+        problems.append(f'N+1: {n}x {shape[:160]}')
+    return problems
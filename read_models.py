@@ -0,0 +1,180 @@
+"""
+Read models for LearnSmart
+Read-only endpoints turn rows straight into JSON, so loading them as ORM
+instances (identity map entries, change tracking, lazy-load proxies) is
+wasted work. The classes here are slotted named tuples with the to_dict()
+of the model they mirror, loaded by Core select()s of explicit columns:
+executing one builds plain rows that no session tracks, and the async
+layer runs the very same statements.
+
+    courses = read(CourseRead, Course.category == 'design')
+    quiz = read_one(QuizRead, Quiz.id == quiz_id)
+    latest = QuizAttemptRead.from_rows(await session.execute(
+        QuizAttemptRead.select(QuizAttempt.user_id == user_id).order_by(QuizAttempt.attempted_at.desc()).limit(5)
+    ))
+
+Each class lists the columns it reads as its fields, so adding a column to
+a to_dict() here means adding it to the field list too.
+"""
+
+import json
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from models import db, User, Course, Quiz, Question, Enrollment, QuizAttempt
+
+
+class ReadModel:
+    """Loading for a named tuple whose fields are columns of model"""
+    __slots__ = ()
+    model = None
+
+    @classmethod
+    def columns(cls):
+        return [getattr(cls.model, name) for name in cls._fields]
+
+    @classmethod
+    def select(cls, *where):
+        """A select() of the columns; add order_by() and limit() as with any select"""
+        return select(*cls.columns()).where(*where)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls._make(row) for row in rows]
+
+
+class UserRead(ReadModel, namedtuple('UserRead', 'id username email role interests skill_level created_at')):
+    __slots__ = ()
+    model = User
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email,
+            'role': self.role,
+            'interests': json.loads(self.interests) if self.interests else [],
+            'skill_level': self.skill_level,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class CourseRead(ReadModel, namedtuple('CourseRead', 'id title description category difficulty_level '
+                                                     'duration_hours instructor created_at updated_at')):
+    __slots__ = ()
+    model = Course
+
+    def to_dict(self, lesson_count, enrollment_count):
+        # Counts always come precomputed; there are no relationships to fall back on
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'category': self.category,
+            'difficulty_level': self.difficulty_level,
+            'duration_hours': self.duration_hours,
+            'instructor': self.instructor,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'lesson_count': lesson_count,
+            'enrollment_count': enrollment_count
+        }
+
+
+class QuizRead(ReadModel, namedtuple('QuizRead', 'id course_id title description total_questions passing_score '
+                                                 'time_limit_minutes created_at')):
+    __slots__ = ()
+    model = Quiz
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'course_id': self.course_id,
+            'title': self.title,
+            'description': self.description,
+            'total_questions': self.total_questions,
+            'passing_score': self.passing_score,
+            'time_limit_minutes': self.time_limit_minutes,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class QuestionRead(ReadModel, namedtuple('QuestionRead', 'id quiz_id question_text options correct_answer '
+                                                         'explanation points')):
+    __slots__ = ()
+    model = Question
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'quiz_id': self.quiz_id,
+            'question_text': self.question_text,
+            'options': json.loads(self.options) if self.options else [],
+            'correct_answer': self.correct_answer,
+            'explanation': self.explanation,
+            'points': self.points
+        }
+
+
+class QuizAttemptRead(ReadModel, namedtuple('QuizAttemptRead', 'id user_id quiz_id score total_questions '
+                                                               'correct_answers percentage passed '
+                                                               'time_taken_minutes attempted_at answers')):
+    __slots__ = ()
+    model = QuizAttempt
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'quiz_id': self.quiz_id,
+            'score': self.score,
+            'total_questions': self.total_questions,
+            'correct_answers': self.correct_answers,
+            'percentage': self.percentage,
+            'passed': self.passed,
+            'time_taken_minutes': self.time_taken_minutes,
+            'attempted_at': self.attempted_at.isoformat(),
+            'answers': json.loads(self.answers) if self.answers else {}
+        }
+
+
+class EnrollmentRead(ReadModel, namedtuple('EnrollmentRead', 'id user_id course_id enrolled_at completed_at '
+                                                             'progress_percentage course')):
+    """An enrollment with its course (a CourseRead), read in one joined select"""
+    __slots__ = ()
+    model = Enrollment
+
+    @classmethod
+    def columns(cls):
+        return [getattr(Enrollment, name) for name in cls._fields[:-1]] + CourseRead.columns()
+
+    @classmethod
+    def select(cls, *where):
+        return select(*cls.columns()).join(Course, Enrollment.course_id == Course.id).where(*where)
+
+    @classmethod
+    def from_rows(cls, rows):
+        split = len(cls._fields) - 1
+        return [cls(*row[:split], CourseRead._make(row[split:])) for row in rows]
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'course_id': self.course_id,
+            'enrolled_at': self.enrolled_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'progress_percentage': self.progress_percentage
+        }
+
+
+def read(read_class, *where):
+    """Every matching row as read_class instances (current session, nothing tracked)"""
+    return read_class.from_rows(db.session.execute(read_class.select(*where)))
+
+
+def read_one(read_class, *where):
+    """The first matching row as a read_class instance, or None"""
+    rows = read_class.from_rows(db.session.execute(read_class.select(*where).limit(1)))
+    return rows[0] if rows else None
@@ -0,0 +1,307 @@
+"""
+Precomputed recommendations for LearnSmart
+Both recommendation lists, the interest matches behind
+/api/learner/recommendations and the scored path behind
+/api/ai/personalized-path, are stored per user in user_recommendation.
+
+`flask --app app refresh-recommendations` computes every user's lists on a
+process pool, one shard of user ids per task. Enrollments, course
+completions and profile changes bump the user's version in
+recommendation_status within the same transaction and mark it stale; a
+background refresher recomputes stale users shortly after. Admin writes
+that add, remove or recategorize a course can change anyone's lists and
+mark every user stale. Enrollment counts, which the path scores by,
+drift without marking anyone: the refresher also recomputes, oldest
+first, lists older than RECOMMENDATIONS_MAX_AGE_SECONDS. Users whose
+lists are missing or stale are scored live by the endpoints.
+"""
+
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import bindparam, create_engine, delete, exists, func, insert, select, update
+
+from refresher import BackgroundRefresher
+from models import db, User, Course, Enrollment, UserRecommendation, RecommendationStatus, insert_ignore
+
+INTERESTS = 'interests'
+PATH = 'path'
+
+# What the scoring functions read from a course; plain tuples pickle cheaply to workers
+CatalogCourse = namedtuple('CatalogCourse', 'id category difficulty_level')
+
+
+def recommend_courses(interests, courses, enrolled_course_ids, limit=6):
+    """The first three courses whose category matches each interest, minus enrolled ones"""
+    recommended = []
+    seen = set(enrolled_course_ids)
+    for interest in interests:
+        matches = [c for c in courses if interest.lower() in c.category.lower()]
+        for course in matches[:3]:
+            if course.id not in seen:
+                seen.add(course.id)
+                recommended.append(course)
+    return recommended[:limit]
+
+
+def compute_lists(interests, skill_level, enrolled_ids, completed_ids, catalog, enrollment_counts):
+    """
+    Both lists for one user as {kind: [(course_id, score, reason)]}. catalog
+    must be in id order, the order the live endpoints see courses in.
+    """
+    from ai_features import generate_personalized_path
+
+    by_id = {course.id: course for course in catalog}
+    path = generate_personalized_path(
+        user_profile={'interests': interests, 'skill_level': skill_level},
+        completed_courses=[by_id[course_id] for course_id in completed_ids if course_id in by_id],
+        all_courses=catalog,
+        enrollment_counts=enrollment_counts
+    )
+    return {
+        INTERESTS: [(course.id, None, None) for course in recommend_courses(interests, catalog, enrolled_ids)],
+        PATH: [(rec['course'].id, rec['score'], rec['reason']) for rec in path],
+    }
+
+
+def load_catalog_snapshot(connection):
+    catalog = [CatalogCourse(*row) for row in connection.execute(
+        select(Course.id, Course.category, Course.difficulty_level)
+        .where(Course.deleted_at.is_(None)).order_by(Course.id)
+    )]
+    enrollment_counts = dict(connection.execute(
+        select(Enrollment.course_id, func.count(Enrollment.id)).group_by(Enrollment.course_id)
+    ).all())
+    return catalog, enrollment_counts
+
+
+def compute_users(connection, user_ids, catalog, enrollment_counts):
+    """
+    Compute the lists of user_ids. Versions are read before the user data,
+    so a change committed in between leaves the user stale rather than
+    marking older data fresh. Returns [(user_id, version, lists)].
+    """
+    versions = dict(connection.execute(
+        select(RecommendationStatus.user_id, RecommendationStatus.version)
+        .where(RecommendationStatus.user_id.in_(user_ids))
+    ).all())
+    users = connection.execute(
+        select(User.id, User.interests, User.skill_level).where(User.id.in_(user_ids))
+    ).all()
+    enrolled, completed = {}, {}
+    for user_id, course_id, completed_at in connection.execute(
+        select(Enrollment.user_id, Enrollment.course_id, Enrollment.completed_at)
+        .where(Enrollment.user_id.in_(user_ids))
+    ):
+        enrolled.setdefault(user_id, set()).add(course_id)
+        if completed_at is not None:
+            completed.setdefault(user_id, []).append(course_id)
+
+    results = []
+    for user_id, interests, skill_level in users:
+        lists = compute_lists(json.loads(interests) if interests else [], skill_level,
+                              enrolled.get(user_id, ()), completed.get(user_id, ()),
+                              catalog, enrollment_counts)
+        results.append((user_id, versions.get(user_id, 0), lists))
+    return results
+
+
+def store_results(results):
+    """Replace the stored lists of the computed users and mark them fresh (current session)"""
+    if not results:
+        return
+    user_ids = [user_id for user_id, _, _ in results]
+    rows = [
+        {'user_id': user_id, 'kind': kind, 'rank': rank, 'course_id': course_id, 'score': score, 'reason': reason}
+        for user_id, _, lists in results
+        for kind, entries in lists.items()
+        for rank, (course_id, score, reason) in enumerate(entries)
+    ]
+    db.session.execute(delete(UserRecommendation).where(UserRecommendation.user_id.in_(user_ids)))
+    if rows:
+        db.session.execute(insert(UserRecommendation), rows)
+
+    # Users computed for the first time get a status row at version 0
+    db.session.execute(insert_ignore(RecommendationStatus),
+                       [{'user_id': user_id, 'version': 0, 'stale': True} for user_id in user_ids])
+    status = RecommendationStatus.__table__
+    db.session.execute(
+        status.update()
+        .where(status.c.user_id == bindparam('uid'), status.c.version == bindparam('computed_version'))
+        .values(stale=False, computed_at=datetime.utcnow()),
+        [{'uid': user_id, 'computed_version': version} for user_id, version, _ in results]
+    )
+
+
+def mark_stale(user_id, condition=None):
+    """
+    Bump the user's version so their stored lists are no longer served. Runs
+    in the caller's transaction; users without a status row are scored live
+    anyway. condition optionally restricts the update (e.g. to completions).
+    """
+    stmt = update(RecommendationStatus).where(RecommendationStatus.user_id == user_id)
+    if condition is not None:
+        stmt = stmt.where(condition)
+    db.session.execute(
+        stmt.values(version=RecommendationStatus.version + 1, stale=True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def mark_catalog_changed():
+    """
+    Bump every user's version: a course was added, removed or changed
+    category or difficulty, which the lists of any user may depend on. Runs
+    in the caller's transaction.
+    """
+    db.session.execute(
+        update(RecommendationStatus)
+        .values(version=RecommendationStatus.version + 1, stale=True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def mark_stale_if_completed(user_id, course_id):
+    """Bump the user's version only when the enrollment in course_id is complete"""
+    mark_stale(user_id, exists().where(
+        Enrollment.user_id == user_id,
+        Enrollment.course_id == course_id,
+        Enrollment.completed_at.isnot(None)
+    ))
+
+
+def stored_recommendation_queries(user_id, kind):
+    """
+    (whether the user's lists are stale, or None without a status row;
+    their stored (course, score, reason) rows in rank order) as statements,
+    shared with the async app
+    """
+    return (
+        select(RecommendationStatus.stale).where(RecommendationStatus.user_id == user_id),
+        select(Course, UserRecommendation.score, UserRecommendation.reason)
+        .join(UserRecommendation, UserRecommendation.course_id == Course.id)
+        .where(UserRecommendation.user_id == user_id, UserRecommendation.kind == kind)
+        .order_by(UserRecommendation.rank)
+    )
+
+
+def stored_recommendations(user_id, kind):
+    """Stored (course, score, reason) rows in rank order, or None when the user must be scored live"""
+    if not current_app.config.get('RECOMMENDATIONS_PRECOMPUTED', True):
+        return None
+    status_query, rows_query = stored_recommendation_queries(user_id, kind)
+    stale = db.session.scalar(status_query)
+    if stale is None or stale:
+        return None
+    return db.session.execute(rows_query).all()
+
+
+class RecommendationRefresher(BackgroundRefresher):
+    """Recomputes users whose recommendation status is stale, then lists past their maximum age"""
+    name = 'recommendations'
+
+    def refresh_batch(self):
+        """Recompute up to batch_size stale or outdated users; returns how many there were"""
+        user_ids = db.session.scalars(
+            select(RecommendationStatus.user_id).where(RecommendationStatus.stale == True).limit(self.batch_size)
+        ).all()
+        if len(user_ids) < self.batch_size:
+            # Fresh lists still drift with enrollment counts; redo the oldest
+            max_age = timedelta(seconds=self.app.config.get('RECOMMENDATIONS_MAX_AGE_SECONDS', 3600))
+            user_ids += db.session.scalars(
+                select(RecommendationStatus.user_id)
+                .where(RecommendationStatus.stale == False,
+                       RecommendationStatus.computed_at < datetime.utcnow() - max_age)
+                .order_by(RecommendationStatus.computed_at)
+                .limit(self.batch_size - len(user_ids))
+            ).all()
+        if user_ids:
+            connection = db.session.connection()
+            catalog, enrollment_counts = load_catalog_snapshot(connection)
+            store_results(compute_users(connection, user_ids, catalog, enrollment_counts))
+        db.session.commit()
+        return len(user_ids)
+
+
+def get_refresher():
+    return current_app.extensions.get('recommendations')
+
+
+def schedule_refresh():
+    """Ask the refresher to pick up users marked stale by the committed transaction"""
+    refresher = get_refresher()
+    if refresher is not None:
+        refresher.wake()
+
+
+# Process-pool batch job
+
+_worker = {}
+
+
+def _init_worker(database_url, catalog, enrollment_counts):
+    _worker['engine'] = create_engine(database_url)
+    _worker['catalog'] = catalog
+    _worker['enrollment_counts'] = enrollment_counts
+
+
+def _compute_shard(user_ids):
+    with _worker['engine'].connect() as connection:
+        return compute_users(connection, user_ids, _worker['catalog'], _worker['enrollment_counts'])
+
+
+def refresh_all(processes=None, shard_size=1000, stale_only=False):
+    """
+    Recompute every user (or only stale ones) on a process pool. Workers
+    read and score one shard of user ids each; this process writes the
+    results, so SQLite sees a single writer. Returns the number of users.
+    """
+    query = select(User.id).order_by(User.id)
+    if stale_only:
+        query = select(RecommendationStatus.user_id).where(RecommendationStatus.stale == True) \
+            .order_by(RecommendationStatus.user_id)
+    user_ids = db.session.scalars(query).all()
+    shards = [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+    catalog, enrollment_counts = load_catalog_snapshot(db.session.connection())
+    db.session.commit()
+
+    database_url = db.engine.url.render_as_string(hide_password=False)
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(database_url, catalog, enrollment_counts)) as pool:
+        for results in pool.map(_compute_shard, shards):
+            store_results(results)
+            db.session.commit()
+    return len(user_ids)
+
+
+@click.command('refresh-recommendations')
+@click.option('--processes', type=int, default=None, help='Worker processes (default: one per CPU).')
+@click.option('--shard-size', type=int, default=1000, help='Users per task.')
+@click.option('--stale-only', is_flag=True, help='Only users whose lists are stale.')
+def refresh_recommendations_command(processes, shard_size, stale_only):
+    """Precompute recommendation lists for every user."""
+    start = time.perf_counter()
+    count = refresh_all(processes, shard_size, stale_only)
+    click.echo(f'✓ Recommendations computed for {count} users in {time.perf_counter() - start:.1f}s')
+
+
+def init_recommendations(app):
+    """Attach the stale-user refresher and the batch command"""
+    app.cli.add_command(refresh_recommendations_command)
+    if not app.config.get('RECOMMENDATIONS_PRECOMPUTED', True):
+        return None
+    refresher = RecommendationRefresher(
+        app,
+        interval_seconds=app.config.get('RECOMMENDATIONS_REFRESH_SECONDS', 5.0),
+        batch_size=app.config.get('RECOMMENDATIONS_REFRESH_BATCH', 500)
+    )
+    app.extensions['recommendations'] = refresher
+
+    import atexit
+    atexit.register(refresher.stop)
+    return refresher
@@ -0,0 +1,66 @@
+"""
+Background refresh threads for LearnSmart
+Precomputed data (recommendation lists, similar-course lists) is marked
+stale by the requests that change its inputs and recomputed by a thread in
+batches. Subclasses implement refresh_batch(); requests call wake() after
+committing, and the thread also polls every interval_seconds so that work
+marked by other processes is picked up.
+"""
+
+import threading
+
+
+class BackgroundRefresher:
+    name = 'refresher'
+
+    def __init__(self, app, interval_seconds=5.0, batch_size=500):
+        self.app = app
+        self.interval = interval_seconds
+        self.batch_size = batch_size
+        self._cond = threading.Condition()
+        self._woken = False
+        self._stopping = False
+        self._thread = None
+
+    def refresh_batch(self):
+        """Recompute up to batch_size stale items in an app context; returns how many were stale"""
+        raise NotImplementedError
+
+    def start(self):
+        """Start polling every interval without asking for an immediate run"""
+        self._ensure_started()
+
+    def wake(self):
+        self._ensure_started()
+        with self._cond:
+            self._woken = True
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopping or self._woken, self.interval)
+                self._woken = False
+                if self._stopping:
+                    return
+            try:
+                with self.app.app_context():
+                    while self.refresh_batch() == self.batch_size:
+                        pass
+            except Exception as e:
+                print(f"{self.name.capitalize()} refresh failed, will retry: {str(e)}")
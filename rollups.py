@@ -0,0 +1,341 @@
+"""
+Activity rollups for LearnSmart
+Enrollments, course and lesson completions, quiz attempts and distinct
+active learners are counted per hour and per day, for each course and for
+the whole platform (course_id 0), in the activity_rollup table. Trend
+endpoints read only these rows.
+
+A catch-up job keeps them current. rollup_state holds a watermark: every
+hour before it has been rolled up. Each run counts the raw rows of the
+hours between the watermark and now - ROLLUP_LAG_SECONDS with grouped
+queries over the timestamp indexes, then closes finished days. A day's
+counts are the sums of its hours; its distinct learners are counted again
+from the raw rows, because distinct counts do not add up. Hourly rows
+older than ROLLUP_HOURLY_RETENTION_DAYS are then compacted away, leaving
+the daily ones.
+
+The lag leaves room for transactions and write-behind batches to commit.
+Rows that arrive with a timestamp behind the watermark anyway (imports,
+restored backups) are counted after `flask --app app rollup-activity
+--rebuild`.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, union_all, update
+
+from models import (
+    db, Enrollment, Lesson, LessonProgress, Quiz, QuizAttempt, ActivityRollup, RollupState, insert_ignore,
+    time_bucket
+)
+from refresher import BackgroundRefresher
+from sketches import weekly_learners
+
+HOUR = 'hour'
+DAY = 'day'
+WEEK = 'week'
+# Counts summed from hours into days and weeks
+ADDITIVE = ('enrollments', 'course_completions', 'lesson_completions', 'quiz_attempts', 'quizzes_passed')
+METRICS = ADDITIVE + ('active_learners',)
+# Platform-wide rows
+ALL_COURSES = 0
+# Longest series one request may ask for
+MAX_BUCKETS = 2000
+
+
+def floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def floor_week(moment):
+    return floor_day(moment) - timedelta(days=moment.weekday())
+
+
+# Truncation and length of each series granularity
+BUCKETS = {HOUR: (floor_hour, timedelta(hours=1)), DAY: (floor_day, timedelta(days=1)),
+           WEEK: (floor_week, timedelta(weeks=1))}
+
+
+def _bucket_value(value):
+    # Text on SQLite and MySQL, a timestamp on PostgreSQL
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def _activity_sources(start, end):
+    """(timestamp, user_id, course_id) selects of everything that makes a learner active"""
+    return (
+        select(Enrollment.enrolled_at.label('at'), Enrollment.user_id, Enrollment.course_id)
+        .where(Enrollment.enrolled_at >= start, Enrollment.enrolled_at < end),
+        select(LessonProgress.completed_at.label('at'), LessonProgress.user_id, Lesson.course_id)
+        .join(Lesson, Lesson.id == LessonProgress.lesson_id)
+        .where(LessonProgress.completed_at >= start, LessonProgress.completed_at < end),
+        select(QuizAttempt.attempted_at.label('at'), QuizAttempt.user_id, Quiz.course_id)
+        .join(Quiz, Quiz.id == QuizAttempt.quiz_id)
+        .where(QuizAttempt.attempted_at >= start, QuizAttempt.attempted_at < end),
+    )
+
+
+def distinct_learners(start, end, granularity):
+    """{(bucket_start, course_id): distinct active learners} for [start, end), course_id 0 included"""
+    activity = union_all(*_activity_sources(start, end)).subquery()
+    bucket = time_bucket(activity.c.at, granularity)
+    counts = {}
+    for bucket_start, course_id, learners in db.session.execute(
+        select(bucket, activity.c.course_id, func.count(activity.c.user_id.distinct()))
+        .group_by(bucket, activity.c.course_id)
+    ):
+        counts[(_bucket_value(bucket_start), course_id)] = learners
+    for bucket_start, learners in db.session.execute(
+        select(bucket, func.count(activity.c.user_id.distinct())).group_by(bucket)
+    ):
+        counts[(_bucket_value(bucket_start), ALL_COURSES)] = learners
+    return counts
+
+
+def hourly_counts(start, end):
+    """{(hour, course_id): {metric: count}} for [start, end) from the raw tables"""
+    rows = {}
+
+    def add(key, metric, value):
+        for course_id in (key[1], ALL_COURSES):
+            counts = rows.setdefault((key[0], course_id), dict.fromkeys(METRICS, 0))
+            counts[metric] += value or 0
+
+    enrolled = time_bucket(Enrollment.enrolled_at, HOUR)
+    for hour, course_id, count in db.session.execute(
+        select(enrolled, Enrollment.course_id, func.count())
+        .where(Enrollment.enrolled_at >= start, Enrollment.enrolled_at < end)
+        .group_by(enrolled, Enrollment.course_id)
+    ):
+        add((_bucket_value(hour), course_id), 'enrollments', count)
+
+    completed = time_bucket(Enrollment.completed_at, HOUR)
+    for hour, course_id, count in db.session.execute(
+        select(completed, Enrollment.course_id, func.count())
+        .where(Enrollment.completed_at >= start, Enrollment.completed_at < end)
+        .group_by(completed, Enrollment.course_id)
+    ):
+        add((_bucket_value(hour), course_id), 'course_completions', count)
+
+    progressed = time_bucket(LessonProgress.completed_at, HOUR)
+    for hour, course_id, count in db.session.execute(
+        select(progressed, Lesson.course_id, func.count())
+        .join(Lesson, Lesson.id == LessonProgress.lesson_id)
+        .where(LessonProgress.completed_at >= start, LessonProgress.completed_at < end)
+        .group_by(progressed, Lesson.course_id)
+    ):
+        add((_bucket_value(hour), course_id), 'lesson_completions', count)
+
+    attempted = time_bucket(QuizAttempt.attempted_at, HOUR)
+    for hour, course_id, count, passed in db.session.execute(
+        select(attempted, Quiz.course_id, func.count(), func.sum(QuizAttempt.passed.cast(db.Integer)))
+        .join(Quiz, Quiz.id == QuizAttempt.quiz_id)
+        .where(QuizAttempt.attempted_at >= start, QuizAttempt.attempted_at < end)
+        .group_by(attempted, Quiz.course_id)
+    ):
+        add((_bucket_value(hour), course_id), 'quiz_attempts', count)
+        add((_bucket_value(hour), course_id), 'quizzes_passed', passed)
+
+    for key, learners in distinct_learners(start, end, HOUR).items():
+        rows.setdefault(key, dict.fromkeys(METRICS, 0))['active_learners'] = learners
+    return rows
+
+
+def daily_counts(start, end):
+    """{(day, course_id): {metric: count}} for the whole days in [start, end) from hourly rollups"""
+    day = time_bucket(ActivityRollup.bucket_start, DAY)
+    rows = {}
+    for values in db.session.execute(
+        select(day, ActivityRollup.course_id, *(func.sum(getattr(ActivityRollup, metric)) for metric in ADDITIVE))
+        .where(ActivityRollup.granularity == HOUR, ActivityRollup.bucket_start >= start,
+               ActivityRollup.bucket_start < end)
+        .group_by(day, ActivityRollup.course_id)
+    ):
+        counts = dict(zip(ADDITIVE, values[2:]))
+        counts['active_learners'] = 0
+        rows[(_bucket_value(values[0]), values[1])] = counts
+    for key, learners in distinct_learners(start, end, DAY).items():
+        rows.setdefault(key, dict.fromkeys(METRICS, 0))['active_learners'] = learners
+    return rows
+
+
+def _store(granularity, rows):
+    values = [dict(counts, granularity=granularity, bucket_start=bucket_start, course_id=course_id)
+              for (bucket_start, course_id), counts in rows.items()]
+    for start in range(0, len(values), 5000):
+        db.session.execute(insert(ActivityRollup), values[start:start + 5000])
+
+
+def earliest_activity():
+    """Timestamp of the oldest raw activity row, or None"""
+    moments = [db.session.scalar(select(func.min(column))) for column in (
+        Enrollment.enrolled_at, Enrollment.completed_at, LessonProgress.completed_at, QuizAttempt.attempted_at
+    )]
+    moments = [_bucket_value(moment) for moment in moments if moment is not None]
+    return min(moments) if moments else None
+
+
+def rollup_state():
+    """The single rollup_state row, created (starting at the oldest activity) if missing"""
+    state = db.session.get(RollupState, 1)
+    if state is None:
+        earliest = earliest_activity()
+        start = floor_hour(earliest) if earliest else floor_hour(datetime.utcnow())
+        db.session.execute(insert_ignore(RollupState),
+                           [{'id': 1, 'watermark': start, 'days_through': floor_day(start)}])
+        state = db.session.get(RollupState, 1)
+    return state
+
+
+def catch_up(lag_seconds=300, max_hours=168, retention_days=31, now=None):
+    """
+    Roll up to max_hours closed hours past the watermark and close the days
+    they finish; commits. Returns the number of hours rolled up. Several
+    processes may run this concurrently: the watermark is advanced with a
+    compare-and-set, and a process that loses the race rolls back.
+    """
+    now = now or datetime.utcnow()
+    state = rollup_state()
+    start, days_through = state.watermark, state.days_through
+    end = min(floor_hour(now - timedelta(seconds=lag_seconds)), start + timedelta(hours=max_hours))
+    if end <= start:
+        db.session.commit()
+        return 0
+
+    closed_through = floor_day(end)
+    claimed = db.session.execute(
+        update(RollupState).where(RollupState.id == 1, RollupState.watermark == start)
+        .values(watermark=end, days_through=max(days_through, closed_through), updated_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return 0
+
+    _store(HOUR, hourly_counts(start, end))
+    if closed_through > days_through:
+        _store(DAY, daily_counts(days_through, closed_through))
+    compact(closed_through - timedelta(days=retention_days))
+    db.session.commit()
+    return int((end - start) / timedelta(hours=1))
+
+
+def compact(before):
+    """Drop hourly rollups of days before `before`; their daily rows remain"""
+    db.session.execute(delete(ActivityRollup).where(
+        ActivityRollup.granularity == HOUR, ActivityRollup.bucket_start < before
+    ))
+
+
+def rebuild(now=None, **options):
+    """Forget every rollup and roll up all activity again (commits per batch); returns hours rolled up"""
+    db.session.execute(delete(ActivityRollup))
+    db.session.execute(delete(RollupState))
+    db.session.commit()
+    hours = 0
+    while True:
+        rolled = catch_up(now=now, **options)
+        if not rolled:
+            return hours
+        hours += rolled
+
+
+def activity_series(course_id, granularity, start, end):
+    """
+    [{'bucket': ..., metric: count, ...}] for every bucket in [start, end)
+    up to the watermark, zeros included, read from the rollups. Weeks (from
+    Monday) are sums of days; their active_learners is estimated from the
+    daily learner sketches, or None before any are stored.
+    """
+    floor, step = BUCKETS[granularity]
+    start = floor(start)
+    stored = DAY if granularity == WEEK else granularity
+    rows = db.session.execute(
+        select(ActivityRollup.bucket_start, *(getattr(ActivityRollup, metric) for metric in METRICS))
+        .where(ActivityRollup.granularity == stored, ActivityRollup.course_id == course_id,
+               ActivityRollup.bucket_start >= start, ActivityRollup.bucket_start < end)
+    ).all()
+
+    series = {}
+    bucket = start
+    while bucket < end:
+        series[bucket] = dict.fromkeys(METRICS, 0)
+        bucket += step
+    for bucket_start, *values in rows:
+        counts = series.setdefault(floor(_bucket_value(bucket_start)), dict.fromkeys(METRICS, 0))
+        for metric, value in zip(METRICS, values):
+            counts[metric] += value
+    if granularity == WEEK:
+        # Distinct counts do not add up; merge the days' learner sketches instead
+        weekly = weekly_learners(course_id, start, end)
+        for bucket, counts in series.items():
+            counts['active_learners'] = weekly.get(bucket, 0) if weekly else None
+    return [dict(counts, bucket=bucket.isoformat()) for bucket, counts in sorted(series.items())]
+
+
+def bucket_count(granularity, start, end):
+    floor, step = BUCKETS[granularity]
+    return max(0, -((floor(start) - end) // step))
+
+
+class RollupRefresher(BackgroundRefresher):
+    """Runs catch_up every interval once started"""
+    name = 'rollups'
+
+    def refresh_batch(self):
+        config = self.app.config
+        return catch_up(config['ROLLUP_LAG_SECONDS'], self.batch_size, config['ROLLUP_HOURLY_RETENTION_DAYS'])
+
+
+def schedule_rollups():
+    """Start the catch-up thread if it is not running yet"""
+    refresher = current_app.extensions.get('rollups')
+    if refresher is not None:
+        refresher.wake()
+
+
+def rollup_options(config):
+    return {'lag_seconds': config['ROLLUP_LAG_SECONDS'], 'max_hours': config['ROLLUP_BATCH_HOURS'],
+            'retention_days': config['ROLLUP_HOURLY_RETENTION_DAYS']}
+
+
+@click.command('rollup-activity')
+@click.option('--rebuild', 'from_scratch', is_flag=True, help='Discard the rollups and recount all activity.')
+def rollup_activity_command(from_scratch):
+    """Roll activity up to the last closed hour (for cron, or after imports with --rebuild)."""
+    start = time.perf_counter()
+    options = rollup_options(current_app.config)
+    if from_scratch:
+        hours = rebuild(**options)
+    else:
+        hours = 0
+        while True:
+            rolled = catch_up(**options)
+            if not rolled:
+                break
+            hours += rolled
+    state = rollup_state()
+    click.echo(f'✓ {hours} hours rolled up, watermark {state.watermark.isoformat()}, '
+               f'in {time.perf_counter() - start:.1f}s')
+
+
+def init_rollups(app):
+    """Attach the catch-up refresher and the rollup command"""
+    app.cli.add_command(rollup_activity_command)
+    refresher = RollupRefresher(
+        app,
+        interval_seconds=app.config.get('ROLLUP_REFRESH_SECONDS', 60.0),
+        batch_size=app.config.get('ROLLUP_BATCH_HOURS', 168)
+    )
+    app.extensions['rollups'] = refresher
+
+    import atexit
+    atexit.register(refresher.stop)
+    return refresher
@@ -1,15 +1,39 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, send_file
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models import db, User, Course, Lesson, Quiz, Question, Enrollment, LessonProgress, QuizAttempt
+from models import (
+    db, User, Course, Lesson, Quiz, Question, Enrollment, LessonProgress, QuizAttempt, RecommendationStatus,
+    CourseVector, RollupState, deleted_course_ids, insert_ignore, supports_returning
+)
+from sqlalchemy import select, update, literal, func, case
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 import json
-from ai_features import (
-    generate_course_summary,
-    generate_quiz_question,
-    analyze_learning_style,
-    generate_personalized_path,
-    get_learning_insights,
-    analyze_quiz_performance
+import os
+from write_behind import LESSON_PROGRESS, QUIZ_ATTEMPT
+from profiling import list_profiles, profile_path
+from query_budget import query_budget
+from events import get_broker, publish, publish_lesson_progress
+from recommendations import (
+    INTERESTS, PATH, recommend_courses, mark_stale, mark_stale_if_completed, mark_catalog_changed,
+    stored_recommendations, schedule_refresh
+)
+from similarity import mark_course_stale, forget_course, similar_courses, schedule_similarity_refresh
+from calibration import (
+    question_calibrations, quiz_expected_score, add_expected_scores, course_difficulty, difficulty_label
+)
+from item_analysis import record_responses, item_statistics
+from cache import (
+    cached_json, cached_user_json, invalidate, with_members, bump_user_versions, bump_course_learners
+)
+from catalog import catalog_json, publish_catalog
+from purge import schedule_purge
+from authoring import TreeError, create_tree, refresh_question_counts, update_tree, validate_tree
+from read_models import (
+    CourseRead, EnrollmentRead, QuestionRead, QuizAttemptRead, QuizRead, UserRead, read, read_one
+)
+from sketches import record_activity, record_quiz_attempt, score_summary, learner_estimate
+from rollups import (
+    ALL_COURSES, BUCKETS, DAY, HOUR, MAX_BUCKETS, activity_series, bucket_count, schedule_rollups
 )
 
 auth_bp = Blueprint('auth', __name__)
@@ -18,8 +42,223 @@ admin_bp = Blueprint('admin', __name__)
 learner_bp = Blueprint('learner', __name__)
 ai_bp = Blueprint('ai', __name__)
 
+def get_write_behind():
+    """Return the app's write-behind queue, or None when writes are synchronous"""
+    return current_app.extensions.get('write_behind')
+
+def wait_for_own_writes(user_id):
+    """Make the user's buffered progress events visible before reading"""
+    queue = get_write_behind()
+    if queue:
+        queue.wait_for_user(user_id)
+
+def update_enrollment_progress(user_id, course_id):
+    """
+    Recompute an enrollment's progress from the user's completed lessons in a
+    single UPDATE, and mark the user's recommendations stale once the course
+    is complete. course_id may be a value or a scalar subquery.
+    """
+    total_lessons = select(func.count(Lesson.id)).where(
+        Lesson.course_id == course_id
+    ).scalar_subquery()
+    completed_lessons = select(func.count(LessonProgress.id)).join(Lesson).where(
+        LessonProgress.user_id == user_id,
+        Lesson.course_id == course_id
+    ).scalar_subquery()
+    percentage = case(
+        (total_lessons > 0, completed_lessons * 100.0 / total_lessons),
+        else_=0
+    )
+    
+    db.session.execute(
+        update(Enrollment)
+        .where(Enrollment.user_id == user_id, Enrollment.course_id == course_id)
+        .values(
+            progress_percentage=percentage,
+            completed_at=case(
+                (percentage >= 100, func.coalesce(Enrollment.completed_at, datetime.utcnow())),
+                else_=Enrollment.completed_at
+            )
+        )
+        .execution_options(synchronize_session=False)
+    )
+    # A completed course changes the learning path
+    mark_stale_if_completed(user_id, course_id)
+
+def course_count_queries(course_ids):
+    """The two grouped SELECTs behind course_counts (also run by the async layer)"""
+    return (
+        select(Lesson.course_id, func.count(Lesson.id))
+        .where(Lesson.course_id.in_(course_ids))
+        .group_by(Lesson.course_id),
+        select(Enrollment.course_id, func.count(Enrollment.id))
+        .where(Enrollment.course_id.in_(course_ids))
+        .group_by(Enrollment.course_id)
+    )
+
+def course_counts(course_ids):
+    """Lesson and enrollment counts for many courses in two grouped queries"""
+    if not course_ids:
+        return {}, {}
+    lessons_query, enrollments_query = course_count_queries(course_ids)
+    return dict(db.session.execute(lessons_query).all()), dict(db.session.execute(enrollments_query).all())
+
+def courses_to_dicts(courses):
+    """Serialize courses (models or CourseRead rows) without a lazy load per course"""
+    lesson_counts, enrollment_counts = course_counts(list({c.id for c in courses}))
+    return [course.to_dict(lesson_count=lesson_counts.get(course.id, 0),
+                           enrollment_count=enrollment_counts.get(course.id, 0))
+            for course in courses]
+
+def recommended_course_dicts(user_id, score_live, serialize=courses_to_dicts):
+    """
+    The list GET /api/learner/recommendations answers with: the user's
+    stored interest recommendations while they are fresh, else the courses
+    score_live() returns (None if it returns None), serialized with the
+    learner's expected score on each
+    """
+    stored = stored_recommendations(user_id, INTERESTS)
+    recommended = [course for course, _, _ in stored] if stored is not None else score_live()
+    if recommended is None:
+        return None
+    return add_expected_scores(user_id, serialize(recommended))
+
+def enrollments_to_dicts(enrollments, lesson_counts, enrollment_counts):
+    """Serialize enrollments with their (already loaded) course"""
+    enrollments_data = []
+    for enrollment in enrollments:
+        try:
+            enrollment_dict = enrollment.to_dict()
+            enrollment_dict['course'] = enrollment.course.to_dict(
+                lesson_count=lesson_counts.get(enrollment.course_id, 0),
+                enrollment_count=enrollment_counts.get(enrollment.course_id, 0)
+            )
+            enrollments_data.append(enrollment_dict)
+        except Exception as e:
+            print(f"Error processing enrollment {enrollment.id}: {str(e)}")
+    return enrollments_data
+
+def dashboard_queries(user_id):
+    """Enrollments with their course, the five latest attempts (both as read models) and the quiz totals"""
+    return (
+        EnrollmentRead.select(Enrollment.user_id == user_id),
+        QuizAttemptRead.select(QuizAttempt.user_id == user_id)
+        .order_by(QuizAttempt.attempted_at.desc()).limit(5),
+        select(func.count(QuizAttempt.id), func.count(case((QuizAttempt.passed == True, 1))))
+        .where(QuizAttempt.user_id == user_id)
+    )
+
+def dashboard_to_dict(enrollments, recent_attempts, quiz_totals, lesson_counts, enrollment_counts):
+    total_quizzes_taken, passed_quizzes = quiz_totals
+    return {
+        'total_courses': len(enrollments),
+        'completed_courses': len([e for e in enrollments if e.completed_at]),
+        'total_quizzes_taken': total_quizzes_taken,
+        'passed_quizzes': passed_quizzes,
+        'recent_attempts': [attempt.to_dict() for attempt in recent_attempts],
+        'enrollments': enrollments_to_dicts(enrollments, lesson_counts, enrollment_counts)
+    }
+
+def insights_to_dict(user_id, courses, quiz_attempts, lesson_progress):
+    """Run the AI insight and quiz analysis over already loaded rows (CPU only)"""
+    from ai_features import get_learning_insights, analyze_quiz_performance
+    return {
+        'insights': get_learning_insights(user_id, courses, quiz_attempts, lesson_progress),
+        'performance_analysis': analyze_quiz_performance(quiz_attempts)
+    }
+
+def catalog_course_dicts(courses, lesson_counts, enrollment_counts):
+    """Serialize courses with counts already loaded for the whole catalog"""
+    return [course.to_dict(lesson_count=lesson_counts.get(course.id, 0),
+                           enrollment_count=enrollment_counts.get(course.id, 0))
+            for course in courses]
+
+def live_catalog_recommendations(user, enrollments, courses):
+    """The user's interest recommendations scored over an already loaded catalog"""
+    return recommend_courses(user.get_interests(), courses, {e.course_id for e in enrollments})
+
+def bootstrap_to_dict(user, enrollments, quiz_attempts, lesson_progress, courses, lesson_counts, enrollment_counts,
+                      recommendations):
+    """
+    Assemble the bootstrap response from already loaded rows (CPU only);
+    recommendations is the list GET /api/learner/recommendations answers with
+    """
+    recent_attempts = sorted(quiz_attempts, key=lambda a: a.attempted_at, reverse=True)[:5]
+    quiz_totals = (len(quiz_attempts), len([a for a in quiz_attempts if a.passed]))
+    
+    return {
+        'profile': user.to_dict(),
+        'dashboard': dashboard_to_dict(enrollments, recent_attempts, quiz_totals, lesson_counts, enrollment_counts),
+        'insights': insights_to_dict(user.id, [e.course for e in enrollments], quiz_attempts, lesson_progress),
+        'recommendations': recommendations,
+        'courses': catalog_course_dicts(courses, lesson_counts, enrollment_counts)
+    }
+
+def load_catalog():
+    """Every course plus lesson and enrollment counts (three queries)"""
+    courses = Course.query.all()
+    lesson_counts, enrollment_counts = course_counts([c.id for c in courses])
+    return courses, lesson_counts, enrollment_counts
+
+def get_bootstrap_executor():
+    """Shared worker pool for concurrent bootstrap sections, created on first use"""
+    executor = current_app.extensions.get('bootstrap_executor')
+    if executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = current_app.extensions.setdefault(
+            'bootstrap_executor',
+            ThreadPoolExecutor(current_app.config.get('BOOTSTRAP_WORKERS', 4), thread_name_prefix='bootstrap')
+        )
+    return executor
+
+def course_payload(course_id):
+    """A course with its lessons and quizzes, as GET /api/courses/<id> returns it; None if missing"""
+    course = Course.query.get(course_id)
+    if not course:
+        return None
+    
+    course_data = course.to_dict()
+    course_data['lessons'] = [lesson.to_dict() for lesson in course.lessons]
+    course_data['quizzes'] = [quiz.to_dict() for quiz in course.quizzes]
+    return course_data
+
+def quiz_payload(quiz_id):
+    """A quiz with its questions and their calibrations, the part of GET /api/learner/quiz/<id> all learners share"""
+    quiz = read_one(QuizRead, Quiz.id == quiz_id)
+    if not quiz:
+        return None
+    
+    questions = read(QuestionRead, Question.quiz_id == quiz_id)
+    quiz_data = quiz.to_dict()
+    quiz_data['questions'] = [question.to_dict() for question in questions]
+    
+    # Calibrated difficulty per question
+    calibrations = question_calibrations([question.id for question in questions])
+    for question_data in quiz_data['questions']:
+        calibration = calibrations.get(question_data['id'])
+        question_data['calibration'] = calibration.to_dict() if calibration else None
+    return quiz_data
+
+def insert_or_ignore_returning(model, values, source):
+    """
+    Insert one row built from a single-row SELECT, skipping it on a unique
+    conflict. Returns a detached model instance for the new row, or None when
+    nothing was inserted (conflict, or the SELECT matched no row).
+    """
+    stmt = insert_ignore(model).from_select(list(values), source)
+    if supports_returning():
+        row = db.session.execute(stmt.returning(*model.__table__.c)).first()
+        return model(**row._mapping) if row else None
+    
+    # No RETURNING (MySQL): fall back to reading the row back by its unique key
+    result = db.session.execute(stmt)
+    if result.rowcount != 1:
+        return None
+    return model.query.get(result.lastrowid)
+
 # Authentication Routes
 @auth_bp.route('/register', methods=['POST'])
+@query_budget(5)
 def register():
     data = request.get_json()
     
@@ -42,7 +281,11 @@ def register():
     user.set_password(data['password'])
     
     db.session.add(user)
+    db.session.flush()
+    # New users are scored live until the refresher has stored their lists
+    db.session.add(RecommendationStatus(user_id=user.id, version=1, stale=True))
     db.session.commit()
+    schedule_refresh()
     
     access_token = create_access_token(identity=user.id)
     
@@ -53,6 +296,7 @@ def register():
     }), 201
 
 @auth_bp.route('/login', methods=['POST'])
+@query_budget(1)
 def login():
     data = request.get_json()
     
@@ -72,6 +316,7 @@ def login():
     return jsonify({'error': 'Invalid credentials'}), 401
 
 @auth_bp.route('/profile', methods=['GET'])
+@query_budget(1)
 @jwt_required()
 def get_profile():
     user_id = get_jwt_identity()
@@ -83,6 +328,7 @@ def get_profile():
     return jsonify(user.to_dict())
 
 @auth_bp.route('/profile', methods=['PUT'])
+@query_budget(4)
 @jwt_required()
 def update_profile():
     user_id = get_jwt_identity()
@@ -99,8 +345,11 @@ def update_profile():
         user.skill_level = data['skill_level']
     if 'email' in data:
         user.email = data['email']
+    if 'interests' in data or 'skill_level' in data:
+        mark_stale(user_id)
     
     db.session.commit()
+    schedule_refresh()
     
     return jsonify({
         'message': 'Profile updated successfully',
@@ -109,57 +358,92 @@ def update_profile():
 
 # Course Routes
 @courses_bp.route('/', methods=['GET'])
+@query_budget(3)
 def get_courses():
+    # Served from the host's shared catalog snapshot once one is published
+    body = catalog_json()
+    if body is not None:
+        return current_app.response_class(body, mimetype='application/json')
+    
     try:
-        courses = Course.query.all()
+        courses = read(CourseRead)
         print(f"Found {len(courses)} courses")
-        courses_data = [course.to_dict() for course in courses]
+        courses_data = courses_to_dicts(courses)
         return jsonify(courses_data)
     except Exception as e:
         print(f"Error in get_courses: {str(e)}")
         return jsonify({'error': str(e), 'courses': []}), 500
 
 @courses_bp.route('/<int:course_id>', methods=['GET'])
+@query_budget(4)
 def get_course(course_id):
+    # Served from the payload cache until an admin route changes the course
+    body = cached_json('course', course_id, lambda: course_payload(course_id))
+    if body is None:
+        return jsonify({'error': 'Course not found'}), 404
+    
+    return current_app.response_class(body, mimetype='application/json')
+
+@courses_bp.route('/<int:course_id>/similar', methods=['GET'])
+@query_budget(4)
+def get_similar_courses(course_id):
     course = Course.query.get(course_id)
     if not course:
         return jsonify({'error': 'Course not found'}), 404
     
-    course_data = course.to_dict()
-    course_data['lessons'] = [lesson.to_dict() for lesson in course.lessons]
-    course_data['quizzes'] = [quiz.to_dict() for quiz in course.quizzes]
+    # Lists are precomputed by similarity.py; the request is one indexed lookup
+    limit = max(1, min(request.args.get('limit', 10, type=int), current_app.config['SIMILARITY_NEIGHBORS']))
+    similar = similar_courses(course_id, limit)
+    courses_data = courses_to_dicts([similar_course for similar_course, _ in similar])
+    for course_data, (_, score) in zip(courses_data, similar):
+        course_data['similarity'] = round(score, 4)
     
-    return jsonify(course_data)
+    return jsonify(courses_data)
 
 @courses_bp.route('/category/<category>', methods=['GET'])
+@query_budget(3)
 def get_courses_by_category(category):
-    courses = Course.query.filter_by(category=category).all()
-    return jsonify([course.to_dict() for course in courses])
+    body = catalog_json(category)
+    if body is not None:
+        return current_app.response_class(body, mimetype='application/json')
+    
+    courses = read(CourseRead, Course.category == category)
+    return jsonify(courses_to_dicts(courses))
 
 # Learner Routes
 @learner_bp.route('/enroll/<int:course_id>', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def enroll_course(course_id):
     try:
         user_id = get_jwt_identity()
         print(f"Enrollment request: user_id={user_id}, course_id={course_id}")
         
-        # Check if already enrolled
-        existing_enrollment = Enrollment.query.filter_by(user_id=user_id, course_id=course_id).first()
-        if existing_enrollment:
+        # Insert only if the course exists and the user is not enrolled yet
+        # (INSERT ... SELECT skips the soft-delete filter, hence deleted_at)
+        enrollment = insert_or_ignore_returning(
+            Enrollment,
+            ['user_id', 'course_id', 'enrolled_at', 'progress_percentage'],
+            select(literal(user_id), Course.id, literal(datetime.utcnow()), literal(0.0))
+            .where(Course.id == course_id, Course.deleted_at.is_(None))
+        )
+        if enrollment:
+            mark_stale(user_id)
+            bump_user_versions([user_id])
+        db.session.commit()
+        
+        if not enrollment:
+            # Only the failure path pays for a second query to tell the cases apart
+            if db.session.query(Course.id).filter_by(id=course_id).first() is None:
+                print("Course not found")
+                return jsonify({'error': 'Course not found'}), 404
             print("Already enrolled")
             return jsonify({'error': 'Already enrolled in this course'}), 400
         
-        course = Course.query.get(course_id)
-        if not course:
-            print("Course not found")
-            return jsonify({'error': 'Course not found'}), 404
-        
-        enrollment = Enrollment(user_id=user_id, course_id=course_id)
-        db.session.add(enrollment)
-        db.session.commit()
-        
+        schedule_refresh()
         print("Enrollment successful")
+        publish(user_id, 'enrolled', enrollment.to_dict())
+        record_activity('course', course_id, user_id, enrollment.enrolled_at)
         return jsonify({
             'message': 'Successfully enrolled in course',
             'enrollment': enrollment.to_dict()
@@ -169,20 +453,21 @@ def enroll_course(course_id):
         return jsonify({'error': f'Enrollment failed: {str(e)}'}), 500
 
 @learner_bp.route('/my-courses', methods=['GET'])
+@query_budget(3)
 @jwt_required()
 def get_my_courses():
     user_id = get_jwt_identity()
-    enrollments = Enrollment.query.filter_by(user_id=user_id).all()
+    wait_for_own_writes(user_id)
+    enrollments = read(EnrollmentRead, Enrollment.user_id == user_id)
     
-    courses_data = []
-    for enrollment in enrollments:
-        course_data = enrollment.course.to_dict()
+    courses_data = courses_to_dicts([enrollment.course for enrollment in enrollments])
+    for course_data, enrollment in zip(courses_data, enrollments):
         course_data['enrollment'] = enrollment.to_dict()
-        courses_data.append(course_data)
     
     return jsonify(courses_data)
 
 @learner_bp.route('/lesson-progress', methods=['POST'])
+@query_budget(5)
 @jwt_required()
 def mark_lesson_complete():
     user_id = get_jwt_identity()
@@ -194,30 +479,53 @@ def mark_lesson_complete():
     if not lesson_id:
         return jsonify({'error': 'Lesson ID required'}), 400
     
-    # Check if already completed
-    existing_progress = LessonProgress.query.filter_by(user_id=user_id, lesson_id=lesson_id).first()
-    if existing_progress:
+    queue = get_write_behind()
+    
+    if queue:
+        # Validation happens now; the row is written by the next group commit
+        existing_progress = LessonProgress.query.filter_by(user_id=user_id, lesson_id=lesson_id).first()
+        if existing_progress or queue.has_pending_lesson(user_id, lesson_id):
+            return jsonify({'error': 'Lesson already completed'}), 400
+        if not Lesson.query.get(lesson_id):
+            return jsonify({'error': 'Lesson not found'}), 404
+        progress_data = {
+            'id': None,
+            'user_id': user_id,
+            'lesson_id': lesson_id,
+            'completed_at': datetime.utcnow().isoformat(),
+            'time_spent_minutes': time_spent
+        }
+        queue.submit(LESSON_PROGRESS, progress_data)
+        return jsonify({
+            'message': 'Lesson marked as complete',
+            'progress': progress_data
+        }), 202
+    
+    # Insert only if the lesson exists and is not completed yet; a concurrent
+    # duplicate loses the conflict instead of failing the unique constraint
+    progress = insert_or_ignore_returning(
+        LessonProgress,
+        ['user_id', 'lesson_id', 'completed_at', 'time_spent_minutes'],
+        select(literal(user_id), Lesson.id, literal(datetime.utcnow()), literal(time_spent))
+        .where(Lesson.id == lesson_id, Lesson.course_id.notin_(deleted_course_ids()))
+    )
+    if not progress:
+        db.session.rollback()
+        if db.session.query(Lesson.id).filter_by(id=lesson_id).first() is None:
+            return jsonify({'error': 'Lesson not found'}), 404
         return jsonify({'error': 'Lesson already completed'}), 400
     
-    progress = LessonProgress(user_id=user_id, lesson_id=lesson_id, time_spent_minutes=time_spent)
-    db.session.add(progress)
-    
     # Update course progress
-    lesson = Lesson.query.get(lesson_id)
-    if lesson:
-        enrollment = Enrollment.query.filter_by(user_id=user_id, course_id=lesson.course_id).first()
-        if enrollment:
-            total_lessons = len(lesson.course.lessons)
-            completed_lessons = LessonProgress.query.join(Lesson).filter(
-                LessonProgress.user_id == user_id,
-                Lesson.course_id == lesson.course_id
-            ).count()
-            enrollment.progress_percentage = (completed_lessons / total_lessons) * 100
-            
-            if enrollment.progress_percentage >= 100:
-                enrollment.completed_at = datetime.utcnow()
+    update_enrollment_progress(
+        user_id,
+        select(Lesson.course_id).where(Lesson.id == lesson_id).scalar_subquery()
+    )
+    bump_user_versions([user_id])
     
     db.session.commit()
+    schedule_refresh()
+    publish_lesson_progress(user_id, [lesson_id])
+    record_activity('lesson', lesson_id, user_id, progress.completed_at)
     
     return jsonify({
         'message': 'Lesson marked as complete',
@@ -225,18 +533,20 @@ def mark_lesson_complete():
     })
 
 @learner_bp.route('/quiz/<int:quiz_id>', methods=['GET'])
+@query_budget(4)
 @jwt_required()
 def get_quiz(quiz_id):
-    quiz = Quiz.query.get(quiz_id)
-    if not quiz:
+    body = cached_json('quiz', quiz_id, lambda: quiz_payload(quiz_id))
+    if body is None:
         return jsonify({'error': 'Quiz not found'}), 404
     
-    quiz_data = quiz.to_dict()
-    quiz_data['questions'] = [question.to_dict() for question in quiz.questions]
-    
-    return jsonify(quiz_data)
+    # The shared payload is cached; the learner's expected score is added per request
+    expected = quiz_expected_score(get_jwt_identity(), quiz_id)
+    return current_app.response_class(with_members(body, current_app, expected_score=expected),
+                                      mimetype='application/json')
 
 @learner_bp.route('/quiz/<int:quiz_id>/submit', methods=['POST'])
+@query_budget(5)
 @jwt_required()
 def submit_quiz(quiz_id):
     user_id = get_jwt_identity()
@@ -261,6 +571,27 @@ def submit_quiz(quiz_id):
     percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
     passed = percentage >= quiz.passing_score
     
+    queue = get_write_behind()
+    if queue:
+        attempt_data = {
+            'id': None,
+            'user_id': user_id,
+            'quiz_id': quiz_id,
+            'score': correct_answers,
+            'total_questions': total_questions,
+            'correct_answers': correct_answers,
+            'percentage': percentage,
+            'passed': passed,
+            'time_taken_minutes': time_taken,
+            'attempted_at': datetime.utcnow().isoformat(),
+            'answers': answers
+        }
+        queue.submit(QUIZ_ATTEMPT, attempt_data)
+        return jsonify({
+            'message': 'Quiz submitted successfully',
+            'attempt': attempt_data
+        }), 202
+    
     attempt = QuizAttempt(
         user_id=user_id,
         quiz_id=quiz_id,
@@ -274,7 +605,12 @@ def submit_quiz(quiz_id):
     attempt.set_answers(answers)
     
     db.session.add(attempt)
+    db.session.flush()
+    record_responses(attempt.id, [(question.id, question.correct_answer) for question in quiz.questions], answers)
+    bump_user_versions([user_id])
     db.session.commit()
+    publish(user_id, 'quiz_attempt', attempt.to_dict())
+    record_quiz_attempt(quiz_id, user_id, percentage, attempt.attempted_at)
     
     return jsonify({
         'message': 'Quiz submitted successfully',
@@ -282,82 +618,67 @@ def submit_quiz(quiz_id):
     })
 
 @learner_bp.route('/recommendations', methods=['GET'])
+@query_budget(7)
 @jwt_required()
 def get_recommendations():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
     
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+    def score_live():
+        # Cold or stale user
+        user = User.query.get(user_id)
+        
+        if not user:
+            return None
+        
+        # Get user's interests
+        user_interests = user.get_interests()
+        
+        # Get courses in user's interest areas: one query for all interests, then
+        # the first three matches per interest
+        candidates = []
+        if user_interests:
+            candidates = Course.query.filter(
+                db.or_(*[Course.category.ilike(f'%{interest}%') for interest in user_interests])
+            ).order_by(Course.id).all()
+        
+        # Skip already enrolled courses
+        enrolled_course_ids = {course_id for (course_id,) in
+                               db.session.query(Enrollment.course_id).filter_by(user_id=user_id)}
+        
+        return recommend_courses(user_interests, candidates, enrolled_course_ids)
     
-    # Get user's interests and completed courses
-    user_interests = user.get_interests()
-    completed_courses = db.session.query(Course).join(Enrollment).filter(
-        Enrollment.user_id == user_id,
-        Enrollment.completed_at.isnot(None)
-    ).all()
-    
-    # Get courses in user's interest areas
-    recommended_courses = []
-    if user_interests:
-        for interest in user_interests:
-            courses = Course.query.filter(Course.category.ilike(f'%{interest}%')).limit(3).all()
-            recommended_courses.extend(courses)
-    
-    # Remove duplicates and already enrolled courses
-    enrolled_course_ids = [e.course_id for e in Enrollment.query.filter_by(user_id=user_id).all()]
-    recommended_courses = [c for c in recommended_courses if c.id not in enrolled_course_ids]
-    
-    # Remove duplicates
-    seen = set()
-    unique_courses = []
-    for course in recommended_courses:
-        if course.id not in seen:
-            seen.add(course.id)
-            unique_courses.append(course)
-    
-    return jsonify([course.to_dict() for course in unique_courses[:6]])
+    recommendations = recommended_course_dicts(user_id, score_live)
+    if recommendations is None:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(recommendations)
 
 @learner_bp.route('/dashboard', methods=['GET'])
+@query_budget(6)
 @jwt_required()
 def get_dashboard():
     try:
         user_id = get_jwt_identity()
         print(f"Dashboard request for user: {user_id}")
+        wait_for_own_writes(user_id)
         
-        # Get user's enrollments
-        enrollments = Enrollment.query.filter_by(user_id=user_id).all()
-        print(f"User has {len(enrollments)} enrollments")
-        
-        # Get recent quiz attempts
-        recent_attempts = QuizAttempt.query.filter_by(user_id=user_id).order_by(
-            QuizAttempt.attempted_at.desc()
-        ).limit(5).all()
-        
-        # Calculate statistics
-        total_courses = len(enrollments)
-        completed_courses = len([e for e in enrollments if e.completed_at])
-        total_quizzes_taken = len(QuizAttempt.query.filter_by(user_id=user_id).all())
-        passed_quizzes = len(QuizAttempt.query.filter_by(user_id=user_id, passed=True).all())
-        
-        # Prepare enrollments with course data
-        enrollments_data = []
-        for enrollment in enrollments:
-            try:
-                enrollment_dict = enrollment.to_dict()
-                enrollment_dict['course'] = enrollment.course.to_dict()
-                enrollments_data.append(enrollment_dict)
-            except Exception as e:
-                print(f"Error processing enrollment {enrollment.id}: {str(e)}")
+        def build():
+            enrollments_query, attempts_query, totals_query = dashboard_queries(user_id)
+            
+            # Get user's enrollments
+            enrollments = EnrollmentRead.from_rows(db.session.execute(enrollments_query))
+            print(f"User has {len(enrollments)} enrollments")
+            
+            # Get recent quiz attempts and totals
+            recent_attempts = QuizAttemptRead.from_rows(db.session.execute(attempts_query))
+            quiz_totals = db.session.execute(totals_query).one()
+            
+            # Prepare enrollments with course data
+            lesson_counts, enrollment_counts = course_counts([e.course_id for e in enrollments])
+            
+            return dashboard_to_dict(enrollments, recent_attempts, quiz_totals, lesson_counts, enrollment_counts)
         
-        return jsonify({
-            'total_courses': total_courses,
-            'completed_courses': completed_courses,
-            'total_quizzes_taken': total_quizzes_taken,
-            'passed_quizzes': passed_quizzes,
-            'recent_attempts': [attempt.to_dict() for attempt in recent_attempts],
-            'enrollments': enrollments_data
-        })
+        # Recomputed only after the user's own activity changed
+        return current_app.response_class(cached_user_json('dashboard', user_id, build), mimetype='application/json')
     except Exception as e:
         print(f"Dashboard error: {str(e)}")
         import traceback
@@ -372,8 +693,79 @@ def get_dashboard():
             'enrollments': []
         }), 500
 
+@learner_bp.route('/bootstrap', methods=['GET'])
+@query_budget(11)
+@jwt_required()
+def get_bootstrap():
+    """
+    Everything the learner home screen needs in one response: profile,
+    dashboard, AI insights, recommendations and the course catalog. The user,
+    enrollments, attempts and progress are loaded once and shared by every
+    section. With BOOTSTRAP_CONCURRENT the catalog is loaded on a worker
+    thread while the learner's own data loads here.
+    """
+    user_id = get_jwt_identity()
+    
+    future = None
+    if current_app.config.get('BOOTSTRAP_CONCURRENT'):
+        app = current_app._get_current_object()
+        
+        def catalog_in_app_context():
+            # Own app context, so own session; the courses come back detached
+            with app.app_context():
+                return load_catalog()
+        
+        future = get_bootstrap_executor().submit(catalog_in_app_context)
+    
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    wait_for_own_writes(user_id)
+    enrollments = Enrollment.query.options(
+        joinedload(Enrollment.course).selectinload(Course.lessons).load_only(Lesson.id)
+    ).filter_by(user_id=user_id).all()
+    quiz_attempts = QuizAttempt.query.filter_by(user_id=user_id).all()
+    lesson_progress = LessonProgress.query.filter_by(user_id=user_id).all()
+    
+    courses, lesson_counts, enrollment_counts = future.result() if future else load_catalog()
+    recommendations = recommended_course_dicts(
+        user_id, lambda: live_catalog_recommendations(user, enrollments, courses),
+        serialize=lambda recommended: catalog_course_dicts(recommended, lesson_counts, enrollment_counts)
+    )
+    
+    return jsonify(bootstrap_to_dict(user, enrollments, quiz_attempts, lesson_progress,
+                                     courses, lesson_counts, enrollment_counts, recommendations))
+
+@learner_bp.route('/events', methods=['GET'])
+@query_budget(0)
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    """
+    Server-Sent Events stream of the user's enrollment, progress and quiz
+    updates. EventSource cannot send headers, so the token may be passed as
+    ?token=<access token>.
+    """
+    broker = get_broker()
+    if broker is None:
+        return jsonify({'error': 'Live updates are disabled'}), 404
+    
+    subscription = broker.subscribe(get_jwt_identity())
+    if subscription is None:
+        return jsonify({'error': 'Too many open event streams'}), 503
+    
+    stream = broker.stream(subscription, current_app.config.get('SSE_HEARTBEAT_SECONDS', 15))
+    response = Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # A stream that is never iterated never reaches its finally block
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    return response
+
 # Admin Routes
 @admin_bp.route('/users', methods=['GET'])
+@query_budget(2)
 @jwt_required()
 def get_users():
     user_id = get_jwt_identity()
@@ -382,10 +774,11 @@ def get_users():
     if current_user.role != 'admin':
         return jsonify({'error': 'Admin access required'}), 403
     
-    users = User.query.all()
+    users = read(UserRead)
     return jsonify([user.to_dict() for user in users])
 
 @admin_bp.route('/courses', methods=['POST'])
+@query_budget(7)
 @jwt_required()
 def create_course():
     user_id = get_jwt_identity()
@@ -406,14 +799,95 @@ def create_course():
     )
     
     db.session.add(course)
+    db.session.flush()
+    db.session.add(CourseVector(course_id=course.id, stale=True))
+    # A new course can enter anyone's recommendations
+    mark_catalog_changed()
     db.session.commit()
+    schedule_similarity_refresh()
+    schedule_refresh()
+    publish_catalog()
     
     return jsonify({
         'message': 'Course created successfully',
         'course': course.to_dict()
     }), 201
 
+@admin_bp.route('/course-trees', methods=['POST'])
+@query_budget(11)
+@jwt_required()
+def create_course_tree():
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    data = request.get_json(silent=True)
+    problems = validate_tree(data)
+    if problems:
+        return jsonify({'error': 'Invalid course tree', 'problems': problems}), 400
+    
+    # One transaction, one INSERT per table
+    course, ids = create_tree(data)
+    mark_catalog_changed()
+    db.session.commit()
+    schedule_similarity_refresh()
+    schedule_refresh()
+    publish_catalog()
+    
+    return jsonify({'message': 'Course created successfully', **ids}), 201
+
+@admin_bp.route('/course-trees/<int:course_id>', methods=['PATCH'])
+@query_budget(17)
+@jwt_required()
+def update_course_tree(course_id):
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    course = Course.query.get(course_id)
+    if not course:
+        return jsonify({'error': 'Course not found'}), 404
+    
+    data = request.get_json(silent=True)
+    problems = validate_tree(data, diff=True)
+    if problems:
+        return jsonify({'error': 'Invalid course tree', 'problems': problems}), 400
+    
+    try:
+        ids, changes = update_tree(course, data)
+    except TreeError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Invalid course tree', 'problems': e.problems}), 400
+    
+    if changes['course_fields']:
+        course.updated_at = datetime.utcnow()
+    lessons_changed = changes['lessons_updated'] or changes['lessons_created']
+    if lessons_changed or {'title', 'description'} & set(changes['course_fields']):
+        mark_course_stale(course_id)
+    if lessons_changed or changes['course_fields']:
+        # Learners' dashboards show the course
+        bump_course_learners(course_id)
+    recategorized = {'category', 'difficulty_level'} & set(changes['course_fields'])
+    if recategorized:
+        mark_catalog_changed()
+    db.session.commit()
+    
+    if any(changes.values()):
+        invalidate('course', course_id)
+        invalidate('quiz', *[quiz['id'] for quiz in ids['quizzes']])
+        schedule_similarity_refresh()
+        publish_catalog()
+    if recategorized:
+        schedule_refresh()
+    
+    return jsonify({'message': 'Course updated successfully', **ids, 'changes': changes})
+
 @admin_bp.route('/courses/<int:course_id>', methods=['PUT'])
+@query_budget(9)
 @jwt_required()
 def update_course(course_id):
     user_id = get_jwt_identity()
@@ -427,6 +901,8 @@ def update_course(course_id):
         return jsonify({'error': 'Course not found'}), 404
     
     data = request.get_json()
+    recategorized = (data.get('category', course.category) != course.category
+                     or data.get('difficulty_level', course.difficulty_level) != course.difficulty_level)
     
     course.title = data.get('title', course.title)
     course.description = data.get('description', course.description)
@@ -435,8 +911,19 @@ def update_course(course_id):
     course.duration_hours = data.get('duration_hours', course.duration_hours)
     course.instructor = data.get('instructor', course.instructor)
     course.updated_at = datetime.utcnow()
+    if 'title' in data or 'description' in data:
+        mark_course_stale(course_id)
+    # Learners' dashboards show the course
+    bump_course_learners(course_id)
+    if recategorized:
+        mark_catalog_changed()
     
     db.session.commit()
+    invalidate('course', course_id)
+    schedule_similarity_refresh()
+    if recategorized:
+        schedule_refresh()
+    publish_catalog()
     
     return jsonify({
         'message': 'Course updated successfully',
@@ -444,6 +931,7 @@ def update_course(course_id):
     })
 
 @admin_bp.route('/courses/<int:course_id>', methods=['DELETE'])
+@query_budget(9)
 @jwt_required()
 def delete_course(course_id):
     user_id = get_jwt_identity()
@@ -456,12 +944,25 @@ def delete_course(course_id):
     if not course:
         return jsonify({'error': 'Course not found'}), 404
     
-    db.session.delete(course)
+    # Soft delete: the course, its lessons and quizzes vanish from every query
+    # now, and the purger removes the rows in short batches afterwards
+    deleted_quiz_ids = db.session.scalars(select(Quiz.id).where(Quiz.course_id == course_id)).all()
+    course.deleted_at = datetime.utcnow()
+    bump_course_learners(course_id)
+    forget_course(course_id)
+    mark_catalog_changed()
     db.session.commit()
+    invalidate('course', course_id)
+    invalidate('quiz', *deleted_quiz_ids)
+    schedule_similarity_refresh()
+    schedule_refresh()
+    publish_catalog()
+    schedule_purge()
     
     return jsonify({'message': 'Course deleted successfully'})
 
 @admin_bp.route('/courses/<int:course_id>/lessons', methods=['POST'])
+@query_budget(6)
 @jwt_required()
 def create_lesson(course_id):
     user_id = get_jwt_identity()
@@ -485,7 +986,13 @@ def create_lesson(course_id):
     )
     
     db.session.add(lesson)
+    mark_course_stale(course_id)
+    bump_course_learners(course_id)
     db.session.commit()
+    invalidate('course', course_id)
+    schedule_similarity_refresh()
+    # lesson_count is in the course list
+    publish_catalog()
     
     return jsonify({
         'message': 'Lesson created successfully',
@@ -493,6 +1000,7 @@ def create_lesson(course_id):
     }), 201
 
 @admin_bp.route('/courses/<int:course_id>/quizzes', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def create_quiz(course_id):
     user_id = get_jwt_identity()
@@ -517,6 +1025,7 @@ def create_quiz(course_id):
     
     db.session.add(quiz)
     db.session.commit()
+    invalidate('course', course_id)
     
     return jsonify({
         'message': 'Quiz created successfully',
@@ -524,6 +1033,7 @@ def create_quiz(course_id):
     }), 201
 
 @admin_bp.route('/quizzes/<int:quiz_id>/questions', methods=['POST'])
+@query_budget(6)
 @jwt_required()
 def create_question(quiz_id):
     user_id = get_jwt_identity()
@@ -548,18 +1058,115 @@ def create_question(quiz_id):
     question.set_options(data['options'])
     
     db.session.add(question)
+    db.session.flush()
     
-    # Update quiz total questions count
-    quiz.total_questions = len(quiz.questions) + 1
+    # Recount in SQL rather than loading every question of the quiz
+    course_id = quiz.course_id
+    refresh_question_counts([quiz_id])
     
     db.session.commit()
+    # The course payload lists its quizzes with their question counts
+    invalidate('quiz', quiz_id)
+    invalidate('course', course_id)
     
     return jsonify({
         'message': 'Question created successfully',
         'question': question.to_dict()
     }), 201
 
+@admin_bp.route('/quizzes/<int:quiz_id>/item-analysis', methods=['GET'])
+@query_budget(4)
+@jwt_required()
+def get_item_analysis(quiz_id):
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    quiz = Quiz.query.get(quiz_id)
+    if not quiz:
+        return jsonify({'error': 'Quiz not found'}), 404
+    
+    items = item_statistics(quiz)
+    answered = [item for item in items if item['p_value'] is not None]
+    most_missed = min(answered, key=lambda item: item['p_value']) if answered else None
+    
+    return jsonify({
+        'quiz_id': quiz.id,
+        'title': quiz.title,
+        'questions': items,
+        # The question most learners get wrong
+        'most_missed_question_id': most_missed['question_id'] if most_missed else None
+    })
+
+@admin_bp.route('/metrics', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def get_metrics():
+    """Per-endpoint request metrics in Prometheus text format"""
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    registry = current_app.extensions.get('metrics')
+    if not registry:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@admin_bp.route('/profiles', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def get_profiles():
+    """List stored request profiles, newest first"""
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify(list_profiles(current_app.config['PROFILE_DIR']))
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def get_profile_detail(profile_id):
+    """Profile metadata with the SQL statements the request executed"""
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    path = profile_path(current_app.config['PROFILE_DIR'], profile_id, 'json')
+    if not path:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    return send_file(os.path.abspath(path), mimetype='application/json')
+
+@admin_bp.route('/profiles/<profile_id>/pstats', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def download_profile(profile_id):
+    """Download the cProfile output, readable with pstats or snakeviz"""
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    path = profile_path(current_app.config['PROFILE_DIR'], profile_id, 'pstats')
+    if not path:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    return send_file(os.path.abspath(path), mimetype='application/octet-stream',
+                     as_attachment=True, download_name=f'{profile_id}.pstats')
+
 @admin_bp.route('/analytics', methods=['GET'])
+@query_budget(6)
 @jwt_required()
 def get_analytics():
     user_id = get_jwt_identity()
@@ -574,17 +1181,20 @@ def get_analytics():
     total_enrollments = Enrollment.query.count()
     total_quiz_attempts = QuizAttempt.query.count()
     
-    # Course performance
-    courses = Course.query.all()
+    # Course performance, aggregated in the database
+    courses = db.session.query(
+        Course.id,
+        Course.title,
+        func.count(Enrollment.id),
+        func.count(Enrollment.completed_at)
+    ).outerjoin(Enrollment, Enrollment.course_id == Course.id).group_by(Course.id, Course.title).all()
     course_performance = []
-    for course in courses:
-        enrollments = len(course.enrollments)
-        completions = len([e for e in course.enrollments if e.completed_at])
+    for course_id, title, enrollments, completions in courses:
         completion_rate = (completions / enrollments * 100) if enrollments > 0 else 0
         
         course_performance.append({
-            'course_id': course.id,
-            'title': course.title,
+            'course_id': course_id,
+            'title': title,
             'enrollments': enrollments,
             'completions': completions,
             'completion_rate': completion_rate
@@ -598,11 +1208,126 @@ def get_analytics():
         'course_performance': course_performance
     })
 
+def activity_series_response(course_id):
+    """Time series of rolled-up activity for ?granularity=hour|day|week&start=&end= (ISO dates, end exclusive)"""
+    granularity = request.args.get('granularity', DAY)
+    if granularity not in BUCKETS:
+        return jsonify({'error': 'granularity must be one of hour, day, week'}), 400
+    
+    state = db.session.get(RollupState, 1)
+    schedule_rollups()
+    if state is None:
+        return jsonify({'granularity': granularity, 'course_id': course_id, 'rolled_up_through': None,
+                        'series': []})
+    
+    # Only buckets that are completely rolled up
+    through = state.watermark if granularity == HOUR else state.days_through
+    try:
+        end = min(datetime.fromisoformat(request.args['end']), through) if 'end' in request.args else through
+        start = (datetime.fromisoformat(request.args['start']) if 'start' in request.args
+                 else end - 30 * BUCKETS[granularity][1])
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    if bucket_count(granularity, start, end) > MAX_BUCKETS:
+        return jsonify({'error': f'At most {MAX_BUCKETS} buckets per request'}), 400
+    
+    return jsonify({
+        'granularity': granularity,
+        'course_id': course_id,
+        'rolled_up_through': through.isoformat(),
+        'series': activity_series(course_id, granularity, start, end)
+    })
+
+@admin_bp.route('/analytics/activity', methods=['GET'])
+@query_budget(4)
+@jwt_required()
+def get_activity_series():
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return activity_series_response(ALL_COURSES)
+
+@admin_bp.route('/analytics/courses/<int:course_id>/activity', methods=['GET'])
+@query_budget(4)
+@jwt_required()
+def get_course_activity_series(course_id):
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    # No 404 for deleted courses: their history stays in the rollups
+    return activity_series_response(course_id)
+
+def sketch_range():
+    """(start, end) from ?start=&end= (ISO dates, end exclusive); (None, None) for all time"""
+    start = request.args.get('start')
+    end = request.args.get('end')
+    return (datetime.fromisoformat(start) if start else None), (datetime.fromisoformat(end) if end else None)
+
+@admin_bp.route('/analytics/quizzes/<int:quiz_id>/scores', methods=['GET'])
+@query_budget(2)
+@jwt_required()
+def get_quiz_score_distribution(quiz_id):
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    try:
+        start, end = sketch_range()
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    
+    # Approximate percentiles from the stored score sketches
+    return jsonify(dict(score_summary(quiz_id, start, end), quiz_id=quiz_id))
+
+@admin_bp.route('/analytics/learners', methods=['GET'])
+@query_budget(2)
+@jwt_required()
+def get_active_learner_estimate():
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    try:
+        start, end = sketch_range()
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    
+    return jsonify(dict(learner_estimate(ALL_COURSES, start, end), course_id=ALL_COURSES))
+
+@admin_bp.route('/analytics/courses/<int:course_id>/learners', methods=['GET'])
+@query_budget(2)
+@jwt_required()
+def get_course_learner_estimate(course_id):
+    user_id = get_jwt_identity()
+    current_user = User.query.get(user_id)
+    
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    try:
+        start, end = sketch_range()
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    
+    return jsonify(dict(learner_estimate(course_id, start, end), course_id=course_id))
+
 # AI Routes
 @ai_bp.route('/summarize-course/<int:course_id>', methods=['GET'])
+@query_budget(2)
 @jwt_required()
 def summarize_course(course_id):
     """Generate AI summary of a course"""
+    from ai_features import generate_course_summary
     course = Course.query.get(course_id)
     if not course:
         return jsonify({'error': 'Course not found'}), 404
@@ -621,30 +1346,47 @@ def summarize_course(course_id):
     })
 
 @ai_bp.route('/analyze-learning-style', methods=['GET'])
+@query_budget(3)
 @jwt_required()
 def analyze_user_learning_style():
     """Analyze user's learning style based on their activity"""
+    from ai_features import analyze_learning_style
     user_id = get_jwt_identity()
+    wait_for_own_writes(user_id)
     
-    # Get user's quiz attempts
-    quiz_attempts = QuizAttempt.query.filter_by(user_id=user_id).all()
-    
-    # Get lesson progress
-    lesson_progress = LessonProgress.query.filter_by(user_id=user_id).all()
-    completion_times = [p.time_spent_minutes for p in lesson_progress]
-    
-    analysis = analyze_learning_style(
-        [{'score': attempt.score, 'percentage': attempt.percentage} for attempt in quiz_attempts],
-        completion_times
-    )
+    def build():
+        # Get user's quiz attempts
+        quiz_attempts = QuizAttempt.query.filter_by(user_id=user_id).all()
+        
+        # Get lesson progress
+        lesson_progress = LessonProgress.query.filter_by(user_id=user_id).all()
+        completion_times = [p.time_spent_minutes for p in lesson_progress]
+        
+        return analyze_learning_style(
+            [{'score': attempt.score, 'percentage': attempt.percentage} for attempt in quiz_attempts],
+            completion_times
+        )
     
-    return jsonify(analysis)
+    return current_app.response_class(cached_user_json('learning_style', user_id, build),
+                                      mimetype='application/json')
 
 @ai_bp.route('/personalized-path', methods=['GET'])
+@query_budget(8)
 @jwt_required()
 def get_personalized_path():
     """Get AI-recommended personalized learning path"""
+    from ai_features import generate_personalized_path
     user_id = get_jwt_identity()
+    
+    stored = stored_recommendations(user_id, PATH)
+    if stored is not None:
+        courses_data = add_expected_scores(user_id, courses_to_dicts([course for course, _, _ in stored]))
+        return jsonify({
+            'recommended_path': [{'course': course_data, 'score': score, 'reason': reason}
+                                 for course_data, (_, score, reason) in zip(courses_data, stored)]
+        })
+    
+    # Cold or stale user: score live against the whole catalog
     user = User.query.get(user_id)
     
     if not user:
@@ -657,6 +1399,7 @@ def get_personalized_path():
     
     # Get all available courses
     all_courses = Course.query.all()
+    lesson_counts, enrollment_counts = course_counts([c.id for c in all_courses])
     
     # Generate personalized path
     recommendations = generate_personalized_path(
@@ -665,51 +1408,63 @@ def get_personalized_path():
             'skill_level': user.skill_level
         },
         completed_courses=completed_courses,
-        all_courses=all_courses
+        all_courses=all_courses,
+        enrollment_counts=enrollment_counts
     )
     
+    courses_data = add_expected_scores(user_id, [
+        rec['course'].to_dict(
+            lesson_count=lesson_counts.get(rec['course'].id, 0),
+            enrollment_count=enrollment_counts.get(rec['course'].id, 0)
+        ) for rec in recommendations
+    ])
+    
     return jsonify({
         'recommended_path': [{
-            'course': rec['course'].to_dict(),
+            'course': course_data,
             'score': rec['score'],
             'reason': rec['reason']
-        } for rec in recommendations]
+        } for course_data, rec in zip(courses_data, recommendations)]
     })
 
 @ai_bp.route('/learning-insights', methods=['GET'])
+@query_budget(6)
 @jwt_required()
 def get_user_insights():
     """Get AI-powered learning insights for the user"""
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    wait_for_own_writes(user_id)
     
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    # Get user's enrollments
-    enrollments = Enrollment.query.filter_by(user_id=user_id).all()
-    courses = [e.course for e in enrollments]
-    
-    # Get quiz attempts
-    quiz_attempts = QuizAttempt.query.filter_by(user_id=user_id).all()
-    
-    # Get lesson progress
-    lesson_progress = LessonProgress.query.filter_by(user_id=user_id).all()
-    
-    insights = get_learning_insights(user_id, courses, quiz_attempts, lesson_progress)
+    def build():
+        if not User.query.get(user_id):
+            return None
+        
+        # Get user's enrollments with each course's lessons
+        enrollments = Enrollment.query.options(
+            joinedload(Enrollment.course).selectinload(Course.lessons)
+        ).filter_by(user_id=user_id).all()
+        courses = [e.course for e in enrollments]
+        
+        # Get quiz attempts
+        quiz_attempts = QuizAttempt.query.filter_by(user_id=user_id).all()
+        
+        # Get lesson progress
+        lesson_progress = LessonProgress.query.filter_by(user_id=user_id).all()
+        
+        return insights_to_dict(user_id, courses, quiz_attempts, lesson_progress)
     
-    # Analyze performance
-    performance = analyze_quiz_performance(quiz_attempts)
+    body = cached_user_json('insights', user_id, build)
+    if body is None:
+        return jsonify({'error': 'User not found'}), 404
     
-    return jsonify({
-        'insights': insights,
-        'performance_analysis': performance
-    })
+    return current_app.response_class(body, mimetype='application/json')
 
 @ai_bp.route('/generate-quiz', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def generate_ai_quiz():
     """Generate AI-powered quiz from course content"""
+    from ai_features import generate_quiz_question
     user_id = get_jwt_identity()
     current_user = User.query.get(user_id)
     
@@ -718,12 +1473,17 @@ def generate_ai_quiz():
     
     data = request.get_json()
     course_id = data.get('course_id')
-    difficulty = data.get('difficulty', 'intermediate')
+    difficulty = data.get('difficulty')
     
     course = Course.query.get(course_id)
     if not course:
         return jsonify({'error': 'Course not found'}), 404
     
+    # Without an explicit difficulty, match the course's calibrated questions
+    calibrated_difficulty = course_difficulty(course_id)
+    if not difficulty:
+        difficulty = difficulty_label(calibrated_difficulty) if calibrated_difficulty is not None else 'intermediate'
+    
     # Generate questions for each lesson
     generated_questions = []
     for lesson in course.lessons:
@@ -738,6 +1498,7 @@ def generate_ai_quiz():
     return jsonify({
         'course_id': course_id,
         'difficulty': difficulty,
+        'calibrated_difficulty': round(calibrated_difficulty, 3) if calibrated_difficulty is not None else None,
         'generated_questions': generated_questions
     })
 
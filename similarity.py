@@ -0,0 +1,349 @@
+"""
+Similar courses for LearnSmart
+Every course is turned into a hashed TF-IDF vector over its title,
+description and lesson titles and content: words and word bigrams are
+hashed into SIMILARITY_DIMENSIONS signed buckets, weighted by sublinear term
+frequency and inverse document frequency, and L2-normalized so that a dot
+product is a cosine similarity. The vectors form a float32 matrix, and the
+SIMILARITY_NEIGHBORS closest courses of each course are found with blocked
+matrix products and stored in course_similarity. That table is all
+GET /api/courses/<id>/similar reads.
+
+`flask --app app build-similarity` vectorizes the whole catalog. Creating
+or editing a course or adding a lesson bumps the course's version in
+course_vector and marks it stale; a background refresher re-vectorizes
+stale courses and recomputes every list they can enter or leave. Building
+needs numpy, serving the stored lists does not; numpy is only imported by
+the functions that build and refresh them.
+"""
+
+import importlib.util
+import re
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask import current_app
+from sqlalchemy import bindparam, delete, insert, or_, select, update
+
+from refresher import BackgroundRefresher
+from models import db, Course, Lesson, CourseVector, CourseSimilarity, SimilarityStats, insert_ignore
+
+# Document frequencies are counted per hashed term slot; 2^18 slots keep
+# collisions rare for catalogs with a few million distinct terms
+DOCUMENT_FREQUENCY_SLOTS = 1 << 18
+# Courses read or written per statement
+CHUNK_SIZE = 500
+# Rows per matrix product; bounds the score block to BLOCK_ROWS x courses floats
+BLOCK_ROWS = 128
+
+TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def course_terms(texts):
+    """Words and word bigrams of a course's texts, as hashed term counts"""
+    counts = Counter()
+    for text in texts:
+        words = [word for word in TOKEN.findall((text or '').lower()) if len(word) > 1]
+        counts.update(zlib.crc32(word.encode()) for word in words)
+        counts.update(zlib.crc32(f'{a} {b}'.encode()) for a, b in zip(words, words[1:]))
+    return counts
+
+
+def course_documents(connection, course_ids):
+    """{course_id: hashed term counts} of the courses that still exist (and are not soft-deleted)"""
+    texts = {course_id: [title, description] for course_id, title, description in connection.execute(
+        select(Course.id, Course.title, Course.description)
+        .where(Course.id.in_(course_ids), Course.deleted_at.is_(None))
+    )}
+    for course_id, title, content in connection.execute(
+        select(Lesson.course_id, Lesson.title, Lesson.content).where(Lesson.course_id.in_(course_ids))
+    ):
+        if course_id in texts:
+            texts[course_id] += [title, content]
+    return {course_id: course_terms(course_texts) for course_id, course_texts in texts.items()}
+
+
+def term_hashes(counts):
+    import numpy as np
+    return np.fromiter(counts.keys(), dtype=np.uint32, count=len(counts))
+
+
+class Vectorizer:
+    """Turns hashed term counts into TF-IDF vectors using a build's corpus statistics"""
+
+    def __init__(self, dimensions, documents, document_frequencies):
+        self.dimensions = dimensions
+        self.documents = documents
+        self.document_frequencies = document_frequencies
+
+    @classmethod
+    def from_stats(cls, stats):
+        import numpy as np
+        return cls(stats.dimensions, stats.documents, np.frombuffer(stats.document_frequencies, dtype=np.int32))
+
+    def vectors(self, documents):
+        import numpy as np
+        matrix = np.zeros((len(documents), self.dimensions), dtype=np.float32)
+        for row, counts in enumerate(documents):
+            if not counts:
+                continue
+            hashes = term_hashes(counts)
+            tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+            df = self.document_frequencies[hashes % DOCUMENT_FREQUENCY_SLOTS]
+            idf = np.log((1 + self.documents) / (1 + df)) + 1
+            signs = np.where(hashes >> 31, -1.0, 1.0)
+            matrix[row] = np.bincount((hashes >> 8) % self.dimensions, weights=signs * tf * idf,
+                                      minlength=self.dimensions)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+def nearest(matrix, rows, k):
+    """
+    The k rows of matrix most similar to each of the given rows (themselves
+    excluded), as (indices, scores) arrays sorted by descending score.
+    """
+    import numpy as np
+    k = min(k, len(matrix) - 1)
+    indices = np.empty((len(rows), max(k, 0)), dtype=np.int64)
+    scores = np.empty((len(rows), max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, scores
+    for start in range(0, len(rows), BLOCK_ROWS):
+        block = rows[start:start + BLOCK_ROWS]
+        block_scores = matrix[block] @ matrix.T
+        block_scores[np.arange(len(block)), block] = -np.inf
+        top = np.argpartition(block_scores, -k, axis=1)[:, -k:]
+        top_scores = np.take_along_axis(block_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        indices[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+    return indices, scores
+
+
+def load_matrix(connection, dimensions):
+    """Stored vectors as (course ids, matrix, neighbor floors), in course id order"""
+    import numpy as np
+    rows = connection.execute(
+        select(CourseVector.course_id, CourseVector.vector, CourseVector.neighbor_floor)
+        .where(CourseVector.vector.isnot(None))
+        .order_by(CourseVector.course_id)
+    ).all()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    matrix = np.frombuffer(b''.join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), dimensions)
+    floors = np.array([row[2] or 0.0 for row in rows], dtype=np.float32)
+    return ids, matrix, floors
+
+
+def store_vectors(course_ids, versions, matrix):
+    """
+    Store freshly computed vectors (current session). A course is marked
+    fresh only if its version is still the one read before its text, so an
+    edit committed in between leaves it stale.
+    """
+    if not course_ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert_ignore(CourseVector),
+                       [{'course_id': course_id, 'version': 0, 'stale': True} for course_id in course_ids])
+    table = CourseVector.__table__
+    db.session.execute(
+        table.update().where(table.c.course_id == bindparam('cid')).values(vector=bindparam('data'), updated_at=now),
+        [{'cid': course_id, 'data': vector.tobytes()} for course_id, vector in zip(course_ids, matrix)]
+    )
+    db.session.execute(
+        table.update()
+        .where(table.c.course_id == bindparam('cid'), table.c.version == bindparam('read_version'))
+        .values(stale=False),
+        [{'cid': course_id, 'read_version': versions.get(course_id, 0)} for course_id in course_ids]
+    )
+
+
+def store_neighbors(course_ids, neighbor_ids, indices, scores, k):
+    """
+    Replace the stored lists of course_ids (current session). Only positive
+    scores are kept; the last kept score of a full list becomes the course's
+    floor, the score another course must beat to enter the list.
+    """
+    rows, floors = [], []
+    for course_id, neighbor_rows, neighbor_scores in zip(course_ids, indices, scores):
+        kept = [(int(neighbor_ids[i]), float(score)) for i, score in zip(neighbor_rows, neighbor_scores) if score > 0]
+        rows.extend({'course_id': course_id, 'rank': rank, 'similar_course_id': similar_id, 'score': score}
+                    for rank, (similar_id, score) in enumerate(kept))
+        floors.append({'cid': course_id, 'floor': kept[-1][1] if len(kept) == k else 0.0})
+    db.session.execute(delete(CourseSimilarity).where(CourseSimilarity.course_id.in_(course_ids)))
+    if rows:
+        db.session.execute(insert(CourseSimilarity), rows)
+    table = CourseVector.__table__
+    db.session.execute(
+        table.update().where(table.c.course_id == bindparam('cid')).values(neighbor_floor=bindparam('floor')),
+        floors
+    )
+
+
+def store_lists(ids, matrix, positions, k):
+    for start in range(0, len(positions), CHUNK_SIZE):
+        block = positions[start:start + CHUNK_SIZE]
+        indices, scores = nearest(matrix, block, k)
+        store_neighbors([int(course_id) for course_id in ids[block]], ids, indices, scores, k)
+
+
+def read_versions(course_ids):
+    return dict(db.session.execute(
+        select(CourseVector.course_id, CourseVector.version).where(CourseVector.course_id.in_(course_ids))
+    ).all())
+
+
+def build_all(dimensions, k):
+    """
+    Vectorize every course with fresh corpus statistics and store every
+    similar-course list (current session). Returns the number of courses.
+    """
+    import numpy as np
+    connection = db.session.connection()
+    course_ids = db.session.scalars(select(Course.id).order_by(Course.id)).all()
+    chunks = [course_ids[i:i + CHUNK_SIZE] for i in range(0, len(course_ids), CHUNK_SIZE)]
+
+    # Two passes over the text: document frequencies, then vectors
+    document_frequencies = np.zeros(DOCUMENT_FREQUENCY_SLOTS, dtype=np.int32)
+    for chunk in chunks:
+        for counts in course_documents(connection, chunk).values():
+            document_frequencies[np.unique(term_hashes(counts) % DOCUMENT_FREQUENCY_SLOTS)] += 1
+    vectorizer = Vectorizer(dimensions, len(course_ids), document_frequencies)
+
+    db.session.execute(delete(CourseSimilarity))
+    db.session.execute(delete(CourseVector).where(CourseVector.course_id.notin_(select(Course.id))))
+    db.session.execute(delete(SimilarityStats))
+    db.session.add(SimilarityStats(id=1, documents=len(course_ids), dimensions=dimensions,
+                                   document_frequencies=document_frequencies.tobytes()))
+    for chunk in chunks:
+        versions = read_versions(chunk)
+        documents = course_documents(connection, chunk)
+        present = [course_id for course_id in chunk if course_id in documents]
+        store_vectors(present, versions, vectorizer.vectors([documents[course_id] for course_id in present]))
+
+    ids, matrix, _ = load_matrix(connection, dimensions)
+    store_lists(ids, matrix, np.arange(len(ids)), k)
+    return len(ids)
+
+
+def refresh_courses(course_ids, k):
+    """
+    Re-vectorize course_ids and recompute every list they can enter or
+    leave: their own, those of courses whose floor they now beat and those
+    that listed them before (current session).
+    """
+    import numpy as np
+    stats = db.session.get(SimilarityStats, 1)
+    connection = db.session.connection()
+    versions = read_versions(course_ids)
+    documents = course_documents(connection, course_ids)
+    course_ids = [course_id for course_id in course_ids if course_id in documents]
+    store_vectors(course_ids, versions, Vectorizer.from_stats(stats).vectors([documents[c] for c in course_ids]))
+
+    ids, matrix, floors = load_matrix(connection, stats.dimensions)
+    position = {int(course_id): i for i, course_id in enumerate(ids)}
+    changed = np.array([position[course_id] for course_id in course_ids], dtype=np.int64)
+    scores = matrix @ matrix[changed].T
+    scores[changed, np.arange(len(changed))] = -np.inf
+    affected = set(np.flatnonzero((scores > floors[:, None]).any(axis=1)).tolist())
+    affected.update(changed.tolist())
+    affected.update(position[course_id] for course_id in db.session.scalars(
+        select(CourseSimilarity.course_id).where(CourseSimilarity.similar_course_id.in_(course_ids)).distinct()
+    ) if course_id in position)
+    store_lists(ids, matrix, np.array(sorted(affected), dtype=np.int64), k)
+    return len(affected)
+
+
+def mark_course_stale(course_id):
+    """Bump the course's version so that the refresher re-vectorizes it (caller's transaction)"""
+    db.session.execute(
+        update(CourseVector).where(CourseVector.course_id == course_id)
+        .values(version=CourseVector.version + 1, stale=True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def forget_course(course_id):
+    """Drop a deleted course's vector and lists; courses that listed it are recomputed"""
+    listing = select(CourseSimilarity.course_id).where(CourseSimilarity.similar_course_id == course_id)
+    db.session.execute(
+        update(CourseVector).where(CourseVector.course_id.in_(listing))
+        .values(version=CourseVector.version + 1, stale=True)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(delete(CourseSimilarity).where(
+        or_(CourseSimilarity.course_id == course_id, CourseSimilarity.similar_course_id == course_id)
+    ))
+    db.session.execute(delete(CourseVector).where(CourseVector.course_id == course_id))
+
+
+def similar_courses(course_id, limit):
+    """Stored (course, score) pairs, most similar first"""
+    return db.session.execute(
+        select(Course, CourseSimilarity.score)
+        .join(CourseSimilarity, CourseSimilarity.similar_course_id == Course.id)
+        .where(CourseSimilarity.course_id == course_id)
+        .order_by(CourseSimilarity.rank)
+        .limit(limit)
+    ).all()
+
+
+class SimilarityRefresher(BackgroundRefresher):
+    """Re-vectorizes stale courses; builds everything when no build exists yet"""
+    name = 'similarity'
+
+    def refresh_batch(self):
+        dimensions = self.app.config['SIMILARITY_DIMENSIONS']
+        k = self.app.config['SIMILARITY_NEIGHBORS']
+        stats = db.session.get(SimilarityStats, 1)
+        if stats is None or stats.dimensions != dimensions:
+            build_all(dimensions, k)
+            db.session.commit()
+            return 0
+        course_ids = db.session.scalars(
+            select(CourseVector.course_id).where(CourseVector.stale == True).limit(self.batch_size)
+        ).all()
+        if course_ids:
+            refresh_courses(course_ids, k)
+        db.session.commit()
+        return len(course_ids)
+
+
+def schedule_similarity_refresh():
+    """Ask the refresher to pick up courses marked stale by the committed transaction"""
+    refresher = current_app.extensions.get('similarity')
+    if refresher is not None:
+        refresher.wake()
+
+
+@click.command('build-similarity')
+def build_similarity_command():
+    """Vectorize every course and precompute the similar-course lists."""
+    if importlib.util.find_spec('numpy') is None:
+        raise click.ClickException('build-similarity requires numpy (pip install numpy)')
+    start = time.perf_counter()
+    count = build_all(current_app.config['SIMILARITY_DIMENSIONS'], current_app.config['SIMILARITY_NEIGHBORS'])
+    db.session.commit()
+    click.echo(f'✓ Similar courses computed for {count} courses in {time.perf_counter() - start:.1f}s')
+
+
+def init_similarity(app):
+    """Attach the stale-course refresher (when numpy is available) and the build command"""
+    app.cli.add_command(build_similarity_command)
+    if importlib.util.find_spec('numpy') is None:
+        return None
+    refresher = SimilarityRefresher(
+        app,
+        interval_seconds=app.config.get('SIMILARITY_REFRESH_SECONDS', 5.0),
+        batch_size=app.config.get('SIMILARITY_REFRESH_BATCH', 200)
+    )
+    app.extensions['similarity'] = refresher
+
+    import atexit
+    atexit.register(refresher.stop)
+    return refresher
@@ -0,0 +1,584 @@
+"""
+Streaming sketches for LearnSmart analytics
+Two mergeable summaries, persisted per subject and UTC day plus a running
+all-time row in the sketch table:
+
+- quiz_scores: a KLL quantile sketch of QuizAttempt.percentage per quiz.
+  With k = 200, a returned percentile's true rank is within about 1.7% of
+  the attempts of the requested one (99% confidence), whatever the count.
+- course_learners: a HyperLogLog of distinct active learners (enrolled,
+  completed a lesson or attempted a quiz) per course, and for the whole
+  platform under course_id 0. With 2^12 registers the relative standard
+  error is 1.04 / sqrt(4096) = 1.6%, about 2% between 5k and 15k
+  learners where linear counting hands over to the raw estimate, and
+  counts in the hundreds are within a few learners.
+
+Each process folds writes into in-memory sketches as they commit; a
+background thread merges them into the stored rows every
+SKETCH_FLUSH_SECONDS with a compare-and-set on a version column, so
+workers never lose each other's updates. All-time answers read one row;
+a date range merges one row per day.
+"""
+
+import math
+import random
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import delete, insert, select, tuple_, update
+
+from models import db, Enrollment, Lesson, LessonProgress, Quiz, QuizAttempt, Sketch, insert_ignore
+from refresher import BackgroundRefresher
+
+SCORES = 'quiz_scores'
+LEARNERS = 'course_learners'
+# Subject of the platform-wide learner sketches
+PLATFORM = 0
+# Bucket of the running all-time sketches
+ALL_TIME = datetime(1970, 1, 1)
+
+HLL_PRECISION = 12
+HLL_ERROR = 1.04 / math.sqrt(1 << HLL_PRECISION)
+KLL_K = 200
+# Normalized rank error of KLL_K at 99% confidence
+KLL_RANK_ERROR = 0.017
+# Keys read per statement while flushing
+FLUSH_CHUNK = 500
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(value):
+    """splitmix64 finalizer: well-mixed 64 bits from an integer id"""
+    x = (value + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter over integer ids. Registers are a dict
+    while few are set (sparse) and a bytearray once an eighth are.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.m = 1 << precision
+        self.sparse = {}
+        self.dense = None
+
+    def add(self, value):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        self._set(index, (64 - self.precision) - rest.bit_length() + 1)
+
+    def _set(self, index, rank):
+        if self.dense is not None:
+            if rank > self.dense[index]:
+                self.dense[index] = rank
+            return
+        if rank > self.sparse.get(index, 0):
+            self.sparse[index] = rank
+            if len(self.sparse) > self.m // 8:
+                self._densify()
+
+    def _densify(self):
+        self.dense = bytearray(self.m)
+        for index, rank in self.sparse.items():
+            self.dense[index] = rank
+        self.sparse = {}
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('HyperLogLog precisions differ')
+        if other.dense is None:
+            for index, rank in other.sparse.items():
+                self._set(index, rank)
+            return self
+        if self.dense is None:
+            self._densify()
+        self.dense = bytearray(map(max, self.dense, other.dense))
+        return self
+
+    def copy(self):
+        clone = HyperLogLog(self.precision)
+        clone.sparse = dict(self.sparse)
+        clone.dense = bytearray(self.dense) if self.dense is not None else None
+        return clone
+
+    def estimate(self):
+        m = self.m
+        if self.dense is None:
+            zeros = m - len(self.sparse)
+            total = zeros + sum(2.0 ** -rank for rank in self.sparse.values())
+        else:
+            zeros = self.dense.count(0)
+            total = sum(_INVERSE_POWERS[rank] for rank in self.dense)
+        if zeros:
+            # Linear counting is more accurate than the raw estimate, which
+            # is biased upwards, until about 2.75m
+            linear = m * math.log(m / zeros)
+            if linear <= 2.75 * m:
+                return linear
+        return 0.7213 / (1 + 1.079 / m) * m * m / total
+
+    def to_bytes(self):
+        if self.dense is None:
+            items = sorted(self.sparse.items())
+            return struct.pack(f'>BBH{len(items) * 2}H', ord('S'), self.precision, len(items),
+                               *(value for index, rank in items for value in (index, rank)))
+        return struct.pack('>BB', ord('D'), self.precision) + bytes(self.dense)
+
+    @classmethod
+    def from_bytes(cls, data):
+        kind, precision = struct.unpack_from('>BB', data)
+        sketch = cls(precision)
+        if kind == ord('D'):
+            sketch.dense = bytearray(data[2:])
+        else:
+            (count,) = struct.unpack_from('>H', data, 2)
+            values = struct.unpack_from(f'>{count * 2}H', data, 4)
+            sketch.sparse = dict(zip(values[::2], values[1::2]))
+        return sketch
+
+
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+
+class KLL:
+    """
+    KLL quantile sketch (Karnin, Lang and Liberty). Level h holds items of
+    weight 2^h; a full level is sorted and every other item, from a random
+    offset, moves up a level. Level capacities shrink geometrically by 2/3
+    below the top one, which bounds the size to about 3k items.
+    """
+
+    def __init__(self, k=KLL_K):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self.min = None
+        self.max = None
+
+    def update(self, value):
+        value = float(value)
+        self.levels[0].append(value)
+        self.n += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        while sum(map(len, self.levels)) >= sum(self._capacity(h) for h in range(len(self.levels))):
+            level = next(h for h in range(len(self.levels)) if len(self.levels[h]) >= self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            items = sorted(self.levels[level])
+            # An odd item out stays behind at its weight
+            self.levels[level] = [items.pop(random.randrange(len(items)))] if len(items) % 2 else []
+            self.levels[level + 1].extend(items[random.getrandbits(1)::2])
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def copy(self):
+        clone = KLL(self.k)
+        clone.n, clone.min, clone.max = self.n, self.min, self.max
+        clone.levels = [list(items) for items in self.levels]
+        return clone
+
+    def quantiles(self, fractions):
+        """Values at each fraction (0 to 1) of the ranks; None when empty"""
+        if self.n == 0:
+            return [None for _ in fractions]
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target = fraction * self.n
+            cumulative = 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    results.append(value)
+                    break
+            else:
+                results.append(self.max)
+        return results
+
+    def to_bytes(self):
+        values = [value for items in self.levels for value in items]
+        return (struct.pack(f'>HIB{len(self.levels)}H', self.k, self.n, len(self.levels), *map(len, self.levels))
+                + struct.pack(f'>ff{len(values)}f', self.min or 0.0, self.max or 0.0, *values))
+
+    @classmethod
+    def from_bytes(cls, data):
+        k, n, depth = struct.unpack_from('>HIB', data)
+        sizes = struct.unpack_from(f'>{depth}H', data, 7)
+        offset = 7 + 2 * depth
+        minimum, maximum, *values = struct.unpack_from(f'>ff{sum(sizes)}f', data, offset)
+        sketch = cls(k)
+        sketch.n = n
+        sketch.min, sketch.max = (minimum, maximum) if n else (None, None)
+        sketch.levels = []
+        for size in sizes:
+            sketch.levels.append(values[:size])
+            values = values[size:]
+        return sketch
+
+
+SKETCH_TYPES = {SCORES: KLL, LEARNERS: HyperLogLog}
+
+
+def _day(moment):
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add(targets, key, sketch):
+    current = targets.get(key)
+    if current is None:
+        targets[key] = sketch.copy()
+    else:
+        current.merge(sketch)
+
+
+class SketchBuffer:
+    """
+    Sketches of the writes this process committed since the last flush,
+    keyed by (kind, source, source_id, day). Learner activity is recorded
+    against the lesson, quiz or course it happened in; the flush resolves
+    lessons and quizzes to their courses in one query each.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._retry = {}
+
+    def _sketch(self, key):
+        sketch = self._pending.get(key)
+        if sketch is None:
+            sketch = self._pending[key] = SKETCH_TYPES[key[0]]()
+        return sketch
+
+    def add_score(self, quiz_id, percentage, at):
+        with self._lock:
+            self._sketch((SCORES, 'quiz', quiz_id, _day(at))).update(percentage)
+
+    def add_learner(self, source, source_id, user_id, at):
+        with self._lock:
+            self._sketch((LEARNERS, source, source_id, _day(at))).add(user_id)
+
+    def take(self):
+        with self._lock:
+            pending, retry = self._pending, self._retry
+            self._pending, self._retry = {}, {}
+        return pending, retry
+
+    def requeue(self, targets, pending=None):
+        """Keep resolved (kind, subject_id, bucket) sketches, and unresolved ones, for the next flush"""
+        with self._lock:
+            for key, sketch in targets.items():
+                _add(self._retry, key, sketch)
+            for key, sketch in (pending or {}).items():
+                _add(self._pending, key, sketch)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending) + len(self._retry)
+
+
+def resolve(pending, retry=None):
+    """
+    Buffered sketches as stored keys: (kind, subject_id, bucket) for the
+    day and for all time, with learners counted for their course and the
+    platform
+    """
+    lesson_ids = {key[2] for key in pending if key[1] == 'lesson'}
+    quiz_ids = {key[2] for key in pending if key[0] == LEARNERS and key[1] == 'quiz'}
+    courses = {'course': {}}
+    courses['lesson'] = dict(db.session.execute(
+        select(Lesson.id, Lesson.course_id).where(Lesson.id.in_(lesson_ids))).all()) if lesson_ids else {}
+    courses['quiz'] = dict(db.session.execute(
+        select(Quiz.id, Quiz.course_id).where(Quiz.id.in_(quiz_ids))).all()) if quiz_ids else {}
+
+    targets = {}
+    for key, sketch in (retry or {}).items():
+        _add(targets, key, sketch)
+    for (kind, source, source_id, day), sketch in pending.items():
+        if kind == SCORES:
+            subjects = (source_id,)
+        else:
+            course_id = source_id if source == 'course' else courses[source].get(source_id)
+            if course_id is None:
+                continue  # deleted since
+            subjects = (course_id, PLATFORM)
+        for subject_id in subjects:
+            for bucket in (day, ALL_TIME):
+                _add(targets, (kind, subject_id, bucket), sketch)
+    return targets
+
+
+def merge_into_table(targets):
+    """
+    Merge sketches into their stored rows (current session). Returns the
+    ones another process updated first; merge them again later.
+    """
+    lost = {}
+    keys = list(targets)
+    for start in range(0, len(keys), FLUSH_CHUNK):
+        chunk = keys[start:start + FLUSH_CHUNK]
+        stored = {(row.kind, row.subject_id, row.bucket_start): row for row in db.session.execute(
+            select(Sketch.id, Sketch.kind, Sketch.subject_id, Sketch.bucket_start, Sketch.version, Sketch.data)
+            .where(tuple_(Sketch.kind, Sketch.subject_id, Sketch.bucket_start).in_(chunk))
+        )}
+        for key in chunk:
+            delta = targets[key]
+            row = stored.get(key)
+            if row is None:
+                written = db.session.execute(insert_ignore(Sketch), [{
+                    'kind': key[0], 'subject_id': key[1], 'bucket_start': key[2], 'version': 1,
+                    'data': delta.to_bytes(), 'updated_at': datetime.utcnow()
+                }]).rowcount
+            else:
+                merged = SKETCH_TYPES[key[0]].from_bytes(row.data).merge(delta)
+                written = db.session.execute(
+                    update(Sketch).where(Sketch.id == row.id, Sketch.version == row.version)
+                    .values(version=row.version + 1, data=merged.to_bytes(), updated_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+            if not written:
+                lost[key] = delta
+    return lost
+
+
+def flush(buffer):
+    """Merge everything buffered into the sketch table; commits. Returns the number of stored keys touched."""
+    pending, retry = buffer.take()
+    if not pending and not retry:
+        return 0
+    try:
+        targets = resolve(pending, retry)
+        lost = merge_into_table(targets)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Nothing was stored; keep every update for the next attempt
+        buffer.requeue(retry, pending)
+        raise
+    buffer.requeue(lost)
+    return len(targets) - len(lost)
+
+
+def load_sketches(kind, subject_id, start=None, end=None):
+    """The merged sketch of a subject: the all-time row, or the days in [start, end)"""
+    query = select(Sketch.data).where(Sketch.kind == kind, Sketch.subject_id == subject_id)
+    if start is None and end is None:
+        query = query.where(Sketch.bucket_start == ALL_TIME)
+    else:
+        query = query.where(Sketch.bucket_start >= max(_day(start or ALL_TIME), ALL_TIME + timedelta(days=1)))
+        if end is not None:
+            query = query.where(Sketch.bucket_start < end)
+    sketch = SKETCH_TYPES[kind]()
+    for (data,) in db.session.execute(query):
+        sketch.merge(SKETCH_TYPES[kind].from_bytes(data))
+    return sketch
+
+
+def score_summary(quiz_id, start=None, end=None):
+    """Approximate score percentiles of a quiz's attempts"""
+    sketch = load_sketches(SCORES, quiz_id, start, end)
+    fractions = (0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+    values = sketch.quantiles(fractions)
+    return {
+        'attempts': sketch.n,
+        'min': sketch.min,
+        'max': sketch.max,
+        'percentiles': {f'p{round(fraction * 100)}': round(value, 2) if value is not None else None
+                        for fraction, value in zip(fractions, values)},
+        'rank_error': KLL_RANK_ERROR
+    }
+
+
+def learner_estimate(course_id, start=None, end=None):
+    """Approximate distinct active learners of a course (0: the platform)"""
+    return {
+        'distinct_learners': round(load_sketches(LEARNERS, course_id, start, end).estimate()),
+        'relative_error': round(HLL_ERROR, 4)
+    }
+
+
+def weekly_learners(course_id, start, end):
+    """{week start: estimated distinct learners} for the weeks (from Monday) in [start, end), from daily sketches"""
+    weeks = {}
+    for bucket_start, data in db.session.execute(
+        select(Sketch.bucket_start, Sketch.data)
+        .where(Sketch.kind == LEARNERS, Sketch.subject_id == course_id,
+               Sketch.bucket_start >= max(start, ALL_TIME + timedelta(days=1)), Sketch.bucket_start < end)
+    ):
+        week = bucket_start - timedelta(days=bucket_start.weekday())
+        weeks.setdefault(week, HyperLogLog()).merge(HyperLogLog.from_bytes(data))
+    return {week: round(sketch.estimate()) for week, sketch in weeks.items()}
+
+
+def record_quiz_attempt(quiz_id, user_id, percentage, at):
+    """Fold a committed quiz attempt into this process's sketches"""
+    buffer = current_app.extensions.get('sketches')
+    if buffer is not None:
+        buffer.add_score(quiz_id, percentage, at)
+        buffer.add_learner('quiz', quiz_id, user_id, at)
+        current_app.extensions['sketch_flusher'].start()
+
+
+def record_activity(source, source_id, user_id, at):
+    """Fold a committed enrollment ('course') or lesson completion ('lesson') into the sketches"""
+    buffer = current_app.extensions.get('sketches')
+    if buffer is not None:
+        buffer.add_learner(source, source_id, user_id, at)
+        current_app.extensions['sketch_flusher'].start()
+
+
+def record_events(events):
+    """Fold committed write-behind events into the sketches"""
+    from write_behind import LESSON_PROGRESS, QUIZ_ATTEMPT
+
+    for event in events:
+        data = event['data']
+        if event['kind'] == LESSON_PROGRESS:
+            record_activity('lesson', data['lesson_id'], data['user_id'], data['completed_at'])
+        elif event['kind'] == QUIZ_ATTEMPT:
+            record_quiz_attempt(data['quiz_id'], data['user_id'], data['percentage'], data['attempted_at'])
+
+
+def rebuild_sketches(window_days=7):
+    """
+    Recompute every sketch from the raw tables, a window of days at a time
+    (commits per window). Returns the number of rows stored.
+    """
+    db.session.execute(delete(Sketch))
+    db.session.commit()
+    from rollups import earliest_activity
+    earliest = earliest_activity()
+    if earliest is None:
+        return 0
+
+    lesson_courses = dict(db.session.execute(select(Lesson.id, Lesson.course_id)).all())
+    quiz_courses = dict(db.session.execute(select(Quiz.id, Quiz.course_id)).all())
+    totals = {}
+    stored = 0
+    start = _day(earliest)
+    now = datetime.utcnow()
+    while start <= now:
+        end = start + timedelta(days=window_days)
+        targets = {}
+
+        def learner(course_id, user_id, at):
+            if course_id is None:
+                return
+            day = _day(at)
+            for subject_id in (course_id, PLATFORM):
+                sketch = targets.get((LEARNERS, subject_id, day))
+                if sketch is None:
+                    sketch = targets[(LEARNERS, subject_id, day)] = HyperLogLog()
+                sketch.add(user_id)
+
+        for quiz_id, user_id, percentage, at in db.session.execute(
+            select(QuizAttempt.quiz_id, QuizAttempt.user_id, QuizAttempt.percentage, QuizAttempt.attempted_at)
+            .where(QuizAttempt.attempted_at >= start, QuizAttempt.attempted_at < end)
+        ):
+            sketch = targets.get((SCORES, quiz_id, _day(at)))
+            if sketch is None:
+                sketch = targets[(SCORES, quiz_id, _day(at))] = KLL()
+            sketch.update(percentage)
+            learner(quiz_courses.get(quiz_id), user_id, at)
+        for lesson_id, user_id, at in db.session.execute(
+            select(LessonProgress.lesson_id, LessonProgress.user_id, LessonProgress.completed_at)
+            .where(LessonProgress.completed_at >= start, LessonProgress.completed_at < end)
+        ):
+            learner(lesson_courses.get(lesson_id), user_id, at)
+        for course_id, user_id, at in db.session.execute(
+            select(Enrollment.course_id, Enrollment.user_id, Enrollment.enrolled_at)
+            .where(Enrollment.enrolled_at >= start, Enrollment.enrolled_at < end)
+        ):
+            learner(course_id, user_id, at)
+
+        rows = [{'kind': kind, 'subject_id': subject_id, 'bucket_start': day, 'version': 1,
+                 'data': sketch.to_bytes(), 'updated_at': now} for (kind, subject_id, day), sketch in targets.items()]
+        for offset in range(0, len(rows), 5000):
+            db.session.execute(insert(Sketch), rows[offset:offset + 5000])
+        db.session.commit()
+        stored += len(rows)
+        for (kind, subject_id, _), sketch in targets.items():
+            _add(totals, (kind, subject_id, ALL_TIME), sketch)
+        start = end
+
+    rows = [{'kind': kind, 'subject_id': subject_id, 'bucket_start': bucket, 'version': 1,
+             'data': sketch.to_bytes(), 'updated_at': now} for (kind, subject_id, bucket), sketch in totals.items()]
+    for offset in range(0, len(rows), 5000):
+        db.session.execute(insert(Sketch), rows[offset:offset + 5000])
+    db.session.commit()
+    return stored + len(rows)
+
+
+class SketchFlusher(BackgroundRefresher):
+    """Merges the process's buffered sketches into the table every interval"""
+    name = 'sketches'
+
+    def refresh_batch(self):
+        flush(self.app.extensions['sketches'])
+        return 0
+
+
+@click.command('build-sketches')
+def build_sketches_command():
+    """Recompute the score and active-learner sketches from all recorded activity."""
+    start = time.perf_counter()
+    rows = rebuild_sketches()
+    click.echo(f'✓ {rows} sketches stored in {time.perf_counter() - start:.1f}s')
+
+
+def init_sketches(app):
+    """Attach the per-process sketch buffer, its flusher and the rebuild command"""
+    app.cli.add_command(build_sketches_command)
+    buffer = SketchBuffer()
+    flusher = SketchFlusher(app, interval_seconds=app.config.get('SKETCH_FLUSH_SECONDS', 10.0))
+    app.extensions['sketches'] = buffer
+    app.extensions['sketch_flusher'] = flusher
+
+    def shutdown():
+        flusher.stop()
+        if len(buffer):
+            with app.app_context():
+                flush(buffer)
+
+    import atexit
+    atexit.register(shutdown)
+    return buffer
@@ -7,6 +7,8 @@ let currentQuiz = null;
 let quizAnswers = {};
 let quizTimer = null;
 let timeRemaining = 0;
+let learnerState = null;
+let eventSource = null;
 
 // API Base URL
 const API_BASE = '/api';
@@ -22,22 +24,10 @@ document.addEventListener('DOMContentLoaded', function() {
 function checkAuthStatus() {
     const token = localStorage.getItem('access_token');
     if (token) {
-        // Verify token and get user info
-        fetch(`${API_BASE}/auth/profile`, {
-            headers: {
-                'Authorization': `Bearer ${token}`
-            }
-        })
-        .then(response => {
-            if (response.ok) {
-                return response.json();
-            } else {
-                localStorage.removeItem('access_token');
-                throw new Error('Invalid token');
-            }
-        })
-        .then(user => {
-            currentUser = user;
+        // Verify token and load everything the home screen needs in one request
+        loadBootstrap()
+        .then(data => {
+            currentUser = data.profile;
             updateUIForLoggedInUser();
         })
         .catch(error => {
@@ -49,6 +39,43 @@ function checkAuthStatus() {
     }
 }
 
+// Fetch profile, dashboard, insights, recommendations and courses in one request
+function loadBootstrap() {
+    return fetch(`${API_BASE}/learner/bootstrap`, {
+        headers: {
+            'Authorization': `Bearer ${localStorage.getItem('access_token')}`
+        }
+    })
+    .then(response => {
+        if (response.ok) {
+            return response.json();
+        }
+        // Only an expired or malformed token logs the user out; keep it through server errors
+        if (response.status === 401 || response.status === 422) {
+            localStorage.removeItem('access_token');
+            throw new Error('Invalid token');
+        }
+        throw new Error(`Bootstrap failed: ${response.status}`);
+    })
+    .then(data => {
+        learnerState = data;
+        return data;
+    });
+}
+
+// Use the prefetched bootstrap data once, then fetch fresh data on later visits
+function takeLearnerState() {
+    if (learnerState) {
+        const data = learnerState;
+        learnerState = null;
+        return Promise.resolve(data);
+    }
+    return loadBootstrap().then(data => {
+        learnerState = null;
+        return data;
+    });
+}
+
 // Update UI for logged in user
 function updateUIForLoggedInUser() {
     document.getElementById('loginLink').style.display = 'none';
@@ -60,6 +87,7 @@ function updateUIForLoggedInUser() {
     if (currentUser.role === 'admin') {
         document.getElementById('adminLink').style.display = 'block';
     }
+    openEventStream();
 }
 
 // Update UI for logged out user
@@ -70,6 +98,41 @@ function updateUIForLoggedOutUser() {
     document.getElementById('dashboardLink').style.display = 'none';
     document.getElementById('adminLink').style.display = 'none';
     currentUser = null;
+    closeEventStream();
+}
+
+// Live updates: progress, enrollments and quiz attempts pushed by the server
+function openEventStream() {
+    if (eventSource || !window.EventSource) {
+        return;
+    }
+    // EventSource cannot set headers, so the token goes in the query string
+    const token = encodeURIComponent(localStorage.getItem('access_token'));
+    eventSource = new EventSource(`${API_BASE}/learner/events?token=${token}`);
+    eventSource.addEventListener('enrolled', refreshLiveDashboard);
+    eventSource.addEventListener('quiz_attempt', refreshLiveDashboard);
+    eventSource.addEventListener('progress', event => {
+        const progress = JSON.parse(event.data);
+        if (progress.completed) {
+            showAlert('Course completed!', 'success');
+        }
+        refreshLiveDashboard();
+    });
+}
+
+function closeEventStream() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+// Events from other tabs and devices: redraw the dashboard if it is on screen
+function refreshLiveDashboard() {
+    learnerState = null;
+    if (document.getElementById('dashboardSection').style.display === 'block') {
+        loadDashboard();
+    }
 }
 
 // Setup event listeners
@@ -200,6 +263,7 @@ function handleLogin(e) {
             updateUIForLoggedInUser();
             showAlert('Login successful!', 'success');
             showHome();
+            loadBootstrap().catch(error => console.error('Prefetch failed:', error));
         } else {
             showAlert(data.error || 'Login failed', 'danger');
         }
@@ -262,6 +326,7 @@ function handleRegister(e) {
 function logout() {
     localStorage.removeItem('access_token');
     currentUser = null;
+    learnerState = null;
     updateUIForLoggedOutUser();
     showAlert('Logged out successfully', 'info');
     showHome();
@@ -270,14 +335,17 @@ function logout() {
 // Load courses
 function loadCourses() {
     console.log('Loading courses...');
-    fetch(`${API_BASE}/courses/`)
-    .then(response => {
-        console.log('Courses response status:', response.status);
-        if (!response.ok) {
-            console.error('Response not OK:', response.status);
-        }
-        return response.json();
-    })
+    const coursesRequest = learnerState && learnerState.courses
+        ? Promise.resolve(learnerState.courses)
+        : fetch(`${API_BASE}/courses/`)
+            .then(response => {
+                console.log('Courses response status:', response.status);
+                if (!response.ok) {
+                    console.error('Response not OK:', response.status);
+                }
+                return response.json();
+            });
+    coursesRequest
     .then(courses => {
         console.log('Courses received:', courses.length, 'courses');
         const coursesList = document.getElementById('coursesList');
@@ -419,15 +487,40 @@ function loadCourseDetail(courseId) {
                             </div>
                         `).join('')}
                     </div>
+                    <h4 class="mt-4">Similar Courses</h4>
+                    <div id="similarCoursesList"></div>
                 </div>
             </div>
         `;
+        loadSimilarCourses(course.id);
     })
     .catch(error => {
         showAlert('Failed to load course details', 'danger');
     });
 }
 
+function loadSimilarCourses(courseId) {
+    fetch(`${API_BASE}/courses/${courseId}/similar?limit=5`)
+    .then(response => response.json())
+    .then(courses => {
+        document.getElementById('similarCoursesList').innerHTML = courses.map(course => `
+            <div class="card mb-2">
+                <div class="card-body">
+                    <h6>${course.title}</h6>
+                    <small class="text-muted">${course.category} • ${course.difficulty_level}</small>
+                    <br>
+                    <button class="btn btn-sm btn-outline-primary mt-2" onclick="showCourseDetail(${course.id})">
+                        View Course
+                    </button>
+                </div>
+            </div>
+        `).join('') || '<p class="small text-muted">No similar courses yet.</p>';
+    })
+    .catch(error => {
+        console.error('Failed to load similar courses:', error);
+    });
+}
+
 // Enroll in course
 function enrollInCourse(courseId) {
     console.log('Attempting to enroll in course:', courseId);
@@ -460,6 +553,8 @@ function enrollInCourse(courseId) {
         console.log('Enrollment response data:', data);
         if (data.message) {
             showAlert(data.message, 'success');
+            // The prefetched courses and dashboard predate the enrollment
+            learnerState = null;
             // Reload the page to show updated enrollment status
             window.location.reload();
         } else {
@@ -475,13 +570,10 @@ function enrollInCourse(courseId) {
 
 // Load dashboard
 function loadDashboard() {
-    fetch(`${API_BASE}/learner/dashboard`, {
-        headers: {
-            'Authorization': `Bearer ${localStorage.getItem('access_token')}`
-        }
-    })
-    .then(response => response.json())
-    .then(data => {
+    takeLearnerState()
+    .then(state => {
+        const data = state.dashboard;
+        
         // Update stats
         document.getElementById('totalCourses').textContent = data.total_courses;
         document.getElementById('completedCourses').textContent = data.completed_courses;
@@ -514,11 +606,9 @@ function loadDashboard() {
             myCoursesList.appendChild(courseCard);
         });
         
-        // Load recommendations
-        loadRecommendations();
-        
-        // Load AI insights
-        loadAIInsights();
+        // Recommendations and AI insights came in the same response
+        renderRecommendations(state.recommendations);
+        renderAIInsights(state.insights);
     })
     .catch(error => {
         showAlert('Failed to load dashboard', 'danger');
@@ -533,47 +623,49 @@ function loadAIInsights() {
         }
     })
     .then(response => response.json())
-    .then(data => {
-        const insightsList = document.getElementById('insightsList');
-        insightsList.innerHTML = '';
-        
-        if (data.insights && data.insights.length > 0) {
-            data.insights.forEach(insight => {
-                const insightItem = document.createElement('p');
-                insightItem.className = 'small mb-2';
-                insightItem.textContent = insight;
-                insightsList.appendChild(insightItem);
-            });
-        } else {
-            insightsList.innerHTML = '<p class="small text-muted">No insights available yet. Start learning to get personalized insights!</p>';
-        }
-        
-        // Show performance analysis
-        if (data.performance_analysis) {
-            const perf = data.performance_analysis;
-            if (perf.average_score) {
-                const scoreInfo = document.createElement('p');
-                scoreInfo.className = 'small mt-3 mb-0';
-                scoreInfo.innerHTML = `<strong>Average Score:</strong> ${perf.average_score}%`;
-                insightsList.appendChild(scoreInfo);
-            }
-            
-            if (perf.recommendations && perf.recommendations.length > 0) {
-                perf.recommendations.forEach(rec => {
-                    const recItem = document.createElement('p');
-                    recItem.className = 'small mb-1';
-                    recItem.innerHTML = `💡 ${rec}`;
-                    insightsList.appendChild(recItem);
-                });
-            }
-        }
-    })
+    .then(renderAIInsights)
     .catch(error => {
         console.error('Failed to load AI insights:', error);
         document.getElementById('insightsList').innerHTML = '<p class="small text-muted">Unable to load insights at this time.</p>';
     });
 }
 
+function renderAIInsights(data) {
+    const insightsList = document.getElementById('insightsList');
+    insightsList.innerHTML = '';
+    
+    if (data.insights && data.insights.length > 0) {
+        data.insights.forEach(insight => {
+            const insightItem = document.createElement('p');
+            insightItem.className = 'small mb-2';
+            insightItem.textContent = insight;
+            insightsList.appendChild(insightItem);
+        });
+    } else {
+        insightsList.innerHTML = '<p class="small text-muted">No insights available yet. Start learning to get personalized insights!</p>';
+    }
+    
+    // Show performance analysis
+    if (data.performance_analysis) {
+        const perf = data.performance_analysis;
+        if (perf.average_score) {
+            const scoreInfo = document.createElement('p');
+            scoreInfo.className = 'small mt-3 mb-0';
+            scoreInfo.innerHTML = `<strong>Average Score:</strong> ${perf.average_score}%`;
+            insightsList.appendChild(scoreInfo);
+        }
+        
+        if (perf.recommendations && perf.recommendations.length > 0) {
+            perf.recommendations.forEach(rec => {
+                const recItem = document.createElement('p');
+                recItem.className = 'small mb-1';
+                recItem.innerHTML = `💡 ${rec}`;
+                insightsList.appendChild(recItem);
+            });
+        }
+    }
+}
+
 // Load recommendations
 function loadRecommendations() {
     fetch(`${API_BASE}/learner/recommendations`, {
@@ -582,32 +674,34 @@ function loadRecommendations() {
         }
     })
     .then(response => response.json())
-    .then(courses => {
-        const recommendationsList = document.getElementById('recommendationsList');
-        recommendationsList.innerHTML = '';
-        
-        courses.forEach(course => {
-            const courseCard = document.createElement('div');
-            courseCard.className = 'card recommendation-card';
-            courseCard.innerHTML = `
-                <div class="card-body">
-                    <h6 class="card-title">${course.title}</h6>
-                    <p class="card-text small">${course.description || 'No description'}</p>
-                    <small class="text-muted">${course.category} • ${course.difficulty_level}</small>
-                    <br>
-                    <button class="btn btn-sm btn-outline-primary mt-2" onclick="showCourseDetail(${course.id})">
-                        View Course
-                    </button>
-                </div>
-            `;
-            recommendationsList.appendChild(courseCard);
-        });
-    })
+    .then(renderRecommendations)
     .catch(error => {
         console.error('Failed to load recommendations:', error);
     });
 }
 
+function renderRecommendations(courses) {
+    const recommendationsList = document.getElementById('recommendationsList');
+    recommendationsList.innerHTML = '';
+    
+    courses.forEach(course => {
+        const courseCard = document.createElement('div');
+        courseCard.className = 'card recommendation-card';
+        courseCard.innerHTML = `
+            <div class="card-body">
+                <h6 class="card-title">${course.title}</h6>
+                <p class="card-text small">${course.description || 'No description'}</p>
+                <small class="text-muted">${course.category} • ${course.difficulty_level}</small>
+                <br>
+                <button class="btn btn-sm btn-outline-primary mt-2" onclick="showCourseDetail(${course.id})">
+                    View Course
+                </button>
+            </div>
+        `;
+        recommendationsList.appendChild(courseCard);
+    });
+}
+
 // Load quiz
 function loadQuiz(quizId) {
     fetch(`${API_BASE}/learner/quiz/${quizId}`, {
@@ -718,6 +812,7 @@ function submitQuiz() {
     .then(response => response.json())
     .then(data => {
         if (data.attempt) {
+            learnerState = null;
             showQuizResults(data.attempt);
         } else {
             showAlert(data.error || 'Quiz submission failed', 'danger');
@@ -0,0 +1,507 @@
+"""
+Write-behind buffering for LearnSmart
+Lesson-progress and quiz-attempt events are validated by the request,
+appended to a local append-only log and committed to the database in
+groups by a background writer thread.
+
+Every process logs to a directory of its own under WRITE_BEHIND_LOG_DIR and
+holds an flock on its lock file while it runs. A starting process replays
+only the directories whose lock it can take, i.e. whose process has exited,
+and segments left directly in WRITE_BEHIND_LOG_DIR. Events the database
+refuses are appended to rejected.jsonl there, with the error, instead of
+being retried forever; copying their "event" objects into a .log file in
+the same place has the next start replay them.
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: a live process's log cannot be told from a dead one's; run one worker
+    fcntl = None
+
+write_behind_log = logging.getLogger('learnsmart.write_behind')
+
+LESSON_PROGRESS = 'lesson_progress'
+QUIZ_ATTEMPT = 'quiz_attempt'
+
+LOCK_FILE = 'lock'
+REJECTED_FILE = 'rejected.jsonl'
+# Longest pause between retries of a batch while the database is unavailable
+MAX_RETRY_SECONDS = 30.0
+
+
+def _try_lock(path):
+    """The open lock file at path with an exclusive lock held, or None while another process holds it"""
+    f = open(path, 'a')
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+    return f
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _transient(error):
+    """Whether a commit failed because of the database (retry later) rather than the events in it"""
+    from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+    return isinstance(error, (OperationalError, InterfaceError)) or (
+        isinstance(error, DBAPIError) and error.connection_invalidated
+    )
+
+
+class WriteBehindQueue:
+    """
+    In-process durable queue with group commit.
+
+    Every event is appended to the current log segment before the request
+    returns. The writer swaps segments, commits all buffered events in one
+    transaction and then removes the old segment, so a crash before the
+    commit replays the segment on the next start. Each event carries a
+    random id in the log; a replay of events that were committed after all
+    (a crash between the commit and the removal, or a retried batch whose
+    first events went through) finds them already stored and skips them.
+
+    A batch the database cannot take right now is retried with exponential
+    backoff; an event it refuses on its own is moved to the rejected log so
+    that it does not hold back the ones behind it.
+    """
+
+    def __init__(self, app, log_dir, flush_interval_ms=50, batch_size=500, fsync=True):
+        self.app = app
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.batch_size = batch_size
+        self.fsync = fsync
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pending_lessons = set()
+        self._user_seq = {}
+        self._seq = 0
+        self._committed_seq = 0
+        self._dir = None
+        self._lock = None
+        self._adopted = {}  # log directory of an exited process -> its lock file, until replayed
+        self._segment = None
+        self._segment_path = None
+        self._segment_no = 0
+        self._segment_events = 0
+        self._sealed = []
+        self._thread = None
+        self._stopping = False
+        self._flush_requested = False
+
+    # Producer side
+
+    def submit(self, kind, data):
+        """Append an event to the log and buffer it for the next group commit"""
+        self._ensure_started()
+        with self._cond:
+            self._seq += 1
+            event = {'seq': self._seq, 'id': uuid.uuid4().hex, 'kind': kind, 'data': data}
+            self._segment.write(json.dumps(event) + '\n')
+            self._segment.flush()
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+            self._segment_events += 1
+            self._buffer(event)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return event
+
+    def has_pending_lesson(self, user_id, lesson_id):
+        with self._cond:
+            return (user_id, lesson_id) in self._pending_lessons
+
+    def wait_for_user(self, user_id, timeout=5.0):
+        """Block until every event submitted by the user has been committed"""
+        with self._cond:
+            target = self._user_seq.get(user_id, 0)
+            if target <= self._committed_seq:
+                return True
+            self._request_flush()
+            return self._cond.wait_for(lambda: self._committed_seq >= target, timeout)
+
+    def flush(self, timeout=10.0):
+        """Force a group commit of everything submitted so far"""
+        with self._cond:
+            target = self._seq
+            if target <= self._committed_seq or self._thread is None:
+                return True
+            self._request_flush()
+            return self._cond.wait_for(lambda: self._committed_seq >= target, timeout)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.flush()
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        with self._cond:
+            self._segment.close()
+            if not self._pending and not self._sealed:
+                # Nothing left to replay: leave no directory behind
+                _remove(self._segment_path)
+                _remove(os.path.join(self._dir, LOCK_FILE))
+                try:
+                    os.rmdir(self._dir)
+                except OSError:
+                    pass
+            # Whatever is left is for the next start (or a sibling's) to replay
+            self._lock.close()
+            for lock in self._adopted.values():
+                lock.close()
+            self._adopted = {}
+            self._stopping = False
+
+    def _request_flush(self):
+        self._flush_requested = True
+        self._cond.notify_all()
+
+    def _buffer(self, event):
+        self._pending.append(event)
+        data = event['data']
+        self._user_seq[data['user_id']] = event['seq']
+        if event['kind'] == LESSON_PROGRESS:
+            self._pending_lessons.add((data['user_id'], data['lesson_id']))
+
+    # Writer side
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._claim_directory()
+            self._replay()
+            self._open_segment()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _claim_directory(self):
+        """Create this process's log directory and lock it for as long as the process runs"""
+        self._dir = os.path.join(self.log_dir, '%d-%s' % (os.getpid(), uuid.uuid4().hex[:8]))
+        os.makedirs(self._dir)
+        self._lock = _try_lock(os.path.join(self._dir, LOCK_FILE))
+        self._segment_no = 0
+
+    def _log_dirs(self):
+        """log_dir itself and every process directory in it other than this process's"""
+        with os.scandir(self.log_dir) as entries:
+            dirs = sorted(entry.path for entry in entries if entry.is_dir() and entry.path != self._dir)
+        return [self.log_dir] + dirs
+
+    def _segment_files(self, directory):
+        try:
+            names = [n for n in os.listdir(directory) if n.endswith('.log')]
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(directory, n) for n in names)
+
+    def has_leftovers(self):
+        """Whether any log directory holds segments; only those of exited processes are replayed"""
+        return os.path.isdir(self.log_dir) and any(self._segment_files(d) for d in self._log_dirs())
+
+    def _replay(self):
+        """Re-buffer events left in segments by processes that have exited"""
+        for directory in self._log_dirs():
+            try:
+                lock = _try_lock(os.path.join(directory, LOCK_FILE))
+            except FileNotFoundError:
+                # Cleaned up by the process that replayed it
+                continue
+            if lock is None:
+                # Its process is alive and still appending
+                continue
+            self._adopted[directory] = lock
+            for path in self._segment_files(directory):
+                with open(path) as f:
+                    for line in f:
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            # Torn final write from a crash; the request never returned
+                            continue
+                        self._seq += 1
+                        event['seq'] = self._seq
+                        self._buffer(event)
+                self._sealed.append(path)
+        self._release_adopted()
+
+    def _release_adopted(self):
+        """Remove the adopted directories whose segments have all been committed"""
+        for directory, lock in list(self._adopted.items()):
+            if any(os.path.dirname(path) == directory for path in self._sealed):
+                continue
+            if directory != self.log_dir:
+                _remove(os.path.join(directory, LOCK_FILE))
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+            lock.close()
+            del self._adopted[directory]
+
+    def _open_segment(self):
+        self._segment_no += 1
+        self._segment_path = os.path.join(self._dir, '%012d.log' % self._segment_no)
+        self._segment = open(self._segment_path, 'a')
+        self._segment_events = 0
+
+    def _run(self):
+        delay = 0.0
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: (self._stopping or self._flush_requested
+                             or len(self._pending) >= self.batch_size),
+                    self.flush_interval
+                )
+                self._flush_requested = False
+                if self._stopping and not self._pending:
+                    return
+                if not self._pending:
+                    continue
+                batch = self._pending
+                self._pending = []
+                if self._segment_events:
+                    # A retry of events already sealed leaves the current segment open
+                    self._segment.close()
+                    self._sealed.append(self._segment_path)
+                    self._open_segment()
+                sealed = list(self._sealed)
+
+            try:
+                self._commit(batch)
+            except Exception as e:
+                delay = min(delay * 2, MAX_RETRY_SECONDS) if delay else self.flush_interval
+                write_behind_log.warning('Write-behind commit of %d events failed, retrying in %.2fs: %s',
+                                         len(batch), delay, e)
+                with self._cond:
+                    self._pending = batch + self._pending
+                    if self._stopping:
+                        # Still in the log; the next start replays them
+                        return
+                    self._cond.wait_for(lambda: self._stopping, delay)
+                continue
+            delay = 0.0
+
+            with self._cond:
+                for path in sealed:
+                    _remove(path)
+                    self._sealed.remove(path)
+                self._release_adopted()
+                for event in batch:
+                    data = event['data']
+                    if event['kind'] == LESSON_PROGRESS:
+                        self._pending_lessons.discard((data['user_id'], data['lesson_id']))
+                    if self._user_seq.get(data['user_id']) == event['seq']:
+                        del self._user_seq[data['user_id']]
+                self._committed_seq = batch[-1]['seq']
+                self._cond.notify_all()
+
+    def _commit(self, batch):
+        """
+        Commit a batch; raises only when the database is unavailable. When
+        the batch fails for anything else, its events are committed one by
+        one and those that still fail are rejected.
+        """
+        from models import db
+
+        with self.app.app_context():
+            try:
+                commit_events(batch)
+            except Exception as e:
+                db.session.rollback()
+                if _transient(e):
+                    raise
+                # Isolate the offending events rather than holding back the whole batch;
+                # events of the batch that did get stored are skipped as already stored
+                for event in batch:
+                    try:
+                        commit_events([event])
+                    except Exception as e:
+                        db.session.rollback()
+                        if _transient(e):
+                            raise
+                        self._reject(event, e)
+            # Completed courses marked users stale; let the refresher pick them up
+            from recommendations import schedule_refresh
+            schedule_refresh()
+
+    def _reject(self, event, error):
+        """Append an event the database refuses to the rejected log, where it can be inspected and replayed"""
+        write_behind_log.error('Write-behind event %s (%s of user %s) rejected: %s', event.get('id'),
+                               event.get('kind'), event.get('data', {}).get('user_id'), error)
+        record = {'rejected_at': datetime.utcnow().isoformat(), 'error': str(error),
+                  'event': {name: value for name, value in event.items() if name != 'seq'}}
+        with open(os.path.join(self.log_dir, REJECTED_FILE), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+
+def commit_events(events):
+    """Apply and commit events, then publish and sketch the ones applied (app context)"""
+    from models import db
+    from sketches import record_events
+
+    applied = apply_events(events)
+    db.session.commit()
+    publish_events(applied)
+    record_events(applied)
+
+
+def stored_events(events):
+    """Ids of the events whose rows a previous commit already wrote"""
+    from models import db, LessonProgress, QuizAttempt
+    from sqlalchemy import select, tuple_
+
+    attempt_ids = [event['id'] for event in events if event['kind'] == QUIZ_ATTEMPT and event.get('id')]
+    lessons = {(event['data']['user_id'], event['data']['lesson_id']): event.get('id')
+               for event in events if event['kind'] == LESSON_PROGRESS}
+    stored = set()
+    if attempt_ids:
+        stored.update(db.session.scalars(
+            select(QuizAttempt.event_id).where(QuizAttempt.event_id.in_(attempt_ids))
+            .execution_options(include_deleted=True)
+        ))
+    if lessons:
+        stored.update(lessons[pair] for pair in db.session.execute(
+            select(LessonProgress.user_id, LessonProgress.lesson_id)
+            .where(tuple_(LessonProgress.user_id, LessonProgress.lesson_id).in_(list(lessons)))
+            .execution_options(include_deleted=True)
+        ).tuples())
+    return stored
+
+
+def apply_events(events):
+    """
+    Add the rows for a batch of events to the current session, skipping
+    events a previous commit already stored. Returns the events applied.
+    """
+    from models import db, Lesson, LessonProgress, QuizAttempt, QuestionResponse, insert_ignore
+    from routes import update_enrollment_progress
+    from item_analysis import quiz_questions, response_rows
+    from cache import bump_user_versions
+    from sqlalchemy import insert
+
+    stored = stored_events(events) - {None}
+    events = [event for event in events if event.get('id') not in stored]
+    if not events:
+        return []
+
+    progress_rows = []
+    touched = set()
+    attempts = []
+    bump_user_versions(event['data']['user_id'] for event in events)
+    for event in events:
+        data = event['data']
+        if event['kind'] == LESSON_PROGRESS:
+            progress_rows.append({
+                'user_id': data['user_id'],
+                'lesson_id': data['lesson_id'],
+                'time_spent_minutes': data['time_spent_minutes'],
+                'completed_at': datetime.fromisoformat(data['completed_at'])
+            })
+            touched.add((data['user_id'], data['lesson_id']))
+        elif event['kind'] == QUIZ_ATTEMPT:
+            attempt = QuizAttempt(
+                user_id=data['user_id'],
+                quiz_id=data['quiz_id'],
+                score=data['score'],
+                total_questions=data['total_questions'],
+                correct_answers=data['correct_answers'],
+                percentage=data['percentage'],
+                passed=data['passed'],
+                time_taken_minutes=data['time_taken_minutes'],
+                attempted_at=datetime.fromisoformat(data['attempted_at']),
+                event_id=event.get('id')
+            )
+            attempt.set_answers(data['answers'])
+            db.session.add(attempt)
+            attempts.append((attempt, data['answers']))
+
+    if attempts:
+        # Ids first, then every attempt's per-question responses in one insert
+        db.session.flush()
+        questions = quiz_questions({attempt.quiz_id for attempt, _ in attempts})
+        rows = []
+        for attempt, answers in attempts:
+            rows.extend(response_rows(attempt.id, questions.get(attempt.quiz_id, ()), answers))
+        if rows:
+            db.session.execute(insert(QuestionResponse), rows)
+
+    if not progress_rows:
+        return events
+    # Racing duplicates are skipped by the conflict clause
+    db.session.execute(insert_ignore(LessonProgress), progress_rows)
+
+    # Recompute each affected enrollment once per batch rather than once per event
+    lesson_ids = {lesson_id for _, lesson_id in touched}
+    course_by_lesson = dict(
+        db.session.query(Lesson.id, Lesson.course_id).filter(Lesson.id.in_(lesson_ids)).all()
+    )
+    courses = {(user_id, course_by_lesson[lesson_id])
+               for user_id, lesson_id in touched if lesson_id in course_by_lesson}
+    for user_id, course_id in courses:
+        update_enrollment_progress(user_id, course_id)
+    return events
+
+
+def publish_events(events):
+    """Push committed events to the users' live update streams"""
+    from events import publish, publish_lesson_progress
+
+    lessons_by_user = {}
+    for event in events:
+        data = event['data']
+        if event['kind'] == LESSON_PROGRESS:
+            lessons_by_user.setdefault(data['user_id'], []).append(data['lesson_id'])
+        elif event['kind'] == QUIZ_ATTEMPT:
+            publish(data['user_id'], 'quiz_attempt', data)
+    for user_id, lesson_ids in lessons_by_user.items():
+        publish_lesson_progress(user_id, lesson_ids)
+
+
+def init_write_behind(app):
+    """Attach a write-behind queue to the app when WRITE_BEHIND_ENABLED is set"""
+    if not app.config.get('WRITE_BEHIND_ENABLED'):
+        return None
+
+    queue = WriteBehindQueue(
+        app,
+        app.config['WRITE_BEHIND_LOG_DIR'],
+        flush_interval_ms=app.config['WRITE_BEHIND_FLUSH_MS'],
+        batch_size=app.config['WRITE_BEHIND_BATCH_SIZE'],
+        fsync=app.config['WRITE_BEHIND_FSYNC']
+    )
+    app.extensions['write_behind'] = queue
+
+    # Events left over from a previous run must not wait for the next request
+    if queue.has_leftovers():
+        queue._ensure_started()
+
+    import atexit
+    atexit.register(queue.stop)
+    return queue